@@ -0,0 +1,32 @@
+"""
+云 API 不可用时的 HTTP 响应
+熔断期间的写请求返回 503 和 Retry-After，调用方可以据此退避，而不是等待 SDK 超时；
+超过 X-Request-Timeout 截止时间的请求返回 504
+"""
+
+import math
+from typing import Any, Dict
+
+from fastapi import HTTPException
+
+
+def circuit_open_error(message: str, retry_after: float) -> HTTPException:
+    """熔断期间的 503 响应"""
+    return HTTPException(
+        status_code=503,
+        detail=f"云 API 暂时不可用（熔断中）: {message}",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+def deadline_exceeded_error(message: str) -> HTTPException:
+    """超过请求截止时间的 504 响应"""
+    return HTTPException(status_code=504, detail=f"超过请求截止时间: {message}")
+
+
+def raise_for_unavailable(result: Dict[str, Any]):
+    """客户端调用结果因熔断或请求截止而失败时抛出 503/504"""
+    if result.get("circuit_open"):
+        raise circuit_open_error(result["error"], result.get("retry_after", 0))
+    if result.get("deadline_exceeded"):
+        raise deadline_exceeded_error(result["error"])
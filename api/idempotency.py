@@ -0,0 +1,69 @@
+"""
+Idempotency-Key 请求头处理
+同一个键在有效期内重复提交时返回首次的响应（状态码、响应头和响应体，并带上 Idempotent-Replayed: true），不再调用云 API
+"""
+
+from typing import Awaitable, Callable, Optional, TypeVar, Union
+
+from fastapi import Header, HTTPException, Response
+from pydantic import BaseModel
+
+from services.idempotency import IdempotencyConflictError, StoredResponse, get_idempotency_store, request_fingerprint
+
+T = TypeVar("T")
+
+# 幂等键最大长度
+MAX_KEY_LENGTH = 255
+
+
+def idempotency_key_header(
+    idempotency_key: Optional[str] = Header(
+        None,
+        alias="Idempotency-Key",
+        max_length=MAX_KEY_LENGTH,
+        description="幂等键：有效期内以相同键重复提交时返回首次的响应，不重复执行"
+    )
+) -> Optional[str]:
+    """FastAPI 依赖：读取 Idempotency-Key 请求头"""
+    return idempotency_key or None
+
+
+async def run_idempotent(
+    scope: str,
+    idempotency_key: Optional[str],
+    request: BaseModel,
+    response: Response,
+    handler: Callable[[], Awaitable[T]]
+) -> Union[T, Response]:
+    """
+    未携带幂等键时直接执行；携带时按 (接口, 键) 去重，键被用于不同请求内容时返回 422
+    handler 在 response 上设置的状态码和响应头随响应保存，重放时一并返回
+    """
+    if not idempotency_key:
+        return await handler()
+
+    async def execute() -> StoredResponse:
+        result = await handler()
+        headers = {name: value for name, value in response.headers.items() if name != "content-length"}
+        return StoredResponse(result, response.status_code, headers)
+
+    try:
+        stored, replayed = await get_idempotency_store().run(
+            f"{scope}:{idempotency_key}",
+            request_fingerprint(scope, request.model_dump_json()),
+            execute
+        )
+    except IdempotencyConflictError:
+        raise HTTPException(status_code=422, detail="Idempotency-Key 已用于不同的请求内容")
+    if not replayed:
+        return stored.body
+
+    headers = {**stored.headers, "Idempotent-Replayed": "true"}
+    if isinstance(stored.body, str):
+        # 从共享状态存储重放的是序列化后的响应
+        return Response(stored.body, status_code=stored.status_code or 200, media_type="application/json", headers=headers)
+    # 同一 worker 内等待执行中请求的结果
+    if stored.status_code is not None:
+        response.status_code = stored.status_code
+    response.headers.update(headers)
+    return stored.body
@@ -4,7 +4,7 @@ API 请求和响应模型
 """
 
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 from core.config import settings
 
@@ -35,6 +35,7 @@ class AddEntriesToAclResponse(ApiResponse):
     acl_entry_ip: str = Field(..., description="已添加的 IP 地址")
     description: str = Field(..., description="描述信息")
     acl_id: str = Field(..., description="访问控制列表 ID")
+    existing: bool = Field(False, description="条目已存在或已被更大网段包含，本次未写入")
 
 class RemoveEntriesFromAclRequest(BaseModel):
     """删除 ALB 访问控制条目请求"""
@@ -46,6 +47,26 @@ class RemoveEntriesFromAclResponse(ApiResponse):
     acl_entry_ip: str = Field(..., description="已删除的 IP 地址")
     acl_id: str = Field(..., description="访问控制列表 ID")
 
+class ReconcileAclRequest(BaseModel):
+    """ALB 访问控制期望状态同步请求"""
+    cidrs: List[str] = Field(..., description="ACL 应有的完整 IP/CIDR 列表，空列表表示清空")
+    description: Optional[str] = Field(None, description="新增条目的描述信息")
+    dry_run: bool = Field(False, description="只计算差异，不写入云端")
+
+class ReconcileResponse(ApiResponse):
+    """期望状态同步响应"""
+    resource_id: str = Field(..., description="ACL ID 或安全组 ID")
+    region: str = Field(..., description="地域")
+    dry_run: bool = Field(..., description="是否为预演")
+    to_add: List[str] = Field(default_factory=list, description="需要新增的网段")
+    to_remove: List[str] = Field(default_factory=list, description="需要删除的网段")
+    unchanged: int = Field(0, description="已存在、无需变更的网段数量")
+    invalid: List[str] = Field(default_factory=list, description="无法解析的条目")
+    added: int = Field(0, description="实际新增成功的数量")
+    removed: int = Field(0, description="实际删除成功的数量")
+    failures: Dict[str, str] = Field(default_factory=dict, description="写入失败的网段及原因")
+    api_calls: int = Field(0, description="写入时的云 API 调用次数")
+
 # ==== ECS 安全组模型 ====
 
 class AuthorizeSecurityGroupRequest(BaseModel):
@@ -62,6 +83,7 @@ class AuthorizeSecurityGroupResponse(ApiResponse):
     source_cidr_ip: str = Field(..., description="已添加的 IP 地址")
     security_group_id: str = Field(..., description="安全组 ID")
     authorization_rule_id: str = Field(..., description="授权规则 ID")
+    existing: bool = Field(False, description="规则已存在或已被更大网段包含，本次未写入")
 
 class RevokeSecurityGroupRequest(BaseModel):
     """删除 ECS 安全组规则请求"""
@@ -76,20 +98,66 @@ class RevokeSecurityGroupResponse(ApiResponse):
     source_cidr_ip: str = Field(..., description="已删除的 IP 地址")
     security_group_id: str = Field(..., description="安全组 ID")
 
+class ReconcileSecurityGroupRequest(ReconcileAclRequest):
+    """ECS 安全组期望状态同步请求：只同步策略、端口和协议均匹配的入方向规则"""
+    cidrs: List[str] = Field(..., description="安全组应有的完整来源 IP/CIDR 列表，空列表表示清空匹配的规则")
+    policy: str = Field(default="Drop", description="访问策略")
+    port_range: str = Field(default="-1/-1", description="端口范围")
+    ip_protocol: str = Field(default="ALL", description="协议类型")
+
+class ConsolidateSecurityGroupRequest(BaseModel):
+    """安全组规则合并请求：只处理策略 Drop、端口 -1/-1、协议 ALL 的入方向规则"""
+    dry_run: bool = Field(False, description="只计算差异，不写入云端")
+    max_rules: Optional[int] = Field(None, ge=0, description="合并后显式规则数的目标上限，默认 SG_CONSOLIDATE_MAX_RULES")
+    prefix_list_id: Optional[str] = Field(None, description="超出上限的网段移入的前缀列表，默认 SG_CONSOLIDATE_PREFIX_LIST_ID")
+    description: Optional[str] = Field(None, description="新增规则和前缀列表条目的描述信息")
+
+class ConsolidateResponse(ApiResponse):
+    """安全组规则合并响应"""
+    security_group_id: str = Field(..., description="安全组 ID")
+    region: str = Field(..., description="地域")
+    dry_run: bool = Field(..., description="是否为预演")
+    rules_before: int = Field(0, description="合并前的规则数")
+    rules_after: int = Field(0, description="合并后的规则数（预演时为预计值）")
+    rules_saved: int = Field(0, description="减少的规则数")
+    to_add: List[str] = Field(default_factory=list, description="新增的超网规则")
+    to_remove: List[str] = Field(default_factory=list, description="被超网或前缀列表取代、需要撤销的规则")
+    to_prefix_list: List[str] = Field(default_factory=list, description="新增到前缀列表的网段")
+    merges: Dict[str, List[str]] = Field(default_factory=dict, description="取代规则的网段及其取代的规则")
+    pinned: int = Field(0, description="有到期时间、保持原样的规则数")
+    prefix_list_id: str = Field("", description="使用的前缀列表")
+    failures: Dict[str, str] = Field(default_factory=dict, description="写入失败的网段及原因")
+    api_calls: int = Field(0, description="写入时的云 API 调用次数")
+
 # ==== API 文档响应模型 ====
 
 # ==== BanIP 聚合接口模型 ====
 
+class BanTargetResult(BaseModel):
+    """单个封禁目标（地域）的结果"""
+    region: str = Field(..., description="地域")
+    acl_id: str = Field("", description="访问控制列表 ID")
+    security_group_id: str = Field("", description="安全组 ID")
+    alb_success: Optional[bool] = Field(None, description="ALB操作是否成功（未配置ACL时为空）")
+    ecs_success: Optional[bool] = Field(None, description="ECS操作是否成功（未配置安全组时为空）")
+    message: str = Field("", description="失败原因")
+    elapsed_ms: float = Field(0.0, description="耗时（毫秒）")
+
 class BanIPRequest(BaseModel):
     """BanIP 封禁请求模型"""
     ip: str = Field(..., description="要封禁的IP地址")
     description: Optional[str] = Field(None, description="封禁描述")
+    ttl_seconds: Optional[float] = Field(None, ge=0, description="封禁时长（秒），到期后自动解封；0 表示永久，不传时使用 BAN_DEFAULT_TTL")
 
 class BanIPResponse(ApiResponse):
     """BanIP 封禁响应模型"""
     ip: str = Field(..., description="被封禁的IP地址")
     alb_result: Optional[AddEntriesToAclResponse] = Field(None, description="ALB封禁结果")
     ecs_result: Optional[AuthorizeSecurityGroupResponse] = Field(None, description="ECS封禁结果")
+    timings: Dict[str, float] = Field(default_factory=dict, description="各后端耗时（毫秒）")
+    targets: List[BanTargetResult] = Field(default_factory=list, description="各目标的结果")
+    expires_at: Optional[str] = Field(None, description="自动解封时间（ISO 格式），永久封禁时为空")
+    queued_request_id: Optional[str] = Field(None, description="云 API 熔断时转入写回队列的请求 ID")
 
 class UnbanIPRequest(BaseModel):
     """BanIP 解封请求模型"""
@@ -101,6 +169,68 @@ class UnbanIPResponse(ApiResponse):
     ip: str = Field(..., description="被解封的IP地址")
     alb_result: Optional[RemoveEntriesFromAclResponse] = Field(None, description="ALB解封结果")
     ecs_result: Optional[RevokeSecurityGroupResponse] = Field(None, description="ECS解封结果")
+    timings: Dict[str, float] = Field(default_factory=dict, description="各后端耗时（毫秒）")
+    targets: List[BanTargetResult] = Field(default_factory=list, description="各目标的结果")
+    queued_request_id: Optional[str] = Field(None, description="云 API 熔断时转入写回队列的请求 ID")
+
+# ==== BanIP 批量接口模型 ====
+
+class BulkBanIPRequest(BaseModel):
+    """BanIP 批量封禁请求模型"""
+    ips: List[str] = Field(..., min_length=1, description="要封禁的IP地址或CIDR列表")
+    description: Optional[str] = Field(None, description="封禁描述")
+    ttl_seconds: Optional[float] = Field(None, ge=0, description="封禁时长（秒），到期后自动解封；0 表示永久，不传时使用 BAN_DEFAULT_TTL")
+
+class BulkUnbanIPRequest(BaseModel):
+    """BanIP 批量解封请求模型"""
+    ips: List[str] = Field(..., min_length=1, description="要解封的IP地址或CIDR列表")
+    description: Optional[str] = Field(None, description="解封描述")
+
+class BulkIPResult(BaseModel):
+    """批量操作中单个IP的结果"""
+    ip: str = Field(..., description="请求中的IP地址")
+    cidr_ip: str = Field(..., description="实际操作的CIDR")
+    success: bool = Field(..., description="ALB或ECS至少一项成功")
+    alb_success: bool = Field(..., description="ALB操作是否成功")
+    ecs_success: bool = Field(..., description="ECS操作是否成功")
+    message: str = Field("", description="失败原因或提示")
+
+class BulkBanIPResponse(ApiResponse):
+    """BanIP 批量封禁响应模型"""
+    total: int = Field(..., description="IP总数")
+    succeeded: int = Field(..., description="成功数量")
+    failed: int = Field(..., description="失败数量")
+    alb_api_calls: int = Field(..., description="ALB API 调用次数")
+    ecs_api_calls: int = Field(..., description="ECS API 调用次数")
+    results: List[BulkIPResult] = Field(default_factory=list, description="逐个IP的结果")
+    expires_at: Optional[str] = Field(None, description="自动解封时间（ISO 格式），永久封禁时为空")
+
+class BulkUnbanIPResponse(BulkBanIPResponse):
+    """BanIP 批量解封响应模型"""
+
+class BanImportResponse(ApiResponse):
+    """BanIP 导入响应模型"""
+    action: str = Field(..., description="操作类型（ban/unban）")
+    total: int = Field(..., description="文件中的IP/CIDR数量（按批次去重后）")
+    succeeded: int = Field(..., description="成功数量")
+    failed: int = Field(..., description="失败数量（含无效条目）")
+    unchanged: int = Field(..., description="所有目标上已处于目标状态、未调用云 API 的数量")
+    batches: int = Field(..., description="处理的批次数")
+    alb_api_calls: int = Field(..., description="ALB API 调用次数")
+    ecs_api_calls: int = Field(..., description="ECS API 调用次数")
+    failures: List[BulkIPResult] = Field(default_factory=list, description="失败的IP（最多返回前 100 个）")
+    expires_at: Optional[str] = Field(None, description="自动解封时间（ISO 格式），永久封禁时为空")
+
+# ==== BanIP 写回队列模型 ====
+
+class QueuedIPResponse(ApiResponse):
+    """写回队列请求状态响应模型"""
+    request_id: str = Field(..., description="请求 ID，可用于轮询结果")
+    action: str = Field(..., description="操作类型（ban/unban）")
+    cidr_ip: str = Field(..., description="操作的CIDR")
+    status: str = Field(..., description="状态：pending 等待刷写、done 已完成、cancelled 与相反操作抵消")
+    alb_success: Optional[bool] = Field(None, description="ALB操作是否成功")
+    ecs_success: Optional[bool] = Field(None, description="ECS操作是否成功")
 
 class APIDocumentation(BaseModel):
     """API 文档模型"""
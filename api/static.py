@@ -0,0 +1,43 @@
+"""
+预先序列化的静态 JSON 响应
+文档和示例接口的内容不随请求变化，导入时编码一次为字节并计算 ETag，
+请求携带匹配的 If-None-Match 时返回 304，否则直接返回缓存的字节
+"""
+
+import hashlib
+import json
+from typing import Any
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+# 客户端/代理可缓存的时间（秒）
+STATIC_MAX_AGE = 300
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """按弱比较规则检查 If-None-Match（支持逗号分隔的多个值和 *）"""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class PrecomputedResponse:
+    """只序列化一次的 JSON 响应"""
+
+    def __init__(self, content: Any, max_age: int = STATIC_MAX_AGE):
+        # 与 FastAPI 默认 JSONResponse 的编码方式一致
+        self.body = json.dumps(
+            jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+        ).encode("utf-8")
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+        self.headers = {"ETag": self.etag, "Cache-Control": f"public, max-age={max_age}"}
+
+    def respond(self, request: Request) -> Response:
+        """返回缓存的响应，ETag 匹配时返回 304"""
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, self.etag):
+            return Response(status_code=304, headers=self.headers)
+        return Response(self.body, media_type="application/json", headers=self.headers)
@@ -3,15 +3,23 @@ ALB 访问控制 API 路由
 实现 AddEntriesToAcl 和 RemoveEntriesFromAcl 接口
 """
 
-from fastapi import APIRouter, Depends
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from loguru import logger
+from core.logger import sampled_logger
 from core.config import settings
-from services.alicloud import AliCloudClient
+from services.alicloud import AliCloudClient, aliyun_client_dependency
+from services.reconcile import reconcile_acl
+from api.errors import raise_for_unavailable
+from api.static import PrecomputedResponse
 from api.models import (
     AddEntriesToAclRequest,
     AddEntriesToAclResponse,
     RemoveEntriesFromAclRequest,
     RemoveEntriesFromAclResponse,
+    ReconcileAclRequest,
+    ReconcileResponse,
     ErrorResponse,
     APIDocumentation
 )
@@ -19,9 +27,6 @@ from api.models import (
 # 创建路由器实例
 router = APIRouter()
 
-# 初始化阿里云客户端
-aliyun_client = AliCloudClient()
-
 # API 文档信息
 add_entries_to_acl_doc = APIDocumentation(
     title="添加ALB访问控制条目",
@@ -37,74 +42,82 @@ remove_entries_from_acl_doc = APIDocumentation(
     parameter_info="参数说明: SourceCidrIp - 来源IP地址段（CIDR格式，如192.168.1.0/24）；AclId - 访问控制列表ID（可选，默认从环境变量DEFAULT_ALB_ACL_ID获取）"
 )
 
+# 使用示例（导入时序列化一次）
+ALB_EXAMPLES = PrecomputedResponse({
+    "add_entries_to_acl": [
+        {
+            "description": "添加单个IP地址到默认ACL",
+            "request": {
+                "source_cidr_ip": "192.168.1.100/32",
+                "description": "服务器IP地址"
+            },
+            "endpoint": "POST /api/v1/alb/add-entries"
+        },
+        {
+            "description": "添加IP地址段到指定ACL",
+            "request": {
+                "acl_id": "acl-nnd9vclvwdcorsg1rm",
+                "source_cidr_ip": "192.168.1.0/24",
+                "description": "内网IP段"
+            },
+            "endpoint": "POST /api/v1/alb/add-entries"
+        }
+    ],
+    "remove_entries_from_acl": [
+        {
+            "description": "从默认ACL删除IP地址",
+            "request": {
+                "source_cidr_ip": "192.168.1.100/32"
+            },
+            "endpoint": "POST /api/v1/alb/remove-entries"
+        }
+    ],
+    "parameter_requirements": [
+        "所有IP地址必须使用CIDR格式（如192.168.1.0/24）",
+        "ACL ID可选，不提供时使用环境变量DEFAULT_ALB_ACL_ID的值",
+        "描述信息可选，不提供时使用自动生成的时间戳"
+    ]
+})
+
 @router.get("/examples", tags=["ALB 使用示例"])
-async def get_alb_examples():
+async def get_alb_examples(request: Request):
     """获取 ALB API 使用示例"""
-    return {
-        "add_entries_to_acl": [
-            {
-                "description": "添加单个IP地址到默认ACL",
-                "request": {
-                    "source_cidr_ip": "192.168.1.100/32",
-                    "description": "服务器IP地址"
-                },
-                "endpoint": "POST /api/v1/alb/add-entries"
-            },
-            {
-                "description": "添加IP地址段到指定ACL",
-                "request": {
-                    "acl_id": "acl-nnd9vclvwdcorsg1rm",
-                    "source_cidr_ip": "192.168.1.0/24",
-                    "description": "内网IP段"
-                },
-                "endpoint": "POST /api/v1/alb/add-entries"
-            }
-        ],
-        "remove_entries_from_acl": [
-            {
-                "description": "从默认ACL删除IP地址",
-                "request": {
-                    "source_cidr_ip": "192.168.1.100/32"
-                },
-                "endpoint": "POST /api/v1/alb/remove-entries"
-            }
-        ],
-        "parameter_requirements": [
-            "所有IP地址必须使用CIDR格式（如192.168.1.0/24）",
-            "ACL ID可选，不提供时使用环境变量DEFAULT_ALB_ACL_ID的值",
-            "描述信息可选，不提供时使用自动生成的时间戳"
-        ]
-    }
+    return ALB_EXAMPLES.respond(request)
 
 
+# 文档信息（导入时序列化一次）
+ALB_DOCUMENTATION = PrecomputedResponse({
+    "add_entries_to_acl": add_entries_to_acl_doc,
+    "remove_entries_from_acl": remove_entries_from_acl_doc
+})
+
 @router.get("/docs", tags=["ALB 文档"])
-async def get_alb_documentation():
+async def get_alb_documentation(request: Request):
     """获取 ALB API 文档信息"""
-    return {
-        "add_entries_to_acl": add_entries_to_acl_doc,
-        "remove_entries_from_acl": remove_entries_from_acl_doc
-    }
+    return ALB_DOCUMENTATION.respond(request)
 
 @router.post("/add-entries", response_model=AddEntriesToAclResponse, tags=["ALB 添加访问控制"])
 async def add_entries_to_acl(
-    request: AddEntriesToAclRequest
+    request: AddEntriesToAclRequest,
+    aliyun_client: AliCloudClient = Depends(aliyun_client_dependency)
 ):
     """添加 ALB 访问控制条目 (AddEntriesToAcl)"""
-    logger.info(f"收到添加 ALB 访问控制请求: {request.source_cidr_ip}")
+    logger.debug("收到添加 ALB 访问控制请求: {}", request.source_cidr_ip)
 
     try:
         # 使用默认ACL ID或请求中的ACL ID
         acl_id = request.acl_id or settings.default_alb_acl_id
 
         # 调用阿里云客户端
-        result = aliyun_client.add_entries_to_acl(
+        result = await aliyun_client.add_entries_to_acl_async(
             acl_id=acl_id,
             source_cidr_ip=request.source_cidr_ip,
             description=request.description
         )
+        raise_for_unavailable(result)
 
         if result["success"]:
-            logger.info(f"成功添加 ALB 访问控制条目: {request.source_cidr_ip}")
+            sampled_logger.info("成功添加 ALB 访问控制条目: {}", request.source_cidr_ip)
             return AddEntriesToAclResponse(
                 success=True,
                 message="添加 ALB 访问控制条目成功",
@@ -113,7 +126,7 @@ async def add_entries_to_acl(
                 acl_id=acl_id
             )
         else:
-            logger.error(f"添加 ALB 访问控制条目失败: {result['error']}")
+            logger.error("添加 ALB 访问控制条目失败: {}", result['error'])
             return AddEntriesToAclResponse(
                 success=False,
                 message=f"添加失败: {result['error']}",
@@ -122,29 +135,33 @@ async def add_entries_to_acl(
                 acl_id=acl_id
             )
 
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"添加 ALB 访问控制条目异常: {str(e)}")
+        logger.error("添加 ALB 访问控制条目异常: {}", e)
         raise Exception(f"添加 ALB 访问控制条目时发生错误: {str(e)}")
 
 @router.post("/remove-entries", response_model=RemoveEntriesFromAclResponse, tags=["ALB 删除访问控制"])
 async def remove_entries_from_acl(
-    request: RemoveEntriesFromAclRequest
+    request: RemoveEntriesFromAclRequest,
+    aliyun_client: AliCloudClient = Depends(aliyun_client_dependency)
 ):
     """删除 ALB 访问控制条目 (RemoveEntriesFromAcl)"""
-    logger.info(f"收到删除 ALB 访问控制请求: {request.source_cidr_ip}")
+    logger.debug("收到删除 ALB 访问控制请求: {}", request.source_cidr_ip)
 
     try:
         # 使用默认ACL ID或请求中的ACL ID
         acl_id = request.acl_id or settings.default_alb_acl_id
 
         # 调用阿里云客户端
-        result = aliyun_client.remove_entries_from_acl(
+        result = await aliyun_client.remove_entries_from_acl_async(
             acl_id=acl_id,
             source_cidr_ip=request.source_cidr_ip
         )
+        raise_for_unavailable(result)
 
         if result["success"]:
-            logger.info(f"成功删除 ALB 访问控制条目: {request.source_cidr_ip}")
+            sampled_logger.info("成功删除 ALB 访问控制条目: {}", request.source_cidr_ip)
             return RemoveEntriesFromAclResponse(
                 success=True,
                 message="删除 ALB 访问控制条目成功",
@@ -152,7 +169,7 @@ async def remove_entries_from_acl(
                 acl_id=acl_id
             )
         else:
-            logger.error(f"删除 ALB 访问控制条目失败: {result['error']}")
+            logger.error("删除 ALB 访问控制条目失败: {}", result['error'])
             return RemoveEntriesFromAclResponse(
                 success=False,
                 message=f"删除失败: {result['error']}",
@@ -160,6 +177,39 @@ async def remove_entries_from_acl(
                 acl_id=acl_id
             )
 
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("删除 ALB 访问控制条目异常: {}", e)
+        raise Exception(f"删除 ALB 访问控制条目时发生错误: {str(e)}")
+
+@router.put("/acls/{acl_id}/entries", response_model=ReconcileResponse, tags=["ALB 期望状态同步"])
+async def reconcile_acl_entries(
+    acl_id: str,
+    request: ReconcileAclRequest,
+    region: Optional[str] = Query(None, description="地域，默认 DEFAULT_REGION"),
+    aliyun_client: AliCloudClient = Depends(aliyun_client_dependency)
+):
+    """把 ACL 同步为请求中的完整网段列表，只写入新增和删除的差异"""
+    logger.debug("收到 ACL 同步请求: {} 期望 {} 条", acl_id, len(request.cidrs))
+
+    try:
+        summary = await reconcile_acl(
+            aliyun_client.for_region(region),
+            acl_id,
+            request.cidrs,
+            dry_run=request.dry_run,
+            description=request.description
+        )
     except Exception as e:
-        logger.error(f"删除 ALB 访问控制条目异常: {str(e)}")
-        raise Exception(f"删除 ALB 访问控制条目时发生错误: {str(e)}")
\ No newline at end of file
+        logger.error("同步 ALB 访问控制条目异常: {}", e)
+        raise Exception(f"同步 ALB 访问控制条目时发生错误: {str(e)}")
+
+    failed = len(summary["failures"])
+    return ReconcileResponse(
+        success=not failed,
+        message="同步完成" if not failed else f"同步完成，{failed} 个网段写入失败",
+        resource_id=acl_id,
+        region=region or settings.default_region,
+        **summary
+    )
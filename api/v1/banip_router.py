@@ -3,9 +3,26 @@ BanIP 聚合接口路由
 提供一键封禁和解封IP的功能，同时操作ALB和ECS安全组
 """
 
-from fastapi import APIRouter, Depends
+import asyncio
+import time
+from datetime import datetime
+from collections import Counter
+from typing import Dict, List, Any, Tuple, Optional, Awaitable, Callable
+from fastapi import APIRouter, Depends, HTTPException, File, Query, Request, Response, UploadFile
+from fastapi.responses import StreamingResponse
 from loguru import logger
-from services.alicloud import AliCloudClient
+from core.config import settings
+from core.deadline import complete_on_cancel
+from core.logger import sampled_logger
+from services.alicloud import AliCloudClient, aliyun_client_dependency, collect_batch_failures, collect_batch_skipped
+from services.cidr import normalize_cidr
+from services.targets import BanTarget, get_ban_targets, fan_out
+from services.ban_queue import get_ban_queue, blocking_breakers, BAN, UNBAN, STATUS_PENDING, STATUS_DONE
+from services.ledger import BanRecord, applied_target, ban_expiry, ban_records, record_bans, release_bans, revoke_banned_cidrs
+from services.banlist import iter_ban_list_pages, iter_uploaded_ips, iter_batches, encode_ndjson, encode_csv
+from api.errors import circuit_open_error
+from api.idempotency import idempotency_key_header, run_idempotent
+from api.static import PrecomputedResponse
 from api.models import (
     BanIPRequest,
     BanIPResponse,
@@ -19,263 +36,820 @@ from api.models import (
     AddEntriesToAclResponse,
     AuthorizeSecurityGroupResponse,
     RemoveEntriesFromAclResponse,
-    RevokeSecurityGroupResponse
+    RevokeSecurityGroupResponse,
+    BulkBanIPRequest,
+    BulkBanIPResponse,
+    BulkUnbanIPRequest,
+    BulkUnbanIPResponse,
+    BulkIPResult,
+    BanTargetResult,
+    BanImportResponse,
+    QueuedIPResponse
 )
-from core.config import settings
 
 # 创建路由器实例
 router = APIRouter()
 
-# 初始化阿里云客户端
-aliyun_client = AliCloudClient()
+def _to_cidr(ip: str) -> str:
+    """转换为规范的CIDR格式（IPv4 为 /32，IPv6 为 /128），无效地址返回 400"""
+    try:
+        return normalize_cidr(ip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-@router.post("/ban", response_model=BanIPResponse, tags=["IP封禁聚合接口"])
-async def ban_ip(request: BanIPRequest):
-    """一键封禁IP：同时添加到ALB黑名单和ECS拒绝规则"""
-    logger.info(f"收到封禁IP请求: {request.ip}")
+def _divert_if_circuit_open(
+    action: str,
+    targets: List[BanTarget],
+    cidr_ip: str,
+    description: Optional[str],
+    ttl_seconds: Optional[float] = None
+) -> Optional[str]:
+    """
+    写入所需的云 API 熔断时：CIRCUIT_BREAKER_DIVERT 为 true 则转入写回队列并返回请求 ID（熔断恢复后写入），
+    否则返回 503；未熔断时返回 None
+    """
+    blocked = blocking_breakers(targets, [action])
+    if not blocked:
+        return None
+    names = ", ".join(f"{breaker.operation} ({breaker.region})" for breaker in blocked)
+    if not settings.circuit_breaker_divert:
+        raise circuit_open_error(names, max(breaker.snapshot()["retry_after"] for breaker in blocked))
+    request_id, _ = get_ban_queue().submit(action, cidr_ip, description, ttl_seconds)
+    logger.warning("云 API 熔断中，{} 转入写回队列: {} ({})", action, cidr_ip, names)
+    return request_id
 
-    # 转换为CIDR格式
-    cidr_ip = f"{request.ip}/32" if "/" not in request.ip else request.ip
-    description = request.description or f"IP封禁 - {request.ip}"
+_COVERED_MESSAGE = "已被现有的永久条目覆盖，不会自动解封"
+
+def _queued_message(action: str, request_id: str) -> str:
+    return f"云 API 熔断中，{action}请求已转入写回队列，可通过 /api/v1/banip/queue/{request_id} 查询结果"
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+async def _timed(coro) -> Tuple[Any, float]:
+    """执行协程并返回 (结果, 耗时毫秒)"""
+    start = time.perf_counter()
+    result = await coro
+    return result, round((time.perf_counter() - start) * 1000, 2)
+
+async def _run_legs(alb_leg: Optional[Awaitable], ecs_leg: Optional[Awaitable]) -> Tuple[Any, float, Any, float]:
+    """并发执行一个目标的 ALB 与 ECS 两路，未配置的一路结果为 None"""
+    async def run(leg):
+        return (None, 0.0) if leg is None else await _timed(leg)
 
-    alb_result = None
-    ecs_result = None
-    success_count = 0
+    (alb_result, alb_ms), (ecs_result, ecs_ms) = await asyncio.gather(run(alb_leg), run(ecs_leg))
+    return alb_result, alb_ms, ecs_result, ecs_ms
 
+def _aggregate_legs(
+    action: str,
+    ip: str,
+    targets: List[BanTarget],
+    legs: List[Tuple[Any, float, Any, float]],
+    total_ms: float
+) -> Dict[str, Any]:
+    """汇总所有目标的结果：至少一路成功即视为成功，alb_result/ecs_result 取第一个配置了该路的目标"""
+    target_results = []
+    for target, (alb_result, alb_ms, ecs_result, ecs_ms) in zip(targets, legs):
+        errors = [result.message for result in (alb_result, ecs_result) if result is not None and not result.success]
+        target_results.append(BanTargetResult(
+            region=target.region,
+            acl_id=target.acl_id,
+            security_group_id=target.security_group_id,
+            alb_success=None if alb_result is None else alb_result.success,
+            ecs_success=None if ecs_result is None else ecs_result.success,
+            message="; ".join(errors),
+            elapsed_ms=max(alb_ms, ecs_ms)
+        ))
+
+    alb_results = [leg[0] for leg in legs if leg[0] is not None]
+    ecs_results = [leg[2] for leg in legs if leg[2] is not None]
+    total = len(alb_results) + len(ecs_results)
+    success_count = sum(1 for result in alb_results + ecs_results if result.success)
+
+    if success_count >= 1:
+        # 至少有一个成功就算成功
+        overall_success = True
+        message = f"IP{action}完成（成功{success_count}/{total}）"
+    else:
+        overall_success = False
+        message = f"IP{action}失败（ALB和ECS均失败）"
+
+    return {
+        "success": overall_success,
+        "message": message,
+        "ip": ip,
+        "alb_result": alb_results[0] if alb_results else None,
+        "ecs_result": ecs_results[0] if ecs_results else None,
+        # alb/ecs 为所有目标中最慢的一路
+        "timings": {
+            "alb": max((leg[1] for leg in legs), default=0.0),
+            "ecs": max((leg[3] for leg in legs), default=0.0),
+            "total": total_ms
+        },
+        "targets": target_results
+    }
+
+async def _ban_alb(aliyun_client: AliCloudClient, ip: str, cidr_ip: str, description: str, acl_id: str) -> AddEntriesToAclResponse:
+    """封禁ALB访问"""
     try:
-        # 尝试封禁ALB访问
-        try:
-            result = aliyun_client.add_entries_to_acl(
-                acl_id=settings.default_alb_acl_id,
-                source_cidr_ip=cidr_ip,
-                description=description
-            )
+        result = await aliyun_client.add_entries_to_acl_async(
+            acl_id=acl_id,
+            source_cidr_ip=cidr_ip,
+            description=description
+        )
 
-            if result["success"]:
-                logger.info(f"ALB封禁成功: {request.ip}")
-                alb_result = AddEntriesToAclResponse(
-                    success=True,
-                    message="ALB封禁成功",
-                    acl_entry_ip=cidr_ip,
-                    description=description,
-                    acl_id=settings.default_alb_acl_id
-                )
-                success_count += 1
-            else:
-                logger.error(f"ALB封禁失败: {result['error']}")
-                alb_result = AddEntriesToAclResponse(
-                    success=False,
-                    message=f"ALB封禁失败: {result['error']}",
-                    acl_entry_ip=cidr_ip,
-                    description=description,
-                    acl_id=settings.default_alb_acl_id
-                )
-        except Exception as e:
-            logger.error(f"ALB封禁异常: {str(e)}")
-            alb_result = AddEntriesToAclResponse(
-                success=False,
-                message=f"ALB封禁异常: {str(e)}",
+        if result["success"]:
+            sampled_logger.info("ALB封禁成功: {}", ip)
+            return AddEntriesToAclResponse(
+                success=True,
+                message="ALB封禁成功",
                 acl_entry_ip=cidr_ip,
                 description=description,
-                acl_id=aliyun_client.default_alb_acl_id
+                acl_id=acl_id,
+                existing=bool(result.get("skipped"))
             )
 
-        # 尝试封禁ECS访问（拒绝规则）
-        try:
-            result = aliyun_client.authorize_security_group(
-                source_cidr_ip=cidr_ip,
-                policy="Drop",  # 拒绝访问
-                description=description,
-                security_group_id=settings.default_security_group_id
-            )
+        logger.error("ALB封禁失败: {}", result['error'])
+        return AddEntriesToAclResponse(
+            success=False,
+            message=f"ALB封禁失败: {result['error']}",
+            acl_entry_ip=cidr_ip,
+            description=description,
+            acl_id=acl_id
+        )
+    except Exception as e:
+        logger.error("ALB封禁异常: {}", e)
+        return AddEntriesToAclResponse(
+            success=False,
+            message=f"ALB封禁异常: {str(e)}",
+            acl_entry_ip=cidr_ip,
+            description=description,
+            acl_id=acl_id
+        )
 
-            if result["success"]:
-                logger.info(f"ECS封禁成功: {request.ip}")
-                ecs_result = AuthorizeSecurityGroupResponse(
-                    success=True,
-                    message="ECS封禁成功",
-                    source_cidr_ip=cidr_ip,
-                    security_group_id=settings.default_security_group_id,
-                    authorization_rule_id="generated_rule_id"
-                )
-                success_count += 1
-            else:
-                logger.error(f"ECS封禁失败: {result['error']}")
-                ecs_result = AuthorizeSecurityGroupResponse(
-                    success=False,
-                    message=f"ECS封禁失败: {result['error']}",
-                    source_cidr_ip=cidr_ip,
-                    security_group_id=settings.default_security_group_id,
-                    authorization_rule_id=""
-                )
-        except Exception as e:
-            logger.error(f"ECS封禁异常: {str(e)}")
-            ecs_result = AuthorizeSecurityGroupResponse(
-                success=False,
-                message=f"ECS封禁异常: {str(e)}",
+async def _ban_ecs(aliyun_client: AliCloudClient, ip: str, cidr_ip: str, description: str, security_group_id: str) -> AuthorizeSecurityGroupResponse:
+    """封禁ECS访问（拒绝规则）"""
+    try:
+        result = await aliyun_client.authorize_security_group_async(
+            source_cidr_ip=cidr_ip,
+            policy="Drop",  # 拒绝访问
+            description=description,
+            security_group_id=security_group_id
+        )
+
+        if result["success"]:
+            sampled_logger.info("ECS封禁成功: {}", ip)
+            return AuthorizeSecurityGroupResponse(
+                success=True,
+                message="ECS封禁成功",
                 source_cidr_ip=cidr_ip,
-                security_group_id=settings.default_security_group_id,
-                authorization_rule_id=""
+                security_group_id=security_group_id,
+                authorization_rule_id="generated_rule_id",
+                existing=bool(result.get("skipped"))
             )
 
-        # 判断整体成功率
-        if success_count >= 1:
-            # 至少有一个成功就算成功
-            overall_success = True
-            message = f"IP封禁完成（成功{success_count}/2）"
-        else:
-            overall_success = False
-            message = "IP封禁失败（ALB和ECS均失败）"
+        logger.error("ECS封禁失败: {}", result['error'])
+        return AuthorizeSecurityGroupResponse(
+            success=False,
+            message=f"ECS封禁失败: {result['error']}",
+            source_cidr_ip=cidr_ip,
+            security_group_id=security_group_id,
+            authorization_rule_id=""
+        )
+    except Exception as e:
+        logger.error("ECS封禁异常: {}", e)
+        return AuthorizeSecurityGroupResponse(
+            success=False,
+            message=f"ECS封禁异常: {str(e)}",
+            source_cidr_ip=cidr_ip,
+            security_group_id=security_group_id,
+            authorization_rule_id=""
+        )
+
+@router.post("/ban", response_model=BanIPResponse, tags=["IP封禁聚合接口"])
+async def ban_ip(
+    request: BanIPRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Depends(idempotency_key_header),
+    aliyun_client: AliCloudClient = Depends(aliyun_client_dependency)
+):
+    """一键封禁IP：同时添加到ALB黑名单和ECS拒绝规则（支持 Idempotency-Key）"""
+    return await run_idempotent(
+        "banip/ban", idempotency_key, request, response, lambda: _ban_ip(request, response, aliyun_client)
+    )
 
+async def _ban_ip(request: BanIPRequest, response: Response, aliyun_client: AliCloudClient) -> BanIPResponse:
+    logger.debug("收到封禁IP请求: {}", request.ip)
+
+    # 转换为CIDR格式
+    cidr_ip = _to_cidr(request.ip)
+    description = request.description or f"IP封禁 - {request.ip}"
+
+    targets = get_ban_targets()
+    request_id = _divert_if_circuit_open(BAN, targets, cidr_ip, description, request.ttl_seconds)
+    if request_id is not None:
+        response.status_code = 202
         return BanIPResponse(
-            success=overall_success,
-            message=message,
-            ip=request.ip,
-            alb_result=alb_result,
-            ecs_result=ecs_result
+            success=True, message=_queued_message("封禁", request_id), ip=request.ip, queued_request_id=request_id
         )
 
+    async def apply() -> BanIPResponse:
+        # 各目标以及每个目标的 ALB 与 ECS 两路互不依赖，并发执行
+        start = time.perf_counter()
+        legs = await fan_out(targets, lambda target: _run_legs(
+            _ban_alb(aliyun_client.for_region(target.region), request.ip, cidr_ip, description, target.acl_id)
+            if target.acl_id else None,
+            _ban_ecs(aliyun_client.for_region(target.region), request.ip, cidr_ip, description, target.security_group_id)
+            if target.security_group_id else None
+        ))
+        total_ms = round((time.perf_counter() - start) * 1000, 2)
+        summary = _aggregate_legs("封禁", request.ip, targets, legs, total_ms)
+
+        # 写入成功的目标记入台账，到期后由后台任务自动解封；目标上已有条目的只延长台账中已有的到期封禁
+        expires_at = ban_expiry(request.ttl_seconds)
+        written, existing = [], []
+        for target, (alb_result, _, ecs_result, _) in zip(targets, legs):
+            target_written, target_existing = ban_records(
+                cidr_ip, target,
+                alb_result is not None and alb_result.success,
+                ecs_result is not None and ecs_result.success,
+                alb_existing=alb_result is not None and alb_result.existing,
+                ecs_existing=ecs_result is not None and ecs_result.existing,
+                expires_at=expires_at,
+                description=description
+            )
+            written += target_written
+            existing += target_existing
+        covered = await record_bans(written, existing)
+        if covered:
+            summary["message"] += f"，{_COVERED_MESSAGE}"
+
+        recorded = written or len(existing) > len(covered)
+        return BanIPResponse(**summary, expires_at=_isoformat(expires_at) if recorded else None)
+
+    try:
+        # 请求被放弃时已发起的写入仍会生效，写入与台账记录一起完成，否则有到期时间的封禁不会被自动解封
+        return await complete_on_cancel(apply())
     except Exception as e:
-        logger.error(f"IP封禁聚合接口异常: {str(e)}")
+        logger.error("IP封禁聚合接口异常: {}", e)
         raise Exception(f"IP封禁时发生错误: {str(e)}")
 
+async def _unban_alb(aliyun_client: AliCloudClient, ip: str, cidr_ip: str, acl_id: str) -> RemoveEntriesFromAclResponse:
+    """解封ALB访问"""
+    try:
+        result = await aliyun_client.remove_entries_from_acl_async(
+            acl_id=acl_id,
+            source_cidr_ip=cidr_ip
+        )
+
+        if result["success"]:
+            sampled_logger.info("ALB解封成功: {}", ip)
+            return RemoveEntriesFromAclResponse(
+                success=True,
+                message="ALB解封成功",
+                acl_entry_ip=cidr_ip,
+                acl_id=acl_id
+            )
+
+        logger.error("ALB解封失败: {}", result['error'])
+        return RemoveEntriesFromAclResponse(
+            success=False,
+            message=f"ALB解封失败: {result['error']}",
+            acl_entry_ip=cidr_ip,
+            acl_id=acl_id
+        )
+    except Exception as e:
+        logger.error("ALB解封异常: {}", e)
+        return RemoveEntriesFromAclResponse(
+            success=False,
+            message=f"ALB解封异常: {str(e)}",
+            acl_entry_ip=cidr_ip,
+            acl_id=acl_id
+        )
+
+async def _unban_ecs(aliyun_client: AliCloudClient, ip: str, cidr_ip: str, security_group_id: str) -> RevokeSecurityGroupResponse:
+    """解封ECS访问"""
+    try:
+        # 删除拒绝规则，安全组做过合并时一并拆分覆盖该 IP 的超网规则
+        failures = collect_batch_failures(
+            await revoke_banned_cidrs(aliyun_client, [cidr_ip], security_group_id), [cidr_ip]
+        )
+
+        if cidr_ip not in failures:
+            sampled_logger.info("ECS解封成功: {}", ip)
+            return RevokeSecurityGroupResponse(
+                success=True,
+                message="ECS解封成功",
+                source_cidr_ip=cidr_ip,
+                security_group_id=security_group_id
+            )
+
+        logger.error("ECS解封失败: {}", failures[cidr_ip])
+        return RevokeSecurityGroupResponse(
+            success=False,
+            message=f"ECS解封失败: {failures[cidr_ip]}",
+            source_cidr_ip=cidr_ip,
+            security_group_id=security_group_id
+        )
+    except Exception as e:
+        logger.error("ECS解封异常: {}", e)
+        return RevokeSecurityGroupResponse(
+            success=False,
+            message=f"ECS解封异常: {str(e)}",
+            source_cidr_ip=cidr_ip,
+            security_group_id=security_group_id
+        )
+
 @router.post("/unban", response_model=UnbanIPResponse, tags=["IP解封聚合接口"])
-async def unban_ip(request: UnbanIPRequest):
+async def unban_ip(
+    request: UnbanIPRequest,
+    response: Response,
+    aliyun_client: AliCloudClient = Depends(aliyun_client_dependency)
+):
     """一键解封IP：同时从ALB黑名单和ECS规则中删除"""
-    logger.info(f"收到解封IP请求: {request.ip}")
+    logger.debug("收到解封IP请求: {}", request.ip)
 
     # 转换为CIDR格式
-    cidr_ip = f"{request.ip}/32" if "/" not in request.ip else request.ip
+    cidr_ip = _to_cidr(request.ip)
 
-    alb_result = None
-    ecs_result = None
-    success_count = 0
+    targets = get_ban_targets()
+    request_id = _divert_if_circuit_open(UNBAN, targets, cidr_ip, request.description)
+    if request_id is not None:
+        response.status_code = 202
+        return UnbanIPResponse(
+            success=True, message=_queued_message("解封", request_id), ip=request.ip, queued_request_id=request_id
+        )
 
     try:
-        # 尝试解封ALB访问
-        try:
-            result = aliyun_client.remove_entries_from_acl(
-                acl_id=settings.default_alb_acl_id,
-                source_cidr_ip=cidr_ip
+        # 各目标以及每个目标的 ALB 与 ECS 两路互不依赖，并发执行
+        start = time.perf_counter()
+        legs = await fan_out(targets, lambda target: _run_legs(
+            _unban_alb(aliyun_client.for_region(target.region), request.ip, cidr_ip, target.acl_id)
+            if target.acl_id else None,
+            _unban_ecs(aliyun_client.for_region(target.region), request.ip, cidr_ip, target.security_group_id)
+            if target.security_group_id else None
+        ))
+        total_ms = round((time.perf_counter() - start) * 1000, 2)
+        summary = _aggregate_legs("解封", request.ip, targets, legs, total_ms)
+        await release_bans([
+            BanRecord(cidr_ip, applied)
+            for applied in (
+                applied_target(target, result.alb_success, result.ecs_success)
+                for target, result in zip(targets, summary["targets"])
             )
+            if applied is not None
+        ])
 
-            if result["success"]:
-                logger.info(f"ALB解封成功: {request.ip}")
-                alb_result = RemoveEntriesFromAclResponse(
-                    success=True,
-                    message="ALB解封成功",
-                    acl_entry_ip=cidr_ip,
-                    acl_id=settings.default_alb_acl_id
-                )
-                success_count += 1
-            else:
-                logger.error(f"ALB解封失败: {result['error']}")
-                alb_result = RemoveEntriesFromAclResponse(
-                    success=False,
-                    message=f"ALB解封失败: {result['error']}",
-                    acl_entry_ip=cidr_ip,
-                    acl_id=settings.default_alb_acl_id
-                )
-        except Exception as e:
-            logger.error(f"ALB解封异常: {str(e)}")
-            alb_result = RemoveEntriesFromAclResponse(
-                success=False,
-                message=f"ALB解封异常: {str(e)}",
-                acl_entry_ip=cidr_ip,
-                acl_id=settings.default_alb_acl_id
-            )
+        return UnbanIPResponse(**summary)
 
-        # 尝试解封ECS访问
-        try:
-            result = aliyun_client.revoke_security_group(
-                source_cidr_ip=cidr_ip,
-                policy="Drop",  # 删除拒绝规则
-                security_group_id=settings.default_security_group_id
+    except Exception as e:
+        logger.error("IP解封聚合接口异常: {}", e)
+        raise Exception(f"IP解封时发生错误: {str(e)}")
+
+# ==== 批量封禁/解封 ====
+
+def _group_by_cidr(ips: List[str]) -> Dict[str, str]:
+    """转换为CIDR并去重，保持原始顺序，返回 CIDR -> 原始IP"""
+    ip_by_cidr = {}
+    for ip in ips:
+        ip = ip.strip()
+        if ip:
+            try:
+                cidr_ip = normalize_cidr(ip)
+            except ValueError:
+                # 无效条目原样交给服务层，由其返回失败结果
+                cidr_ip = ip
+            ip_by_cidr.setdefault(cidr_ip, ip)
+    return ip_by_cidr
+
+def _api_calls(batch_results: List[Dict[str, Any]]) -> int:
+    """实际发生的云 API 调用次数（不含缓存命中跳过的条目）"""
+    return sum(1 for result in batch_results if not result.get("skipped"))
+
+async def _no_results() -> List[Dict[str, Any]]:
+    return []
+
+async def _run_bulk_targets(
+    targets: List[BanTarget],
+    alb_call: Callable[[BanTarget], Awaitable[List[Dict[str, Any]]]],
+    ecs_call: Callable[[BanTarget], Awaitable[List[Dict[str, Any]]]]
+) -> List[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+    """向所有目标并发执行批量调用，返回每个目标的 (ALB 结果, ECS 结果)；多个目标时失败原因带上地域"""
+    async def run(target: BanTarget):
+        return await asyncio.gather(
+            alb_call(target) if target.acl_id else _no_results(),
+            ecs_call(target) if target.security_group_id else _no_results()
+        )
+
+    target_results = []
+    for target, (alb, ecs) in zip(targets, await fan_out(targets, run)):
+        if len(targets) > 1:
+            alb = [{**r, "error": f"{target.region}: {r['error']}"} if not r["success"] else r for r in alb]
+            ecs = [{**r, "error": f"{target.region}: {r['error']}"} if not r["success"] else r for r in ecs]
+        target_results.append((alb, ecs))
+    return target_results
+
+def _build_bulk_results(
+    ip_by_cidr: Dict[str, str],
+    alb_results: List[Dict[str, Any]],
+    ecs_results: List[Dict[str, Any]]
+) -> List[BulkIPResult]:
+    """将分批调用结果展开为逐个IP的结果"""
+    alb_failures = collect_batch_failures(alb_results, list(ip_by_cidr))
+    ecs_failures = collect_batch_failures(ecs_results, list(ip_by_cidr))
+
+    results = []
+    for cidr_ip, ip in ip_by_cidr.items():
+        errors = []
+        if cidr_ip in alb_failures:
+            errors.append(f"ALB: {alb_failures[cidr_ip]}")
+        if cidr_ip in ecs_failures:
+            errors.append(f"ECS: {ecs_failures[cidr_ip]}")
+
+        alb_success = cidr_ip not in alb_failures
+        ecs_success = cidr_ip not in ecs_failures
+        results.append(BulkIPResult(
+            ip=ip,
+            cidr_ip=cidr_ip,
+            success=alb_success or ecs_success,
+            alb_success=alb_success,
+            ecs_success=ecs_success,
+            message="; ".join(errors)
+        ))
+    return results
+
+def _bulk_records(
+    cidr_ips: List[str],
+    targets: List[BanTarget],
+    target_results: List[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]],
+    expires_at: Optional[float] = None,
+    description: str = ""
+) -> Tuple[List[BanRecord], List[BanRecord]]:
+    """
+    台账按目标记录：每个 CIDR 在每个目标上只计入实际成功的一路，
+    拆分为 (本次写入的, 目标上已有条目、本次未写入的)
+    """
+    written, existing = [], []
+    for target, (alb, ecs) in zip(targets, target_results):
+        alb_failures = collect_batch_failures(alb, cidr_ips)
+        ecs_failures = collect_batch_failures(ecs, cidr_ips)
+        alb_skipped = collect_batch_skipped(alb)
+        ecs_skipped = collect_batch_skipped(ecs)
+        for cidr_ip in cidr_ips:
+            target_written, target_existing = ban_records(
+                cidr_ip, target, cidr_ip not in alb_failures, cidr_ip not in ecs_failures,
+                alb_existing=cidr_ip in alb_skipped,
+                ecs_existing=cidr_ip in ecs_skipped,
+                expires_at=expires_at,
+                description=description
             )
+            written += target_written
+            existing += target_existing
+    return written, existing
 
-            if result["success"]:
-                logger.info(f"ECS解封成功: {request.ip}")
-                ecs_result = RevokeSecurityGroupResponse(
-                    success=True,
-                    message="ECS解封成功",
-                    source_cidr_ip=cidr_ip,
-                    security_group_id=settings.default_security_group_id
+async def _apply_bulk(
+    aliyun_client: AliCloudClient,
+    action: str,
+    ip_by_cidr: Dict[str, str],
+    targets: List[BanTarget],
+    description: Optional[str] = None,
+    ttl_seconds: Optional[float] = None
+) -> Tuple[List[BulkIPResult], List[Dict[str, Any]], List[Dict[str, Any]], Optional[float]]:
+    """
+    向所有目标批量封禁/解封并更新封禁台账
+    返回 (逐个IP的结果, ALB 结果, ECS 结果, 封禁到期时间)
+    """
+    async def apply():
+        cidr_ips = list(ip_by_cidr)
+        expires_at = ban_expiry(ttl_seconds) if action == BAN else None
+        if action == BAN:
+            # 有到期时间的封禁不合并相邻网段：到期后按台账中的原网段删除，合并出的超网删不掉
+            target_results = await _run_bulk_targets(
+                targets,
+                lambda target: aliyun_client.for_region(target.region).add_entries_to_acl_batch_async(
+                    acl_id=target.acl_id,
+                    source_cidr_ips=cidr_ips,
+                    description=description,
+                    merge=expires_at is None
+                ),
+                lambda target: aliyun_client.for_region(target.region).authorize_security_group_batch_async(
+                    source_cidr_ips=cidr_ips,
+                    policy="Drop",  # 拒绝访问
+                    description=description,
+                    security_group_id=target.security_group_id,
+                    merge=expires_at is None
                 )
-                success_count += 1
-            else:
-                logger.error(f"ECS解封失败: {result['error']}")
-                ecs_result = RevokeSecurityGroupResponse(
-                    success=False,
-                    message=f"ECS解封失败: {result['error']}",
-                    source_cidr_ip=cidr_ip,
-                    security_group_id=settings.default_security_group_id
+            )
+        else:
+            target_results = await _run_bulk_targets(
+                targets,
+                lambda target: aliyun_client.for_region(target.region).remove_entries_from_acl_batch_async(
+                    acl_id=target.acl_id,
+                    source_cidr_ips=cidr_ips
+                ),
+                # 删除拒绝规则，安全组做过合并时一并拆分覆盖这些 IP 的超网规则
+                lambda target: revoke_banned_cidrs(
+                    aliyun_client.for_region(target.region), cidr_ips, target.security_group_id
                 )
-        except Exception as e:
-            logger.error(f"ECS解封异常: {str(e)}")
-            ecs_result = RevokeSecurityGroupResponse(
-                success=False,
-                message=f"ECS解封异常: {str(e)}",
-                source_cidr_ip=cidr_ip,
-                security_group_id=settings.default_security_group_id
             )
 
-        # 判断整体成功率
-        if success_count >= 1:
-            # 至少有一个成功就算成功
-            overall_success = True
-            message = f"IP解封完成（成功{success_count}/2）"
+        alb_results = [result for alb, _ in target_results for result in alb]
+        ecs_results = [result for _, ecs in target_results for result in ecs]
+        results = _build_bulk_results(ip_by_cidr, alb_results, ecs_results)
+
+        if action == BAN:
+            written, existing = _bulk_records(cidr_ips, targets, target_results, expires_at, description or "")
+            covered = {record.cidr_ip for record in await record_bans(written, existing)}
+            for result in results:
+                if result.cidr_ip in covered:
+                    result.message = "; ".join(filter(None, [result.message, _COVERED_MESSAGE]))
         else:
-            overall_success = False
-            message = "IP解封失败（ALB和ECS均失败）"
+            # 解封时目标上已没有的条目同样移出台账
+            written, existing = _bulk_records(cidr_ips, targets, target_results)
+            await release_bans(written + existing)
+        return results, alb_results, ecs_results, expires_at
 
-        return UnbanIPResponse(
-            success=overall_success,
-            message=message,
-            ip=request.ip,
-            alb_result=alb_result,
-            ecs_result=ecs_result
+    # 请求被放弃时已发起的写入仍会生效，写入与台账更新一起完成
+    return await complete_on_cancel(apply())
+
+@router.post("/ban-bulk", response_model=BulkBanIPResponse, tags=["IP封禁聚合接口"])
+async def ban_ip_bulk(
+    request: BulkBanIPRequest,
+    aliyun_client: AliCloudClient = Depends(aliyun_client_dependency)
+):
+    """批量封禁IP：按各API单次上限打包，同时添加到ALB黑名单和ECS拒绝规则"""
+    logger.debug("收到批量封禁IP请求: {} 个", len(request.ips))
+
+    ip_by_cidr = _group_by_cidr(request.ips)
+    description = request.description or f"IP批量封禁 - {len(ip_by_cidr)} 个"
+
+    try:
+        results, alb_results, ecs_results, expires_at = await _apply_bulk(
+            aliyun_client, BAN, ip_by_cidr, get_ban_targets(), description, request.ttl_seconds
+        )
+        succeeded = sum(1 for result in results if result.success)
+        logger.info("批量封禁完成: 成功{}/{}，API 调用 ALB {} 次、ECS {} 次", succeeded, len(results), _api_calls(alb_results), _api_calls(ecs_results))
+
+        return BulkBanIPResponse(
+            success=succeeded > 0,
+            message=f"IP批量封禁完成（成功{succeeded}/{len(results)}）",
+            total=len(results),
+            succeeded=succeeded,
+            failed=len(results) - succeeded,
+            alb_api_calls=_api_calls(alb_results),
+            ecs_api_calls=_api_calls(ecs_results),
+            results=results,
+            expires_at=_isoformat(expires_at) if succeeded else None
         )
 
     except Exception as e:
-        logger.error(f"IP解封聚合接口异常: {str(e)}")
-        raise Exception(f"IP解封时发生错误: {str(e)}")
+        logger.error("IP批量封禁接口异常: {}", e)
+        raise Exception(f"IP批量封禁时发生错误: {str(e)}")
+
+@router.post("/unban-bulk", response_model=BulkUnbanIPResponse, tags=["IP解封聚合接口"])
+async def unban_ip_bulk(
+    request: BulkUnbanIPRequest,
+    aliyun_client: AliCloudClient = Depends(aliyun_client_dependency)
+):
+    """批量解封IP：按各API单次上限打包，同时从ALB黑名单和ECS规则中删除"""
+    logger.debug("收到批量解封IP请求: {} 个", len(request.ips))
+
+    ip_by_cidr = _group_by_cidr(request.ips)
+
+    try:
+        results, alb_results, ecs_results, _ = await _apply_bulk(
+            aliyun_client, UNBAN, ip_by_cidr, get_ban_targets()
+        )
+        succeeded = sum(1 for result in results if result.success)
+        logger.info("批量解封完成: 成功{}/{}，API 调用 ALB {} 次、ECS {} 次", succeeded, len(results), _api_calls(alb_results), _api_calls(ecs_results))
+
+        return BulkUnbanIPResponse(
+            success=succeeded > 0,
+            message=f"IP批量解封完成（成功{succeeded}/{len(results)}）",
+            total=len(results),
+            succeeded=succeeded,
+            failed=len(results) - succeeded,
+            alb_api_calls=_api_calls(alb_results),
+            ecs_api_calls=_api_calls(ecs_results),
+            results=results
+        )
+
+    except Exception as e:
+        logger.error("IP批量解封接口异常: {}", e)
+        raise Exception(f"IP批量解封时发生错误: {str(e)}")
+
+# ==== 导出/导入 ====
+
+# 导入响应中最多返回的失败条目数
+MAX_IMPORT_FAILURES = 100
+
+@router.get("/list", tags=["IP封禁聚合接口"])
+async def list_banned_ips(
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$", description="输出格式：ndjson 或 csv"),
+    aliyun_client: AliCloudClient = Depends(aliyun_client_dependency)
+):
+    """导出当前封禁列表：逐页读取各目标的 ALB 访问控制条目和安全组拒绝规则，以 NDJSON 或 CSV 流式返回"""
+    pages = iter_ban_list_pages(aliyun_client, get_ban_targets())
+
+    if fmt == "csv":
+        async def csv_body():
+            yield encode_csv([], header=True)
+            async for page in pages:
+                yield encode_csv(page)
+
+        return StreamingResponse(
+            csv_body(),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": 'attachment; filename="banlist.csv"'}
+        )
+
+    async def ndjson_body():
+        async for page in pages:
+            yield encode_ndjson(page)
+
+    return StreamingResponse(ndjson_body(), media_type="application/x-ndjson")
+
+@router.post("/import", response_model=BanImportResponse, tags=["IP封禁聚合接口"])
+async def import_banned_ips(
+    file: UploadFile = File(..., description="每行一个IP/CIDR，支持 # 注释；CSV 文件按表头中的 cidr_ip/ip 列读取"),
+    action: str = Query(BAN, pattern="^(ban|unban)$", description="ban 封禁或 unban 解封"),
+    ttl_seconds: Optional[float] = Query(None, ge=0, description="封禁时长（秒），0 表示永久，不传时使用 BAN_DEFAULT_TTL"),
+    description: Optional[str] = Query(None, description="封禁描述"),
+    aliyun_client: AliCloudClient = Depends(aliyun_client_dependency)
+):
+    """
+    导入封禁列表：流式读取上传文件，每 BAN_IMPORT_BATCH_SIZE 个IP一批写入所有目标
+    已处于目标状态的条目由状态缓存跳过，只写入差异部分
+    """
+    targets = get_ban_targets()
+    description = description or f"IP导入 - {file.filename}"
+    legs = sum(bool(target.acl_id) + bool(target.security_group_id) for target in targets)
+
+    total = succeeded = unchanged = batches = alb_calls = ecs_calls = 0
+    failures: List[BulkIPResult] = []
+    expires_at = None
+    try:
+        async for batch in iter_batches(iter_uploaded_ips(file.read), settings.ban_import_batch_size):
+            ip_by_cidr = _group_by_cidr(batch)
+            results, alb_results, ecs_results, expires_at = await _apply_bulk(
+                aliyun_client, action, ip_by_cidr, targets, description, ttl_seconds
+            )
+            skipped = Counter(
+                entry for result in alb_results + ecs_results if result.get("skipped") for entry in result["entries"]
+            )
+
+            batches += 1
+            total += len(results)
+            succeeded += sum(1 for result in results if result.success)
+            unchanged += sum(1 for cidr_ip in ip_by_cidr if legs and skipped[cidr_ip] >= legs)
+            alb_calls += _api_calls(alb_results)
+            ecs_calls += _api_calls(ecs_results)
+            room = MAX_IMPORT_FAILURES - len(failures)
+            if room > 0:
+                failures += [result for result in results if not result.success][:room]
+    except Exception as e:
+        logger.error("导入封禁列表异常: {}", e)
+        raise Exception(f"导入封禁列表时发生错误: {str(e)}")
+    finally:
+        await file.close()
+
+    verb = "封禁" if action == BAN else "解封"
+    logger.info("导入{}完成: 成功{}/{}，未变化 {} 个，API 调用 ALB {} 次、ECS {} 次", verb, succeeded, total, unchanged, alb_calls, ecs_calls)
+    return BanImportResponse(
+        success=total > 0 and succeeded > 0,
+        message=f"IP导入{verb}完成（成功{succeeded}/{total}）",
+        action=action,
+        total=total,
+        succeeded=succeeded,
+        failed=total - succeeded,
+        unchanged=unchanged,
+        batches=batches,
+        alb_api_calls=alb_calls,
+        ecs_api_calls=ecs_calls,
+        failures=failures,
+        expires_at=_isoformat(expires_at) if action == BAN and succeeded else None
+    )
+
+# ==== 写回队列 ====
+
+def _queued_response(result: Dict[str, Any]) -> QueuedIPResponse:
+    """将队列中的请求状态转换为响应"""
+    status = result["status"]
+    success = status != STATUS_DONE or bool(result.get("alb_success") or result.get("ecs_success"))
+    messages = {
+        STATUS_PENDING: "已加入写回队列，等待批量写入",
+        STATUS_DONE: result.get("message") or "批量写入完成",
+    }
+    return QueuedIPResponse(
+        success=success,
+        message=messages.get(status, "与相反操作抵消，未调用云 API"),
+        request_id=result["request_id"],
+        action=result["action"],
+        cidr_ip=result["cidr_ip"],
+        status=status,
+        alb_success=result.get("alb_success"),
+        ecs_success=result.get("ecs_success")
+    )
+
+async def _enqueue(action: str, ip: str, description: str, wait: bool, ttl_seconds: Optional[float] = None) -> QueuedIPResponse:
+    request_id, future = get_ban_queue().submit(action, _to_cidr(ip), description, ttl_seconds)
+    if wait:
+        return _queued_response(await future)
+    return _queued_response(await get_ban_queue().get_result(request_id))
+
+@router.post("/queue/ban", response_model=QueuedIPResponse, tags=["IP封禁聚合接口"])
+async def enqueue_ban_ip(request: BanIPRequest, wait: bool = False):
+    """通过写回队列封禁IP：短时间内的重复请求合并，批量写入ALB和ECS；wait=true 时等待写入结果"""
+    logger.debug("收到排队封禁IP请求: {}", request.ip)
+    return await _enqueue(BAN, request.ip, request.description or f"IP封禁 - {request.ip}", wait, request.ttl_seconds)
+
+@router.post("/queue/unban", response_model=QueuedIPResponse, tags=["IP解封聚合接口"])
+async def enqueue_unban_ip(request: UnbanIPRequest, wait: bool = False):
+    """通过写回队列解封IP：与尚未写入的封禁请求相互抵消；wait=true 时等待写入结果"""
+    logger.debug("收到排队解封IP请求: {}", request.ip)
+    return await _enqueue(UNBAN, request.ip, request.description, wait)
+
+@router.get("/queue/{request_id}", response_model=QueuedIPResponse, tags=["IP封禁聚合接口"])
+async def get_queued_request(request_id: str):
+    """查询写回队列中请求的状态"""
+    result = await get_ban_queue().get_result(request_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"请求不存在或已过期: {request_id}")
+    return _queued_response(result)
+
+# 使用示例（导入时序列化一次）
+BANIP_EXAMPLES = PrecomputedResponse({
+    "ban_ip": [
+        {
+            "description": "封禁恶意IP地址",
+            "request": {
+                "ip": "34.1.28.44",
+                "description": "恶意扫描IP"
+            },
+            "endpoint": "POST /api/v1/banip/ban"
+        },
+        {
+            "description": "封禁IP段",
+            "request": {
+                "ip": "192.168.1.100/24",
+                "description": "内部网络攻击"
+            },
+            "endpoint": "POST /api/v1/banip/ban"
+        }
+    ],
+    "unban_ip": [
+        {
+            "description": "解封误封IP",
+            "request": {
+                "ip": "34.1.28.44",
+                "description": "误封解除"
+            },
+            "endpoint": "POST /api/v1/banip/unban"
+        }
+    ],
+    "ban_ip_bulk": [
+        {
+            "description": "批量封禁WAF告警IP",
+            "request": {
+                "ips": ["34.1.28.44", "34.1.28.45", "10.10.0.0/24"],
+                "description": "WAF批量告警"
+            },
+            "endpoint": "POST /api/v1/banip/ban-bulk"
+        }
+    ],
+    "queue_ban_ip": [
+        {
+            "description": "通过写回队列封禁IP（立即返回请求ID）",
+            "request": {
+                "ip": "34.1.28.44",
+                "description": "检测器告警"
+            },
+            "endpoint": "POST /api/v1/banip/queue/ban"
+        },
+        {
+            "description": "查询排队请求的结果",
+            "endpoint": "GET /api/v1/banip/queue/{request_id}"
+        }
+    ],
+    "unban_ip_bulk": [
+        {
+            "description": "批量解封IP",
+            "request": {
+                "ips": ["34.1.28.44", "34.1.28.45"]
+            },
+            "endpoint": "POST /api/v1/banip/unban-bulk"
+        }
+    ],
+    "parameter_requirements": [
+        "IP地址可以是单个IP（如34.1.28.44）或CIDR格式（如34.1.28.44/32）",
+        "描述信息可选，用于记录封禁原因",
+        "封禁操作会同时作用于ALB和ECS安全组",
+        "解封操作需要确保之前有对应的封禁规则",
+        "批量接口按API单次上限打包（ALB每次20条，ECS每次100条），并返回逐个IP的结果"
+    ]
+})
 
 @router.get("/examples", tags=["BanIP 使用示例"])
-async def get_banip_examples():
+async def get_banip_examples(request: Request):
     """获取BanIP API使用示例"""
-    return {
-        "ban_ip": [
-            {
-                "description": "封禁恶意IP地址",
-                "request": {
-                    "ip": "34.1.28.44",
-                    "description": "恶意扫描IP"
-                },
-                "endpoint": "POST /api/v1/banip/ban"
-            },
-            {
-                "description": "封禁IP段",
-                "request": {
-                    "ip": "192.168.1.100/24",
-                    "description": "内部网络攻击"
-                },
-                "endpoint": "POST /api/v1/banip/ban"
-            }
-        ],
-        "unban_ip": [
-            {
-                "description": "解封误封IP",
-                "request": {
-                    "ip": "34.1.28.44",
-                    "description": "误封解除"
-                },
-                "endpoint": "POST /api/v1/banip/unban"
-            }
-        ],
-        "parameter_requirements": [
-            "IP地址可以是单个IP（如34.1.28.44）或CIDR格式（如34.1.28.44/32）",
-            "描述信息可选，用于记录封禁原因",
-            "封禁操作会同时作用于ALB和ECS安全组",
-            "解封操作需要确保之前有对应的封禁规则"
-        ]
-    }
\ No newline at end of file
+    return BANIP_EXAMPLES.respond(request)
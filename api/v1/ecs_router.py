@@ -3,14 +3,29 @@ ECS 安全组 API 路由
 实现 AuthorizeSecurityGroup 和 RevokeSecurityGroup 接口
 """
 
-from fastapi import APIRouter, Depends
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from loguru import logger
-from services.alicloud import AliCloudClient
+from core.logger import sampled_logger
+from core.config import settings
+from services.alicloud import AliCloudClient, aliyun_client_dependency
+from services.reconcile import reconcile_security_group
+from services.consolidate import consolidate_security_group
+from services.ledger import get_ban_ledger, mark_consolidated
+from api.idempotency import idempotency_key_header, run_idempotent
+from api.errors import raise_for_unavailable
+from api.static import PrecomputedResponse
 from api.models import (
     AuthorizeSecurityGroupRequest,
     AuthorizeSecurityGroupResponse,
     RevokeSecurityGroupRequest,
     RevokeSecurityGroupResponse,
+    ReconcileSecurityGroupRequest,
+    ReconcileResponse,
+    ConsolidateSecurityGroupRequest,
+    ConsolidateResponse,
     ErrorResponse,
     APIDocumentation
 )
@@ -18,9 +33,6 @@ from api.models import (
 # 创建路由器实例
 router = APIRouter()
 
-# 初始化阿里云客户端
-aliyun_client = AliCloudClient()
-
 # API 文档信息
 authorize_security_group_doc = APIDocumentation(
     title="添加ECS安全组入方向规则",
@@ -36,76 +48,93 @@ revoke_security_group_doc = APIDocumentation(
     parameter_info="参数说明: SourceCidrIp - 来源IP地址段（CIDR格式）；SecurityGroupId - 安全组ID（可选，默认从环境变量DEFAULT_SECURITY_GROUP_ID获取）；Policy - 访问策略；PortRange - 端口范围；IpProtocol - 协议类型。所有参数必须与添加规则时保持一致"
 )
 
+# 使用示例（导入时序列化一次）
+ECS_EXAMPLES = PrecomputedResponse({
+    "authorize_security_group": [
+        {
+            "description": "添加SSH访问规则",
+            "request": {
+                "security_group_id": "sg-bp19nke7purenpearpmb",
+                "source_cidr_ip": "192.168.1.100/32",
+                "description": "允许SSH访问",
+                "policy": "Accept",
+                "port_range": "22/22",
+                "ip_protocol": "TCP"
+            },
+            "endpoint": "POST /api/v1/ecs/authorize"
+        },
+        {
+            "description": "添加Web访问规则",
+            "request": {
+                "source_cidr_ip": "192.168.1.0/24",
+                "description": "允许HTTP和HTTPS访问",
+                "policy": "Accept",
+                "port_range": "80/443",
+                "ip_protocol": "TCP"
+            },
+            "endpoint": "POST /api/v1/ecs/authorize"
+        }
+    ],
+    "revoke_security_group": [
+        {
+            "description": "删除SSH访问规则",
+            "request": {
+                "security_group_id": "sg-bp19nke7purenpearpmb",
+                "source_cidr_ip": "192.168.1.100/32",
+                "policy": "Accept",
+                "port_range": "22/22",
+                "ip_protocol": "TCP"
+            },
+            "endpoint": "POST /api/v1/ecs/revoke"
+        }
+    ],
+    "parameter_requirements": [
+        "所有IP地址必须使用CIDR格式（如192.168.1.0/24）",
+        "安全组ID可选，不提供时使用环境变量DEFAULT_SECURITY_GROUP_ID的值",
+        "端口范围格式：起始端口/结束端口（如22/22或80/443）",
+        "协议类型：TCP、UDP、ICMP或ALL（大写）",
+        "删除规则时，所有参数必须与添加时完全一致"
+    ]
+})
+
 @router.get("/examples", tags=["ECS 使用示例"])
-async def get_ecs_examples():
+async def get_ecs_examples(request: Request):
     """获取 ECS API 使用示例"""
-    return {
-        "authorize_security_group": [
-            {
-                "description": "添加SSH访问规则",
-                "request": {
-                    "security_group_id": "sg-bp19nke7purenpearpmb",
-                    "source_cidr_ip": "192.168.1.100/32",
-                    "description": "允许SSH访问",
-                    "policy": "Accept",
-                    "port_range": "22/22",
-                    "ip_protocol": "TCP"
-                },
-                "endpoint": "POST /api/v1/ecs/authorize"
-            },
-            {
-                "description": "添加Web访问规则",
-                "request": {
-                    "source_cidr_ip": "192.168.1.0/24",
-                    "description": "允许HTTP和HTTPS访问",
-                    "policy": "Accept",
-                    "port_range": "80/443",
-                    "ip_protocol": "TCP"
-                },
-                "endpoint": "POST /api/v1/ecs/authorize"
-            }
-        ],
-        "revoke_security_group": [
-            {
-                "description": "删除SSH访问规则",
-                "request": {
-                    "security_group_id": "sg-bp19nke7purenpearpmb",
-                    "source_cidr_ip": "192.168.1.100/32",
-                    "policy": "Accept",
-                    "port_range": "22/22",
-                    "ip_protocol": "TCP"
-                },
-                "endpoint": "POST /api/v1/ecs/revoke"
-            }
-        ],
-        "parameter_requirements": [
-            "所有IP地址必须使用CIDR格式（如192.168.1.0/24）",
-            "安全组ID可选，不提供时使用环境变量DEFAULT_SECURITY_GROUP_ID的值",
-            "端口范围格式：起始端口/结束端口（如22/22或80/443）",
-            "协议类型：TCP、UDP、ICMP或ALL（大写）",
-            "删除规则时，所有参数必须与添加时完全一致"
-        ]
-    }
+    return ECS_EXAMPLES.respond(request)
 
 
+# 文档信息（导入时序列化一次）
+ECS_DOCUMENTATION = PrecomputedResponse({
+    "authorize_security_group": authorize_security_group_doc,
+    "revoke_security_group": revoke_security_group_doc
+})
+
 @router.get("/docs", tags=["ECS 安全文档"])
-async def get_ecs_documentation():
+async def get_ecs_documentation(request: Request):
     """获取 ECS 安全组 API 文档信息"""
-    return {
-        "authorize_security_group": authorize_security_group_doc,
-        "revoke_security_group": revoke_security_group_doc
-    }
+    return ECS_DOCUMENTATION.respond(request)
 
 @router.post("/authorize", response_model=AuthorizeSecurityGroupResponse, tags=["ECS 添加安全组规则"])
 async def authorize_security_group(
-    request: AuthorizeSecurityGroupRequest
+    request: AuthorizeSecurityGroupRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Depends(idempotency_key_header),
+    aliyun_client: AliCloudClient = Depends(aliyun_client_dependency)
 ):
-    """添加 ECS 安全组入方向规则 (AuthorizeSecurityGroup)"""
-    logger.info(f"收到添加 ECS 安全组规则请求: {request.source_cidr_ip}")
+    """添加 ECS 安全组入方向规则 (AuthorizeSecurityGroup)，支持 Idempotency-Key"""
+    return await run_idempotent(
+        "ecs/authorize", idempotency_key, request, response, lambda: _authorize_security_group(request, aliyun_client)
+    )
+
+async def _authorize_security_group(
+    request: AuthorizeSecurityGroupRequest,
+    aliyun_client: AliCloudClient
+) -> AuthorizeSecurityGroupResponse:
+    logger.debug("收到添加 ECS 安全组规则请求: {}", request.source_cidr_ip)
 
     try:
         # 调用阿里云客户端
-        result = aliyun_client.authorize_security_group(
+        result = await aliyun_client.authorize_security_group_async(
             source_cidr_ip=request.source_cidr_ip,
             security_group_id=request.security_group_id,
             description=request.description,
@@ -113,9 +142,10 @@ async def authorize_security_group(
             port_range=request.port_range,
             ip_protocol=request.ip_protocol
         )
+        raise_for_unavailable(result)
 
         if result["success"]:
-            logger.info(f"成功添加 ECS 安全组规则: {request.source_cidr_ip}")
+            sampled_logger.info("成功添加 ECS 安全组规则: {}", request.source_cidr_ip)
             return AuthorizeSecurityGroupResponse(
                 success=True,
                 message="添加 ECS 安全组规则成功",
@@ -124,7 +154,7 @@ async def authorize_security_group(
                 authorization_rule_id="generated_rule_id"  # 实际应从阿里云响应中获取
             )
         else:
-            logger.error(f"添加 ECS 安全组规则失败: {result['error']}")
+            logger.error("添加 ECS 安全组规则失败: {}", result['error'])
             return AuthorizeSecurityGroupResponse(
                 success=False,
                 message=f"添加失败: {result['error']}",
@@ -133,29 +163,33 @@ async def authorize_security_group(
                 authorization_rule_id=""
             )
 
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"添加 ECS 安全组规则异常: {str(e)}")
+        logger.error("添加 ECS 安全组规则异常: {}", e)
         raise Exception(f"添加 ECS 安全组规则时发生错误: {str(e)}")
 
 @router.post("/revoke", response_model=RevokeSecurityGroupResponse, tags=["ECS 删除安全组规则"])
 async def revoke_security_group(
-    request: RevokeSecurityGroupRequest
+    request: RevokeSecurityGroupRequest,
+    aliyun_client: AliCloudClient = Depends(aliyun_client_dependency)
 ):
     """删除 ECS 安全组入方向规则 (RevokeSecurityGroup)"""
-    logger.info(f"收到删除 ECS 安全组规则请求: {request.source_cidr_ip}")
+    logger.debug("收到删除 ECS 安全组规则请求: {}", request.source_cidr_ip)
 
     try:
         # 调用阿里云客户端
-        result = aliyun_client.revoke_security_group(
+        result = await aliyun_client.revoke_security_group_async(
             source_cidr_ip=request.source_cidr_ip,
             security_group_id=request.security_group_id,
             policy=request.policy,
             port_range=request.port_range,
             ip_protocol=request.ip_protocol
         )
+        raise_for_unavailable(result)
 
         if result["success"]:
-            logger.info(f"成功删除 ECS 安全组规则: {request.source_cidr_ip}")
+            sampled_logger.info("成功删除 ECS 安全组规则: {}", request.source_cidr_ip)
             return RevokeSecurityGroupResponse(
                 success=True,
                 message="删除 ECS 安全组规则成功",
@@ -163,7 +197,7 @@ async def revoke_security_group(
                 security_group_id=request.security_group_id or aliyun_client.default_security_group_id
             )
         else:
-            logger.error(f"删除 ECS 安全组规则失败: {result['error']}")
+            logger.error("删除 ECS 安全组规则失败: {}", result['error'])
             return RevokeSecurityGroupResponse(
                 success=False,
                 message=f"删除失败: {result['error']}",
@@ -171,6 +205,81 @@ async def revoke_security_group(
                 security_group_id=request.security_group_id or aliyun_client.default_security_group_id
             )
 
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"删除 ECS 安全组规则异常: {str(e)}")
-        raise Exception(f"删除 ECS 安全组规则时发生错误: {str(e)}")
\ No newline at end of file
+        logger.error("删除 ECS 安全组规则异常: {}", e)
+        raise Exception(f"删除 ECS 安全组规则时发生错误: {str(e)}")
+
+@router.put("/security-groups/{security_group_id}/rules", response_model=ReconcileResponse, tags=["ECS 期望状态同步"])
+async def reconcile_security_group_rules(
+    security_group_id: str,
+    request: ReconcileSecurityGroupRequest,
+    region: Optional[str] = Query(None, description="地域，默认 DEFAULT_REGION"),
+    aliyun_client: AliCloudClient = Depends(aliyun_client_dependency)
+):
+    """把安全组中策略、端口和协议匹配的入方向规则同步为请求中的完整网段列表，只写入差异"""
+    logger.debug("收到安全组同步请求: {} 期望 {} 条", security_group_id, len(request.cidrs))
+
+    try:
+        summary = await reconcile_security_group(
+            aliyun_client.for_region(region),
+            security_group_id,
+            request.cidrs,
+            dry_run=request.dry_run,
+            description=request.description,
+            policy=request.policy,
+            port_range=request.port_range,
+            ip_protocol=request.ip_protocol
+        )
+    except Exception as e:
+        logger.error("同步 ECS 安全组规则异常: {}", e)
+        raise Exception(f"同步 ECS 安全组规则时发生错误: {str(e)}")
+
+    failed = len(summary["failures"])
+    return ReconcileResponse(
+        success=not failed,
+        message="同步完成" if not failed else f"同步完成，{failed} 个网段写入失败",
+        resource_id=security_group_id,
+        region=region or settings.default_region,
+        **summary
+    )
+
+@router.post("/security-groups/{security_group_id}/consolidate", response_model=ConsolidateResponse, tags=["ECS 规则合并"])
+async def consolidate_security_group_rules(
+    security_group_id: str,
+    request: ConsolidateSecurityGroupRequest,
+    region: Optional[str] = Query(None, description="地域，默认 DEFAULT_REGION"),
+    aliyun_client: AliCloudClient = Depends(aliyun_client_dependency)
+):
+    """合并安全组中的封禁规则：相邻网段合并为超网，超出上限的网段移入前缀列表；台账中有到期时间的封禁保持原样"""
+    region = region or settings.default_region
+    logger.debug("收到安全组规则合并请求: {} ({})", security_group_id, region)
+
+    try:
+        ledger = get_ban_ledger()
+        pinned = await asyncio.to_thread(ledger.expiring_cidrs, region, security_group_id) if ledger is not None else []
+        summary = await consolidate_security_group(
+            aliyun_client.for_region(region),
+            security_group_id,
+            dry_run=request.dry_run,
+            max_rules=settings.sg_consolidate_max_rules if request.max_rules is None else request.max_rules,
+            prefix_list_id=request.prefix_list_id or settings.sg_consolidate_prefix_list_id or None,
+            pinned=pinned,
+            description=request.description
+        )
+        if not request.dry_run and summary["merges"]:
+            # 记录安全组做过合并，之后解封被超网或前缀列表覆盖的网段时拆分覆盖它的规则
+            await mark_consolidated(region, security_group_id, summary["prefix_list_id"])
+    except Exception as e:
+        logger.error("合并 ECS 安全组规则异常: {}", e)
+        raise Exception(f"合并 ECS 安全组规则时发生错误: {str(e)}")
+
+    failed = len(summary["failures"])
+    return ConsolidateResponse(
+        success=not failed,
+        message=f"合并完成，减少 {summary['rules_saved']} 条规则" if not failed else f"合并完成，{failed} 个网段写入失败",
+        security_group_id=security_group_id,
+        region=region,
+        **summary
+    )
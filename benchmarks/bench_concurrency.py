@@ -0,0 +1,61 @@
+"""
+并发基准测试
+对比同步串行调用与线程池异步调用在 N 个并发请求下的总耗时
+
+用法: python -m benchmarks.bench_concurrency --requests 32 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import time
+
+from services.alicloud import AliCloudClient
+
+
+class SlowAlbClient:
+    """模拟固定往返延迟的 ALB SDK 客户端"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def add_entries_to_acl_with_options(self, request, runtime):
+        time.sleep(self.latency)
+        return {"acl_id": request.acl_id}
+
+
+def run_sequential(client: AliCloudClient, n: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        client.add_entries_to_acl("acl-bench", f"10.0.{i // 256}.{i % 256}/32")
+    return time.perf_counter() - start
+
+
+async def run_concurrent(client: AliCloudClient, n: int) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        client.add_entries_to_acl_async("acl-bench", f"10.0.{i // 256}.{i % 256}/32")
+        for i in range(n)
+    ))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AliCloudClient 并发基准测试")
+    parser.add_argument("--requests", type=int, default=16, help="并发请求数")
+    parser.add_argument("--latency", type=float, default=0.2, help="模拟的单次往返延迟（秒）")
+    args = parser.parse_args()
+
+    client = AliCloudClient()
+    client.alb_client = SlowAlbClient(args.latency)
+
+    sequential = run_sequential(client, args.requests)
+    concurrent = asyncio.run(run_concurrent(client, args.requests))
+    client.close()
+
+    print(f"请求数: {args.requests}  单次延迟: {args.latency * 1000:.0f}ms")
+    print(f"串行调用:   {sequential:.3f}s")
+    print(f"并发调用:   {concurrent:.3f}s  ({concurrent / args.latency:.1f} 个往返)")
+
+
+if __name__ == "__main__":
+    main()
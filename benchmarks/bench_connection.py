@@ -0,0 +1,70 @@
+"""
+连接复用基准测试
+对比冷连接（每次请求新建 TCP/TLS 连接）与热连接（共享客户端连接池复用）的单次请求延迟
+
+使用只读的 ListAclEntries 接口，不修改任何云上资源；未配置 AK/SK 时接口会返回鉴权错误，
+但仍完成一次完整的网络往返，可用于对比连接建立开销。
+
+用法: python -m benchmarks.bench_connection --requests 20
+"""
+
+import argparse
+import statistics
+import time
+
+from alibabacloud_alb20200616 import models as AlbModels
+from core.config import settings
+from services.alicloud import AliCloudClient
+
+
+def _reset_connection_pool():
+    """清空 SDK 按域名缓存的 HTTP 会话，强制下一次请求重新建立连接"""
+    try:
+        from darabonba.core import DaraCore
+        for session in DaraCore._sessions.values():
+            session.close()
+        DaraCore._sessions.clear()
+    except ImportError:
+        pass
+
+
+def _list_acl_entries(client: AliCloudClient, acl_id: str) -> float:
+    request = AlbModels.ListAclEntriesRequest(acl_id=acl_id, max_results=1)
+    start = time.perf_counter()
+    try:
+        client.alb_client.list_acl_entries_with_options(request, client.runtime)
+    except Exception:
+        pass
+    return (time.perf_counter() - start) * 1000
+
+
+def _summary(name: str, samples):
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{name}: p50={p50:.1f}ms  p99={p99:.1f}ms  mean={statistics.mean(samples):.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷/热连接单次请求延迟对比")
+    parser.add_argument("--requests", type=int, default=20, help="每组请求数")
+    parser.add_argument("--acl-id", default=settings.default_alb_acl_id, help="用于只读查询的 ACL ID")
+    args = parser.parse_args()
+
+    client = AliCloudClient()
+
+    cold = []
+    for _ in range(args.requests):
+        _reset_connection_pool()
+        cold.append(_list_acl_entries(client, args.acl_id))
+
+    _list_acl_entries(client, args.acl_id)  # 预热
+    warm = [_list_acl_entries(client, args.acl_id) for _ in range(args.requests)]
+    client.close()
+
+    _summary("冷连接", cold)
+    _summary("热连接", warm)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+日志开销微基准
+模拟一次单 IP 封禁请求（ALB + ECS 两路）在请求线程上产生的日志，比较每个请求的日志耗时：
+
+- 原配置：同步写入、文本格式、f-string，每次调用输出全部 INFO 行（共 9 行）
+- 新配置：后台线程写入、JSON、惰性格式化，调用明细降为 DEBUG，重复的成功日志按调用位置限速
+
+日志写到行缓冲的临时文件，模拟容器中逐行写出的 stderr
+用法: python -m benchmarks.bench_logging
+"""
+
+import sys
+import tempfile
+import time
+
+from loguru import logger
+
+from core.logger import sampled_logger, setup_logging
+
+REQUESTS = 20_000
+IP = "203.0.113.7/32"
+PROTOCOL = "ALL"
+
+
+def _request_before():
+    logger.info(f"收到封禁IP请求: {IP}")
+    logger.info(f"执行阿里云 API: AddEntriesToAcl ({1} 条)")
+    logger.info(f"API 响应: AddEntriesToAcl - 成功")
+    logger.info(f"ALB封禁成功: {IP}")
+    logger.info(f"authorize_security_group 被调用，ip_protocol={PROTOCOL}")
+    logger.info(f"执行阿里云 API: AuthorizeSecurityGroup ({1} 条)")
+    logger.info(f"实际传递的协议值: {PROTOCOL}")
+    logger.info(f"API 响应: AuthorizeSecurityGroup - 成功")
+    logger.info(f"ECS封禁成功: {IP}")
+
+
+def _request_after():
+    logger.debug("收到封禁IP请求: {}", IP)
+    logger.debug("执行阿里云 API: AddEntriesToAcl ({} 条)", 1)
+    sampled_logger.info("API 响应: AddEntriesToAcl - 成功 ({} 条)", 1)
+    sampled_logger.info("ALB封禁成功: {}", IP)
+    logger.debug("执行阿里云 API: AuthorizeSecurityGroup ({} 条, 协议 {})", 1, PROTOCOL)
+    sampled_logger.info("API 响应: AuthorizeSecurityGroup - 成功 ({} 条)", 1)
+    sampled_logger.info("ECS封禁成功: {}", IP)
+
+
+def _measure(request) -> float:
+    """返回每个请求在请求线程上的日志耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        request()
+    return (time.perf_counter() - start) / REQUESTS * 1e6
+
+
+def main():
+    with tempfile.TemporaryFile("w", buffering=1, encoding="utf-8") as sink:
+        logger.remove()
+        logger.add(sink, level="INFO")
+        before = _measure(_request_before)
+
+        setup_logging(level="INFO", json_output=True, enqueue=True, sample_per_second=0, log_file="", sink=sink)
+        unsampled = _measure(_request_after)
+        logger.complete()
+
+        setup_logging(level="INFO", json_output=True, enqueue=True, sample_per_second=5, log_file="", sink=sink)
+        after = _measure(_request_after)
+        logger.complete()
+
+    logger.remove()
+    logger.add(sys.stderr)
+    print(f"原配置（同步、文本、全部输出）:     {before:8.1f} µs/请求")
+    print(f"新配置（后台写入、JSON、不限速）:   {unsampled:8.1f} µs/请求")
+    print(f"新配置（后台写入、JSON、每秒 5 条）: {after:8.1f} µs/请求")
+
+
+if __name__ == "__main__":
+    main()
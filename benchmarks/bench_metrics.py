@@ -0,0 +1,48 @@
+"""
+指标记录开销微基准
+测量单线程和多线程下 inc/observe 的单次耗时，以及 render 的耗时
+
+用法: python -m benchmarks.bench_metrics
+"""
+
+import threading
+import time
+import timeit
+
+from core.metrics import MetricsRegistry
+
+ITERATIONS = 200_000
+THREADS = 8
+LABELS = (("operation", "AddEntriesToAcl"), ("region", "cn-hangzhou"))
+
+
+def _record(registry: MetricsRegistry, n: int):
+    for _ in range(n):
+        registry.inc("cloud_api_calls_total", LABELS)
+        registry.observe("cloud_api_call_duration_seconds", 0.12, LABELS)
+
+
+def main():
+    registry = MetricsRegistry()
+
+    inc = timeit.timeit(lambda: registry.inc("cloud_api_calls_total", LABELS), number=ITERATIONS)
+    observe = timeit.timeit(lambda: registry.observe("cloud_api_call_duration_seconds", 0.12, LABELS), number=ITERATIONS)
+    print(f"inc:     {inc / ITERATIONS * 1e9:8.0f} ns/次")
+    print(f"observe: {observe / ITERATIONS * 1e9:8.0f} ns/次")
+
+    per_thread = ITERATIONS // THREADS
+    threads = [threading.Thread(target=_record, args=(registry, per_thread)) for _ in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    print(f"{THREADS} 线程 inc+observe: {elapsed / (per_thread * THREADS) * 1e9:8.0f} ns/次")
+
+    render = timeit.timeit(registry.render, number=100)
+    print(f"render:  {render / 100 * 1e6:8.0f} µs/次")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+白名单匹配微基准
+对比线性扫描与 CIDRIndex 在不同网段数量下的单次查询耗时
+
+用法: python -m benchmarks.bench_whitelist
+"""
+
+import ipaddress
+import random
+import timeit
+
+from core.cidr_index import CIDRIndex
+
+SIZES = (10, 100, 1_000, 10_000, 100_000)
+LOOKUPS = 2_000
+
+
+def _random_networks(n: int, rng: random.Random):
+    networks = []
+    for _ in range(n):
+        prefix = rng.choice((16, 20, 24, 28, 32))
+        address = ipaddress.IPv4Address(rng.getrandbits(32))
+        networks.append(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+    return networks
+
+
+def _linear_lookup(networks, ip: str) -> bool:
+    ip_addr = ipaddress.ip_address(ip)
+    for network in networks:
+        if ip_addr in network:
+            return True
+    return False
+
+
+def main():
+    rng = random.Random(42)
+    probes = [str(ipaddress.IPv4Address(rng.getrandbits(32))) for _ in range(LOOKUPS)]
+
+    print(f"{'网段数':>8}  {'合并后':>8}  {'线性扫描(µs)':>14}  {'索引(µs)':>10}")
+    for size in SIZES:
+        networks = _random_networks(size, rng)
+        index = CIDRIndex(networks)
+
+        # 线性扫描在大规模下太慢，按比例减少样本数
+        linear_probes = probes[:max(20, LOOKUPS * 100 // size)]
+        linear = timeit.timeit(lambda: [_linear_lookup(networks, ip) for ip in linear_probes], number=1)
+        indexed = timeit.timeit(lambda: [ip in index for ip in probes], number=1)
+
+        print(f"{size:>8}  {len(index):>8}  {linear / len(linear_probes) * 1e6:>14.2f}  {indexed / len(probes) * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
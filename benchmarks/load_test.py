@@ -0,0 +1,109 @@
+"""
+接口压测
+用 httpx 以固定并发请求 /alb、/ecs、/banip 写接口，输出每个接口的吞吐量和 p50/p99 延迟
+默认在进程内通过 ASGI 直接调用应用并使用模拟云后端（CLOUD_BACKEND=fake），结果可在本地复现；
+指定 --url 时压测已运行的服务
+
+用法: python -m benchmarks.load_test --requests 500 --concurrency 32 --latency 0.05
+      python -m benchmarks.load_test --url http://localhost:6060 --endpoints banip
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from typing import Callable, Dict, List, Tuple
+
+import httpx
+
+# 各接口的请求路径和请求体（第 i 个请求使用不同 IP，避免被状态缓存跳过）
+SCENARIOS: Dict[str, Tuple[str, Callable[[int], dict]]] = {
+    "alb": ("/api/v1/alb/add-entries", lambda i: {
+        "acl_id": "acl-bench", "source_cidr_ip": f"10.1.{i // 256 % 256}.{i % 256}/32"
+    }),
+    "ecs": ("/api/v1/ecs/authorize", lambda i: {
+        "security_group_id": "sg-bench", "source_cidr_ip": f"10.2.{i // 256 % 256}.{i % 256}/32",
+        "policy": "Drop", "port_range": "-1/-1", "ip_protocol": "ALL"
+    }),
+    "banip": ("/api/v1/banip/ban", lambda i: {"ip": f"10.3.{i // 256 % 256}.{i % 256}"}),
+}
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """最近秩百分位数"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+async def run_scenario(client: httpx.AsyncClient, name: str, requests: int, concurrency: int) -> Dict[str, float]:
+    """以固定并发发送 requests 个请求，返回吞吐量、延迟分位数和失败数"""
+    path, body = SCENARIOS[name]
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            response = await client.post(path, json=body(i))
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200 or not response.json().get("success", False):
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "throughput": requests / elapsed,
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+        "errors": errors,
+    }
+
+
+def build_client(url: str) -> httpx.AsyncClient:
+    """指定 URL 时通过网络访问，否则直接调用进程内应用"""
+    if url:
+        return httpx.AsyncClient(base_url=url, timeout=60)
+    from main import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+
+async def run(args) -> None:
+    async with build_client(args.url) as client:
+        print(f"{'接口':<8}{'请求数':>8}{'吞吐(req/s)':>14}{'p50(ms)':>10}{'p99(ms)':>10}{'失败':>6}")
+        for name in args.endpoints:
+            result = await run_scenario(client, name, args.requests, args.concurrency)
+            print(
+                f"{name:<8}{args.requests:>8}{result['throughput']:>14.1f}"
+                f"{result['p50'] * 1000:>10.1f}{result['p99'] * 1000:>10.1f}{result['errors']:>6}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="接口压测")
+    parser.add_argument("--url", default="", help="已运行服务的地址，为空时在进程内使用模拟云后端")
+    parser.add_argument("--endpoints", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS), help="压测的接口")
+    parser.add_argument("--requests", type=int, default=500, help="每个接口的请求数")
+    parser.add_argument("--concurrency", type=int, default=32, help="并发数")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟后端的单次往返延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟后端的随机错误率")
+    parser.add_argument("--throttle-qps", type=float, default=0.0, help="模拟后端每个 API 每秒配额，0 表示不限流")
+    parser.add_argument("--api-qps", type=float, default=0.0, help="服务端云 API 限流 QPS（API_RATE_LIMIT_QPS），0 表示不限流")
+    args = parser.parse_args()
+
+    if not args.url:
+        # 必须在导入应用（及其配置）之前设置
+        os.environ["CLOUD_BACKEND"] = "fake"
+        os.environ["FAKE_CLOUD_LATENCY"] = str(args.latency)
+        os.environ["FAKE_CLOUD_ERROR_RATE"] = str(args.error_rate)
+        os.environ["FAKE_CLOUD_THROTTLE_QPS"] = str(args.throttle_qps)
+        os.environ["API_RATE_LIMIT_QPS"] = str(args.api_qps)
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+CIDR 前缀索引
+加载时用 collapse_addresses 合并重叠和相邻网段，按 IPv4/IPv6 分别存成有序的整数区间，
+查询时二分查找，耗时与网段数量基本无关
+"""
+
+import ipaddress
+from bisect import bisect_right
+from typing import Iterable, List, Union
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+class CIDRIndex:
+    """不可变的 CIDR 索引，构建后可被多个请求并发读取"""
+
+    def __init__(self, networks: Iterable[IPNetwork]):
+        networks = list(networks)
+        self._starts = {}
+        self._ends = {}
+        self.networks: List[IPNetwork] = []
+        for version in (4, 6):
+            collapsed = list(ipaddress.collapse_addresses(n for n in networks if n.version == version))
+            self._starts[version] = [int(n.network_address) for n in collapsed]
+            self._ends[version] = [int(n.broadcast_address) for n in collapsed]
+            self.networks.extend(collapsed)
+
+    @classmethod
+    def from_strings(cls, items: Iterable[str], strict: bool = False) -> "CIDRIndex":
+        """从 IP/CIDR 字符串构建索引，strict=False 时跳过非法条目"""
+        networks = []
+        for item in items:
+            try:
+                networks.append(ipaddress.ip_network(item.strip(), strict=False))
+            except ValueError:
+                if strict:
+                    raise
+        return cls(networks)
+
+    def __len__(self) -> int:
+        return len(self.networks)
+
+    def __contains__(self, ip) -> bool:
+        try:
+            addr = ip if isinstance(ip, (ipaddress.IPv4Address, ipaddress.IPv6Address)) else ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+
+        # IPv4 映射的 IPv6 地址（::ffff:a.b.c.d）按 IPv4 匹配
+        if addr.version == 6 and addr.ipv4_mapped is not None:
+            addr = addr.ipv4_mapped
+
+        value = int(addr)
+        starts = self._starts[addr.version]
+        i = bisect_right(starts, value) - 1
+        return i >= 0 and value <= self._ends[addr.version][i]
+
+    def covers(self, network: IPNetwork) -> bool:
+        """整个网段是否都落在索引内"""
+        start, end = int(network.network_address), int(network.broadcast_address)
+        i = bisect_right(self._starts[network.version], start) - 1
+        return i >= 0 and end <= self._ends[network.version][i]
@@ -5,7 +5,7 @@
 
 import os
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Dict, Tuple
 
 class Settings(BaseSettings):
     """应用配置设置"""
@@ -17,11 +17,117 @@ class Settings(BaseSettings):
     default_security_group_id: str = os.getenv("DEFAULT_SECURITY_GROUP_ID", "sg-bp19nke7purenpearpmb")
     default_alb_acl_id: str = os.getenv("DEFAULT_ALB_ACL_ID", "acl-nnd9vclvwdcorsg1rm")
 
+    # 云 API 后端：aliyun 调用真实 SDK；fake 使用内存模拟后端（离线测试和压测）
+    cloud_backend: str = os.getenv("CLOUD_BACKEND", "aliyun")
+    # 模拟后端的单次往返延迟（秒）、随机错误率（0-1）和每个 API 每秒配额（0 表示不限流）
+    fake_cloud_latency: float = float(os.getenv("FAKE_CLOUD_LATENCY", "0.05"))
+    fake_cloud_error_rate: float = float(os.getenv("FAKE_CLOUD_ERROR_RATE", "0"))
+    fake_cloud_throttle_qps: float = float(os.getenv("FAKE_CLOUD_THROTTLE_QPS", "0"))
+
+    # 启动后在后台线程创建客户端并导入 SDK 模块（false 时在首次请求时加载）
+    cloud_sdk_warmup: bool = os.getenv("CLOUD_SDK_WARMUP", "true").lower() == "true"
+
+    # 地域服务域名模板，{region} 替换为地域 ID
+    ecs_endpoint_template: str = os.getenv("ECS_ENDPOINT_TEMPLATE", "ecs.{region}.aliyuncs.com")
+    alb_endpoint_template: str = os.getenv("ALB_ENDPOINT_TEMPLATE", "alb.{region}.aliyuncs.com")
+
+    # 封禁目标：逗号分隔的 地域:ACL ID:安全组 ID（ACL 或安全组可留空），未配置时使用上面的默认值
+    # 如 cn-hangzhou:acl-xxx:sg-xxx,cn-shanghai:acl-yyy:sg-yyy,cn-beijing::sg-zzz
+    ban_targets: str = os.getenv("BAN_TARGETS", "")
+    # 同时写入的目标数上限
+    ban_fanout_concurrency: int = int(os.getenv("BAN_FANOUT_CONCURRENCY", "8"))
+
+    # 阿里云 API 调用线程池大小（限制同时进行的 SDK 阻塞调用数）
+    cloud_executor_max_workers: int = int(os.getenv("CLOUD_EXECUTOR_MAX_WORKERS", "16"))
+
+    # HTTP 连接复用配置（连接池大小应不小于线程池大小）
+    http_keep_alive: bool = os.getenv("HTTP_KEEP_ALIVE", "true").lower() == "true"
+    http_max_idle_conns: int = int(os.getenv("HTTP_MAX_IDLE_CONNS", "32"))
+
+    # SDK 连接/读超时（毫秒），API_READ_TIMEOUTS 按 API 覆盖读超时（如 DescribeSecurityGroupAttribute=30000）
+    api_connect_timeout_ms: int = int(os.getenv("API_CONNECT_TIMEOUT_MS", "5000"))
+    api_read_timeout_ms: int = int(os.getenv("API_READ_TIMEOUT_MS", "10000"))
+    api_read_timeouts: str = os.getenv("API_READ_TIMEOUTS", "")
+    # SDK 自身的重试（默认关闭，由 API_MAX_RETRIES 统一重试，避免两层重试叠加）
+    api_sdk_autoretry: bool = os.getenv("API_SDK_AUTORETRY", "false").lower() == "true"
+    api_sdk_max_attempts: int = int(os.getenv("API_SDK_MAX_ATTEMPTS", "3"))
+
+    # 服务端请求超时（毫秒）：未携带 X-Request-Timeout 时的默认截止时间，也是请求头的上限；0 表示不限制
+    request_timeout_ms: int = int(os.getenv("REQUEST_TIMEOUT_MS", "0"))
+
+    # ACL/安全组状态缓存（TTL 秒），命中时幂等的封禁/解封请求无需调用云 API
+    state_cache_enabled: bool = os.getenv("STATE_CACHE_ENABLED", "true").lower() == "true"
+    state_cache_ttl: float = float(os.getenv("STATE_CACHE_TTL", "300"))
+
+    # 批量封禁时把相邻网段合并为超网写入（如两个相邻 /32 合并为 /31），解封时需使用合并后的网段
+    cidr_merge_supernets: bool = os.getenv("CIDR_MERGE_SUPERNETS", "false").lower() == "true"
+
+    # 阿里云 API 限流：每个 API 每个地域的默认 QPS 与突发量，API_RATE_LIMITS 可单独覆盖（如 AddEntriesToAcl=10,AuthorizeSecurityGroup=40）
+    api_rate_limit_qps: float = float(os.getenv("API_RATE_LIMIT_QPS", "20"))
+    api_rate_limit_burst: int = int(os.getenv("API_RATE_LIMIT_BURST", "10"))
+    api_rate_limits: str = os.getenv("API_RATE_LIMITS", "")
+
+    # 限流和瞬时网络错误的重试（带抖动的指数退避，单位秒）
+    api_max_retries: int = int(os.getenv("API_MAX_RETRIES", "4"))
+    api_retry_base_delay: float = float(os.getenv("API_RETRY_BASE_DELAY", "0.2"))
+    api_retry_max_delay: float = float(os.getenv("API_RETRY_MAX_DELAY", "5"))
+
+    # 熔断：每个 API 每个地域连续失败次数达到阈值后熔断（0 表示不熔断），冷却时间（秒）后放行探测调用；
+    # CIRCUIT_BREAKER_DIVERT 为 true 时熔断期间的 /banip 封禁/解封转入写回队列，否则返回 503
+    circuit_breaker_failure_threshold: int = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+    circuit_breaker_reset_timeout: float = float(os.getenv("CIRCUIT_BREAKER_RESET_TIMEOUT", "30"))
+    circuit_breaker_divert: bool = os.getenv("CIRCUIT_BREAKER_DIVERT", "false").lower() == "true"
+
+    # 封禁写回队列：达到批量上限或刷写间隔（秒）时批量写入云端
+    ban_queue_max_batch: int = int(os.getenv("BAN_QUEUE_MAX_BATCH", "100"))
+    ban_queue_flush_interval: float = float(os.getenv("BAN_QUEUE_FLUSH_INTERVAL", "0.2"))
+    ban_queue_max_results: int = int(os.getenv("BAN_QUEUE_MAX_RESULTS", "10000"))
+    # 多 worker 时写回队列结果写入共享状态存储的保留时间（秒），任意 worker 都可查询
+    ban_queue_result_ttl: float = float(os.getenv("BAN_QUEUE_RESULT_TTL", "3600"))
+
+    # 封禁台账（SQLite）：记录每次封禁的目标和到期时间，为空时不记录、不自动解封
+    ban_ledger_path: str = os.getenv("BAN_LEDGER_PATH", "data/ban_ledger.db")
+    # 请求未指定 ttl_seconds 时的封禁时长（秒），0 表示永久
+    ban_default_ttl: float = float(os.getenv("BAN_DEFAULT_TTL", "0"))
+    # 到期清理：检查间隔（秒）、每批解封条数、解封失败后的重试间隔（秒）和最大尝试次数
+    ban_sweep_interval: float = float(os.getenv("BAN_SWEEP_INTERVAL", "5"))
+    ban_sweep_batch: int = int(os.getenv("BAN_SWEEP_BATCH", "1000"))
+    ban_sweep_retry_delay: float = float(os.getenv("BAN_SWEEP_RETRY_DELAY", "60"))
+    ban_sweep_max_attempts: int = int(os.getenv("BAN_SWEEP_MAX_ATTEMPTS", "5"))
+
+    # 安全组规则合并：合并后显式规则数仍超过该值时，把最细的网段移入前缀列表（为空时不使用前缀列表）
+    sg_consolidate_max_rules: int = int(os.getenv("SG_CONSOLIDATE_MAX_RULES", "150"))
+    sg_consolidate_prefix_list_id: str = os.getenv("SG_CONSOLIDATE_PREFIX_LIST_ID", "")
+
+    # 导入封禁列表时每批写入的 IP/CIDR 数量（流式读取上传文件，每次只在内存中保留一批）
+    ban_import_batch_size: int = int(os.getenv("BAN_IMPORT_BATCH_SIZE", "1000"))
+
+    # worker 进程数（uvicorn 同样读取 WEB_CONCURRENCY）
+    web_concurrency: int = int(os.getenv("WEB_CONCURRENCY", "1"))
+    # 共享状态存储：memory（单进程）或 sqlite（同一主机的多个 worker 共享），为空时按 worker 数自动选择
+    state_store: str = os.getenv("STATE_STORE", "")
+    state_store_path: str = os.getenv("STATE_STORE_PATH", "data/state.db")
+
+    # Idempotency-Key：成功响应的保留时间（秒）和最多保留的键数
+    idempotency_ttl: float = float(os.getenv("IDEMPOTENCY_TTL", "600"))
+    idempotency_max_keys: int = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+
     # 日志配置
     log_level: str = os.getenv("LOG_LEVEL", "INFO")
+    # 输出单行 JSON（false 时使用 loguru 默认的文本格式）
+    log_json: bool = os.getenv("LOG_JSON", "true").lower() == "true"
+    # 日志写入放到后台线程，请求线程不等待 I/O
+    log_enqueue: bool = os.getenv("LOG_ENQUEUE", "true").lower() == "true"
+    # 重复的成功日志每个调用位置每秒最多输出的条数，0 表示不限速
+    log_sample_per_second: int = int(os.getenv("LOG_SAMPLE_PER_SECOND", "5"))
+    # 额外写入的日志文件（按 100 MB 轮转），为空时只输出到 stderr
+    log_file: str = os.getenv("LOG_FILE", "")
 
     # 白名单配置
     whitelist_ips: str = os.getenv("WHITELIST_IPS", "")
+    # 白名单文件（每行一个 IP/CIDR），修改后按检查间隔（秒）或收到 SIGHUP 时热更新，间隔为 0 表示只响应 SIGHUP
+    whitelist_file: str = os.getenv("WHITELIST_FILE", "")
+    whitelist_reload_interval: float = float(os.getenv("WHITELIST_RELOAD_INTERVAL", "5"))
 
     class Config:
         env_file = ".env"
@@ -34,5 +140,36 @@ class Settings(BaseSettings):
             return []
         return [ip.strip() for ip in self.whitelist_ips.split(",") if ip.strip()]
 
+    @property
+    def API_RATE_LIMITS(self) -> Dict[str, float]:
+        """解析按 API 覆盖的 QPS 配置"""
+        limits = {}
+        for item in self.api_rate_limits.split(","):
+            if "=" in item:
+                operation, qps = item.split("=", 1)
+                limits[operation.strip()] = float(qps)
+        return limits
+
+    @property
+    def API_READ_TIMEOUTS(self) -> Dict[str, int]:
+        """解析按 API 覆盖的读超时配置（毫秒）"""
+        timeouts = {}
+        for item in self.api_read_timeouts.split(","):
+            if "=" in item:
+                operation, timeout = item.split("=", 1)
+                timeouts[operation.strip()] = int(timeout)
+        return timeouts
+
+    @property
+    def BAN_TARGETS(self) -> List[Tuple[str, str, str]]:
+        """解析封禁目标列表 (地域, ACL ID, 安全组 ID)"""
+        targets = []
+        for item in self.ban_targets.split(","):
+            parts = [part.strip() for part in item.split(":")]
+            if parts[0]:
+                parts += [""] * (3 - len(parts))
+                targets.append(tuple(parts[:3]))
+        return targets
+
 # 创建全局配置实例
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,227 @@
+"""
+请求截止时间与取消
+调用方通过 X-Request-Timeout 请求头（毫秒）限定整个请求的耗时，REQUEST_TIMEOUT_MS 为服务端默认值和上限。
+截止时间和取消标记保存在 contextvar 中，随请求传递到线程池中的云 API 调用：调用前检查调用方是否仍在等待，
+SDK 超时不超过剩余时间，剩余时间不够退避等待时不再重试。
+客户端断开或截止时间已到时中间件取消请求处理：排队中的线程池任务直接取消，执行中的任务在下一次云 API 调用前停止，
+其迟到的结果被丢弃；封禁等写入通过 complete_on_cancel 执行，已发起的写入完成后仍记入台账
+"""
+
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Awaitable, Iterator, Optional, Set, TypeVar
+
+from loguru import logger
+from starlette.responses import JSONResponse
+from core.config import settings
+from core.metrics import metrics, COUNTER
+
+# 截止时间请求头，值为毫秒
+DEADLINE_HEADER = "X-Request-Timeout"
+
+# 当前请求的截止时间（time.monotonic()），未设置时为 None
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+# 当前请求的取消标记（线程池中的调用也能看到），不在请求上下文中时为 None
+_cancelled: ContextVar[Optional[threading.Event]] = ContextVar("request_cancelled", default=None)
+
+T = TypeVar("T")
+
+# 请求被放弃后仍在完成的写入（保持引用，避免任务被回收）
+_detached: Set[asyncio.Task] = set()
+
+metrics.describe("http_requests_abandoned_total", COUNTER, "处理完成前被放弃的请求数（reason=disconnect/deadline）")
+
+
+class RequestCancelledError(Exception):
+    """调用方已不再等待结果（客户端断开），不再调用云 API"""
+
+    def __init__(self, operation: str, reason: str = "客户端已断开"):
+        super().__init__(f"{operation} 未执行：{reason}")
+        self.operation = operation
+
+
+class DeadlineExceededError(RequestCancelledError):
+    """请求截止时间已到，不再调用云 API"""
+
+    def __init__(self, operation: str):
+        super().__init__(operation, "已超过请求截止时间")
+
+
+def remaining() -> Optional[float]:
+    """距离截止时间的秒数（可能为负），未设置截止时间时为 None"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_cancelled(operation: str):
+    """调用方已放弃时抛出：截止时间已到为 DeadlineExceededError，客户端断开为 RequestCancelledError"""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceededError(operation)
+    event = _cancelled.get()
+    if event is not None and event.is_set():
+        raise RequestCancelledError(operation)
+
+
+def sleep(seconds: float) -> bool:
+    """阻塞等待 seconds 秒；调用方在此期间放弃（断开或截止）时提前返回 True"""
+    left = remaining()
+    timeout = seconds if left is None else min(seconds, max(0.0, left))
+    event = _cancelled.get()
+    if event is None:
+        time.sleep(timeout)
+    elif event.wait(timeout):
+        return True
+    return timeout < seconds
+
+
+@contextmanager
+def deadline_scope(timeout: Optional[float]) -> Iterator[None]:
+    """在 timeout 秒后截止；外层已有更早的截止时间时保持外层的"""
+    if timeout is None:
+        yield
+        return
+    deadline = time.monotonic() + timeout
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(deadline, current))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def cancellation_scope() -> Iterator[threading.Event]:
+    """为当前上下文设置取消标记，set() 后其中的云 API 调用不再发起"""
+    event = threading.Event()
+    token = _cancelled.set(event)
+    try:
+        yield event
+    finally:
+        _cancelled.reset(token)
+
+
+async def complete_on_cancel(coro: Awaitable[T]) -> T:
+    """
+    执行 coro；请求处理被取消（客户端断开、超过截止时间）时不中断它，只是不再等待结果：
+    已发起的云端写入仍会生效，其后的台账记录等也必须完成。取消标记照常生效，尚未发起的云 API 调用不再发起
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        if not task.done():
+            _detached.add(task)
+            task.add_done_callback(_finish_detached)
+        raise
+
+
+def _finish_detached(task: asyncio.Task):
+    _detached.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("请求放弃后继续完成的写入异常: {}", task.exception())
+
+
+def _error_response(status_code: int, detail: str) -> JSONResponse:
+    """与全局 HTTP 异常处理的格式一致"""
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": "HTTP Error", "detail": detail, "timestamp": datetime.now().isoformat()}
+    )
+
+
+class DeadlineMiddleware:
+    """
+    请求截止时间与断开检测（纯 ASGI）
+    读取 X-Request-Timeout 请求头（不超过 REQUEST_TIMEOUT_MS）设置截止时间；请求体读取完毕后监听客户端断开。
+    客户端断开或截止时间已到时取消请求处理，截止时尚未开始响应则返回 504
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._header = DEADLINE_HEADER.lower().encode()
+
+    def _timeout(self, scope) -> Optional[float]:
+        """请求的超时秒数，未设置时为 None；请求头不是正整数时抛出 ValueError"""
+        value = next((v for k, v in scope["headers"] if k == self._header), None)
+        timeout_ms = settings.request_timeout_ms or None
+        if value is not None:
+            requested = int(value)
+            if requested <= 0:
+                raise ValueError(value)
+            timeout_ms = requested if timeout_ms is None else min(requested, timeout_ms)
+        return None if timeout_ms is None else timeout_ms / 1000
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            timeout = self._timeout(scope)
+        except ValueError:
+            await _error_response(400, f"{DEADLINE_HEADER} 必须为正整数（毫秒）")(scope, receive, send)
+            return
+
+        disconnected = asyncio.Event()
+        body_received = False
+        watcher: Optional[asyncio.Task] = None
+        response_started = False
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        async def receive_wrapper():
+            # 请求体读取完毕后由 watcher 独占底层 receive，之后的 receive 只等待断开
+            nonlocal body_received, watcher
+            if body_received:
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+            elif not message.get("more_body", False):
+                body_received = True
+                watcher = asyncio.create_task(watch_disconnect())
+            return message
+
+        async def send_wrapper(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        with deadline_scope(timeout), cancellation_scope() as cancelled:
+            handler = asyncio.create_task(self.app(scope, receive_wrapper, send_wrapper))
+            disconnect = asyncio.create_task(disconnected.wait())
+            try:
+                done, _ = await asyncio.wait({handler, disconnect}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if handler in done:
+                    handler.result()
+                    return
+
+                reason = "disconnect" if disconnect in done else "deadline"
+                cancelled.set()
+                handler.cancel()
+                await asyncio.gather(handler, return_exceptions=True)
+                metrics.inc("http_requests_abandoned_total", (("reason", reason),))
+                logger.warning(
+                    "请求被放弃（{}），已取消未完成的云 API 调用: {} {}",
+                    "客户端断开" if reason == "disconnect" else "超过截止时间", scope["method"], scope["path"]
+                )
+                if reason == "deadline" and not response_started:
+                    await _error_response(504, "超过请求截止时间")(scope, receive, send)
+            finally:
+                disconnect.cancel()
+                if watcher is not None:
+                    watcher.cancel()
+                if not handler.done():
+                    # 外层取消（如服务退出）时一并取消请求处理
+                    cancelled.set()
+                    handler.cancel()
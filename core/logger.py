@@ -0,0 +1,176 @@
+"""
+日志配置
+全局只配置一次 loguru：级别取自 LOG_LEVEL，默认输出单行 JSON，写入放到后台线程，
+标准库 logging（uvicorn 等）转发到 loguru；绑定 sample=True 的重复成功日志按调用位置限速
+"""
+
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, Tuple
+
+from loguru import logger
+
+from core.config import settings
+
+# 重复的成功日志使用此 logger，按调用位置限速输出
+sampled_logger = logger.bind(sample=True)
+
+# 不输出到 JSON 的内部字段
+_INTERNAL_EXTRA = ("sample", "_sampled", "_json")
+
+
+class LogSampler:
+    """
+    按调用位置（模块 + 行号）限速：每个位置每秒最多输出 per_second 条，
+    超出的丢弃并计数，下一条放行的日志附带被省略的条数；per_second <= 0 时不限速
+    """
+
+    def __init__(self, per_second: int):
+        self.per_second = per_second
+        self._windows: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, record) -> bool:
+        if self.per_second <= 0 or not record["extra"].get("sample"):
+            return True
+        # 多个输出共用同一个限速器，同一条记录只判定一次
+        decided = record["extra"].get("_sampled")
+        if decided is not None:
+            return decided
+        record["extra"]["_sampled"] = allowed = self._allow(record)
+        return allowed
+
+    def _allow(self, record) -> bool:
+        key = (record["name"], record["line"])
+        now = int(time.monotonic())
+        with self._lock:
+            # [窗口起始秒, 窗口内已输出条数, 已省略条数]
+            window = self._windows.get(key)
+            if window is None:
+                window = self._windows[key] = [now, 0, 0]
+            elif window[0] != now:
+                window[0] = now
+                window[1] = 0
+            if window[1] >= self.per_second:
+                window[2] += 1
+                return False
+            window[1] += 1
+            suppressed, window[2] = window[2], 0
+        if suppressed:
+            record["extra"]["suppressed"] = suppressed
+            record["message"] += f"（已省略 {suppressed} 条同类日志）"
+        return True
+
+
+class BackgroundSink:
+    """
+    后台写入的输出：请求线程只把格式化好的一行放入队列，由守护线程写入 stream
+    （loguru 的 enqueue=True 会序列化整条 record 经进程间管道传递，单条开销反而高于同步写入）
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, message: str):
+        self._queue.put(str(message))
+
+    def _run(self):
+        while True:
+            message = self._queue.get()
+            if message is None:
+                break
+            try:
+                self.stream.write(message)
+                # 队列已空时才刷新，积压时合并写入
+                if self._queue.empty():
+                    self.stream.flush()
+            except Exception:
+                pass
+
+    def stop(self):
+        """写完队列中剩余的日志后退出（logger.remove 时调用）"""
+        self._queue.put(None)
+        self._thread.join()
+
+
+def _json_format(record) -> str:
+    """单行 JSON，只保留排查需要的字段（比 loguru serialize 的完整 record 更小更快）"""
+    payload = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "logger": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+        "message": record["message"],
+    }
+    extra = {key: value for key, value in record["extra"].items() if key not in _INTERNAL_EXTRA}
+    if extra:
+        payload["extra"] = extra
+    exception = record["exception"]
+    if exception is not None:
+        payload["exception"] = "".join(
+            traceback.format_exception(exception.type, exception.value, exception.traceback)
+        )
+    record["extra"]["_json"] = json.dumps(payload, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
+
+
+class InterceptHandler(logging.Handler):
+    """把标准库 logging 的记录转发给 loguru"""
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            level = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+        frame, depth = logging.currentframe(), 2
+        while frame and frame.f_code.co_filename == logging.__file__:
+            frame = frame.f_back
+            depth += 1
+        logger.opt(depth=depth, exception=record.exc_info).log(level, record.getMessage())
+
+
+def setup_logging(
+    level: str = None,
+    json_output: bool = None,
+    enqueue: bool = None,
+    sample_per_second: int = None,
+    log_file: str = None,
+    sink=None
+):
+    """配置全局日志，参数未传时使用 Settings；重复调用会替换之前的输出"""
+    level = (level or settings.log_level).upper()
+    json_output = settings.log_json if json_output is None else json_output
+    enqueue = settings.log_enqueue if enqueue is None else enqueue
+    sample_per_second = settings.log_sample_per_second if sample_per_second is None else sample_per_second
+    log_file = settings.log_file if log_file is None else log_file
+
+    options = {
+        "level": level,
+        "filter": LogSampler(sample_per_second),
+        "backtrace": False,
+        "diagnose": False,
+    }
+    if json_output:
+        options["format"] = _json_format
+
+    sink = sink or sys.stderr
+    logger.remove()
+    logger.add(BackgroundSink(sink) if enqueue else sink, **options)
+    if log_file:
+        # 文件输出自带缓冲，同步写入即可
+        logger.add(log_file, rotation="100 MB", retention=5, **options)
+
+    logging.basicConfig(handlers=[InterceptHandler()], level=logging.getLevelName(level), force=True)
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        std_logger = logging.getLogger(name)
+        std_logger.handlers = []
+        std_logger.propagate = True
@@ -0,0 +1,175 @@
+"""
+Prometheus 指标
+进程内的计数器、仪表和直方图，按 Prometheus 文本格式输出
+
+记录路径不加锁：每个线程写自己的分片（事件循环线程和线程池中的每个线程各一份），
+只有线程首次记录时登记分片需要加锁；输出时汇总所有分片
+"""
+
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# 标签：按固定顺序排列的 (名称, 值) 元组，可直接作为字典键
+Labels = Tuple[Tuple[str, str], ...]
+
+# 延迟直方图的默认分桶（秒），覆盖本地调用到云 API 超时
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+
+class _Shard:
+    """单个线程写入的指标值"""
+
+    def __init__(self):
+        self.values: Dict[Tuple[str, Labels], float] = {}
+        # (名称, 标签) -> [各桶计数..., +Inf 计数, 总和]
+        self.histograms: Dict[Tuple[str, Labels], List[float]] = {}
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._callbacks: Dict[str, Callable[[], Iterable[Tuple[Labels, float]]]] = {}
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    # ==== 定义 ====
+
+    def describe(self, name: str, metric_type: str, help_text: str):
+        """声明指标类型和说明"""
+        self._meta[name] = (metric_type, help_text)
+
+    def register_callback(
+        self,
+        name: str,
+        help_text: str,
+        callback: Callable[[], Iterable[Tuple[Labels, float]]],
+        metric_type: str = GAUGE
+    ):
+        """注册在输出时才读取的指标，如队列长度、缓存命中率"""
+        self.describe(name, metric_type, help_text)
+        self._callbacks[name] = callback
+
+    # ==== 记录 ====
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1):
+        """计数器或仪表加上 value（仪表可传负数）"""
+        values = self._shard().values
+        key = (name, labels)
+        values[key] = values.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: Labels = ()):
+        """记录一次直方图观测值"""
+        histograms = self._shard().histograms
+        key = (name, labels)
+        counts = histograms.get(key)
+        if counts is None:
+            counts = histograms[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    # ==== 读取 ====
+
+    def _collect(self) -> Tuple[Dict[Tuple[str, Labels], float], Dict[Tuple[str, Labels], List[float]]]:
+        """汇总所有分片（list() 在 GIL 下一次性复制，写入线程无需等待）"""
+        values: Dict[Tuple[str, Labels], float] = {}
+        histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for key, value in list(shard.values.items()):
+                values[key] = values.get(key, 0) + value
+            for key, counts in list(shard.histograms.items()):
+                total = histograms.setdefault(key, [0] * len(counts))
+                for i, count in enumerate(list(counts)):
+                    total[i] += count
+        return values, histograms
+
+    def value(self, name: str, labels: Labels = ()) -> float:
+        """读取计数器或仪表的当前值"""
+        return self._collect()[0].get((name, labels), 0)
+
+    def histogram_count(self, name: str, labels: Labels = ()) -> int:
+        """读取直方图的观测次数"""
+        counts = self._collect()[1].get((name, labels))
+        return int(sum(counts[:-1])) if counts else 0
+
+    def render(self) -> str:
+        """按 Prometheus 文本格式输出所有指标"""
+        values, histograms = self._collect()
+        for name, callback in list(self._callbacks.items()):
+            try:
+                for labels, value in callback():
+                    values[(name, labels)] = value
+            except Exception:
+                continue
+
+        # 指标名 -> [(标签, 该序列的输出行)]，直方图各桶保持分桶顺序
+        series: Dict[str, List[Tuple[Labels, List[str]]]] = {}
+        for (name, labels), value in values.items():
+            series.setdefault(name, []).append((labels, [f"{name}{_format_labels(labels)} {_format_value(value)}"]))
+        for (name, labels), counts in histograms.items():
+            lines = []
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', _format_value(bound)),))} {int(cumulative)}")
+            cumulative += counts[-2]
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {int(cumulative)}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(counts[-1])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {int(cumulative)}")
+            series.setdefault(name, []).append((labels, lines))
+
+        output = []
+        for name in sorted(series):
+            metric_type, help_text = self._meta.get(name, (COUNTER, ""))
+            output.append(f"# HELP {name} {help_text}")
+            output.append(f"# TYPE {name} {metric_type}")
+            for _, lines in sorted(series[name], key=lambda item: item[0]):
+                output.extend(lines)
+        return "\n".join(output) + "\n"
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# 全局指标注册表
+metrics = MetricsRegistry()
+
+metrics.describe("http_requests_total", COUNTER, "HTTP 请求数")
+metrics.describe("http_request_duration_seconds", HISTOGRAM, "HTTP 请求耗时（秒）")
+metrics.describe("http_requests_in_flight", GAUGE, "正在处理的 HTTP 请求数")
+metrics.describe("http_requests_rejected_total", COUNTER, "被 IP 白名单拒绝的请求数")
+metrics.describe("cloud_api_calls_total", COUNTER, "阿里云 API 调用数")
+metrics.describe("cloud_api_call_duration_seconds", HISTOGRAM, "阿里云 API 调用耗时（秒，含重试）")
+metrics.describe("cloud_api_calls_in_flight", GAUGE, "正在进行的阿里云 API 调用数")
+metrics.describe("cloud_api_retries_total", COUNTER, "阿里云 API 重试次数")
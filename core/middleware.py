@@ -3,59 +3,227 @@
 包含 IP 白名单验证等中间件
 """
 
-from fastapi import Request, HTTPException
-from typing import List
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import List, Optional, Iterable
 import ipaddress
+from loguru import logger
+from starlette.responses import JSONResponse
 from core.config import settings
+from core.cidr_index import CIDRIndex
+from core.metrics import metrics
 
-class IPWhitelistMiddleware:
-    """IP 白名单验证中间件"""
 
-    def __init__(self, app, whitelist_ips: List[str]):
-        self.app = app
-        self.whitelisted_networks = []
-        self._parse_whitelist_ips(whitelist_ips)
+class IPWhitelist:
+    """
+    可热更新的 IP 白名单
+    重新加载时先完整构建新索引再整体替换引用，进行中的请求只会看到旧索引或新索引
+    """
+
+    def __init__(self, whitelist_ips: List[str], whitelist_file: str = ""):
+        self.whitelist_ips = list(whitelist_ips)
+        self.whitelist_file = whitelist_file
+        self._file_mtime: Optional[float] = None
+        self.index: Optional[CIDRIndex] = None
+        self.reload()
 
-    def _parse_whitelist_ips(self, whitelist_ips: List[str]):
+    @property
+    def enabled(self) -> bool:
+        """未配置任何白名单来源时不做限制"""
+        return self.index is not None
+
+    @staticmethod
+    def _parse_whitelist_ips(whitelist_ips: Iterable[str]) -> list:
         """解析白名单 IP 列表"""
+        whitelisted_networks = []
         for ip in whitelist_ips:
             try:
                 # 支持单个 IP 和 CIDR 表示法
                 if '/' in ip:
                     # CIDR 表示法 (如 192.168.1.0/24)
                     network = ipaddress.ip_network(ip, strict=False)
-                    self.whitelisted_networks.append(network)
+                    whitelisted_networks.append(network)
                 else:
                     # 单个 IP 地址
                     ip_addr = ipaddress.ip_address(ip)
-                    self.whitelisted_networks.append(ipaddress.ip_network(f"{ip}/128" if ':' in ip else f"{ip}/32"))
+                    whitelisted_networks.append(ipaddress.ip_network(f"{ip}/128" if ':' in ip else f"{ip}/32"))
             except ValueError as e:
-                print(f"Invalid IP address in whitelist: {ip} - {e}")
+                logger.warning("Invalid IP address in whitelist: {} - {}", ip, e)
+        return whitelisted_networks
+
+    def _read_file(self) -> List[str]:
+        """读取白名单文件：每行一个或逗号分隔的多个 IP/CIDR，# 开头为注释"""
+        items = []
+        with open(self.whitelist_file, encoding="utf-8") as f:
+            for line in f:
+                line = line.split("#", 1)[0]
+                items.extend(item.strip() for item in line.split(",") if item.strip())
+        return items
+
+    def reload(self) -> bool:
+        """重新加载白名单，文件读取失败时保留当前索引（首次加载失败时只使用 WHITELIST_IPS）"""
+        items = list(self.whitelist_ips)
+        if self.whitelist_file:
+            try:
+                self._file_mtime = os.path.getmtime(self.whitelist_file)
+                items.extend(self._read_file())
+            except OSError as e:
+                if self.index is not None:
+                    logger.error("读取白名单文件失败，保留当前白名单: {} - {}", self.whitelist_file, e)
+                    return False
+                # 首次加载失败时不能放行所有来源：只使用 WHITELIST_IPS（为空时拒绝所有请求），文件恢复后由热更新加载
+                logger.error(
+                    "读取白名单文件失败，仅使用 WHITELIST_IPS（{} 个）: {} - {}",
+                    len(self.whitelist_ips), self.whitelist_file, e
+                )
+                self.index = CIDRIndex(self._parse_whitelist_ips(self.whitelist_ips))
+                return False
+
+        if not items and not self.whitelist_file:
+            self.index = None
+            return True
+
+        index = CIDRIndex(self._parse_whitelist_ips(items))
+        self.index = index
+        logger.info("白名单已加载: {} 个网段", len(index))
+        return True
+
+    def reload_if_changed(self) -> bool:
+        """白名单文件修改时间变化时重新加载"""
+        if not self.whitelist_file:
+            return False
+        try:
+            mtime = os.path.getmtime(self.whitelist_file)
+        except OSError:
+            return False
+        if mtime == self._file_mtime:
+            return False
+        return self.reload()
+
+
+async def watch_whitelist_file(whitelist: IPWhitelist, interval: float):
+    """定期检查白名单文件，变化时在线程池中重新加载"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(whitelist.reload_if_changed)
+        except Exception as e:
+            logger.error("白名单热更新异常: {}", e)
+
 
-    async def __call__(self, request: Request, call_next):
+class IPWhitelistMiddleware:
+    """IP 白名单验证中间件（纯 ASGI，在路由和请求体解析之前拒绝非白名单来源）"""
+
+    def __init__(
+        self,
+        app,
+        whitelist_ips: Optional[List[str]] = None,
+        whitelist: Optional[IPWhitelist] = None,
+        exempt_paths: Iterable[str] = ("/health",)
+    ):
+        self.app = app
+        self.whitelist = whitelist or IPWhitelist(whitelist_ips or [])
+        self.exempt_paths = frozenset(exempt_paths)
+
+    @property
+    def whitelist_index(self) -> Optional[CIDRIndex]:
+        return self.whitelist.index
+
+    @property
+    def whitelisted_networks(self) -> list:
+        return self.whitelist.index.networks if self.whitelist.index else []
+
+    async def __call__(self, scope, receive, send):
         """中间件调用"""
-        client_ip = request.client.host if request.client else None
+        # 只读取一次索引引用，整个请求使用同一份索引
+        index = self.whitelist.index
+        if scope["type"] != "http" or index is None or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        client = scope.get("client")
+        client_ip = client[0] if client else None
 
         if not client_ip:
-            raise HTTPException(status_code=400, detail="无法获取客户端 IP 地址")
+            await self._reject(scope, receive, send, 400, "无法获取客户端 IP 地址")
+            return
 
         # 检查 IP 是否在白名单中
-        if not self._is_ip_allowed(client_ip):
-            raise HTTPException(status_code=403, detail=f"IP 地址 {client_ip} 不在白名单中")
+        if client_ip not in index:
+            metrics.inc("http_requests_rejected_total")
+            await self._reject(scope, receive, send, 403, f"IP 地址 {client_ip} 不在白名单中")
+            return
 
-        response = await call_next(request)
-        return response
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(scope, receive, send, status_code: int, detail: str):
+        """直接返回错误响应，与全局 HTTP 异常处理的格式一致"""
+        response = JSONResponse(
+            status_code=status_code,
+            content={
+                "error": "HTTP Error",
+                "detail": detail,
+                "timestamp": datetime.now().isoformat()
+            }
+        )
+        await response(scope, receive, send)
 
     def _is_ip_allowed(self, client_ip: str) -> bool:
-        """检查 IP 是否被允许"""
+        """检查 IP 是否被允许（前缀索引二分查找）"""
+        index = self.whitelist.index
+        return index is None or client_ip in index
+
+
+class MetricsMiddleware:
+    """HTTP 请求指标中间件（纯 ASGI）：按路由模板统计请求数、状态码、耗时和并发数"""
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def _route_template(scope) -> str:
+        """
+        路由模板：把路径中的路径参数替换回 {参数名}，避免标签数量随参数值无限增长
+        未匹配任何路由的请求（如 404 扫描）统一记为 unmatched
+        """
+        if scope.get("endpoint") is None:
+            return "unmatched"
+        path_params = scope.get("path_params")
+        if not path_params:
+            return scope["path"]
+        names = {str(value): name for name, value in path_params.items()}
+        return "/".join(
+            f"{{{names[segment]}}}" if segment in names else segment
+            for segment in scope["path"].split("/")
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        metrics.inc("http_requests_in_flight")
+        start = time.perf_counter()
         try:
-            ip_addr = ipaddress.ip_address(client_ip)
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.inc("http_requests_in_flight", value=-1)
+            labels = (("method", scope["method"]), ("route", self._route_template(scope)))
+            metrics.inc("http_requests_total", labels + (("status", str(status_code)),))
+            metrics.observe("http_request_duration_seconds", elapsed, labels)
 
-            # 检查是否在任一允许的网络中
-            for network in self.whitelisted_networks:
-                if ip_addr in network:
-                    return True
 
-            return False
-        except ValueError:
-            return False
\ No newline at end of file
+# 全局白名单实例
+ip_whitelist = IPWhitelist(settings.WHITELIST_IPS, settings.whitelist_file)
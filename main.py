@@ -3,141 +3,222 @@
 """
 
 import os
-import logging
+import asyncio
+import signal
+from contextlib import asynccontextmanager
 from datetime import datetime
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
+from loguru import logger
+from core.config import settings
+from core.deadline import DeadlineMiddleware
+from core.logger import setup_logging
+from core.middleware import IPWhitelistMiddleware, MetricsMiddleware, ip_whitelist, watch_whitelist_file
+from core.metrics import metrics
+from api.static import PrecomputedResponse
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# 日志：级别、JSON 输出、后台写入和限速均来自 Settings
+setup_logging()
 
 # Create logs directory with proper permissions
 os.makedirs("logs", exist_ok=True)
 
-# Create FastAPI application（不添加任何中间件）
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    应用生命周期：启动时创建共享状态存储、写回队列和封禁台账，阿里云客户端在后台线程预热（SDK 导入较慢，不阻塞 /health），
+    退出时刷写队列并释放连接、线程池和状态存储
+    """
+    from services.alicloud import warm_up_aliyun_client, close_aliyun_client
+    from services.ban_queue import get_ban_queue
+    from services.ledger import open_ban_ledger, close_ban_ledger, run_ban_sweeper
+    from services.state_store import get_state_store, close_state_store
+    store = get_state_store()
+    if settings.web_concurrency > 1 and not store.shared:
+        logger.warning("WEB_CONCURRENCY={} 但共享状态存储为 memory，幂等键、限流和写回队列状态不会在 worker 间共享", settings.web_concurrency)
+    warmup = None
+    if settings.cloud_sdk_warmup:
+        warmup = asyncio.create_task(asyncio.to_thread(warm_up_aliyun_client))
+    get_ban_queue().start()
+
+    # 封禁台账：按到期时间自动解封
+    ledger = open_ban_ledger()
+    sweeper = None
+    if ledger is not None and settings.ban_sweep_interval > 0:
+        sweeper = asyncio.create_task(run_ban_sweeper(ledger, settings.ban_sweep_interval, store))
+
+    # 白名单热更新：SIGHUP 或白名单文件变化时在线程池中重建索引
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(
+            signal.SIGHUP, lambda: loop.run_in_executor(None, ip_whitelist.reload)
+        )
+    except (AttributeError, NotImplementedError, RuntimeError, ValueError):
+        pass
+    watcher = None
+    if settings.whitelist_file and settings.whitelist_reload_interval > 0:
+        watcher = asyncio.create_task(
+            watch_whitelist_file(ip_whitelist, settings.whitelist_reload_interval)
+        )
+
+    yield
+
+    if watcher is not None:
+        watcher.cancel()
+    if sweeper is not None:
+        sweeper.cancel()
+        await asyncio.gather(sweeper, return_exceptions=True)
+    if warmup is not None:
+        await asyncio.gather(warmup, return_exceptions=True)
+    await get_ban_queue().stop()
+    close_ban_ledger()
+    close_aliyun_client()
+    close_state_store()
+    await logger.complete()
+
+# Create FastAPI application
 app = FastAPI(
     title="阿里云云资源管理服务",
     description="提供 ALB 访问控制和 ECS 安全组管理的 API 服务",
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
+# 请求截止时间：X-Request-Timeout（毫秒）传递到云 API 调用
+app.add_middleware(DeadlineMiddleware)
+
+# 请求指标（位于白名单之内，被拒绝的扫描流量只计数不统计耗时）
+app.add_middleware(MetricsMiddleware)
+
+# IP 白名单：纯 ASGI 中间件，在路由之前拒绝非白名单来源；未配置白名单时放行所有请求
+app.add_middleware(IPWhitelistMiddleware, whitelist=ip_whitelist)
+
 @app.get("/health", tags=["健康检查"])
 async def health_check():
-    """健康检查接口"""
+    """健康检查接口：有云 API 熔断时状态为 degraded（仍返回 200，服务本身可用）"""
+    from services.breaker import CLOSED, get_circuit_breakers
+    breakers = get_circuit_breakers().snapshot()
     return {
-        "status": "healthy",
+        "status": "degraded" if any(breaker["state"] != CLOSED for breaker in breakers.values()) else "healthy",
         "timestamp": datetime.now().isoformat(),
         "version": "1.0.0",
-        "service": "aliyun-manager"
+        "service": "aliyun-manager",
+        "circuit_breakers": breakers
     }
 
+@app.get("/metrics", tags=["健康检查"], response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus 指标"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # 暂时注释掉有问题的导入
 try:
     from api.v1.alb_router import router as alb_router
     app.include_router(alb_router, prefix="/api/v1/alb", tags=["ALB"])
-    print("ALB router loaded successfully")
+    logger.info("ALB 路由已加载")
 
     from api.v1.ecs_router import router as ecs_router
     app.include_router(ecs_router, prefix="/api/v1/ecs", tags=["ECS"])
-    print("ECS router loaded successfully")
+    logger.info("ECS 路由已加载")
 
     from api.v1.banip_router import router as banip_router
     app.include_router(banip_router, prefix="/api/v1/banip", tags=["BanIP"])
-    print("BanIP router loaded successfully - ROUTE REGISTERED!")
-except Exception as e:
-    print(f"Failed to load routers: {e}")
-    import traceback
-    traceback.print_exc()
+    logger.info("BanIP 路由已加载")
+except Exception:
+    logger.exception("加载路由失败")
 
-@app.get("/api/docs", tags=["API 文档汇总"])
-async def get_api_documentation():
-    """获取完整的API文档汇总"""
-    return {
-        "service_info": {
-            "name": "阿里云云资源管理服务",
-            "version": "1.0.0",
-            "description": "提供 ALB 访问控制和 ECS 安全组管理的 API 服务",
-            "status": "运行中"
+# API 文档汇总（导入时序列化一次）
+API_DOCUMENTATION = PrecomputedResponse({
+    "service_info": {
+        "name": "阿里云云资源管理服务",
+        "version": "1.0.0",
+        "description": "提供 ALB 访问控制和 ECS 安全组管理的 API 服务",
+        "status": "运行中"
+    },
+    "api_endpoints": {
+        "alb_access_control": {
+            "base_endpoint": "/api/v1/alb",
+            "description": "ALB访问控制相关接口",
+            "endpoints": [
+                {
+                    "method": "POST",
+                    "path": "/add-entries",
+                    "description": "添加ALB访问控制条目",
+                    "documentation": "/api/v1/alb/docs",
+                    "examples": "/api/v1/alb/examples"
+                },
+                {
+                    "method": "POST",
+                    "path": "/remove-entries",
+                    "description": "删除ALB访问控制条目",
+                    "documentation": "/api/v1/alb/docs",
+                    "examples": "/api/v1/alb/examples"
+                }
+            ]
         },
-        "api_endpoints": {
-            "alb_access_control": {
-                "base_endpoint": "/api/v1/alb",
-                "description": "ALB访问控制相关接口",
-                "endpoints": [
-                    {
-                        "method": "POST",
-                        "path": "/add-entries",
-                        "description": "添加ALB访问控制条目",
-                        "documentation": "/api/v1/alb/docs",
-                        "examples": "/api/v1/alb/examples"
-                    },
-                    {
-                        "method": "POST",
-                        "path": "/remove-entries",
-                        "description": "删除ALB访问控制条目",
-                        "documentation": "/api/v1/alb/docs",
-                        "examples": "/api/v1/alb/examples"
-                    }
-                ]
-            },
-            "ecs_security_group": {
-                "base_endpoint": "/api/v1/ecs",
-                "description": "ECS安全组相关接口",
-                "endpoints": [
-                    {
-                        "method": "POST",
-                        "path": "/authorize",
-                        "description": "添加ECS安全组入方向规则",
-                        "documentation": "/api/v1/ecs/docs",
-                        "examples": "/api/v1/ecs/examples"
-                    },
-                    {
-                        "method": "POST",
-                        "path": "/revoke",
-                        "description": "删除ECS安全组入方向规则",
-                        "documentation": "/api/v1/ecs/docs",
-                        "examples": "/api/v1/ecs/examples"
-                    }
-                ]
+        "ecs_security_group": {
+            "base_endpoint": "/api/v1/ecs",
+            "description": "ECS安全组相关接口",
+            "endpoints": [
+                {
+                    "method": "POST",
+                    "path": "/authorize",
+                    "description": "添加ECS安全组入方向规则",
+                    "documentation": "/api/v1/ecs/docs",
+                    "examples": "/api/v1/ecs/examples"
+                },
+                {
+                    "method": "POST",
+                    "path": "/revoke",
+                    "description": "删除ECS安全组入方向规则",
+                    "documentation": "/api/v1/ecs/docs",
+                    "examples": "/api/v1/ecs/examples"
+                }
+            ]
+        }
+    },
+    "parameter_requirements": {
+        "ip_format": "所有IP地址必须使用CIDR格式（如192.168.1.0/24）",
+        "default_values": "ACL ID和Security Group ID可选，不提供时使用环境变量中的默认值",
+        "protocol_format": "协议类型使用大写格式（TCP、UDP、ICMP、ALL）",
+        "port_format": "端口范围格式：起始端口/结束端口（如22/22或80/443）"
+    },
+    "environment_variables": {
+        "DEFAULT_ALB_ACL_ID": "默认ALB访问控制列表ID",
+        "DEFAULT_SECURITY_GROUP_ID": "默认安全组ID",
+        "ACCESS_KEY_ID": "阿里云访问密钥ID",
+        "ACCESS_KEY_SECRET": "阿里云访问密钥密钥"
+    },
+    "quick_test": {
+        "description": "快速测试接口功能",
+        "test_ip": "34.1.28.44/32",
+        "alb_add_test": {
+            "endpoint": "POST /api/v1/alb/add-entries",
+            "payload": {
+                "source_cidr_ip": "34.1.28.44/32",
+                "description": "测试IP地址"
             }
         },
-        "parameter_requirements": {
-            "ip_format": "所有IP地址必须使用CIDR格式（如192.168.1.0/24）",
-            "default_values": "ACL ID和Security Group ID可选，不提供时使用环境变量中的默认值",
-            "protocol_format": "协议类型使用大写格式（TCP、UDP、ICMP、ALL）",
-            "port_format": "端口范围格式：起始端口/结束端口（如22/22或80/443）"
-        },
-        "environment_variables": {
-            "DEFAULT_ALB_ACL_ID": "默认ALB访问控制列表ID",
-            "DEFAULT_SECURITY_GROUP_ID": "默认安全组ID",
-            "ACCESS_KEY_ID": "阿里云访问密钥ID",
-            "ACCESS_KEY_SECRET": "阿里云访问密钥密钥"
-        },
-        "quick_test": {
-            "description": "快速测试接口功能",
-            "test_ip": "34.1.28.44/32",
-            "alb_add_test": {
-                "endpoint": "POST /api/v1/alb/add-entries",
-                "payload": {
-                    "source_cidr_ip": "34.1.28.44/32",
-                    "description": "测试IP地址"
-                }
-            },
-            "ecs_add_test": {
-                "endpoint": "POST /api/v1/ecs/authorize",
-                "payload": {
-                    "source_cidr_ip": "34.1.28.44/32",
-                    "description": "测试SSH访问",
-                    "policy": "Accept",
-                    "port_range": "22/22",
-                    "ip_protocol": "TCP"
-                }
+        "ecs_add_test": {
+            "endpoint": "POST /api/v1/ecs/authorize",
+            "payload": {
+                "source_cidr_ip": "34.1.28.44/32",
+                "description": "测试SSH访问",
+                "policy": "Accept",
+                "port_range": "22/22",
+                "ip_protocol": "TCP"
             }
         }
     }
+})
+
+@app.get("/api/docs", tags=["API 文档汇总"])
+async def get_api_documentation(request: Request):
+    """获取完整的API文档汇总"""
+    return API_DOCUMENTATION.respond(request)
 
 # 暂时注释掉有问题的导入
 @app.exception_handler(HTTPException)
@@ -149,7 +230,8 @@ async def http_exception_handler(request, exc):
             "error": "HTTP Error",
             "detail": exc.detail,
             "timestamp": datetime.now().isoformat()
-        }
+        },
+        headers=getattr(exc, "headers", None)
     )
 
 @app.exception_handler(Exception)
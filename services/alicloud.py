@@ -3,146 +3,906 @@
 封装 ACCESS_KEY_ID 和 ACCESS_KEY_SECRET 的认证方式
 """
 
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Iterator, AsyncIterator, Iterable, Set, Tuple, Callable
+import asyncio
+import contextvars
+import copy
+import importlib
+import ipaddress
 import json
-from alibabacloud_tea_openapi.models import Config as TeaConfig
-from alibabacloud_tea_util import models as UtilModels
-from alibabacloud_ecs20140526.client import Client as EcsClient
-from alibabacloud_alb20200616.client import Client as AlbClient
-from alibabacloud_ecs20140526 import models as EcsModels
-from alibabacloud_alb20200616 import models as AlbModels
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from core.config import settings
+from core.cidr_index import CIDRIndex
+from core.deadline import DeadlineExceededError, RequestCancelledError, check_cancelled, remaining, sleep
+from core.logger import sampled_logger
+from core.metrics import metrics, COUNTER
+from services.cidr import normalize_cidr, normalize_cidrs, is_ipv6
+from services.ratelimit import RateLimiter, RetryPolicy, is_applied_error, is_quota_error, is_retryable_error, is_throttling_error
+from services.state_store import StateStore, get_state_store
+from services.breaker import CircuitOpenError, get_circuit_breakers, is_endpoint_failure
 from loguru import logger
 
+class _LazyModule:
+    """首次访问属性时才导入的模块（SDK 模块导入耗时较长，不放在服务启动路径上）"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._module or self._load(), attr)
+
+
+OpenApiModels = _LazyModule("alibabacloud_tea_openapi.models")
+UtilModels = _LazyModule("alibabacloud_tea_util.models")
+EcsModels = _LazyModule("alibabacloud_ecs20140526.models")
+AlbModels = _LazyModule("alibabacloud_alb20200616.models")
+EcsClientModule = _LazyModule("alibabacloud_ecs20140526.client")
+AlbClientModule = _LazyModule("alibabacloud_alb20200616.client")
+
+# 单次 API 调用允许携带的最大条目数
+ALB_ACL_ENTRIES_BATCH_SIZE = 20     # AddEntriesToAcl / RemoveEntriesFromAcl
+ECS_PERMISSIONS_BATCH_SIZE = 100    # AuthorizeSecurityGroup / RevokeSecurityGroup
+PREFIX_LIST_ENTRIES_BATCH_SIZE = 200  # ModifyPrefixList
+
+
+def _chunks(items: List[str], size: int) -> Iterator[List[str]]:
+    """按指定大小切分列表"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def build_runtime_options() -> Tuple[Any, Dict[str, Any]]:
+    """
+    按配置预先创建 SDK 运行时参数：(默认参数, API -> 覆盖了读超时的参数)
+    每次调用复用同一个对象，不再逐次构造；长连接复用、超时和 SDK 重试均来自 Settings
+    """
+    def runtime(read_timeout_ms: int):
+        return UtilModels.RuntimeOptions(
+            autoretry=settings.api_sdk_autoretry,
+            max_attempts=settings.api_sdk_max_attempts,
+            connect_timeout=settings.api_connect_timeout_ms,
+            read_timeout=read_timeout_ms,
+            keep_alive=settings.http_keep_alive,
+            max_idle_conns=settings.http_max_idle_conns
+        )
+
+    overrides = {operation: runtime(timeout) for operation, timeout in settings.API_READ_TIMEOUTS.items()}
+    return runtime(settings.api_read_timeout_ms), overrides
+
+
+def collect_batch_failures(
+    batch_results: List[Dict[str, Any]],
+    source_cidr_ips: Optional[List[str]] = None
+) -> Dict[str, str]:
+    """
+    从分批调用结果中提取失败条目及原因
+    传入请求的网段时，被合并进失败超网的网段也记为失败
+    """
+    failures = {}
+    for result in batch_results:
+        if not result["success"]:
+            for entry in result["entries"]:
+                failures[entry] = result["error"]
+
+    if source_cidr_ips and failures:
+        failed_networks = []
+        for entry, error in failures.items():
+            try:
+                failed_networks.append((ipaddress.ip_network(entry), error))
+            except ValueError:
+                continue
+        for cidr_ip in source_cidr_ips:
+            if cidr_ip in failures:
+                continue
+            try:
+                network = ipaddress.ip_network(cidr_ip)
+            except ValueError:
+                continue
+            for failed, error in failed_networks:
+                if failed.version == network.version and network.subnet_of(failed):
+                    failures[cidr_ip] = error
+                    break
+    return failures
+
+
+def collect_batch_skipped(batch_results: List[Dict[str, Any]]) -> Set[str]:
+    """从分批调用结果中提取已处于目标状态（已存在或已被更大网段包含）、未调用云 API 的条目"""
+    return {entry for result in batch_results if result.get("skipped") for entry in result["entries"]}
+
+
+def _canonical_cidr(value: str) -> str:
+    """云端返回的条目统一写法，无法解析时原样保留"""
+    try:
+        return normalize_cidr(value)
+    except ValueError:
+        return value
+
+
+def _split_cover_item(item) -> Tuple[str, tuple]:
+    """缓存条目拆分为 (网段, 分组)：安全组规则按策略、端口和协议分组，ACL 条目只有一组"""
+    if isinstance(item, tuple):
+        return item[0], item[1:]
+    return item, ()
+
+
+def _rule_key(source_cidr_ip: str, policy: str, port_range: str, ip_protocol: str) -> Tuple[str, str, str, str]:
+    """安全组规则的比较键（云端返回的大小写和端口写法与请求不完全一致，需要归一化）"""
+    ip_protocol = (ip_protocol or "ALL").upper()
+    if ip_protocol in ("ALL", "ICMP", "ICMPV6", "GRE"):
+        port_range = "-1/-1"
+    return source_cidr_ip, (policy or "Accept").lower(), port_range, ip_protocol
+
+
+class CloudStateCache:
+    """
+    ACL 条目与安全组规则的本地读穿缓存
+    首次访问时从云端加载，之后由本服务的写操作增量维护，超过 TTL 后重新加载
+    传入共享的状态存储时（多 worker），每个键在存储中有一个版本号，任一 worker 写入后加一；
+    本地版本落后时视为过期并重新加载，各 worker 看到一致的封禁状态
+    """
+
+    def __init__(self, ttl: float, store: Optional[StateStore] = None):
+        self.ttl = ttl
+        self.store = store if store is not None and store.shared else None
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._items: Dict[str, Set] = {}
+        self._cover_indexes: Dict[str, Dict[tuple, CIDRIndex]] = {}
+        self._expires_at: Dict[str, float] = {}
+        self._retry_at: Dict[str, float] = {}
+        self._generations: Dict[str, int] = {}
+        self._observed: Dict[str, int] = {}
+
+    def _shared_generation(self, key: str) -> int:
+        return int(self.store.get(f"cache_gen:{key}") or 0)
+
+    def check(self, key: str) -> bool:
+        """检查缓存是否新鲜，并记录命中/未命中"""
+        fresh = self._expires_at.get(key, 0) > time.monotonic()
+        if self.store is not None:
+            # 重新加载前记下当前版本号，加载期间其他 worker 的写入会使下一次检查再次过期
+            generation = self._observed[key] = self._shared_generation(key)
+            fresh = fresh and generation == self._generations.get(key)
+        if fresh:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return fresh
+
+    def can_load(self, key: str) -> bool:
+        """加载失败后在一个 TTL 内不再重试，避免每次写操作都额外查询一次"""
+        return self._retry_at.get(key, 0) <= time.monotonic()
+
+    def load(self, key: str, items: Iterable):
+        """用云端的完整状态替换缓存"""
+        items = set(items)
+        generation = None
+        if self.store is not None:
+            generation = self._observed.pop(key, None)
+            if generation is None:
+                generation = self._shared_generation(key)
+        with self._lock:
+            self._items[key] = items
+            self._cover_indexes.pop(key, None)
+            self._expires_at[key] = time.monotonic() + self.ttl
+            self._retry_at.pop(key, None)
+            if generation is not None:
+                self._generations[key] = generation
+
+    def mark_failed(self, key: str):
+        """记录加载失败"""
+        with self._lock:
+            self._retry_at[key] = time.monotonic() + self.ttl
+
+    def split(self, key: str, items: List, adding: bool) -> Tuple[List, List]:
+        """拆分为 (需要变更的条目, 已处于目标状态可跳过的条目)"""
+        with self._lock:
+            current = self._items.get(key)
+            if current is None:
+                return list(items), []
+            pending = [item for item in items if (item in current) != adding]
+            skipped = [item for item in items if (item in current) == adding]
+        self.skipped += len(skipped)
+        return pending, skipped
+
+    def split_covered(self, key: str, items: List) -> Tuple[List, List]:
+        """拆分为 (需要新增的条目, 已被现有更大网段包含可跳过的条目)"""
+        with self._lock:
+            current = self._items.get(key)
+            if not current or not items:
+                return list(items), []
+            indexes = self._cover_indexes.get(key)
+            if indexes is None:
+                grouped: Dict[tuple, List[str]] = {}
+                for item in current:
+                    cidr, group = _split_cover_item(item)
+                    grouped.setdefault(group, []).append(cidr)
+                indexes = self._cover_indexes[key] = {
+                    group: CIDRIndex.from_strings(cidrs) for group, cidrs in grouped.items()
+                }
+
+        pending, covered = [], []
+        for item in items:
+            cidr, group = _split_cover_item(item)
+            index = indexes.get(group)
+            try:
+                network = ipaddress.ip_network(cidr)
+            except ValueError:
+                network = None
+            if index is not None and network is not None and index.covers(network):
+                covered.append(item)
+            else:
+                pending.append(item)
+        self.skipped += len(covered)
+        return pending, covered
+
+    def _bump_generation(self, key: str) -> bool:
+        """本服务写入后把共享版本号加一；期间有其他 worker 写入时返回 False（本地缓存需要重新加载）"""
+        if self.store is None:
+            return True
+        generation = self.store.incr(f"cache_gen:{key}")
+        with self._lock:
+            if self._generations.get(key) == generation - 1:
+                self._generations[key] = generation
+                return True
+        return False
+
+    def add(self, key: str, items: Iterable):
+        if not self._bump_generation(key):
+            return self._drop(key)
+        with self._lock:
+            if key in self._items:
+                self._items[key].update(items)
+                self._cover_indexes.pop(key, None)
+
+    def discard(self, key: str, items: Iterable):
+        if not self._bump_generation(key):
+            return self._drop(key)
+        with self._lock:
+            if key in self._items:
+                self._items[key].difference_update(items)
+                self._cover_indexes.pop(key, None)
+
+    def invalidate(self, key: str):
+        """写操作失败时云端状态未知，丢弃缓存等待重新加载（共享时其他 worker 也重新加载）"""
+        self._bump_generation(key)
+        self._drop(key)
+
+    def _drop(self, key: str):
+        with self._lock:
+            self._items.pop(key, None)
+            self._cover_indexes.pop(key, None)
+            self._expires_at.pop(key, None)
+            self._generations.pop(key, None)
+
+
+metrics.describe("cloud_tasks_abandoned_total", COUNTER, "请求被放弃时取消的线程池任务数（state=queued 未开始/running 结果丢弃）")
+
+
+def _drop_late_result(future):
+    """已放弃的请求的线程池任务完成：结果（包括异常）无人等待，直接丢弃"""
+    logger.debug("丢弃已放弃请求的迟到结果: {}", future.exception() or "成功")
+
+
+def _expired(left: Optional[float]) -> bool:
+    return left is not None and left <= 0
+
+
 class AliCloudClient:
     """阿里云 API 客户端管理类"""
 
-    def __init__(self):
+    def __init__(self, region: Optional[str] = None, shared: Optional["AliCloudClient"] = None):
         self.ak_id = settings.access_key_id
         self.ak_secret = settings.access_key_secret
-        self.default_region = settings.default_region
+        self.default_region = region or settings.default_region
         self.default_security_group_id = settings.default_security_group_id
 
+        if shared is not None:
+            # 地域客户端：与主客户端共享线程池、限流器、重试策略和状态缓存，只创建该地域的 SDK 客户端
+            self._owns_executor = False
+            self._executor = shared._executor
+            self.rate_limiter = shared.rate_limiter
+            self.retry_policy = shared.retry_policy
+            self.circuit_breakers = shared.circuit_breakers
+            self.state_cache = shared.state_cache
+            self.runtime = shared.runtime
+            self.runtime_overrides = shared.runtime_overrides
+            self._regional_clients = shared._regional_clients
+            self._regional_lock = shared._regional_lock
+            self._init_clients()
+            return
+
+        # 有界线程池：SDK 为同步阻塞调用，放到线程池中执行，避免阻塞事件循环
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.cloud_executor_max_workers,
+            thread_name_prefix="aliyun-api"
+        )
+
+        # 按 (API, 地域) 限流，限流和瞬时错误自动重试
+        # 多 worker 时令牌和状态缓存版本号放在共享状态存储中
+        store = get_state_store()
+        self.rate_limiter = RateLimiter(
+            settings.api_rate_limit_qps,
+            settings.api_rate_limit_burst,
+            settings.API_RATE_LIMITS,
+            store=store
+        )
+        self.retry_policy = RetryPolicy(
+            max_retries=settings.api_max_retries,
+            base_delay=settings.api_retry_base_delay,
+            max_delay=settings.api_retry_max_delay
+        )
+        # 按 (API, 地域) 熔断，端点故障时快速失败
+        self.circuit_breakers = get_circuit_breakers()
+
+        # ACL/安全组状态缓存，用于跳过幂等的重复封禁/解封
+        self.state_cache = CloudStateCache(settings.state_cache_ttl, store) if settings.state_cache_enabled else None
+
+        # 按地域懒创建的客户端
+        self._owns_executor = True
+        self._regional_clients: Dict[str, "AliCloudClient"] = {self.default_region: self}
+        self._regional_lock = threading.Lock()
+
+        # SDK 运行时参数，首次初始化 SDK 客户端时创建，地域客户端共用（模拟后端不使用）
+        self.runtime = None
+        self.runtime_overrides: Dict[str, Any] = {}
+
         # 初始化客户端
         self._init_clients()
 
     def _init_clients(self):
         """初始化阿里云客户端"""
+        if settings.cloud_backend == "fake":
+            from services.fake_cloud import create_fake_clients
+            self.ecs_client, self.alb_client = create_fake_clients()
+            logger.info("使用模拟云后端: {}", self.default_region)
+            return
+        if settings.cloud_backend != "aliyun":
+            raise ValueError(f"未知的云 API 后端: {settings.cloud_backend}")
+
         if not self.ak_id or not self.ak_secret:
             logger.warning("阿里云 AK/SK 未配置，将使用默认凭证")
             # 在容器环境中，可以依赖阿里云容器服务的默认凭证
-            config = TeaConfig()
+            config = OpenApiModels.Config()
         else:
-            config = TeaConfig(
+            config = OpenApiModels.Config(
                 access_key_id=self.ak_id,
                 access_key_secret=self.ak_secret
             )
 
-        # 设置endpoint（使用全局域名）
-        config.endpoint = "ecs.aliyuncs.com"
-        self.ecs_client = EcsClient(config)
+        # 连接池大小（SDK 按域名复用 HTTP 会话，池大小决定可保持的空闲长连接数）
+        config.max_idle_conns = settings.http_max_idle_conns
 
-        config.endpoint = "alb.cn-hangzhou.aliyuncs.com"  # 使用区域特定的ALB域名
-        self.alb_client = AlbClient(config)
+        # 所有调用共享的运行时参数（超时、SDK 重试、长连接复用），按 API 覆盖读超时
+        if self.runtime is None:
+            self.runtime, self.runtime_overrides = build_runtime_options()
 
-        logger.info("阿里云客户端初始化完成")
+        # 设置endpoint（使用地域域名）
+        config.region_id = self.default_region
+        config.endpoint = settings.ecs_endpoint_template.format(region=self.default_region)
+        self.ecs_client = EcsClientModule.Client(config)
 
-    def _make_request(self, client, request, operation_name: str, action: str, version: str) -> Dict[str, Any]:
-        """执行 API 请求的通用方法"""
-        try:
-            logger.info(f"执行阿里云 API: {operation_name}")
+        config.endpoint = settings.alb_endpoint_template.format(region=self.default_region)
+        self.alb_client = AlbClientModule.Client(config)
 
-            # 直接调用client的方法，不使用call_api
-            if hasattr(client, action):
-                method = getattr(client, action)
-                response = method(request)
-            else:
-                # 如果没有直接方法，尝试直接调用call_api
-                response = client.call_api(request)
+        logger.info("阿里云客户端初始化完成: {}", self.default_region)
 
-            logger.info(f"API 响应: {operation_name} - 成功")
+    def for_region(self, region: Optional[str]) -> "AliCloudClient":
+        """获取指定地域的客户端，首次使用时创建并缓存"""
+        region = region or self.default_region
+        client = self._regional_clients.get(region)
+        if client is None:
+            with self._regional_lock:
+                client = self._regional_clients.get(region)
+                if client is None:
+                    client = self._regional_clients[region] = AliCloudClient(region, shared=self)
+        return client
 
-            return {
-                "success": True,
-                "data": response,
-                "operation": operation_name
-            }
+    def _runtime_for(self, operation_name: str, left: Optional[float]):
+        """该 API 预先创建的运行时参数；请求剩余时间短于其超时时复制一份并缩短超时"""
+        runtime = self.runtime_overrides.get(operation_name, self.runtime)
+        if runtime is None or left is None:
+            return runtime
+        left_ms = max(1, int(left * 1000))
+        if left_ms >= runtime.read_timeout and left_ms >= runtime.connect_timeout:
+            return runtime
+        runtime = copy.copy(runtime)
+        runtime.read_timeout = min(runtime.read_timeout, left_ms)
+        runtime.connect_timeout = min(runtime.connect_timeout, left_ms)
+        # 剩余时间内来不及让 SDK 自身重试
+        runtime.autoretry = False
+        return runtime
+
+    def _call_api(
+        self,
+        operation_name: str,
+        method: Callable,
+        request,
+        region: Optional[str] = None,
+        applied: Optional[Callable[[], bool]] = None
+    ):
+        """
+        执行 API 请求的通用方法
+        调用前按 (API, 地域) 获取令牌；限流和瞬时网络错误按指数退避重试，最终失败时抛出最后一次的异常
+        熔断期间（包括重试过程中熔断）抛出 CircuitOpenError，不再调用云 API；重试用尽后才按最终结果计一次熔断
+        请求设置了截止时间时：截止后抛出 DeadlineExceededError，SDK 超时不超过剩余时间，剩余时间不够退避时不再重试；
+        客户端已断开时抛出 RequestCancelledError，不再消耗令牌和重试
+        非幂等写操作的一次尝试结果不确定（网络错误、服务端故障）后可能已经生效：之后的失败返回"已存在/已删除"类错误码时视为成功；
+        传入 applied 时，重试或放弃前先用它查询云端状态，已生效则视为成功（此时返回 None）
+        """
+        region = region or self.default_region
+        labels = (("operation", operation_name), ("region", region))
+        bucket = self.rate_limiter.bucket(operation_name, region)
+        breaker = self.circuit_breakers.get(operation_name, region)
+        # 熔断按逻辑调用计数：重试结束后才记一次结论（True 端点有响应，False 端点故障，None 不计入）
+        admitted = False
+        endpoint_ok: Optional[bool] = None
+        attempt = 0
+        # 之前有尝试结果不确定，写入可能已经生效
+        ambiguous = False
+        result = "error"
+        metrics.inc("cloud_api_calls_in_flight")
+        start = time.perf_counter()
+        try:
+            check_cancelled(operation_name)
+            if breaker is not None:
+                breaker.before_call()
+                admitted = True
+            while True:
+                if bucket is not None:
+                    bucket.acquire()
+                # 等待令牌期间调用方可能已放弃
+                check_cancelled(operation_name)
+                left = remaining()
+                runtime = self._runtime_for(operation_name, left)
+                clamped = runtime is not self.runtime_overrides.get(operation_name, self.runtime)
+                try:
+                    response = method(request, runtime)
+                except Exception as e:
+                    left = remaining()
+                    if is_endpoint_failure(e) and (clamped or _expired(left)):
+                        # 按请求剩余时间缩短的超时不说明端点故障，不计入熔断
+                        raise DeadlineExceededError(operation_name) from e
+                    if bucket is not None and is_throttling_error(e):
+                        bucket.on_throttled()
+                    if ambiguous and is_applied_error(operation_name, e):
+                        logger.info("API 重试前的尝试已生效: {} - {}", operation_name, e)
+                        endpoint_ok = True
+                        result = "success"
+                        return None
+                    ambiguous = ambiguous or is_endpoint_failure(e)
+                    if ambiguous and applied is not None and self._confirm_applied(operation_name, applied):
+                        # 由查询确认结果，写操作本身的失败不计入熔断
+                        result = "success"
+                        return None
+                    retry = attempt < self.retry_policy.max_retries and is_retryable_error(e)
+                    delay = self.retry_policy.delay(attempt) if retry else 0.0
+                    if not retry or (left is not None and delay >= left):
+                        endpoint_ok = not is_endpoint_failure(e)
+                        raise
+                    attempt += 1
+                    metrics.inc("cloud_api_retries_total", labels)
+                    logger.warning("API 重试: {} 第{}次，{:.2f}s 后重试 - {}", operation_name, attempt, delay, e)
+                    sleep(delay)
+                    check_cancelled(operation_name)
+                    if breaker is not None:
+                        # 重试期间其他调用已使熔断器打开
+                        breaker.raise_if_open()
+                    continue
+
+                endpoint_ok = True
+                if bucket is not None:
+                    bucket.on_success()
+                result = "success"
+                return response
+        except CircuitOpenError:
+            result = "circuit_open"
+            raise
+        except RequestCancelledError as e:
+            result = "deadline_exceeded" if isinstance(e, DeadlineExceededError) else "cancelled"
+            raise
+        finally:
+            if admitted:
+                if endpoint_ok is None:
+                    breaker.release()
+                elif endpoint_ok:
+                    breaker.on_success()
+                else:
+                    breaker.on_failure()
+            metrics.inc("cloud_api_calls_in_flight", value=-1)
+            metrics.inc("cloud_api_calls_total", labels + (("result", result),))
+            metrics.observe("cloud_api_call_duration_seconds", time.perf_counter() - start, labels)
 
+    @staticmethod
+    def _confirm_applied(operation_name: str, applied: Callable[[], bool]) -> bool:
+        """写操作结果不确定时查询云端状态，确认已生效返回 True；查询失败按未生效处理"""
+        try:
+            if applied():
+                logger.info("API 结果不确定，查询确认已生效: {}", operation_name)
+                return True
+        except RequestCancelledError:
+            raise
         except Exception as e:
-            logger.error(f"API 错误: {operation_name} - {str(e)}")
-            return {
-                "success": False,
-                "error": str(e),
-                "operation": operation_name
-            }
+            logger.warning("API 结果不确定，查询云端状态失败: {} - {}", operation_name, e)
+        return False
+
+    # ==== 状态缓存 ====
+
+    def _split_cached(
+        self,
+        key: str,
+        items: List,
+        adding: bool,
+        loader: Callable[[], Iterable]
+    ) -> Tuple[List, List]:
+        """按本地缓存拆分为 (需要调用云 API 的条目, 已处于目标状态可跳过的条目)"""
+        cache = self.state_cache
+        if cache is None:
+            return list(items), []
+
+        if not cache.check(key):
+            if not cache.can_load(key):
+                return list(items), []
+            try:
+                cache.load(key, loader())
+            except Exception as e:
+                logger.warning("加载云端状态失败，跳过缓存: {} - {}", key, e)
+                cache.mark_failed(key)
+                return list(items), []
+
+        pending, skipped = cache.split(key, items, adding)
+        if adding:
+            # 已有更大的网段（如 1.2.3.0/24 之于 1.2.3.4/32）时无需再新增
+            pending, covered = cache.split_covered(key, pending)
+            skipped += covered
+        return pending, skipped
+
+    def _split_acl_entries(self, acl_id: str, source_cidr_ips: List[str], adding: bool) -> Tuple[List[str], List[str]]:
+        """按缓存拆分 ACL 条目"""
+        return self._split_cached(
+            f"acl:{acl_id}", source_cidr_ips, adding, lambda: self._acl_state_items(acl_id)
+        )
+
+    def _split_security_group_rules(
+        self,
+        source_cidr_ips: List[str],
+        security_group_id: str,
+        policy: str,
+        port_range: str,
+        ip_protocol: str,
+        adding: bool
+    ) -> Tuple[List[str], List[str]]:
+        """按缓存拆分安全组规则（仅比较来源 CIDR、策略、端口和协议均相同的规则）"""
+        rules = [_rule_key(cidr, policy, port_range, ip_protocol) for cidr in source_cidr_ips]
+        pending, skipped = self._split_cached(
+            f"sg:{security_group_id}", rules, adding, lambda: self._security_group_state_items(security_group_id)
+        )
+        return [rule[0] for rule in pending], [rule[0] for rule in skipped]
+
+    def _acl_entries_applied(self, acl_id: str, source_cidr_ips: List[str], adding: bool) -> bool:
+        """查询云端（不经缓存）：条目是否都已存在（adding=True）或都已删除"""
+        current = set(self._acl_state_items(acl_id))
+        return all((cidr in current) == adding for cidr in source_cidr_ips)
+
+    def _security_group_rules_applied(self, security_group_id: str, rules: List[Tuple[str, str, str, str]], adding: bool) -> bool:
+        """查询云端（不经缓存）：规则是否都已存在（adding=True）或都已撤销"""
+        current = set(self._security_group_state_items(security_group_id))
+        return all((rule in current) == adding for rule in rules)
+
+    def _acl_state_items(self, acl_id: str) -> Iterator[str]:
+        """云端 ACL 条目，转换为缓存中的写法"""
+        return (_canonical_cidr(entry["entry"]) for entry in self.iter_acl_entries(acl_id))
+
+    def _security_group_state_items(self, security_group_id: str) -> Iterator[Tuple[str, str, str, str]]:
+        """云端安全组规则，转换为缓存中的比较键"""
+        return (
+            _rule_key(_canonical_cidr(rule["source_cidr_ip"]), rule["policy"], rule["port_range"], rule["ip_protocol"])
+            for rule in self.iter_security_group_rules(security_group_id)
+            if rule["source_cidr_ip"]
+        )
+
+    def list_acl_cidrs(self, acl_id: str) -> List[str]:
+        """读取 ACL 当前的全部网段（规范写法），同时用读到的完整状态刷新缓存"""
+        cidrs = list(self._acl_state_items(acl_id))
+        if self.state_cache is not None:
+            self.state_cache.load(f"acl:{acl_id}", cidrs)
+        return cidrs
+
+    def list_security_group_cidrs(
+        self,
+        security_group_id: Optional[str] = None,
+        policy: str = "Drop",
+        port_range: str = "-1/-1",
+        ip_protocol: str = "ALL"
+    ) -> List[str]:
+        """读取安全组中策略、端口和协议均匹配的入方向规则的来源网段，同时刷新缓存"""
+        security_group_id = security_group_id or self.default_security_group_id
+        rules = list(self._security_group_state_items(security_group_id))
+        if self.state_cache is not None:
+            self.state_cache.load(f"sg:{security_group_id}", rules)
+        match = _rule_key("", policy, port_range, ip_protocol)[1:]
+        return [rule[0] for rule in rules if rule[1:] == match]
+
+    def _update_cache(self, key: str, items: Iterable, success: bool, adding: bool):
+        """根据写操作结果维护缓存"""
+        if self.state_cache is None:
+            return
+        if not success:
+            self.state_cache.invalidate(key)
+        elif adding:
+            self.state_cache.add(key, items)
+        else:
+            self.state_cache.discard(key, items)
+
+    @staticmethod
+    def _skipped_result(operation: str, entries: List[str]) -> Dict[str, Any]:
+        """已处于目标状态、无需调用云 API 的条目"""
+        return {
+            "success": True,
+            "skipped": True,
+            "entries": entries,
+            "operation": operation
+        }
+
+    @staticmethod
+    def _failed_result(operation: str, entries: List[str], error: Exception) -> Dict[str, Any]:
+        """
+        云 API 调用失败；熔断导致的失败带有 circuit_open 和 retry_after，
+        请求截止导致的带有 deadline_exceeded，客户端断开导致的带有 cancelled，配额不足的带有 quota_exceeded
+        """
+        result = {
+            "success": False,
+            "error": str(error),
+            "entries": entries,
+            "operation": operation
+        }
+        if isinstance(error, CircuitOpenError):
+            result["circuit_open"] = True
+            result["retry_after"] = error.retry_after
+        elif isinstance(error, DeadlineExceededError):
+            result["deadline_exceeded"] = True
+        elif isinstance(error, RequestCancelledError):
+            result["cancelled"] = True
+        elif is_quota_error(error):
+            result["quota_exceeded"] = True
+        return result
+
+    @staticmethod
+    def _invalid_result(operation: str, entries: List[str]) -> Dict[str, Any]:
+        """无法解析的 IP/CIDR，不调用云 API"""
+        return {
+            "success": False,
+            "error": f"无效的 IP 地址或 CIDR: {', '.join(entries)}",
+            "entries": entries,
+            "operation": operation
+        }
+
+    @classmethod
+    def _with_skipped(
+        cls,
+        results: List[Dict[str, Any]],
+        operation: str,
+        skipped: List[str],
+        invalid: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        if skipped:
+            results = [cls._skipped_result(operation, skipped)] + results
+        if invalid:
+            results = [cls._invalid_result(operation, invalid)] + results
+        return results
+
+    def _normalize(
+        self,
+        source_cidr_ips: List[str],
+        adding: bool,
+        exact: bool = False,
+        merge: bool = True
+    ) -> Tuple[List[str], List[str]]:
+        """
+        规范化待写入的网段，返回 (网段, 无效条目)
+        新增时去掉被同批其他网段包含的条目，并按配置合并相邻网段；删除时只去重，避免漏删小网段；
+        exact=True 时新增也只去重，按原网段写入；merge=False 时不合并相邻网段
+        """
+        shrink = adding and not exact
+        return normalize_cidrs(
+            source_cidr_ips,
+            drop_covered=shrink,
+            merge=shrink and merge and settings.cidr_merge_supernets
+        )
+
+    # ==== 云端状态查询 ====
+
+    def iter_acl_entries(self, acl_id: str) -> Iterator[Dict[str, Any]]:
+        """分页遍历 ALB 访问控制条目 (ListAclEntries)"""
+        for page in self.iter_acl_entry_pages(acl_id):
+            yield from page
+
+    def iter_acl_entry_pages(self, acl_id: str) -> Iterator[List[Dict[str, Any]]]:
+        """逐页获取 ALB 访问控制条目，每次只请求并持有一页"""
+        next_token = None
+        while True:
+            request = AlbModels.ListAclEntriesRequest(acl_id=acl_id, max_results=100, next_token=next_token)
+            body = self._call_api("ListAclEntries", self.alb_client.list_acl_entries_with_options, request).body
+            yield [
+                {
+                    "entry": entry.entry,
+                    "description": entry.description,
+                    "status": entry.status
+                }
+                for entry in body.acl_entries or []
+            ]
+            next_token = body.next_token
+            if not next_token:
+                return
+
+    def iter_security_group_rules(self, security_group_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """分页遍历 ECS 安全组入方向规则 (DescribeSecurityGroupAttribute)"""
+        for page in self.iter_security_group_rule_pages(security_group_id):
+            yield from page
+
+    def iter_security_group_rule_pages(self, security_group_id: Optional[str] = None) -> Iterator[List[Dict[str, Any]]]:
+        """逐页获取 ECS 安全组入方向规则，每次只请求并持有一页"""
+        next_token = None
+        while True:
+            request = EcsModels.DescribeSecurityGroupAttributeRequest(
+                region_id=self.default_region,
+                security_group_id=security_group_id or self.default_security_group_id,
+                direction="ingress",
+                max_results=1000,
+                next_token=next_token
+            )
+            body = self._call_api(
+                "DescribeSecurityGroupAttribute", self.ecs_client.describe_security_group_attribute_with_options, request
+            ).body
+            permissions = body.permissions.permission if body.permissions else None
+            yield [
+                {
+                    "source_cidr_ip": permission.source_cidr_ip or permission.ipv_6source_cidr_ip,
+                    "policy": permission.policy,
+                    "port_range": permission.port_range,
+                    "ip_protocol": permission.ip_protocol,
+                    "description": permission.description,
+                    "security_group_rule_id": permission.security_group_rule_id,
+                    "source_prefix_list_id": getattr(permission, "source_prefix_list_id", None)
+                }
+                for permission in permissions or []
+            ]
+            next_token = body.next_token
+            if not next_token:
+                return
 
     # ==== ALB 访问控制相关方法 ====
 
     def add_entries_to_acl(self, acl_id: str, source_cidr_ip: str, description: Optional[str] = None) -> Dict[str, Any]:
         """添加 ALB 访问控制条目"""
+        try:
+            source_cidr_ip = normalize_cidr(source_cidr_ip)
+        except ValueError:
+            return self._invalid_result("AddEntriesToAcl", [source_cidr_ip])
+        pending, skipped = self._split_acl_entries(acl_id, [source_cidr_ip], adding=True)
+        if not pending:
+            sampled_logger.info("ACL 条目已存在，跳过调用: {}", source_cidr_ip)
+            return self._skipped_result("AddEntriesToAcl", skipped)
+        return self._add_entries_to_acl(acl_id, pending, description)
+
+    def add_entries_to_acl_batch(self, acl_id: str, source_cidr_ips: List[str], description: Optional[str] = None) -> List[Dict[str, Any]]:
+        """批量添加 ALB 访问控制条目，按单次调用上限分批，每批返回一个结果"""
+        source_cidr_ips, invalid = self._normalize(source_cidr_ips, adding=True)
+        pending, skipped = self._split_acl_entries(acl_id, source_cidr_ips, adding=True)
+        results = [
+            self._add_entries_to_acl(acl_id, batch, description)
+            for batch in _chunks(pending, ALB_ACL_ENTRIES_BATCH_SIZE)
+        ]
+        return self._with_skipped(results, "AddEntriesToAcl", skipped, invalid)
+
+    def _add_entries_to_acl(self, acl_id: str, source_cidr_ips: List[str], description: Optional[str] = None) -> Dict[str, Any]:
+        """单次 AddEntriesToAcl 调用，可携带多个条目"""
 
         # 创建AclEntries对象，并显式设置description为None
-        acl_entries = AlbModels.AddEntriesToAclRequestAclEntries(
-            entry=source_cidr_ip,
-            description=None
-        )
+        acl_entries = [
+            AlbModels.AddEntriesToAclRequestAclEntries(
+                entry=source_cidr_ip,
+                description=None
+            )
+            for source_cidr_ip in source_cidr_ips
+        ]
 
         # 创建请求
         request = AlbModels.AddEntriesToAclRequest()
         request.acl_id = acl_id
-        request.acl_entries = [acl_entries]
+        request.acl_entries = acl_entries
 
         try:
-            logger.info(f"执行阿里云 API: AddEntriesToAcl")
+            logger.debug("执行阿里云 API: AddEntriesToAcl ({} 条)", len(acl_entries))
 
-            # 使用带options的方法调用，需要runtime参数
-            runtime = UtilModels.RuntimeOptions()
-            response = self.alb_client.add_entries_to_acl_with_options(request, runtime)
-            logger.info(f"API 响应: AddEntriesToAcl - 成功")
+            response = self._call_api(
+                "AddEntriesToAcl", self.alb_client.add_entries_to_acl_with_options, request,
+                applied=lambda: self._acl_entries_applied(acl_id, source_cidr_ips, adding=True)
+            )
+            sampled_logger.info("API 响应: AddEntriesToAcl - 成功 ({} 条)", len(source_cidr_ips))
+            self._update_cache(f"acl:{acl_id}", source_cidr_ips, success=True, adding=True)
 
             return {
                 "success": True,
                 "data": response,
+                "entries": source_cidr_ips,
                 "operation": "AddEntriesToAcl"
             }
 
         except Exception as e:
-            logger.error(f"API 错误: AddEntriesToAcl - {str(e)}")
-            return {
-                "success": False,
-                "error": str(e),
-                "operation": "AddEntriesToAcl"
-            }
+            logger.error("API 错误: AddEntriesToAcl - {}", e)
+            self._update_cache(f"acl:{acl_id}", source_cidr_ips, success=False, adding=True)
+            return self._failed_result("AddEntriesToAcl", source_cidr_ips, e)
 
     def remove_entries_from_acl(self, acl_id: str, source_cidr_ip: str) -> Dict[str, Any]:
         """删除 ALB 访问控制条目"""
+        try:
+            source_cidr_ip = normalize_cidr(source_cidr_ip)
+        except ValueError:
+            return self._invalid_result("RemoveEntriesFromAcl", [source_cidr_ip])
+        pending, skipped = self._split_acl_entries(acl_id, [source_cidr_ip], adding=False)
+        if not pending:
+            sampled_logger.info("ACL 条目不存在，跳过调用: {}", source_cidr_ip)
+            return self._skipped_result("RemoveEntriesFromAcl", skipped)
+        return self._remove_entries_from_acl(acl_id, pending)
+
+    def remove_entries_from_acl_batch(self, acl_id: str, source_cidr_ips: List[str]) -> List[Dict[str, Any]]:
+        """批量删除 ALB 访问控制条目，按单次调用上限分批，每批返回一个结果"""
+        source_cidr_ips, invalid = self._normalize(source_cidr_ips, adding=False)
+        pending, skipped = self._split_acl_entries(acl_id, source_cidr_ips, adding=False)
+        results = [
+            self._remove_entries_from_acl(acl_id, batch)
+            for batch in _chunks(pending, ALB_ACL_ENTRIES_BATCH_SIZE)
+        ]
+        return self._with_skipped(results, "RemoveEntriesFromAcl", skipped, invalid)
+
+    def _remove_entries_from_acl(self, acl_id: str, source_cidr_ips: List[str]) -> Dict[str, Any]:
+        """单次 RemoveEntriesFromAcl 调用，可携带多个条目"""
         request = AlbModels.RemoveEntriesFromAclRequest()
         request.acl_id = acl_id
-        request.entries = [source_cidr_ip]
+        request.entries = list(source_cidr_ips)
 
         try:
-            logger.info(f"执行阿里云 API: RemoveEntriesFromAcl")
+            logger.debug("执行阿里云 API: RemoveEntriesFromAcl ({} 条)", len(source_cidr_ips))
 
-            # 使用直接方法
-            response = self.alb_client.remove_entries_from_acl(request)
-            logger.info(f"API 响应: RemoveEntriesFromAcl - 成功")
+            response = self._call_api(
+                "RemoveEntriesFromAcl", self.alb_client.remove_entries_from_acl_with_options, request,
+                applied=lambda: self._acl_entries_applied(acl_id, source_cidr_ips, adding=False)
+            )
+            sampled_logger.info("API 响应: RemoveEntriesFromAcl - 成功 ({} 条)", len(source_cidr_ips))
+            self._update_cache(f"acl:{acl_id}", source_cidr_ips, success=True, adding=False)
 
             return {
                 "success": True,
                 "data": response,
+                "entries": source_cidr_ips,
                 "operation": "RemoveEntriesFromAcl"
             }
 
         except Exception as e:
-            logger.error(f"API 错误: RemoveEntriesFromAcl - {str(e)}")
-            return {
-                "success": False,
-                "error": str(e),
-                "operation": "RemoveEntriesFromAcl"
-            }
+            logger.error("API 错误: RemoveEntriesFromAcl - {}", e)
+            self._update_cache(f"acl:{acl_id}", source_cidr_ips, success=False, adding=False)
+            return self._failed_result("RemoveEntriesFromAcl", source_cidr_ips, e)
 
     # ==== ECS 安全组相关方法 ====
 
+    @staticmethod
+    def _permission_source(source_cidr_ip: str) -> Dict[str, str]:
+        """安全组规则的来源字段：IPv6 网段需使用 Ipv6SourceCidrIp"""
+        if is_ipv6(source_cidr_ip):
+            return {"ipv_6source_cidr_ip": source_cidr_ip}
+        return {"source_cidr_ip": source_cidr_ip}
+
     def authorize_security_group(
         self,
         source_cidr_ip: str,
@@ -153,43 +913,92 @@ class AliCloudClient:
         ip_protocol: str = "ALL"
     ) -> Dict[str, Any]:
         """添加 ECS 安全组入方向规则"""
-        logger.info(f"authorize_security_group 被调用，ip_protocol={ip_protocol}")
+        try:
+            source_cidr_ip = normalize_cidr(source_cidr_ip)
+        except ValueError:
+            return self._invalid_result("AuthorizeSecurityGroup", [source_cidr_ip])
+        security_group_id = security_group_id or self.default_security_group_id
+        pending, skipped = self._split_security_group_rules(
+            [source_cidr_ip], security_group_id, policy, port_range, ip_protocol, adding=True
+        )
+        if not pending:
+            sampled_logger.info("安全组规则已存在，跳过调用: {}", source_cidr_ip)
+            return self._skipped_result("AuthorizeSecurityGroup", skipped)
+        return self._authorize_security_group(
+            pending, security_group_id, description, policy, port_range, ip_protocol
+        )
 
-        # 创建权限对象
-        permissions = EcsModels.AuthorizeSecurityGroupRequestPermissions(
-            source_cidr_ip=source_cidr_ip,
-            port_range=port_range,
-            ip_protocol=ip_protocol,
-            policy=policy
+    def authorize_security_group_batch(
+        self,
+        source_cidr_ips: List[str],
+        security_group_id: Optional[str] = None,
+        description: Optional[str] = None,
+        policy: str = "Drop",
+        port_range: str = "-1/-1",
+        ip_protocol: str = "ALL"
+    ) -> List[Dict[str, Any]]:
+        """批量添加 ECS 安全组入方向规则，按单次调用上限分批，每批返回一个结果"""
+        source_cidr_ips, invalid = self._normalize(source_cidr_ips, adding=True)
+        security_group_id = security_group_id or self.default_security_group_id
+        pending, skipped = self._split_security_group_rules(
+            source_cidr_ips, security_group_id, policy, port_range, ip_protocol, adding=True
         )
+        results = [
+            self._authorize_security_group(batch, security_group_id, description, policy, port_range, ip_protocol)
+            for batch in _chunks(pending, ECS_PERMISSIONS_BATCH_SIZE)
+        ]
+        return self._with_skipped(results, "AuthorizeSecurityGroup", skipped, invalid)
+
+    def _authorize_security_group(
+        self,
+        source_cidr_ips: List[str],
+        security_group_id: str,
+        description: Optional[str],
+        policy: str,
+        port_range: str,
+        ip_protocol: str
+    ) -> Dict[str, Any]:
+        """单次 AuthorizeSecurityGroup 调用，可携带多条规则"""
+        # 创建权限对象
+        permissions = [
+            EcsModels.AuthorizeSecurityGroupRequestPermissions(
+                **self._permission_source(source_cidr_ip),
+                port_range=port_range,
+                ip_protocol=ip_protocol,
+                policy=policy
+            )
+            for source_cidr_ip in source_cidr_ips
+        ]
 
         # 创建请求
         request = EcsModels.AuthorizeSecurityGroupRequest()
         request.region_id = self.default_region
-        request.security_group_id = security_group_id or self.default_security_group_id
-        request.permissions = [permissions]
+        request.security_group_id = security_group_id
+        request.permissions = permissions
+
+        rules = [_rule_key(cidr, policy, port_range, ip_protocol) for cidr in source_cidr_ips]
 
         try:
-            logger.info(f"执行阿里云 API: AuthorizeSecurityGroup")
-            logger.info(f"实际传递的协议值: {ip_protocol}")
+            logger.debug("执行阿里云 API: AuthorizeSecurityGroup ({} 条, 协议 {})", len(permissions), ip_protocol)
 
-            # 使用直接方法
-            response = self.ecs_client.authorize_security_group(request)
-            logger.info(f"API 响应: AuthorizeSecurityGroup - 成功")
+            response = self._call_api(
+                "AuthorizeSecurityGroup", self.ecs_client.authorize_security_group_with_options, request,
+                applied=lambda: self._security_group_rules_applied(security_group_id, rules, adding=True)
+            )
+            sampled_logger.info("API 响应: AuthorizeSecurityGroup - 成功 ({} 条)", len(source_cidr_ips))
+            self._update_cache(f"sg:{security_group_id}", rules, success=True, adding=True)
 
             return {
                 "success": True,
                 "data": response,
+                "entries": source_cidr_ips,
                 "operation": "AuthorizeSecurityGroup"
             }
 
         except Exception as e:
-            logger.error(f"API 错误: AuthorizeSecurityGroup - {str(e)}")
-            return {
-                "success": False,
-                "error": str(e),
-                "operation": "AuthorizeSecurityGroup"
-            }
+            logger.error("API 错误: AuthorizeSecurityGroup - {}", e)
+            self._update_cache(f"sg:{security_group_id}", rules, success=False, adding=True)
+            return self._failed_result("AuthorizeSecurityGroup", source_cidr_ips, e)
 
     def revoke_security_group(
         self,
@@ -200,42 +1009,444 @@ class AliCloudClient:
         ip_protocol: str = "ALL"
     ) -> Dict[str, Any]:
         """删除 ECS 安全组入方向规则"""
-        # 创建权限对象
-        permissions = EcsModels.RevokeSecurityGroupRequestPermissions(
-            source_cidr_ip=source_cidr_ip,
-            port_range=port_range,
-            ip_protocol=ip_protocol,
-            policy=policy
+        try:
+            source_cidr_ip = normalize_cidr(source_cidr_ip)
+        except ValueError:
+            return self._invalid_result("RevokeSecurityGroup", [source_cidr_ip])
+        security_group_id = security_group_id or self.default_security_group_id
+        pending, skipped = self._split_security_group_rules(
+            [source_cidr_ip], security_group_id, policy, port_range, ip_protocol, adding=False
+        )
+        if not pending:
+            sampled_logger.info("安全组规则不存在，跳过调用: {}", source_cidr_ip)
+            return self._skipped_result("RevokeSecurityGroup", skipped)
+        return self._revoke_security_group(
+            pending, security_group_id, policy, port_range, ip_protocol
         )
 
+    def revoke_security_group_batch(
+        self,
+        source_cidr_ips: List[str],
+        security_group_id: Optional[str] = None,
+        policy: str = "Drop",
+        port_range: str = "-1/-1",
+        ip_protocol: str = "ALL"
+    ) -> List[Dict[str, Any]]:
+        """批量删除 ECS 安全组入方向规则，按单次调用上限分批，每批返回一个结果"""
+        source_cidr_ips, invalid = self._normalize(source_cidr_ips, adding=False)
+        security_group_id = security_group_id or self.default_security_group_id
+        pending, skipped = self._split_security_group_rules(
+            source_cidr_ips, security_group_id, policy, port_range, ip_protocol, adding=False
+        )
+        results = [
+            self._revoke_security_group(batch, security_group_id, policy, port_range, ip_protocol)
+            for batch in _chunks(pending, ECS_PERMISSIONS_BATCH_SIZE)
+        ]
+        return self._with_skipped(results, "RevokeSecurityGroup", skipped, invalid)
+
+    def _revoke_security_group(
+        self,
+        source_cidr_ips: List[str],
+        security_group_id: str,
+        policy: str,
+        port_range: str,
+        ip_protocol: str
+    ) -> Dict[str, Any]:
+        """单次 RevokeSecurityGroup 调用，可携带多条规则"""
+        # 创建权限对象
+        permissions = [
+            EcsModels.RevokeSecurityGroupRequestPermissions(
+                **self._permission_source(source_cidr_ip),
+                port_range=port_range,
+                ip_protocol=ip_protocol,
+                policy=policy
+            )
+            for source_cidr_ip in source_cidr_ips
+        ]
+
         # 创建请求
         request = EcsModels.RevokeSecurityGroupRequest()
         request.region_id = self.default_region
-        request.security_group_id = security_group_id or self.default_security_group_id
-        request.permissions = [permissions]
+        request.security_group_id = security_group_id
+        request.permissions = permissions
+
+        rules = [_rule_key(cidr, policy, port_range, ip_protocol) for cidr in source_cidr_ips]
 
         try:
-            logger.info(f"执行阿里云 API: RevokeSecurityGroup")
+            logger.debug("执行阿里云 API: RevokeSecurityGroup ({} 条)", len(permissions))
 
-            # 使用直接方法
-            response = self.ecs_client.revoke_security_group(request)
-            logger.info(f"API 响应: RevokeSecurityGroup - 成功")
+            response = self._call_api(
+                "RevokeSecurityGroup", self.ecs_client.revoke_security_group_with_options, request,
+                applied=lambda: self._security_group_rules_applied(security_group_id, rules, adding=False)
+            )
+            sampled_logger.info("API 响应: RevokeSecurityGroup - 成功 ({} 条)", len(source_cidr_ips))
+            self._update_cache(f"sg:{security_group_id}", rules, success=True, adding=False)
 
             return {
                 "success": True,
                 "data": response,
+                "entries": source_cidr_ips,
                 "operation": "RevokeSecurityGroup"
             }
 
         except Exception as e:
-            logger.error(f"API 错误: RevokeSecurityGroup - {str(e)}")
+            logger.error("API 错误: RevokeSecurityGroup - {}", e)
+            self._update_cache(f"sg:{security_group_id}", rules, success=False, adding=False)
+            return self._failed_result("RevokeSecurityGroup", source_cidr_ips, e)
+
+    # ==== ECS 前缀列表相关方法 ====
+
+    def get_prefix_list(self, prefix_list_id: str) -> Dict[str, Any]:
+        """查询前缀列表的地址族、容量和当前条目 (DescribePrefixListAttributes)"""
+        request = EcsModels.DescribePrefixListAttributesRequest(
+            region_id=self.default_region,
+            prefix_list_id=prefix_list_id
+        )
+        body = self._call_api(
+            "DescribePrefixListAttributes", self.ecs_client.describe_prefix_list_attributes_with_options, request
+        ).body
+        entries = body.entries.entry if body.entries else None
+        return {
+            "prefix_list_id": prefix_list_id,
+            "address_family": body.address_family,
+            "max_entries": body.max_entries,
+            "entries": [_canonical_cidr(entry.cidr) for entry in entries or []]
+        }
+
+    def _add_prefix_list_entries(self, prefix_list_id: str, cidrs: List[str], description: Optional[str]) -> Dict[str, Any]:
+        """单次 ModifyPrefixList 调用，可携带多个新增条目"""
+        return self._modify_prefix_list(prefix_list_id, cidrs, [], description)
+
+    def replace_prefix_list_entry(
+        self,
+        prefix_list_id: str,
+        entry: str,
+        replacements: List[str],
+        description: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """在一次 ModifyPrefixList 调用中删除一个条目并新增取代它的条目（原子生效），结果的 entries 为被删除的条目"""
+        return self._modify_prefix_list(prefix_list_id, replacements, [entry], description)
+
+    def _modify_prefix_list(
+        self,
+        prefix_list_id: str,
+        add: List[str],
+        remove: List[str],
+        description: Optional[str]
+    ) -> Dict[str, Any]:
+        """单次 ModifyPrefixList 调用；有删除的条目时结果的 entries 为删除的条目，否则为新增的条目"""
+        request = EcsModels.ModifyPrefixListRequest(
+            region_id=self.default_region,
+            prefix_list_id=prefix_list_id,
+            add_entry=[
+                EcsModels.ModifyPrefixListRequestAddEntry(cidr=cidr, description=description)
+                for cidr in add
+            ] or None,
+            remove_entry=[
+                EcsModels.ModifyPrefixListRequestRemoveEntry(cidr=cidr)
+                for cidr in remove
+            ] or None
+        )
+        entries = remove or add
+        try:
+            logger.debug("执行阿里云 API: ModifyPrefixList (新增 {} 条，删除 {} 条)", len(add), len(remove))
+            response = self._call_api("ModifyPrefixList", self.ecs_client.modify_prefix_list_with_options, request)
+            sampled_logger.info("API 响应: ModifyPrefixList - 成功 (新增 {} 条，删除 {} 条)", len(add), len(remove))
             return {
-                "success": False,
-                "error": str(e),
-                "operation": "RevokeSecurityGroup"
+                "success": True,
+                "data": response,
+                "entries": entries,
+                "operation": "ModifyPrefixList"
             }
+        except Exception as e:
+            logger.error("API 错误: ModifyPrefixList - {}", e)
+            return self._failed_result("ModifyPrefixList", entries, e)
+
+    def authorize_prefix_list_rule(
+        self,
+        prefix_list_id: str,
+        security_group_id: Optional[str] = None,
+        policy: str = "Drop",
+        port_range: str = "-1/-1",
+        ip_protocol: str = "ALL"
+    ) -> Dict[str, Any]:
+        """添加来源为前缀列表的安全组入方向规则"""
+        request = EcsModels.AuthorizeSecurityGroupRequest(
+            region_id=self.default_region,
+            security_group_id=security_group_id or self.default_security_group_id,
+            permissions=[
+                EcsModels.AuthorizeSecurityGroupRequestPermissions(
+                    source_prefix_list_id=prefix_list_id,
+                    port_range=port_range,
+                    ip_protocol=ip_protocol,
+                    policy=policy
+                )
+            ]
+        )
+        try:
+            response = self._call_api("AuthorizeSecurityGroup", self.ecs_client.authorize_security_group_with_options, request)
+            logger.info("API 响应: AuthorizeSecurityGroup - 成功 (前缀列表 {})", prefix_list_id)
+            return {
+                "success": True,
+                "data": response,
+                "entries": [prefix_list_id],
+                "operation": "AuthorizeSecurityGroup"
+            }
+        except Exception as e:
+            logger.error("API 错误: AuthorizeSecurityGroup - {}", e)
+            return self._failed_result("AuthorizeSecurityGroup", [prefix_list_id], e)
+
+    # ==== 异步调用接口 ====
+
+    async def _run_in_executor(self, func, *args, **kwargs) -> Dict[str, Any]:
+        """
+        在有界线程池中执行同步 SDK 调用（携带当前上下文，请求截止时间和取消标记随之传入线程）
+        等待期间被取消（客户端断开或截止）时：仍在排队的任务直接取消，不占用线程；已开始的任务结果到达后丢弃
+        """
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, func, *args, **kwargs)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if future.cancel():
+                metrics.inc("cloud_tasks_abandoned_total", (("state", "queued"),))
+            else:
+                metrics.inc("cloud_tasks_abandoned_total", (("state", "running"),))
+                future.add_done_callback(_drop_late_result)
+            raise
+
+    async def add_entries_to_acl_async(self, acl_id: str, source_cidr_ip: str, description: Optional[str] = None) -> Dict[str, Any]:
+        """添加 ALB 访问控制条目（异步）"""
+        return await self._run_in_executor(self.add_entries_to_acl, acl_id, source_cidr_ip, description)
+
+    async def remove_entries_from_acl_async(self, acl_id: str, source_cidr_ip: str) -> Dict[str, Any]:
+        """删除 ALB 访问控制条目（异步）"""
+        return await self._run_in_executor(self.remove_entries_from_acl, acl_id, source_cidr_ip)
+
+    async def authorize_security_group_async(self, source_cidr_ip: str, **kwargs) -> Dict[str, Any]:
+        """添加 ECS 安全组入方向规则（异步）"""
+        return await self._run_in_executor(self.authorize_security_group, source_cidr_ip, **kwargs)
+
+    async def revoke_security_group_async(self, source_cidr_ip: str, **kwargs) -> Dict[str, Any]:
+        """删除 ECS 安全组入方向规则（异步）"""
+        return await self._run_in_executor(self.revoke_security_group, source_cidr_ip, **kwargs)
+
+    async def list_acl_cidrs_async(self, acl_id: str) -> List[str]:
+        """读取 ACL 当前的全部网段（异步）"""
+        return await self._run_in_executor(self.list_acl_cidrs, acl_id)
+
+    async def list_security_group_cidrs_async(self, security_group_id: Optional[str] = None, **kwargs) -> List[str]:
+        """读取安全组中匹配的规则来源网段（异步）"""
+        return await self._run_in_executor(self.list_security_group_cidrs, security_group_id, **kwargs)
+
+    async def _iter_pages_async(self, pages: Iterator[List[Dict[str, Any]]]) -> AsyncIterator[List[Dict[str, Any]]]:
+        """在线程池中逐页推进同步分页生成器，事件循环不阻塞，同一时间只持有一页"""
+        while True:
+            page = await self._run_in_executor(next, pages, None)
+            if page is None:
+                return
+            yield page
+
+    def iter_acl_entry_pages_async(self, acl_id: str) -> AsyncIterator[List[Dict[str, Any]]]:
+        """逐页获取 ALB 访问控制条目（异步）"""
+        return self._iter_pages_async(self.iter_acl_entry_pages(acl_id))
+
+    def iter_security_group_rule_pages_async(self, security_group_id: Optional[str] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """逐页获取 ECS 安全组入方向规则（异步）"""
+        return self._iter_pages_async(self.iter_security_group_rule_pages(security_group_id))
+
+    async def _run_batches_async(self, batch_func, items: List[str], batch_size: int) -> List[Dict[str, Any]]:
+        """将各批次并发提交到线程池执行"""
+        return list(await asyncio.gather(*(
+            self._run_in_executor(batch_func, batch)
+            for batch in _chunks(items, batch_size)
+        )))
+
+    async def add_entries_to_acl_batch_async(
+        self,
+        acl_id: str,
+        source_cidr_ips: List[str],
+        description: Optional[str] = None,
+        exact: bool = False,
+        merge: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        批量添加 ALB 访问控制条目（异步，各批次并发）
+        exact=True 时按原网段写入，不合并、不按缓存跳过（调用方已按云端当前状态算好差异，如期望状态同步）；
+        merge=False 时不合并相邻网段（有到期时间的封禁，到期后按台账中的原网段删除）
+        """
+        source_cidr_ips, invalid = self._normalize(source_cidr_ips, adding=True, exact=exact, merge=merge)
+        pending, skipped = (source_cidr_ips, []) if exact else await self._run_in_executor(
+            self._split_acl_entries, acl_id, source_cidr_ips, True
+        )
+        results = await self._run_batches_async(
+            lambda batch: self._add_entries_to_acl(acl_id, batch, description),
+            pending, ALB_ACL_ENTRIES_BATCH_SIZE
+        )
+        return self._with_skipped(results, "AddEntriesToAcl", skipped, invalid)
+
+    async def remove_entries_from_acl_batch_async(
+        self,
+        acl_id: str,
+        source_cidr_ips: List[str],
+        exact: bool = False
+    ) -> List[Dict[str, Any]]:
+        """批量删除 ALB 访问控制条目（异步，各批次并发）；exact=True 时不按缓存跳过"""
+        source_cidr_ips, invalid = self._normalize(source_cidr_ips, adding=False)
+        pending, skipped = (source_cidr_ips, []) if exact else await self._run_in_executor(
+            self._split_acl_entries, acl_id, source_cidr_ips, False
+        )
+        results = await self._run_batches_async(
+            lambda batch: self._remove_entries_from_acl(acl_id, batch),
+            pending, ALB_ACL_ENTRIES_BATCH_SIZE
+        )
+        return self._with_skipped(results, "RemoveEntriesFromAcl", skipped, invalid)
+
+    async def authorize_security_group_batch_async(
+        self,
+        source_cidr_ips: List[str],
+        security_group_id: Optional[str] = None,
+        description: Optional[str] = None,
+        policy: str = "Drop",
+        port_range: str = "-1/-1",
+        ip_protocol: str = "ALL",
+        exact: bool = False,
+        merge: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        批量添加 ECS 安全组入方向规则（异步，各批次并发）
+        exact=True 时按原网段写入，不合并、不跳过已被现有规则覆盖的网段（如期望状态同步、规则合并写入超网）；
+        merge=False 时不合并相邻网段（有到期时间的封禁，到期后按台账中的原网段删除）
+        """
+        source_cidr_ips, invalid = self._normalize(source_cidr_ips, adding=True, exact=exact, merge=merge)
+        security_group_id = security_group_id or self.default_security_group_id
+        pending, skipped = (source_cidr_ips, []) if exact else await self._run_in_executor(
+            self._split_security_group_rules, source_cidr_ips, security_group_id, policy, port_range, ip_protocol, True
+        )
+        results = await self._run_batches_async(
+            lambda batch: self._authorize_security_group(batch, security_group_id, description, policy, port_range, ip_protocol),
+            pending, ECS_PERMISSIONS_BATCH_SIZE
+        )
+        return self._with_skipped(results, "AuthorizeSecurityGroup", skipped, invalid)
+
+    async def revoke_security_group_batch_async(
+        self,
+        source_cidr_ips: List[str],
+        security_group_id: Optional[str] = None,
+        policy: str = "Drop",
+        port_range: str = "-1/-1",
+        ip_protocol: str = "ALL",
+        exact: bool = False
+    ) -> List[Dict[str, Any]]:
+        """批量删除 ECS 安全组入方向规则（异步，各批次并发）；exact=True 时不按缓存跳过"""
+        source_cidr_ips, invalid = self._normalize(source_cidr_ips, adding=False)
+        security_group_id = security_group_id or self.default_security_group_id
+        pending, skipped = (source_cidr_ips, []) if exact else await self._run_in_executor(
+            self._split_security_group_rules, source_cidr_ips, security_group_id, policy, port_range, ip_protocol, False
+        )
+        results = await self._run_batches_async(
+            lambda batch: self._revoke_security_group(batch, security_group_id, policy, port_range, ip_protocol),
+            pending, ECS_PERMISSIONS_BATCH_SIZE
+        )
+        return self._with_skipped(results, "RevokeSecurityGroup", skipped, invalid)
+
+    async def get_prefix_list_async(self, prefix_list_id: str) -> Dict[str, Any]:
+        """查询前缀列表（异步）"""
+        return await self._run_in_executor(self.get_prefix_list, prefix_list_id)
+
+    async def add_prefix_list_entries_batch_async(
+        self,
+        prefix_list_id: str,
+        cidrs: List[str],
+        description: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        批量向前缀列表新增条目（异步）
+        同一前缀列表在前一次修改完成前可能拒绝新的修改，因此各批次依次提交
+        """
+        return [
+            await self._run_in_executor(self._add_prefix_list_entries, prefix_list_id, batch, description)
+            for batch in _chunks(cidrs, PREFIX_LIST_ENTRIES_BATCH_SIZE)
+        ]
+
+    async def replace_prefix_list_entry_async(
+        self,
+        prefix_list_id: str,
+        entry: str,
+        replacements: List[str],
+        description: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """替换前缀列表中的一个条目（异步）"""
+        return await self._run_in_executor(
+            self.replace_prefix_list_entry, prefix_list_id, entry, replacements, description
+        )
+
+    async def authorize_prefix_list_rule_async(self, prefix_list_id: str, **kwargs) -> Dict[str, Any]:
+        """添加来源为前缀列表的安全组规则（异步）"""
+        return await self._run_in_executor(self.authorize_prefix_list_rule, prefix_list_id, **kwargs)
+
+    def close(self):
+        """释放线程池资源（地域客户端的线程池由主客户端释放）"""
+        if self._owns_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
 
     def _get_current_time(self) -> str:
         """获取当前时间格式化字符串"""
         from datetime import datetime
-        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
\ No newline at end of file
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+# ==== 进程内共享客户端 ====
+
+_aliyun_client: Optional[AliCloudClient] = None
+_aliyun_client_lock = threading.Lock()
+
+def get_aliyun_client() -> AliCloudClient:
+    """获取进程内共享的阿里云客户端，首次调用时创建"""
+    global _aliyun_client
+    if _aliyun_client is None:
+        with _aliyun_client_lock:
+            if _aliyun_client is None:
+                _aliyun_client = AliCloudClient()
+    return _aliyun_client
+
+def warm_up_aliyun_client():
+    """创建共享客户端并预先导入请求模型模块，在启动后于后台线程调用，首个请求无需等待 SDK 导入"""
+    start = time.perf_counter()
+    try:
+        client = get_aliyun_client()
+        if settings.cloud_backend != "fake":
+            for module in (AlbModels, EcsModels, UtilModels):
+                module._load()
+        logger.info("阿里云客户端预热完成: {} ({:.0f}ms)", client.default_region, (time.perf_counter() - start) * 1000)
+    except Exception as e:
+        logger.warning("阿里云客户端预热失败，将在首次请求时重试: {}", e)
+
+async def aliyun_client_dependency() -> AliCloudClient:
+    """FastAPI 依赖：注入共享客户端（async 依赖不经过线程池调度）"""
+    return get_aliyun_client()
+
+def _state_cache_metrics(attribute: str):
+    """读取共享客户端状态缓存的统计值（客户端未创建或未启用缓存时不输出）"""
+    def collect():
+        cache = _aliyun_client.state_cache if _aliyun_client is not None else None
+        if cache is None:
+            return []
+        if attribute == "hit_ratio":
+            lookups = cache.hits + cache.misses
+            return [((), cache.hits / lookups if lookups else 0.0)]
+        return [((), getattr(cache, attribute))]
+    return collect
+
+metrics.register_callback("state_cache_hits_total", "状态缓存命中次数", _state_cache_metrics("hits"), COUNTER)
+metrics.register_callback("state_cache_misses_total", "状态缓存未命中次数", _state_cache_metrics("misses"), COUNTER)
+metrics.register_callback("state_cache_skipped_entries_total", "因已处于目标状态而跳过的条目数", _state_cache_metrics("skipped"), COUNTER)
+metrics.register_callback("state_cache_hit_ratio", "状态缓存命中率", _state_cache_metrics("hit_ratio"))
+
+def close_aliyun_client():
+    """关闭共享客户端，应用退出时调用"""
+    global _aliyun_client
+    with _aliyun_client_lock:
+        if _aliyun_client is not None:
+            _aliyun_client.close()
+            _aliyun_client = None
@@ -0,0 +1,361 @@
+"""
+封禁/解封写回队列
+在 AliCloudClient 前合并短时间内的大量封禁请求：按 CIDR 去重，相反操作相互抵消，
+达到批量上限或刷写间隔时通过批量接口一次性写入云端
+"""
+
+import asyncio
+import functools
+import json
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional, Dict, Any, Iterable, List, Set, Tuple
+from loguru import logger
+from core.config import settings
+from core.metrics import metrics
+from services.alicloud import get_aliyun_client, collect_batch_failures, collect_batch_skipped
+from services.breaker import CircuitBreaker, get_circuit_breakers
+from services.ledger import BanRecord, applied_target, ban_expiry, ban_records, record_bans, release_bans, revoke_banned_cidrs
+from services.state_store import StateStore, get_state_store
+from services.targets import BanTarget, get_ban_targets, fan_out
+
+BAN = "ban"
+UNBAN = "unban"
+
+# 封禁/解封在 ALB 和 ECS 上调用的云 API
+_OPERATIONS = {
+    BAN: ("AddEntriesToAcl", "AuthorizeSecurityGroup"),
+    UNBAN: ("RemoveEntriesFromAcl", "RevokeSecurityGroup"),
+}
+
+# 请求状态
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_CANCELLED = "cancelled"
+
+
+@dataclass
+class _PendingOperation:
+    """同一 CIDR 上等待刷写的操作"""
+    action: str
+    cidr_ip: str
+    description: Optional[str]
+    ttl_seconds: Optional[float] = None
+    request_ids: List[str] = field(default_factory=list)
+    futures: List[asyncio.Future] = field(default_factory=list)
+
+
+def blocking_breakers(targets: List[BanTarget], actions: Iterable[str]) -> List[CircuitBreaker]:
+    """写入 targets 所需的云 API 中正在熔断的熔断器"""
+    calls = []
+    for action in actions:
+        alb_operation, ecs_operation = _OPERATIONS[action]
+        for target in targets:
+            if target.acl_id:
+                calls.append((alb_operation, target.region))
+            if target.security_group_id:
+                calls.append((ecs_operation, target.region))
+    return get_circuit_breakers().blocking(calls)
+
+
+class BanQueue:
+    """封禁/解封写回队列"""
+
+    def __init__(
+        self,
+        max_batch: int = settings.ban_queue_max_batch,
+        flush_interval: float = settings.ban_queue_flush_interval,
+        max_results: int = settings.ban_queue_max_results,
+        store: Optional[StateStore] = None
+    ):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_results = max_results
+        # 多 worker 时请求状态同时写入共享状态存储，查询请求可以落到任意 worker
+        self.store = store if store is not None and store.shared else None
+
+        self._pending: "OrderedDict[str, _PendingOperation]" = OrderedDict()
+        self._results: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._flush_event: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._held = False
+        # 尚未写入共享状态存储的请求状态（同一请求只保留最新的），由后台任务按顺序在线程池中写入
+        self._unwritten: "OrderedDict[str, str]" = OrderedDict()
+        self._writer: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        """等待刷写的 CIDR 数量"""
+        return len(self._pending)
+
+    # ==== 生命周期 ====
+
+    def start(self):
+        """在当前事件循环中启动后台刷写任务"""
+        if self._task is None or self._task.done():
+            self._flush_event = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务，并把剩余操作刷写完"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush(force=True)
+        if self._writer is not None and self._writer.get_loop() is asyncio.get_running_loop():
+            await self._writer
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            if self._pending:
+                try:
+                    await self.flush()
+                except Exception as e:
+                    logger.error("写回队列刷写异常: {}", e)
+
+    # ==== 提交与查询 ====
+
+    def submit(
+        self,
+        action: str,
+        cidr_ip: str,
+        description: Optional[str] = None,
+        ttl_seconds: Optional[float] = None
+    ) -> Tuple[str, asyncio.Future]:
+        """提交一个封禁/解封操作，返回 (请求 ID, 可等待结果的 future)；合并的重复封禁以最后一次的封禁时长为准"""
+        self.start()
+
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._store_result(request_id, {
+            "request_id": request_id,
+            "action": action,
+            "cidr_ip": cidr_ip,
+            "status": STATUS_PENDING
+        })
+
+        pending = self._pending.get(cidr_ip)
+        if pending is not None and pending.action != action:
+            # 尚未刷写的相反操作相互抵消，均不调用云 API
+            del self._pending[cidr_ip]
+            self._resolve(pending.request_ids, pending.futures, STATUS_CANCELLED, pending.action, cidr_ip)
+            self._resolve([request_id], [future], STATUS_CANCELLED, action, cidr_ip)
+            return request_id, future
+
+        if pending is None:
+            pending = self._pending[cidr_ip] = _PendingOperation(action, cidr_ip, description)
+        pending.ttl_seconds = ttl_seconds
+        pending.request_ids.append(request_id)
+        pending.futures.append(future)
+
+        if len(self._pending) >= self.max_batch:
+            self._flush_event.set()
+        return request_id, future
+
+    async def get_result(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """查询请求状态（本 worker 没有记录时查询共享状态存储）"""
+        result = self._results.get(request_id)
+        if result is None and self.store is not None:
+            value = await asyncio.to_thread(self.store.get, f"banqueue:{request_id}")
+            result = json.loads(value) if value else None
+        return result
+
+    def _store_result(self, request_id: str, result: Dict[str, Any]):
+        self._results[request_id] = result
+        self._results.move_to_end(request_id)
+        while len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+        if self.store is not None:
+            self._unwritten[request_id] = json.dumps(result, ensure_ascii=False)
+            self._unwritten.move_to_end(request_id)
+            loop = asyncio.get_running_loop()
+            if self._writer is None or self._writer.done() or self._writer.get_loop() is not loop:
+                self._writer = loop.create_task(self._write_results())
+
+    async def _write_results(self):
+        """把请求状态写入共享状态存储：阻塞的存储调用放到线程池，只有一个写入任务，保证同一请求的状态按顺序写入"""
+        while self._unwritten:
+            request_id, value = self._unwritten.popitem(last=False)
+            try:
+                await asyncio.to_thread(
+                    self.store.set, f"banqueue:{request_id}", value, ttl=settings.ban_queue_result_ttl
+                )
+            except Exception as e:
+                logger.error("写回队列请求状态写入共享状态存储失败: {}", e)
+
+    def _resolve(
+        self,
+        request_ids: List[str],
+        futures: List[asyncio.Future],
+        status: str,
+        action: str,
+        cidr_ip: str,
+        alb_error: Optional[str] = None,
+        ecs_error: Optional[str] = None,
+        note: Optional[str] = None
+    ):
+        for request_id, future in zip(request_ids, futures):
+            errors = [f"ALB: {alb_error}"] if alb_error else []
+            errors += [f"ECS: {ecs_error}"] if ecs_error else []
+            errors += [note] if note else []
+            result = {
+                "request_id": request_id,
+                "action": action,
+                "cidr_ip": cidr_ip,
+                "status": status,
+                "alb_success": None if status == STATUS_CANCELLED else alb_error is None,
+                "ecs_success": None if status == STATUS_CANCELLED else ecs_error is None,
+                "message": "; ".join(errors),
+                "completed_at": datetime.now().isoformat()
+            }
+            if request_id in self._results:
+                self._store_result(request_id, result)
+            if not future.done():
+                future.set_result(result)
+
+    # ==== 刷写 ====
+
+    async def flush(self, force: bool = False):
+        """
+        把当前等待中的操作按批量接口写入云端
+        所需的云 API 熔断时暂缓刷写，操作留在队列中等熔断恢复（force=True 时仍然写入，如应用退出时）
+        """
+        if not self._pending:
+            return
+
+        targets = get_ban_targets()
+        if not force:
+            blocked = blocking_breakers(targets, {op.action for op in self._pending.values()})
+            if blocked:
+                if not self._held:
+                    logger.warning(
+                        "云 API 熔断中，写回队列暂缓刷写: {} 等待 {} 个",
+                        ", ".join(f"{b.operation} ({b.region})" for b in blocked), len(self._pending)
+                    )
+                self._held = True
+                return
+            if self._held:
+                logger.info("熔断恢复，写回队列继续刷写: {} 个", len(self._pending))
+            self._held = False
+
+        operations = list(self._pending.values())
+        self._pending.clear()
+
+        bans = [op.cidr_ip for op in operations if op.action == BAN]
+        unbans = [op.cidr_ip for op in operations if op.action == UNBAN]
+        description = f"IP批量封禁 - {len(bans)} 个"
+        expires_at = {op.cidr_ip: ban_expiry(op.ttl_seconds) for op in operations if op.action == BAN}
+        # 有到期时间的封禁不合并相邻网段：到期后按台账中的原网段删除，合并出的超网删不掉
+        merge = all(expiry is None for expiry in expires_at.values())
+        logger.info("写回队列刷写: 封禁 {} 个、解封 {} 个", len(bans), len(unbans))
+
+        # 每个目标的 ALB 与 ECS 失败记录、已有条目（未写入）分开保存，台账按目标记录
+        target_failures: Dict[BanTarget, Tuple[Dict[str, str], Dict[str, str]]] = {
+            target: ({}, {}) for target in targets
+        }
+        target_skipped: Dict[BanTarget, Tuple[Set[str], Set[str]]] = {
+            target: (set(), set()) for target in targets
+        }
+
+        # (地域, 条目, 失败记录, 已有条目, 批量调用)：每个目标的 ALB 和 ECS 各一路
+        legs = []
+        for target in targets:
+            client = get_aliyun_client().for_region(target.region)
+            target_alb_failures, target_ecs_failures = target_failures[target]
+            target_alb_skipped, target_ecs_skipped = target_skipped[target]
+            if target.acl_id and bans:
+                legs.append((target.region, bans, target_alb_failures, target_alb_skipped, functools.partial(
+                    client.add_entries_to_acl_batch_async, target.acl_id, bans, description, merge=merge
+                )))
+            if target.acl_id and unbans:
+                legs.append((target.region, unbans, target_alb_failures, target_alb_skipped, functools.partial(
+                    client.remove_entries_from_acl_batch_async, target.acl_id, unbans
+                )))
+            if target.security_group_id and bans:
+                legs.append((target.region, bans, target_ecs_failures, target_ecs_skipped, functools.partial(
+                    client.authorize_security_group_batch_async, bans,
+                    security_group_id=target.security_group_id, description=description, policy="Drop", merge=merge
+                )))
+            if target.security_group_id and unbans:
+                legs.append((target.region, unbans, target_ecs_failures, target_ecs_skipped, functools.partial(
+                    revoke_banned_cidrs, client, unbans, target.security_group_id
+                )))
+
+        results = await fan_out(legs, lambda leg: leg[4](), return_exceptions=True)
+        for (region, entries, failures, skipped, _), result in zip(legs, results):
+            if isinstance(result, Exception):
+                leg_failures = {cidr_ip: str(result) for cidr_ip in entries}
+            else:
+                leg_failures = collect_batch_failures(result, entries)
+                skipped.update(collect_batch_skipped(result))
+            if len(targets) > 1:
+                leg_failures = {cidr_ip: f"{region}: {error}" for cidr_ip, error in leg_failures.items()}
+            failures.update(leg_failures)
+
+        # 每个目标上写入成功的封禁记入台账（已有条目的只延长已有的到期封禁），解封成功的一路移出台账
+        written, existing, released = [], [], []
+        for target, (target_alb_failures, target_ecs_failures) in target_failures.items():
+            target_alb_skipped, target_ecs_skipped = target_skipped[target]
+            for op in operations:
+                alb_success = op.cidr_ip not in target_alb_failures
+                ecs_success = op.cidr_ip not in target_ecs_failures
+                if op.action == UNBAN:
+                    applied_to = applied_target(target, alb_success, ecs_success)
+                    if applied_to is not None:
+                        released.append(BanRecord(op.cidr_ip, applied_to))
+                    continue
+                op_written, op_existing = ban_records(
+                    op.cidr_ip, target, alb_success, ecs_success,
+                    alb_existing=op.cidr_ip in target_alb_skipped,
+                    ecs_existing=op.cidr_ip in target_ecs_skipped,
+                    expires_at=expires_at[op.cidr_ip],
+                    description=op.description or description
+                )
+                written += op_written
+                existing += op_existing
+        covered = {record.cidr_ip for record in await record_bans(written, existing)}
+        await release_bans(released)
+
+        # 对外的结果合并所有目标的失败原因
+        alb_failures: Dict[str, str] = {}
+        ecs_failures: Dict[str, str] = {}
+        for target_alb_failures, target_ecs_failures in target_failures.values():
+            for failures, merged in ((target_alb_failures, alb_failures), (target_ecs_failures, ecs_failures)):
+                for cidr_ip, error in failures.items():
+                    merged[cidr_ip] = f"{merged[cidr_ip]}; {error}" if cidr_ip in merged else error
+
+        for op in operations:
+            self._resolve(
+                op.request_ids, op.futures, STATUS_DONE, op.action, op.cidr_ip,
+                alb_error=alb_failures.get(op.cidr_ip),
+                ecs_error=ecs_failures.get(op.cidr_ip),
+                note="已被现有的永久条目覆盖，不会自动解封" if op.cidr_ip in covered else None
+            )
+
+
+# ==== 进程内共享队列 ====
+
+_ban_queue: Optional[BanQueue] = None
+
+def get_ban_queue() -> BanQueue:
+    """获取进程内共享的写回队列"""
+    global _ban_queue
+    if _ban_queue is None:
+        _ban_queue = BanQueue(store=get_state_store())
+    return _ban_queue
+
+metrics.register_callback(
+    "ban_queue_depth", "写回队列中等待刷写的 CIDR 数",
+    lambda: [((), _ban_queue.depth if _ban_queue is not None else 0)]
+)
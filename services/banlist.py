@@ -0,0 +1,124 @@
+"""
+封禁列表导出/导入
+导出时逐页读取各目标的 ALB 访问控制条目和安全组拒绝规则并逐页编码输出，导入时按块读取上传文件、逐行解析，
+按批次交给批量写入接口；两个方向都只在内存中保留一页或一批
+"""
+
+import codecs
+import csv
+import io
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from loguru import logger
+from services.alicloud import AliCloudClient
+from services.targets import BanTarget
+
+# 导出字段（CSV 列顺序）
+LIST_FIELDS = ("type", "region", "resource_id", "cidr_ip", "description")
+
+# 导入文件的读取块大小
+IMPORT_CHUNK_SIZE = 64 * 1024
+
+# CSV 表头中可作为 IP 列的列名
+_IP_COLUMNS = ("cidr_ip", "ip", "cidr", "source_cidr_ip")
+
+
+def _row(kind: str, region: str, resource_id: str, cidr_ip: str, description: Optional[str]) -> Dict[str, str]:
+    return {
+        "type": kind,
+        "region": region,
+        "resource_id": resource_id,
+        "cidr_ip": cidr_ip,
+        "description": description or ""
+    }
+
+
+async def iter_ban_list_pages(client: AliCloudClient, targets: List[BanTarget]) -> AsyncIterator[List[Dict[str, str]]]:
+    """
+    逐页产出各目标的封禁条目：ALB 访问控制条目和安全组中策略为 Drop 的入方向规则
+    某个 ACL/安全组读取失败时产出一行 type=error 的记录，继续读取其余目标
+    """
+    for target in targets:
+        regional = client.for_region(target.region)
+        if target.acl_id:
+            try:
+                async for page in regional.iter_acl_entry_pages_async(target.acl_id):
+                    yield [_row("alb", target.region, target.acl_id, entry["entry"], entry["description"]) for entry in page]
+            except Exception as e:
+                logger.error("导出 ACL 条目失败: {} {} - {}", target.region, target.acl_id, e)
+                yield [_row("error", target.region, target.acl_id, "", str(e))]
+        if target.security_group_id:
+            try:
+                async for page in regional.iter_security_group_rule_pages_async(target.security_group_id):
+                    yield [
+                        _row("ecs", target.region, target.security_group_id, rule["source_cidr_ip"], rule["description"])
+                        for rule in page
+                        if rule["source_cidr_ip"] and (rule["policy"] or "").lower() == "drop"
+                    ]
+            except Exception as e:
+                logger.error("导出安全组规则失败: {} {} - {}", target.region, target.security_group_id, e)
+                yield [_row("error", target.region, target.security_group_id, "", str(e))]
+
+
+def encode_ndjson(rows: List[Dict[str, Any]]) -> bytes:
+    """每行一个 JSON 对象"""
+    return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+
+
+def encode_csv(rows: List[Dict[str, Any]], header: bool = False) -> bytes:
+    """按 LIST_FIELDS 列顺序编码为 CSV，header=True 时只输出表头"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=LIST_FIELDS, lineterminator="\n")
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+async def iter_uploaded_ips(
+    read: Callable[[int], Awaitable[bytes]],
+    chunk_size: int = IMPORT_CHUNK_SIZE
+) -> AsyncIterator[str]:
+    """
+    按块读取上传文件并逐行产出 IP/CIDR
+    支持 # 注释和空行；CSV 文件首行为表头时读取 cidr_ip/ip 列（如 /list 导出的 CSV），否则取每行第一个字段
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buffer = ""
+    column: Optional[int] = None
+    first = True
+    while True:
+        chunk = await read(chunk_size)
+        buffer += decoder.decode(chunk, final=not chunk)
+        lines = buffer.split("\n")
+        buffer = lines.pop() if chunk else ""
+        for line in lines:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            fields = [field.strip().strip('"') for field in line.split(",")] if "," in line else line.split()
+            if first:
+                first = False
+                names = [field.lower() for field in fields]
+                header = next((name for name in _IP_COLUMNS if name in names), None)
+                if header is not None:
+                    column = names.index(header)
+                    continue
+            index = column or 0
+            if index < len(fields) and fields[index]:
+                yield fields[index]
+        if not chunk:
+            return
+
+
+async def iter_batches(items: AsyncIterator[str], size: int) -> AsyncIterator[List[str]]:
+    """把逐条产出的条目按 size 分批"""
+    batch: List[str] = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,190 @@
+"""
+阿里云 API 熔断
+按 (API, 地域) 统计连续失败：端点故障（超时、连接失败、服务端不可用）连续达到阈值后熔断，熔断期间的调用立即失败，
+不再等待 SDK 超时；冷却时间过后放行一个探测调用（半开），成功则恢复，失败则重新熔断
+"""
+
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+from core.config import settings
+from core.metrics import metrics
+from services.ratelimit import is_network_error, is_server_error
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """熔断期间的调用，retry_after 为距离下一次探测的秒数"""
+
+    def __init__(self, operation: str, region: str, retry_after: float):
+        super().__init__(f"{operation} ({region}) 熔断中，{retry_after:.0f} 秒后重试")
+        self.operation = operation
+        self.region = region
+        self.retry_after = retry_after
+
+
+def is_endpoint_failure(error: Exception) -> bool:
+    """
+    是否计入熔断：网络错误（连接失败、超时）和服务端故障；
+    限流、并发修改冲突（IncorrectStatus.*、Conflict.*）和参数错误说明端点仍在响应，不计入
+    """
+    return is_network_error(error) or is_server_error(error)
+
+
+class CircuitBreaker:
+    """单个 (API, 地域) 的熔断器，线程安全"""
+
+    def __init__(self, operation: str, region: str, failure_threshold: int, reset_timeout: float):
+        self.operation = operation
+        self.region = region
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _retry_after(self, now: float) -> float:
+        return max(0.0, self._opened_at + self.reset_timeout - now)
+
+    def before_call(self):
+        """调用前检查：熔断中抛出 CircuitOpenError；冷却结束后只放行一个探测调用"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == OPEN:
+                retry_after = self._retry_after(now)
+                if retry_after > 0:
+                    raise CircuitOpenError(self.operation, self.region, retry_after)
+                self.state = HALF_OPEN
+                logger.info("熔断半开，放行探测调用: {} ({})", self.operation, self.region)
+            if self._probing:
+                raise CircuitOpenError(self.operation, self.region, 1.0)
+            self._probing = True
+
+    def raise_if_open(self):
+        """重试前检查：其他调用已使熔断器打开时抛出 CircuitOpenError（不占用探测名额）"""
+        with self._lock:
+            if self.state == OPEN:
+                retry_after = self._retry_after(time.monotonic())
+                if retry_after > 0:
+                    raise CircuitOpenError(self.operation, self.region, retry_after)
+
+    def allows(self) -> bool:
+        """当前是否会放行调用（不改变状态）"""
+        with self._lock:
+            if self.state == OPEN:
+                return self._retry_after(time.monotonic()) <= 0
+            return self.state == CLOSED or not self._probing
+
+    def on_success(self):
+        """端点有响应：恢复闭合并清零失败计数"""
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("熔断恢复: {} ({})", self.operation, self.region)
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def release(self):
+        """调用结果不能说明端点状态（如请求自身的截止时间已到）：只归还探测名额，不改变计数"""
+        with self._lock:
+            self._probing = False
+
+    def on_failure(self):
+        """端点故障：连续失败达到阈值或探测失败时熔断"""
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                logger.warning(
+                    "熔断打开: {} ({}) 连续失败 {} 次，{:.0f} 秒内快速失败",
+                    self.operation, self.region, self.failures, self.reset_timeout
+                )
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, object]:
+        """当前状态，用于 /health"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "retry_after": round(self._retry_after(time.monotonic()), 1) if self.state == OPEN else 0.0
+            }
+
+
+class CircuitBreakers:
+    """按 (API, 地域) 维护熔断器；失败阈值为 0 时不熔断"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, operation: str, region: str) -> Optional[CircuitBreaker]:
+        """获取熔断器，首次调用时创建"""
+        if self.failure_threshold <= 0:
+            return None
+        key = (operation, region)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(key)
+                if breaker is None:
+                    breaker = self._breakers[key] = CircuitBreaker(
+                        operation, region, self.failure_threshold, self.reset_timeout
+                    )
+        return breaker
+
+    def blocking(self, calls: Iterable[Tuple[str, str]]) -> List[CircuitBreaker]:
+        """(API, 地域) 中当前不放行调用的熔断器"""
+        breakers = (self._breakers.get(call) for call in set(calls))
+        return [breaker for breaker in breakers if breaker is not None and not breaker.allows()]
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """所有熔断器的状态，键为 API:地域"""
+        return {
+            f"{operation}:{region}": breaker.snapshot()
+            for (operation, region), breaker in list(self._breakers.items())
+        }
+
+    def reset(self):
+        """清空所有熔断器"""
+        with self._lock:
+            self._breakers.clear()
+
+
+# 进程内共享的熔断器（各 worker 独立判断端点状态）
+_circuit_breakers: Optional[CircuitBreakers] = None
+
+
+def get_circuit_breakers() -> CircuitBreakers:
+    """获取进程内共享的熔断器，首次调用时按配置创建"""
+    global _circuit_breakers
+    if _circuit_breakers is None:
+        _circuit_breakers = CircuitBreakers(
+            settings.circuit_breaker_failure_threshold,
+            settings.circuit_breaker_reset_timeout
+        )
+    return _circuit_breakers
+
+
+def _breaker_states():
+    return [
+        ((("operation", breaker.operation), ("region", breaker.region)), _STATE_VALUES[breaker.state])
+        for breaker in list(get_circuit_breakers()._breakers.values())
+    ]
+
+
+metrics.register_callback("cloud_circuit_breaker_state", "阿里云 API 熔断状态（0 闭合、1 半开、2 熔断）", _breaker_states)
@@ -0,0 +1,94 @@
+"""
+CIDR 规范化
+写入云端之前校验并统一 IP/CIDR 写法，去掉被同批其他网段包含的条目，可选合并相邻网段为超网，
+减少占用的 ACL 条目配额和云 API 调用次数
+"""
+
+import ipaddress
+from typing import Iterable, List, Tuple, Union
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_cidr(value: str) -> IPNetwork:
+    """
+    解析 IP 或 CIDR
+    单个 IPv4 地址视为 /32，IPv6 地址视为 /128，主机位不为 0 的网段按掩码取网络地址，
+    IPv4 映射的 IPv6 地址（::ffff:a.b.c.d）按 IPv4 处理
+    """
+    text = (value or "").strip()
+    try:
+        network = ipaddress.ip_network(text, strict=False)
+    except ValueError:
+        raise ValueError(f"无效的 IP 地址或 CIDR: {value}")
+
+    mapped = network.network_address.ipv4_mapped if network.version == 6 else None
+    if mapped is not None and network.prefixlen >= 96:
+        network = ipaddress.ip_network(f"{mapped}/{network.prefixlen - 96}", strict=False)
+    return network
+
+
+def normalize_cidr(value: str) -> str:
+    """返回规范写法的 CIDR，如 1.2.3.4 -> 1.2.3.4/32、2001:DB8::1 -> 2001:db8::1/128"""
+    return parse_cidr(value).with_prefixlen
+
+
+def is_ipv6(cidr: str) -> bool:
+    """是否为 IPv6 网段"""
+    return ":" in cidr
+
+
+def normalize_cidrs(
+    values: Iterable[str],
+    drop_covered: bool = True,
+    merge: bool = False
+) -> Tuple[List[str], List[str]]:
+    """
+    批量规范化，返回 (规范化后的网段, 无效条目)
+    去重并保持首次出现的顺序；drop_covered=True 时去掉被同批其他网段包含的条目，
+    merge=True 时再把相邻网段合并为超网
+    """
+    networks: List[IPNetwork] = []
+    invalid: List[str] = []
+    seen = set()
+    for value in values:
+        try:
+            network = parse_cidr(value)
+        except ValueError:
+            invalid.append(value)
+            continue
+        if network not in seen:
+            seen.add(network)
+            networks.append(network)
+
+    if merge:
+        merged = [
+            network
+            for version in (4, 6)
+            for network in ipaddress.collapse_addresses(n for n in networks if n.version == version)
+        ]
+        return [network.with_prefixlen for network in merged], invalid
+
+    covered = _covered_networks(networks) if drop_covered else set()
+    return [network.with_prefixlen for network in networks if network not in covered], invalid
+
+
+def _covered_networks(networks: List[IPNetwork]) -> set:
+    """
+    找出被列表中其他网段包含的网段
+    CIDR 网段之间只有包含或不相交两种关系，按起始地址排序（同起点时大网段在前）后一次扫描即可
+    """
+    covered = set()
+    for version in (4, 6):
+        ordered = sorted(
+            (n for n in networks if n.version == version),
+            key=lambda n: (int(n.network_address), n.prefixlen)
+        )
+        max_end = -1
+        for network in ordered:
+            end = int(network.broadcast_address)
+            if end <= max_end:
+                covered.add(network)
+            else:
+                max_end = end
+    return covered
@@ -0,0 +1,295 @@
+"""
+安全组规则合并
+每次封禁都会新增一条 Drop 规则，而安全组有规则数上限，规则越多匹配也越慢。合并只处理本服务写入的规则
+（策略 Drop、端口 -1/-1、协议 ALL）：相邻网段全部被封禁时合并为覆盖它们的超网；合并后显式规则仍超过目标数时，
+把最细的网段移入 ECS 前缀列表，由一条引用前缀列表的规则统一拦截。
+合并过的安全组在解封时，覆盖待解封网段的超网规则或前缀列表条目拆分为其余部分，解封后其他网段仍被拦截
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+from services.alicloud import AliCloudClient, collect_batch_failures
+from services.cidr import IPNetwork, normalize_cidrs, parse_cidr
+
+# 本服务写入的封禁规则
+MANAGED_RULE = {"policy": "Drop", "port_range": "-1/-1", "ip_protocol": "ALL"}
+
+
+@dataclass
+class ConsolidationPlan:
+    """合并前后的规则差异"""
+    to_add: List[str] = field(default_factory=list)
+    to_remove: List[str] = field(default_factory=list)
+    moved: List[str] = field(default_factory=list)
+    to_prefix_list: List[str] = field(default_factory=list)
+    replaced_by: Dict[str, str] = field(default_factory=dict)
+    pinned: List[str] = field(default_factory=list)
+    add_reference: bool = False
+    rules_before: int = 0
+    rules_after: int = 0
+
+    @property
+    def merges(self) -> Dict[str, List[str]]:
+        """取代规则的网段 -> 被取代的规则"""
+        merges: Dict[str, List[str]] = {}
+        for cidr, replacement in self.replaced_by.items():
+            merges.setdefault(replacement, []).append(cidr)
+        return merges
+
+
+def _replacement(cidr: str, kept: set) -> Optional[str]:
+    """kept 中包含 cidr 的网段（逐级向上查找超网）"""
+    network = parse_cidr(cidr)
+    for prefixlen in range(network.prefixlen, -1, -1):
+        candidate = network.supernet(new_prefix=prefixlen).with_prefixlen
+        if candidate in kept:
+            return candidate
+    return None
+
+
+def plan_consolidation(
+    live: Iterable[str],
+    pinned: Iterable[str] = (),
+    max_rules: int = 0,
+    prefix_list: Optional[Dict[str, Any]] = None,
+    prefix_list_referenced: bool = False
+) -> ConsolidationPlan:
+    """
+    计算合并方案
+    pinned 为有到期时间的封禁，保持原样（到期后按原网段解封）；prefix_list 为 get_prefix_list 的返回值，
+    显式规则数超过 max_rules 时按前缀长度从细到粗把同地址族的网段移入前缀列表，已在列表中的网段优先且不占容量
+    """
+    live_cidrs, _ = normalize_cidrs(live, drop_covered=False)
+    live_set = set(live_cidrs)
+    pinned_set = set(normalize_cidrs(pinned, drop_covered=False)[0]) & live_set
+    movable = [cidr for cidr in live_cidrs if cidr not in pinned_set]
+    merged, _ = normalize_cidrs(movable, merge=True)
+
+    moved: List[str] = []
+    existing: set = set()
+    overflow = len(merged) + len(pinned_set) - max_rules
+    if prefix_list is not None and max_rules > 0 and overflow > 0:
+        if not prefix_list_referenced:
+            overflow += 1
+        existing = set(prefix_list["entries"])
+        capacity = prefix_list["max_entries"] - len(existing)
+        version = 6 if prefix_list["address_family"] == "IPv6" else 4
+        networks = [parse_cidr(cidr) for cidr in merged]
+        candidates = [
+            network.with_prefixlen
+            for network in sorted(
+                (network for network in networks if network.version == version),
+                key=lambda network: (network.with_prefixlen not in existing, -network.prefixlen)
+            )
+        ]
+        for cidr in candidates:
+            if len(moved) >= overflow:
+                break
+            if cidr not in existing:
+                if capacity <= 0:
+                    break
+                capacity -= 1
+            moved.append(cidr)
+
+    moved_set = set(moved)
+    kept = [cidr for cidr in merged if cidr not in moved_set]
+    kept_set = set(kept)
+    to_remove = [cidr for cidr in movable if cidr not in kept_set]
+    add_reference = bool(moved) and not prefix_list_referenced
+    return ConsolidationPlan(
+        to_add=[cidr for cidr in kept if cidr not in live_set],
+        to_remove=to_remove,
+        moved=moved,
+        to_prefix_list=[cidr for cidr in moved if cidr not in existing],
+        replaced_by={cidr: _replacement(cidr, kept_set | moved_set) for cidr in to_remove},
+        pinned=sorted(pinned_set),
+        add_reference=add_reference,
+        rules_before=len(live_cidrs),
+        rules_after=len(kept) + len(pinned_set) + int(add_reference)
+    )
+
+
+def _exclude(network: IPNetwork, removed: IPNetwork) -> List[IPNetwork]:
+    """network 去掉 removed 后剩余的网段"""
+    if network.version != removed.version:
+        return [network]
+    if network.subnet_of(removed):
+        return []
+    if removed.subnet_of(network):
+        return list(network.address_exclude(removed))
+    return [network]
+
+
+def split_covering(
+    entries: Iterable[str],
+    cidr_ips: Iterable[str],
+    include_equal: bool = False
+) -> Dict[str, Tuple[List[str], List[str]]]:
+    """
+    entries 中包含待解封网段的条目 -> (其中待解封的网段, 去掉这些网段后剩余的部分)
+    include_equal=False 时只查找严格更大的超网（与待解封网段相同的条目由普通解封处理）
+    """
+    networks = [parse_cidr(cidr) for cidr in cidr_ips]
+    splits: Dict[str, Tuple[List[str], List[str]]] = {}
+    for entry in entries:
+        covering = parse_cidr(entry)
+        contained = [
+            network for network in networks
+            if network.version == covering.version and network.subnet_of(covering)
+            and (include_equal or network != covering)
+        ]
+        if not contained:
+            continue
+        remaining = [covering]
+        for network in contained:
+            remaining = [piece for part in remaining for piece in _exclude(part, network)]
+        splits[entry] = (
+            [network.with_prefixlen for network in contained],
+            [network.with_prefixlen for network in remaining]
+        )
+    return splits
+
+
+def _api_calls(batch_results: List[Dict[str, Any]]) -> int:
+    return sum(1 for result in batch_results if not result.get("skipped"))
+
+
+async def _references_prefix_list(client: AliCloudClient, security_group_id: str, prefix_list_id: str) -> bool:
+    """安全组中是否已有引用该前缀列表的 Drop 规则"""
+    async for page in client.iter_security_group_rule_pages_async(security_group_id):
+        for rule in page:
+            if rule.get("source_prefix_list_id") == prefix_list_id and (rule["policy"] or "").lower() == "drop":
+                return True
+    return False
+
+
+async def consolidate_security_group(
+    client: AliCloudClient,
+    security_group_id: str,
+    dry_run: bool = False,
+    max_rules: int = 0,
+    prefix_list_id: Optional[str] = None,
+    pinned: Iterable[str] = (),
+    description: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    合并安全组中本服务写入的 Drop 规则；dry_run=True 时只返回差异
+    先写入前缀列表条目、引用规则和超网规则，只撤销取代者已写入成功的规则，任何时刻都不会放开已封禁的地址
+    """
+    live = await client.list_security_group_cidrs_async(security_group_id, **MANAGED_RULE)
+    prefix_list, referenced = None, False
+    if prefix_list_id:
+        prefix_list = await client.get_prefix_list_async(prefix_list_id)
+        referenced = await _references_prefix_list(client, security_group_id, prefix_list_id)
+    plan = plan_consolidation(live, pinned, max_rules, prefix_list, referenced)
+
+    prefix_results, reference_results, add_results, remove_results = [], [], [], []
+    failures: Dict[str, str] = {}
+    if not dry_run:
+        if plan.to_prefix_list:
+            prefix_results = await client.add_prefix_list_entries_batch_async(prefix_list_id, plan.to_prefix_list, description)
+        if plan.add_reference:
+            reference_results = [await client.authorize_prefix_list_rule_async(
+                prefix_list_id, security_group_id=security_group_id, **MANAGED_RULE
+            )]
+            if not reference_results[0]["success"]:
+                # 没有引用规则时前缀列表中的网段不生效，对应的规则不能撤销
+                failures.update({cidr: reference_results[0]["error"] for cidr in plan.moved})
+        if plan.to_add:
+            add_results = await client.authorize_security_group_batch_async(
+                plan.to_add, security_group_id=security_group_id, description=description, exact=True,
+                **MANAGED_RULE
+            )
+        failures.update(collect_batch_failures(prefix_results + add_results))
+        revocable = [cidr for cidr in plan.to_remove if plan.replaced_by[cidr] not in failures]
+        if revocable:
+            remove_results = await client.revoke_security_group_batch_async(
+                revocable, security_group_id=security_group_id, **MANAGED_RULE
+            )
+            failures.update(collect_batch_failures(remove_results, revocable))
+
+    if dry_run:
+        rules_after = plan.rules_after
+    else:
+        added = sum(1 for cidr in plan.to_add if cidr not in failures)
+        removed = sum(len(result["entries"]) for result in remove_results if result["success"] and not result.get("skipped"))
+        reference = sum(1 for result in reference_results if result["success"])
+        rules_after = plan.rules_before + added + reference - removed
+
+    logger.info(
+        "安全组规则合并{}: {} 规则 {} -> {}，新增超网 {} 移入前缀列表 {}",
+        "（预演）" if dry_run else "", security_group_id, plan.rules_before, rules_after,
+        len(plan.to_add), len(plan.moved)
+    )
+    return {
+        "dry_run": dry_run,
+        "rules_before": plan.rules_before,
+        "rules_after": rules_after,
+        "rules_saved": plan.rules_before - rules_after,
+        "to_add": plan.to_add,
+        "to_remove": plan.to_remove,
+        "to_prefix_list": plan.to_prefix_list,
+        "merges": plan.merges,
+        "pinned": len(plan.pinned),
+        "prefix_list_id": prefix_list_id or "",
+        "failures": failures,
+        "api_calls": _api_calls(prefix_results + reference_results + add_results + remove_results)
+    }
+
+
+# ==== 合并后的解封 ====
+
+def _split_failed(operation: str, entries: List[str], error: str) -> Dict[str, Any]:
+    return {"success": False, "error": error, "entries": entries, "operation": operation}
+
+
+async def release_consolidated(
+    client: AliCloudClient,
+    security_group_id: str,
+    cidr_ips: List[str],
+    prefix_list_ids: Iterable[str] = (),
+    description: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    解封被合并规则覆盖的网段，返回各步调用的结果（失败结果的 entries 包含对应的待解封网段）
+    超网规则先写入其余部分再撤销，前缀列表条目在一次修改中替换为其余部分，任何时刻都不会放开其他已封禁的地址
+    """
+    results: List[Dict[str, Any]] = []
+
+    live = await client.list_security_group_cidrs_async(security_group_id, **MANAGED_RULE)
+    splits = split_covering(live, cidr_ips)
+    if splits:
+        live_set = set(live)
+        pieces = list(dict.fromkeys(
+            piece for _, remaining in splits.values() for piece in remaining if piece not in live_set
+        ))
+        add_results = await client.authorize_security_group_batch_async(
+            pieces, security_group_id=security_group_id, description=description, exact=True, **MANAGED_RULE
+        ) if pieces else []
+        add_failures = collect_batch_failures(add_results)
+        revocable = []
+        for entry, (contained, remaining) in splits.items():
+            error = next((add_failures[piece] for piece in remaining if piece in add_failures), None)
+            if error is None:
+                revocable.append(entry)
+            else:
+                results.append(_split_failed("AuthorizeSecurityGroup", contained, f"拆分合并规则 {entry} 失败: {error}"))
+        if revocable:
+            results += await client.revoke_security_group_batch_async(
+                revocable, security_group_id=security_group_id, exact=True, **MANAGED_RULE
+            )
+
+    # 同一前缀列表在前一次修改完成前可能拒绝新的修改，依次提交
+    for prefix_list_id in prefix_list_ids:
+        prefix_list = await client.get_prefix_list_async(prefix_list_id)
+        for entry, (_, remaining) in split_covering(prefix_list["entries"], cidr_ips, include_equal=True).items():
+            results.append(await client.replace_prefix_list_entry_async(prefix_list_id, entry, remaining, description))
+
+    if results:
+        logger.info(
+            "解封合并过的安全组 {}: 拆分超网规则 {} 条，前缀列表条目 {} 条",
+            security_group_id, len(splits), sum(1 for result in results if result["operation"] == "ModifyPrefixList")
+        )
+    return results
@@ -0,0 +1,273 @@
+"""
+内存模拟的阿里云 ALB/ECS 后端
+实现 AliCloudClient 用到的 SDK 方法子集（*_with_options），可配置往返延迟、错误率和限流，
+用于离线测试和压测：CLOUD_BACKEND=fake 时替换真实 SDK 客户端，不访问阿里云
+"""
+
+import random
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Dict, Optional, Tuple
+
+from core.config import settings
+
+
+class FakeCloudError(Exception):
+    """模拟的云 API 错误，与 SDK 异常一样带有 code 属性，限流/重试逻辑按 code 判断"""
+
+    def __init__(self, code: str, message: str):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.message = message
+
+
+class FakeCloudBackend:
+    """
+    模拟云端的共享状态和故障注入
+    所有地域的客户端共享一份状态（ACL/安全组 ID 全局唯一）；限流按 API 计数，超过每秒配额时返回 Throttling.User
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_qps: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_qps = throttle_qps
+        self.calls: Dict[str, int] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._acls: Dict[str, Dict[str, Optional[str]]] = {}
+        self._acl_quotas: Dict[str, int] = {}
+        self._security_groups: Dict[str, Dict[Tuple[str, str, str, str], SimpleNamespace]] = {}
+        self._prefix_lists: Dict[str, SimpleNamespace] = {}
+        self._windows: Dict[str, Tuple[int, int]] = {}
+
+    def _enter(self, operation: str):
+        """记录调用并注入延迟、限流和随机错误"""
+        if self.latency > 0:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            if self.throttle_qps > 0:
+                second = int(time.monotonic())
+                window, count = self._windows.get(operation, (second, 0))
+                if window != second:
+                    window, count = second, 0
+                self._windows[operation] = (window, count + 1)
+                if count >= self.throttle_qps:
+                    raise FakeCloudError("Throttling.User", f"Request was denied due to user flow control: {operation}")
+            if self.error_rate > 0 and self._random.random() < self.error_rate:
+                raise FakeCloudError("ServiceUnavailable", f"The request has failed due to a temporary failure: {operation}")
+
+    @staticmethod
+    def _response(**body) -> SimpleNamespace:
+        return SimpleNamespace(
+            status_code=200,
+            body=SimpleNamespace(request_id=uuid.uuid4().hex.upper(), **body)
+        )
+
+    @staticmethod
+    def _page(items: list, next_token: Optional[str], max_results: Optional[int]) -> Tuple[list, Optional[str]]:
+        start = int(next_token or 0)
+        end = start + (max_results or 100)
+        return items[start:end], (str(end) if end < len(items) else None)
+
+    # ==== ALB ====
+
+    def list_acl_entries(self, request) -> SimpleNamespace:
+        self._enter("ListAclEntries")
+        with self._lock:
+            entries = list(self._acls.get(request.acl_id, {}).items())
+        page, next_token = self._page(entries, request.next_token, request.max_results)
+        return self._response(
+            acl_entries=[
+                SimpleNamespace(entry=entry, description=description, status="Available")
+                for entry, description in page
+            ],
+            next_token=next_token,
+            total_count=len(entries)
+        )
+
+    def set_acl_quota(self, acl_id: str, max_entries: int):
+        """限制 ACL 的条目数（阿里云上为账号配额），超过时新增返回 QuotaExceeded.AclEntriesNum"""
+        with self._lock:
+            self._acl_quotas[acl_id] = max_entries
+
+    def add_entries_to_acl(self, request) -> SimpleNamespace:
+        self._enter("AddEntriesToAcl")
+        with self._lock:
+            acl = self._acls.setdefault(request.acl_id, {})
+            entries = {entry.entry for entry in request.acl_entries or []}
+            quota = self._acl_quotas.get(request.acl_id)
+            if quota is not None and len(acl.keys() | entries) > quota:
+                raise FakeCloudError("QuotaExceeded.AclEntriesNum", f"The quota of acl entries is exceeded: {request.acl_id}")
+            for entry in request.acl_entries or []:
+                acl[entry.entry] = entry.description
+        return self._response(job_id=uuid.uuid4().hex)
+
+    def remove_entries_from_acl(self, request) -> SimpleNamespace:
+        self._enter("RemoveEntriesFromAcl")
+        with self._lock:
+            acl = self._acls.get(request.acl_id, {})
+            for entry in request.entries or []:
+                acl.pop(entry, None)
+        return self._response(job_id=uuid.uuid4().hex)
+
+    # ==== ECS ====
+
+    @staticmethod
+    def _permission_key(permission) -> Tuple[str, str, str, str]:
+        return (
+            permission.source_cidr_ip or permission.ipv_6source_cidr_ip or permission.source_prefix_list_id,
+            (permission.policy or "Accept").lower(),
+            permission.port_range,
+            (permission.ip_protocol or "ALL").upper()
+        )
+
+    def describe_security_group_attribute(self, request) -> SimpleNamespace:
+        self._enter("DescribeSecurityGroupAttribute")
+        with self._lock:
+            rules = list(self._security_groups.get(request.security_group_id, {}).values())
+        page, next_token = self._page(rules, request.next_token, request.max_results)
+        return self._response(
+            security_group_id=request.security_group_id,
+            permissions=SimpleNamespace(permission=page),
+            next_token=next_token
+        )
+
+    def authorize_security_group(self, request) -> SimpleNamespace:
+        self._enter("AuthorizeSecurityGroup")
+        with self._lock:
+            group = self._security_groups.setdefault(request.security_group_id, {})
+            for permission in request.permissions or []:
+                key = self._permission_key(permission)
+                if key not in group:
+                    group[key] = SimpleNamespace(
+                        source_cidr_ip=permission.source_cidr_ip,
+                        ipv_6source_cidr_ip=permission.ipv_6source_cidr_ip,
+                        source_prefix_list_id=permission.source_prefix_list_id,
+                        policy=permission.policy,
+                        port_range=permission.port_range,
+                        ip_protocol=permission.ip_protocol,
+                        description=permission.description,
+                        security_group_rule_id=f"sgr-{uuid.uuid4().hex[:20]}"
+                    )
+        return self._response()
+
+    def revoke_security_group(self, request) -> SimpleNamespace:
+        self._enter("RevokeSecurityGroup")
+        with self._lock:
+            group = self._security_groups.get(request.security_group_id, {})
+            for permission in request.permissions or []:
+                group.pop(self._permission_key(permission), None)
+        return self._response()
+
+    def create_prefix_list(self, prefix_list_id: str, max_entries: int = 200, address_family: str = "IPv4"):
+        """创建空的前缀列表（阿里云上由运维预先创建，模拟后端在测试中调用）"""
+        with self._lock:
+            self._prefix_lists[prefix_list_id] = SimpleNamespace(
+                address_family=address_family, max_entries=max_entries, entries={}
+            )
+
+    def _prefix_list(self, prefix_list_id: str) -> SimpleNamespace:
+        prefix_list = self._prefix_lists.get(prefix_list_id)
+        if prefix_list is None:
+            raise FakeCloudError("InvalidPrefixListId.NotFound", f"The specified prefix list does not exist: {prefix_list_id}")
+        return prefix_list
+
+    def describe_prefix_list_attributes(self, request) -> SimpleNamespace:
+        self._enter("DescribePrefixListAttributes")
+        with self._lock:
+            prefix_list = self._prefix_list(request.prefix_list_id)
+            entries = list(prefix_list.entries.items())
+        return self._response(
+            prefix_list_id=request.prefix_list_id,
+            address_family=prefix_list.address_family,
+            max_entries=prefix_list.max_entries,
+            entries=SimpleNamespace(entry=[
+                SimpleNamespace(cidr=cidr, description=description) for cidr, description in entries
+            ])
+        )
+
+    def modify_prefix_list(self, request) -> SimpleNamespace:
+        self._enter("ModifyPrefixList")
+        with self._lock:
+            prefix_list = self._prefix_list(request.prefix_list_id)
+            entries = dict(prefix_list.entries)
+            for entry in request.remove_entry or []:
+                entries.pop(entry.cidr, None)
+            for entry in request.add_entry or []:
+                entries[entry.cidr] = entry.description
+            if len(entries) > prefix_list.max_entries:
+                raise FakeCloudError("QuotaExceed.PrefixListEntry", f"The maximum number of entries is exceeded: {request.prefix_list_id}")
+            prefix_list.entries = entries
+        return self._response()
+
+
+class FakeAlbClient:
+    """ALB SDK 客户端的模拟实现"""
+
+    def __init__(self, backend: FakeCloudBackend):
+        self.backend = backend
+
+    def list_acl_entries_with_options(self, request, runtime):
+        return self.backend.list_acl_entries(request)
+
+    def add_entries_to_acl_with_options(self, request, runtime):
+        return self.backend.add_entries_to_acl(request)
+
+    def remove_entries_from_acl_with_options(self, request, runtime):
+        return self.backend.remove_entries_from_acl(request)
+
+
+class FakeEcsClient:
+    """ECS SDK 客户端的模拟实现"""
+
+    def __init__(self, backend: FakeCloudBackend):
+        self.backend = backend
+
+    def describe_security_group_attribute_with_options(self, request, runtime):
+        return self.backend.describe_security_group_attribute(request)
+
+    def authorize_security_group_with_options(self, request, runtime):
+        return self.backend.authorize_security_group(request)
+
+    def revoke_security_group_with_options(self, request, runtime):
+        return self.backend.revoke_security_group(request)
+
+    def describe_prefix_list_attributes_with_options(self, request, runtime):
+        return self.backend.describe_prefix_list_attributes(request)
+
+    def modify_prefix_list_with_options(self, request, runtime):
+        return self.backend.modify_prefix_list(request)
+
+
+# 进程内共享的模拟后端
+_fake_backend: Optional[FakeCloudBackend] = None
+_fake_backend_lock = threading.Lock()
+
+
+def get_fake_backend() -> FakeCloudBackend:
+    """获取进程内共享的模拟后端，首次调用时按配置创建"""
+    global _fake_backend
+    if _fake_backend is None:
+        with _fake_backend_lock:
+            if _fake_backend is None:
+                _fake_backend = FakeCloudBackend(
+                    latency=settings.fake_cloud_latency,
+                    error_rate=settings.fake_cloud_error_rate,
+                    throttle_qps=settings.fake_cloud_throttle_qps
+                )
+    return _fake_backend
+
+
+def create_fake_clients() -> Tuple[FakeEcsClient, FakeAlbClient]:
+    """创建使用共享模拟后端的 (ECS, ALB) 客户端"""
+    backend = get_fake_backend()
+    return FakeEcsClient(backend), FakeAlbClient(backend)
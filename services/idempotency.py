@@ -0,0 +1,169 @@
+"""
+幂等键
+上游在超时后会用相同的 Idempotency-Key 重试写请求；同一个键在有效期内只执行一次：
+已完成的请求直接返回缓存的响应，仍在执行的请求由重复请求等待其结果，不再重复调用云 API
+完成的响应保存在共享状态存储中，多 worker 部署时任意 worker 都能重放；同一 worker 内的并发重复请求直接等待
+执行中的 future，其他 worker 上的重复请求轮询执行中标记直到结果写入；
+响应的状态码和响应头随响应体一起保存，重放时原样返回（如熔断时转入写回队列的 202）
+"""
+
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from core.config import settings
+from core.metrics import metrics, COUNTER
+from services.state_store import MemoryStateStore, StateStore, get_state_store
+
+metrics.describe("idempotency_requests_total", COUNTER, "携带 Idempotency-Key 的请求数（result=executed/replayed/joined/conflict）")
+
+# 执行中标记的有效期（秒）：执行请求的 worker 异常退出时，过期后其他请求可重新执行
+PENDING_TTL = 60.0
+
+# 等待其他 worker 执行结果时的轮询间隔（秒）
+_POLL_INTERVAL = 0.05
+_POLL_MAX_INTERVAL = 0.5
+
+_STATUS_PENDING = "pending"
+_STATUS_DONE = "done"
+
+
+class IdempotencyConflictError(Exception):
+    """同一个幂等键被用于不同的请求内容"""
+
+
+class StoredResponse(NamedTuple):
+    """
+    带状态码和响应头的响应：body 为执行得到的响应模型，从存储中重放时为序列化后的 JSON 字符串；
+    status_code 为空表示接口的默认状态码
+    """
+    body: Any
+    status_code: Optional[int] = None
+    headers: Dict[str, str] = {}
+
+
+def request_fingerprint(*parts: str) -> str:
+    """请求内容摘要，用于识别同一个键被复用到不同请求上"""
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def _encode(result: Any) -> str:
+    if hasattr(result, "model_dump_json"):
+        return result.model_dump_json()
+    return json.dumps(result, ensure_ascii=False)
+
+
+class IdempotencyStore:
+    """
+    幂等键存储：完成的响应以 JSON 保存在 StateStore 中，保留 ttl 秒
+    只缓存 success 为 True 的响应：失败的请求在返回给所有并发等待者后即移除，之后的重试会重新执行
+    """
+
+    def __init__(self, ttl: float, store: Optional[StateStore] = None, max_entries: int = 10000):
+        self.ttl = ttl
+        self.store = store if store is not None else MemoryStateStore(max_entries)
+        self._inflight: Dict[str, Tuple[str, asyncio.Future]] = {}
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    async def _read(self, key: str) -> Optional[Dict[str, Any]]:
+        value = await asyncio.to_thread(self.store.get, key)
+        return json.loads(value) if value else None
+
+    async def run(self, key: str, fingerprint: str, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        按幂等键执行 func，返回 (响应, 是否为重放)
+        本 worker 执行或等待的请求返回 func 的返回值；从存储中重放的请求返回 StoredResponse，body 为保存的 JSON 字符串
+        func 返回 StoredResponse 时状态码和响应头一并保存；键已被不同请求内容使用时抛出 IdempotencyConflictError
+        """
+        interval = _POLL_INTERVAL
+        while True:
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                return await self._join(key, fingerprint, func, *inflight)
+
+            record = await self._read(key)
+            if record is not None:
+                if record["fingerprint"] != fingerprint:
+                    metrics.inc("idempotency_requests_total", (("result", "conflict"),))
+                    raise IdempotencyConflictError(key)
+                if record["status"] == _STATUS_DONE:
+                    metrics.inc("idempotency_requests_total", (("result", "replayed"),))
+                    return StoredResponse(record["body"], record.get("status_code"), record.get("headers") or {}), True
+                # 其他 worker 正在执行
+                await asyncio.sleep(interval)
+                interval = min(interval * 2, _POLL_MAX_INTERVAL)
+                continue
+
+            marker = json.dumps({"fingerprint": fingerprint, "status": _STATUS_PENDING})
+            if await asyncio.to_thread(self.store.add, key, marker, ttl=PENDING_TTL):
+                return await self._execute(key, fingerprint, func), False
+
+    async def _join(self, key, fingerprint, func, inflight_fingerprint: str, future: asyncio.Future) -> Tuple[Any, bool]:
+        """等待本 worker 内执行中的同一请求"""
+        if inflight_fingerprint != fingerprint:
+            metrics.inc("idempotency_requests_total", (("result", "conflict"),))
+            raise IdempotencyConflictError(key)
+        metrics.inc("idempotency_requests_total", (("result", "joined"),))
+        try:
+            return await asyncio.shield(future), True
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise
+            # 首个请求被取消（如客户端断开），由当前请求重新执行
+            return await self.run(key, fingerprint, func)
+
+    async def _execute(self, key: str, fingerprint: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行请求并保存响应；存储调用（SQLite 等）是阻塞的，放到线程池执行，不阻塞事件循环
+        保存完成前执行中的 future 仍登记在 _inflight 中，期间到达的重复请求直接取得结果
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (fingerprint, future)
+        metrics.inc("idempotency_requests_total", (("result", "executed"),))
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            self._inflight.pop(key, None)
+            future.cancel()
+            await asyncio.to_thread(self.store.delete, key)
+            raise
+        except Exception as e:
+            self._inflight.pop(key, None)
+            future.set_exception(e)
+            # 没有等待者时不输出 "exception was never retrieved"
+            future.exception()
+            await asyncio.to_thread(self.store.delete, key)
+            raise
+
+        future.set_result(result)
+        stored = result if isinstance(result, StoredResponse) else StoredResponse(result)
+        try:
+            if getattr(stored.body, "success", True):
+                record = {
+                    "fingerprint": fingerprint,
+                    "status": _STATUS_DONE,
+                    "body": _encode(stored.body),
+                    "status_code": stored.status_code,
+                    "headers": stored.headers
+                }
+                await asyncio.to_thread(self.store.set, key, json.dumps(record, ensure_ascii=False), ttl=self.ttl)
+            else:
+                await asyncio.to_thread(self.store.delete, key)
+        finally:
+            self._inflight.pop(key, None)
+        return result
+
+
+# 进程内共享的幂等键存储
+_idempotency_store: Optional[IdempotencyStore] = None
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """获取进程内共享的幂等键存储，首次调用时按配置创建"""
+    global _idempotency_store
+    if _idempotency_store is None:
+        _idempotency_store = IdempotencyStore(settings.idempotency_ttl, get_state_store())
+    return _idempotency_store
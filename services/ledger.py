@@ -0,0 +1,497 @@
+"""
+封禁台账
+在本地 SQLite 中记录每个 CIDR 在各目标上的封禁及到期时间；后台清理任务按到期时间索引分批取出到期的封禁，
+通过批量删除接口从 ALB 访问控制和安全组中解封，短期自动封禁不会一直占用 ACL 配额
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from loguru import logger
+from core.config import settings
+from core.metrics import metrics
+from services.alicloud import AliCloudClient, get_aliyun_client, collect_batch_failures
+from services.consolidate import release_consolidated
+from services.state_store import StateStore, get_state_store
+from services.targets import BanTarget, fan_out
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bans (
+    cidr_ip TEXT NOT NULL,
+    region TEXT NOT NULL,
+    acl_id TEXT NOT NULL DEFAULT '',
+    security_group_id TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    banned_at REAL NOT NULL,
+    expires_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (cidr_ip, region, acl_id, security_group_id)
+);
+-- 永久封禁（expires_at 为空）不进入索引，清理只扫描到期的部分
+CREATE INDEX IF NOT EXISTS idx_bans_expires_at ON bans (expires_at) WHERE expires_at IS NOT NULL;
+-- 做过规则合并的安全组及合并时使用的前缀列表（未使用时为空串），解封时需要拆分覆盖待解封网段的超网规则和前缀列表条目
+CREATE TABLE IF NOT EXISTS consolidated_groups (
+    region TEXT NOT NULL,
+    security_group_id TEXT NOT NULL,
+    prefix_list_id TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (region, security_group_id, prefix_list_id)
+);
+"""
+
+
+class BanRecord(NamedTuple):
+    """台账中的一条封禁：一个 CIDR 在一个目标上实际写入成功的 ACL/安全组"""
+    cidr_ip: str
+    target: BanTarget
+    expires_at: Optional[float] = None
+    description: str = ""
+    attempts: int = 0
+
+
+def ban_expiry(ttl_seconds: Optional[float] = None, now: Optional[float] = None) -> Optional[float]:
+    """封禁到期时间戳：未指定时使用 BAN_DEFAULT_TTL，时长为 0 表示永久（返回 None）"""
+    ttl = settings.ban_default_ttl if ttl_seconds is None else ttl_seconds
+    if not ttl or ttl <= 0:
+        return None
+    return (time.time() if now is None else now) + ttl
+
+
+def applied_target(target: BanTarget, alb_success: Optional[bool], ecs_success: Optional[bool]) -> Optional[BanTarget]:
+    """只保留写入成功的一路，两路都未成功时返回 None（不记录）"""
+    applied = BanTarget(
+        target.region,
+        target.acl_id if alb_success else "",
+        target.security_group_id if ecs_success else ""
+    )
+    return applied if applied.acl_id or applied.security_group_id else None
+
+
+def ban_records(
+    cidr_ip: str,
+    target: BanTarget,
+    alb_success: Optional[bool],
+    ecs_success: Optional[bool],
+    alb_existing: bool = False,
+    ecs_existing: bool = False,
+    expires_at: Optional[float] = None,
+    description: str = ""
+) -> Tuple[List[BanRecord], List[BanRecord]]:
+    """一个 CIDR 在一个目标上成功的封禁，拆分为 (本次写入的, 目标上已有条目、本次未写入的)"""
+    def records(applied: Optional[BanTarget]) -> List[BanRecord]:
+        return [] if applied is None else [BanRecord(cidr_ip, applied, expires_at, description)]
+
+    return (
+        records(applied_target(target, alb_success and not alb_existing, ecs_success and not ecs_existing)),
+        records(applied_target(target, alb_success and alb_existing, ecs_success and ecs_existing))
+    )
+
+
+class BanLedger:
+    """
+    SQLite 封禁台账，所有方法都是阻塞调用，在事件循环中应通过 asyncio.to_thread 调用
+    entries 为最近一次写入或 count() 时的记录数，供指标读取，不在事件循环中查询数据库
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self.entries = self._count()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def record_bans(self, records: Iterable[BanRecord], now: Optional[float] = None) -> int:
+        """记录封禁；同一 CIDR 在同一目标上重复封禁时以最新一次的到期时间为准"""
+        now = time.time() if now is None else now
+        rows = [
+            (r.cidr_ip, r.target.region, r.target.acl_id, r.target.security_group_id,
+             r.description or "", now, r.expires_at)
+            for r in records
+        ]
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            self._conn.executemany(
+                """
+                INSERT INTO bans (cidr_ip, region, acl_id, security_group_id, description, banned_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (cidr_ip, region, acl_id, security_group_id) DO UPDATE SET
+                    description = excluded.description,
+                    banned_at = excluded.banned_at,
+                    expires_at = excluded.expires_at,
+                    attempts = 0
+                """,
+                rows
+            )
+            self.entries = self._count()
+        return len(rows)
+
+    def extend(self, records: Iterable[BanRecord], now: Optional[float] = None) -> List[BanRecord]:
+        """
+        只延长台账中已有的到期封禁（同一 CIDR 在 record.target 的任一路上），不新增记录；
+        返回延长了的记录，没有延长的是永久封禁或台账外的条目
+        """
+        now = time.time() if now is None else now
+        extended = []
+        with self._lock, self._conn:
+            for r in records:
+                cursor = self._conn.execute(
+                    """
+                    UPDATE bans SET description = ?, banned_at = ?, expires_at = ?, attempts = 0
+                    WHERE cidr_ip = ? AND region = ? AND expires_at IS NOT NULL
+                        AND ((? != '' AND acl_id = ?) OR (? != '' AND security_group_id = ?))
+                    """,
+                    (r.description or "", now, r.expires_at, r.cidr_ip, r.target.region,
+                     r.target.acl_id, r.target.acl_id, r.target.security_group_id, r.target.security_group_id)
+                )
+                if cursor.rowcount:
+                    extended.append(r)
+        return extended
+
+    def forget(self, cidr_ips: Iterable[str]) -> int:
+        """已解封的 CIDR 从台账中删除（所有目标）"""
+        with self._lock, self._conn:
+            cursor = self._conn.executemany("DELETE FROM bans WHERE cidr_ip = ?", [(c,) for c in cidr_ips])
+            self.entries = self._count()
+            return cursor.rowcount
+
+    def release(self, records: Iterable[BanRecord]) -> int:
+        """
+        已解封的部分从台账中移除：记录的 target 只包含解封成功的一路（ACL/安全组），
+        同一地域上的封禁去掉这一路，两路都已解封的记录删除
+        """
+        rows = [
+            (r.target.acl_id, r.target.security_group_id, r.cidr_ip, r.target.region)
+            for r in records if r.target.acl_id or r.target.security_group_id
+        ]
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            # 去掉一路后可能与已有的单路记录重复，以 OR REPLACE 合并
+            self._conn.executemany(
+                """
+                UPDATE OR REPLACE bans SET
+                    acl_id = CASE WHEN acl_id = ?1 THEN '' ELSE acl_id END,
+                    security_group_id = CASE WHEN security_group_id = ?2 THEN '' ELSE security_group_id END
+                WHERE cidr_ip = ?3 AND region = ?4
+                """,
+                rows
+            )
+            cursor = self._conn.executemany(
+                "DELETE FROM bans WHERE cidr_ip = ? AND region = ? AND acl_id = '' AND security_group_id = ''",
+                [(cidr_ip, region) for _, _, cidr_ip, region in rows]
+            )
+            self.entries = self._count()
+            return cursor.rowcount
+
+    def due(self, now: Optional[float] = None, limit: int = 1000) -> List[BanRecord]:
+        """按到期时间顺序取出已到期的封禁（走 expires_at 索引，不扫描全表）"""
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT cidr_ip, region, acl_id, security_group_id, expires_at, description, attempts
+                FROM bans WHERE expires_at <= ? ORDER BY expires_at LIMIT ?
+                """,
+                (now, limit)
+            ).fetchall()
+        return [
+            BanRecord(cidr_ip, BanTarget(region, acl_id, sg_id), expires_at, description, attempts)
+            for cidr_ip, region, acl_id, sg_id, expires_at, description, attempts in rows
+        ]
+
+    def delete(self, records: Iterable[BanRecord]) -> int:
+        """删除指定目标上的封禁记录"""
+        with self._lock, self._conn:
+            cursor = self._conn.executemany(
+                "DELETE FROM bans WHERE cidr_ip = ? AND region = ? AND acl_id = ? AND security_group_id = ?",
+                [(r.cidr_ip, r.target.region, r.target.acl_id, r.target.security_group_id) for r in records]
+            )
+            self.entries = self._count()
+            return cursor.rowcount
+
+    def reschedule(self, records: Iterable[BanRecord], expires_at: float) -> int:
+        """解封失败的记录推迟到 expires_at 再试，并累加尝试次数"""
+        with self._lock, self._conn:
+            cursor = self._conn.executemany(
+                """
+                UPDATE bans SET expires_at = ?, attempts = attempts + 1
+                WHERE cidr_ip = ? AND region = ? AND acl_id = ? AND security_group_id = ?
+                """,
+                [(expires_at, r.cidr_ip, r.target.region, r.target.acl_id, r.target.security_group_id) for r in records]
+            )
+            return cursor.rowcount
+
+    def get(self, cidr_ip: str) -> List[BanRecord]:
+        """查询一个 CIDR 在各目标上的封禁"""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT region, acl_id, security_group_id, expires_at, description, attempts
+                FROM bans WHERE cidr_ip = ?
+                """,
+                (cidr_ip,)
+            ).fetchall()
+        return [
+            BanRecord(cidr_ip, BanTarget(region, acl_id, sg_id), expires_at, description, attempts)
+            for region, acl_id, sg_id, expires_at, description, attempts in rows
+        ]
+
+    def expiring_cidrs(self, region: str, security_group_id: str) -> List[str]:
+        """安全组中有到期时间的封禁（到期后按原网段解封，不能被合并）"""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT cidr_ip FROM bans
+                WHERE region = ? AND security_group_id = ? AND expires_at IS NOT NULL
+                """,
+                (region, security_group_id)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def mark_consolidated(self, region: str, security_group_id: str, prefix_list_id: str = ""):
+        """记录安全组做过合并（及合并时使用的前缀列表）"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO consolidated_groups (region, security_group_id, prefix_list_id) VALUES (?, ?, ?)",
+                (region, security_group_id, prefix_list_id or "")
+            )
+
+    def consolidated_prefix_lists(self, region: str, security_group_id: str) -> Optional[List[str]]:
+        """安全组合并时使用的前缀列表，没有做过合并时返回 None"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT prefix_list_id FROM consolidated_groups WHERE region = ? AND security_group_id = ?",
+                (region, security_group_id)
+            ).fetchall()
+        return [row[0] for row in rows if row[0]] if rows else None
+
+    def _count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM bans").fetchone()[0]
+
+    def count(self) -> int:
+        """台账中的封禁记录数（同时刷新 entries，包括其他 worker 的写入）"""
+        with self._lock:
+            self.entries = self._count()
+            return self.entries
+
+
+# ==== 合并过的安全组 ====
+
+def _consolidated_key(region: str, security_group_id: str) -> str:
+    return f"consolidated:{region}:{security_group_id}"
+
+
+async def mark_consolidated(region: str, security_group_id: str, prefix_list_id: Optional[str] = None):
+    """
+    记录安全组做过合并，之后的解封需要检查超网规则和前缀列表
+    记录在台账中（重启后仍然有效，多 worker 共用）；未启用台账时退而记录在共享状态存储中
+    """
+    ledger = get_ban_ledger()
+    if ledger is not None:
+        await asyncio.to_thread(ledger.mark_consolidated, region, security_group_id, prefix_list_id or "")
+        return
+    logger.warning("未启用封禁台账，安全组合并记录只保存在状态存储中: {} ({})", security_group_id, region)
+    store = get_state_store()
+    key = _consolidated_key(region, security_group_id)
+    value = await asyncio.to_thread(store.get, key)
+    prefix_lists = set(json.loads(value) if value else [])
+    if prefix_list_id:
+        prefix_lists.add(prefix_list_id)
+    await asyncio.to_thread(store.set, key, json.dumps(sorted(prefix_lists)))
+
+
+async def consolidated_prefix_lists(region: str, security_group_id: str) -> Optional[List[str]]:
+    """安全组合并时使用的前缀列表，没有做过合并时返回 None"""
+    ledger = get_ban_ledger()
+    if ledger is not None:
+        return await asyncio.to_thread(ledger.consolidated_prefix_lists, region, security_group_id)
+    value = await asyncio.to_thread(get_state_store().get, _consolidated_key(region, security_group_id))
+    return json.loads(value) if value else None
+
+
+async def revoke_banned_cidrs(
+    client: AliCloudClient,
+    cidr_ips: List[str],
+    security_group_id: str
+) -> List[Dict[str, Any]]:
+    """
+    从安全组解封（批量结果）：撤销各网段的 Drop 规则；安全组做过合并时，
+    再拆分覆盖这些网段的超网规则和前缀列表条目，拆分失败的网段记为解封失败
+    """
+    results = await client.revoke_security_group_batch_async(
+        cidr_ips, security_group_id=security_group_id, policy="Drop"
+    )
+    prefix_lists = await consolidated_prefix_lists(client.default_region, security_group_id)
+    if prefix_lists is None:
+        return results
+
+    failures = collect_batch_failures(results, cidr_ips)
+    revoked = [cidr_ip for cidr_ip in cidr_ips if cidr_ip not in failures]
+    if revoked:
+        try:
+            results += await release_consolidated(client, security_group_id, revoked, prefix_lists)
+        except Exception as e:
+            logger.error("解封时查询合并规则失败: {} - {}", security_group_id, e)
+            results.append({
+                "success": False,
+                "error": f"查询合并规则失败: {e}",
+                "entries": revoked,
+                "operation": "DescribeSecurityGroupAttribute"
+            })
+    return results
+
+
+# ==== 到期清理 ====
+
+async def _unban_target(target: BanTarget, cidr_ips: List[str]) -> Dict[str, str]:
+    """通过批量删除接口在一个目标上解封，返回失败的 CIDR -> 原因"""
+    client = get_aliyun_client().for_region(target.region)
+    legs = []
+    if target.acl_id:
+        legs.append(client.remove_entries_from_acl_batch_async(target.acl_id, cidr_ips))
+    if target.security_group_id:
+        legs.append(revoke_banned_cidrs(client, cidr_ips, target.security_group_id))
+    failures: Dict[str, str] = {}
+    for result in await asyncio.gather(*legs):
+        failures.update(collect_batch_failures(result, cidr_ips))
+    return failures
+
+
+async def sweep_expired_bans(ledger: BanLedger, limit: int = 0, now: Optional[float] = None) -> int:
+    """
+    解封一批到期的封禁，返回本批处理的记录数
+    同一目标上的到期 CIDR 合并为一次批量删除；失败的记录按重试间隔推迟，超过最大尝试次数后放弃并从台账删除
+    """
+    now = time.time() if now is None else now
+    records = await asyncio.to_thread(ledger.due, now, limit or settings.ban_sweep_batch)
+    if not records:
+        return 0
+
+    by_target: Dict[BanTarget, List[BanRecord]] = {}
+    for record in records:
+        by_target.setdefault(record.target, []).append(record)
+
+    groups = list(by_target.items())
+    results = await fan_out(
+        groups,
+        lambda group: _unban_target(group[0], [record.cidr_ip for record in group[1]]),
+        return_exceptions=True
+    )
+
+    done, retry = [], []
+    for (target, group), result in zip(groups, results):
+        for record in group:
+            error = str(result) if isinstance(result, Exception) else result.get(record.cidr_ip)
+            if error is None:
+                done.append(record)
+            elif record.attempts + 1 >= settings.ban_sweep_max_attempts:
+                logger.error("到期解封多次失败，放弃并移出台账: {} {} - {}", record.cidr_ip, target, error)
+                done.append(record)
+            else:
+                retry.append(record)
+
+    await asyncio.to_thread(ledger.delete, done)
+    if retry:
+        await asyncio.to_thread(ledger.reschedule, retry, now + settings.ban_sweep_retry_delay)
+    logger.info("到期解封: {} 条，失败待重试 {} 条", len(done), len(retry))
+    return len(records)
+
+
+async def run_ban_sweeper(ledger: BanLedger, interval: float, store: Optional[StateStore] = None):
+    """
+    后台清理任务：到期记录较多时连续处理多批，处理完后按间隔等待
+    传入共享状态存储时（多 worker 共用一个台账），只有持有租约的 worker 执行清理；持有者退出后租约过期由其他 worker 接管
+    """
+    owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    while True:
+        try:
+            # 刷新记录数指标（多 worker 时其他 worker 也会写入）
+            await asyncio.to_thread(ledger.count)
+        except Exception as e:
+            logger.error("统计封禁台账记录数失败: {}", e)
+        if store is not None and store.shared and not store.acquire_lease("ban_sweeper", owner, ttl=interval * 3):
+            await asyncio.sleep(interval)
+            continue
+        try:
+            while await sweep_expired_bans(ledger) >= settings.ban_sweep_batch:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("到期解封异常: {}", e)
+        await asyncio.sleep(interval)
+
+
+# ==== 进程内共享台账 ====
+
+_ban_ledger: Optional[BanLedger] = None
+
+def open_ban_ledger() -> Optional[BanLedger]:
+    """按 BAN_LEDGER_PATH 打开台账（应用启动时调用），未配置路径时返回 None"""
+    global _ban_ledger
+    if _ban_ledger is None and settings.ban_ledger_path:
+        _ban_ledger = BanLedger(settings.ban_ledger_path)
+    return _ban_ledger
+
+def get_ban_ledger() -> Optional[BanLedger]:
+    """获取已打开的台账，未打开时返回 None（不记录）"""
+    return _ban_ledger
+
+def close_ban_ledger():
+    """关闭台账"""
+    global _ban_ledger
+    if _ban_ledger is not None:
+        _ban_ledger.close()
+        _ban_ledger = None
+
+async def record_bans(records: List[BanRecord], existing: Iterable[BanRecord] = ()) -> List[BanRecord]:
+    """
+    写入共享台账（未启用时跳过）；台账异常只记录日志，不影响封禁结果
+    existing 为目标上已有条目（已存在或已被更大网段包含）、本次没有写入的封禁：永久封禁照常记录；
+    有到期时间的只延长台账中已有的到期封禁，不新增记录，否则到期时会删掉并非本次写入的条目。
+    返回没有延长的封禁（被永久或台账外的条目覆盖，不会自动解封）
+    """
+    ledger = get_ban_ledger()
+    existing = list(existing)
+    if ledger is None or not (records or existing):
+        return []
+    expiring = [record for record in existing if record.expires_at is not None]
+    records = list(records) + [record for record in existing if record.expires_at is None]
+    try:
+        await asyncio.to_thread(ledger.record_bans, records)
+        extended = await asyncio.to_thread(ledger.extend, expiring) if expiring else []
+    except Exception as e:
+        logger.error("写入封禁台账失败: {}", e)
+        return []
+    return [record for record in expiring if record not in extended]
+
+async def release_bans(records: List[BanRecord]):
+    """已解封的部分从共享台账中移除（未启用时跳过），records 的 target 只包含解封成功的一路"""
+    ledger = get_ban_ledger()
+    if ledger is None or not records:
+        return
+    try:
+        await asyncio.to_thread(ledger.release, records)
+    except Exception as e:
+        logger.error("更新封禁台账失败: {}", e)
+
+metrics.register_callback(
+    "ban_ledger_entries", "封禁台账中的记录数",
+    lambda: [((), _ban_ledger.entries if _ban_ledger is not None else 0)]
+)
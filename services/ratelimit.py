@@ -0,0 +1,217 @@
+"""
+阿里云 API 限流与重试
+按 API 和地域维护令牌桶，遇到限流时自适应降速；对限流和瞬时网络错误做带抖动的指数退避重试
+"""
+
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional
+
+import requests
+
+from core.deadline import sleep
+from services.state_store import StateStore
+
+# 服务端故障的错误码前缀（端点不可用）
+SERVER_ERROR_CODES = (
+    "ServiceUnavailable",
+    "InternalError",
+    "SystemBusy",
+)
+
+# 可重试的错误码前缀：限流、服务端故障，以及 ALB 访问控制并发修改冲突（端点正常，资源暂时被占用）
+RETRYABLE_ERROR_CODES = ("Throttling",) + SERVER_ERROR_CODES + (
+    "IncorrectStatus.Acl",
+    "Conflict.Lock",
+)
+
+# 配额不足的错误码前缀（ACL 条目数、安全组规则数等达到上限）
+QUOTA_ERROR_CODES = (
+    "QuotaExceed",
+    "AuthorizationLimitExceed",
+)
+
+# 非幂等写操作的结果不确定（超时、服务端故障）后重试时，说明上一次尝试其实已经生效的错误码前缀
+APPLIED_ERROR_CODES = {
+    "AddEntriesToAcl": ("ResourceAlreadyExist.AclEntry",),
+    "RemoveEntriesFromAcl": ("ResourceNotFound.AclEntry",),
+    "AuthorizeSecurityGroup": ("InvalidPermission.Duplicate",),
+}
+
+# 可重试的网络异常
+RETRYABLE_EXCEPTIONS = (
+    ConnectionError,
+    TimeoutError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
+
+# SDK 把连接失败、超时等网络错误包装为 RetryError，重试耗尽后再包装为 UnretryableException
+# （code 为空，原异常在 inner_exception 中）；按类名匹配，不在此导入 SDK
+SDK_NETWORK_ERRORS = frozenset({
+    ("Tea.exceptions", "RetryError"),
+    ("darabonba.exceptions", "RetryError"),
+})
+
+
+def _error_chain(error: BaseException) -> Iterator[BaseException]:
+    """异常本身及其包装的原异常（inner_exception、__cause__）"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = getattr(error, "inner_exception", None) or error.__cause__
+
+
+def _error_code(error: Exception) -> str:
+    """异常链中第一个非空的错误码"""
+    for item in _error_chain(error):
+        code = getattr(item, "code", None)
+        if code:
+            return str(code)
+    return ""
+
+
+def is_network_error(error: Exception) -> bool:
+    """是否为网络错误（连接失败、超时），包括被 SDK 包装的"""
+    return any(
+        isinstance(item, RETRYABLE_EXCEPTIONS) or (type(item).__module__, type(item).__name__) in SDK_NETWORK_ERRORS
+        for item in _error_chain(error)
+    )
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """是否为限流错误（Throttling、Throttling.User、Throttling.Api 等）"""
+    return _error_code(error).startswith("Throttling")
+
+
+def is_server_error(error: Exception) -> bool:
+    """是否为服务端故障错误码（ServiceUnavailable、InternalError 等）"""
+    return _error_code(error).startswith(SERVER_ERROR_CODES)
+
+
+def is_quota_error(error: Exception) -> bool:
+    """是否为配额不足错误（QuotaExceeded.AclEntriesNum、AuthorizationLimitExceed 等）"""
+    return _error_code(error).startswith(QUOTA_ERROR_CODES)
+
+
+def is_applied_error(operation: str, error: Exception) -> bool:
+    """写操作的错误是否说明目标状态已经达成（条目已存在、已删除）"""
+    codes = APPLIED_ERROR_CODES.get(operation)
+    return bool(codes) and _error_code(error).startswith(codes)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """是否为可重试的错误"""
+    return _error_code(error).startswith(RETRYABLE_ERROR_CODES) or is_network_error(error)
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶
+    遇到限流时速率减半，之后每次成功逐步恢复到配置速率（AIMD），使吞吐稳定在账号配额之下
+    """
+
+    def __init__(self, rate: float, burst: int, min_rate: float = 0.5):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.min_rate = min(min_rate, rate)
+        self._tokens = float(self.burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self):
+        """获取一个令牌，令牌不足时阻塞等待（不持有锁休眠）；请求已放弃时不再等待，直接返回，由调用方检查"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            if sleep(wait):
+                return
+
+    def on_throttled(self):
+        """云端返回限流：速率减半"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def on_success(self):
+        """调用成功：速率线性恢复"""
+        if self.rate < self.max_rate:
+            with self._lock:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class SharedTokenBucket(TokenBucket):
+    """令牌保存在共享状态存储中，多个 worker 共用同一份配额；限流后的降速（AIMD）仍在各 worker 内进行"""
+
+    def __init__(self, store: StateStore, key: str, rate: float, burst: int, min_rate: float = 0.5):
+        super().__init__(rate, burst, min_rate)
+        self.store = store
+        self.key = key
+
+    def acquire(self):
+        """从共享令牌桶获取一个令牌，令牌不足时等待后重试；请求已放弃时不再等待"""
+        while True:
+            wait = self.store.take_token(self.key, self.rate, self.burst)
+            if wait <= 0 or sleep(wait):
+                return
+
+
+class RateLimiter:
+    """按 (API, 地域) 维护令牌桶；传入共享的状态存储时令牌在 worker 间共享"""
+
+    def __init__(
+        self,
+        default_qps: float,
+        burst: int,
+        overrides: Optional[Dict[str, float]] = None,
+        store: Optional[StateStore] = None
+    ):
+        self.default_qps = default_qps
+        self.burst = burst
+        self.overrides = overrides or {}
+        self.store = store if store is not None and store.shared else None
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, operation: str, region: str) -> Optional[TokenBucket]:
+        """获取令牌桶，QPS 配置为 0 表示不限流"""
+        key = f"{operation}:{region}"
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            qps = self.overrides.get(operation, self.default_qps)
+            if qps <= 0:
+                return None
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = (
+                        SharedTokenBucket(self.store, f"ratelimit:{key}", qps, self.burst)
+                        if self.store is not None else TokenBucket(qps, self.burst)
+                    )
+        return bucket
+
+
+@dataclass
+class RetryPolicy:
+    """带抖动的指数退避重试策略"""
+    max_retries: int
+    base_delay: float
+    max_delay: float
+
+    def delay(self, attempt: int) -> float:
+        """第 attempt 次重试前的等待时间（full jitter）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
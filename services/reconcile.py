@@ -0,0 +1,148 @@
+"""
+期望状态同步
+给定一个 ACL 或安全组应有的完整网段集合，与云端当前状态做集合差，只写入需要新增和删除的条目，
+API 调用量与变化量成正比，而不是每次重新提交整个列表
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+from services.alicloud import AliCloudClient, collect_batch_failures
+from services.cidr import normalize_cidrs
+
+
+@dataclass
+class ReconcilePlan:
+    """期望状态与云端状态的差异"""
+    to_add: List[str] = field(default_factory=list)
+    to_remove: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    invalid: List[str] = field(default_factory=list)
+
+
+def plan_reconcile(desired: Iterable[str], live: Iterable[str]) -> ReconcilePlan:
+    """
+    按规范化后的网段计算差异：to_add 为期望中有而云端没有的，to_remove 为云端有而期望中没有的
+    两者都保持输入顺序；期望中无法解析的条目放入 invalid，不参与比较
+    """
+    desired_cidrs, invalid = normalize_cidrs(desired, drop_covered=False)
+    live_cidrs, _ = normalize_cidrs(live, drop_covered=False)
+    live_set = set(live_cidrs)
+    desired_set = set(desired_cidrs)
+    to_add = [cidr for cidr in desired_cidrs if cidr not in live_set]
+    return ReconcilePlan(
+        to_add=to_add,
+        to_remove=[cidr for cidr in live_cidrs if cidr not in desired_set],
+        unchanged=len(desired_cidrs) - len(to_add),
+        invalid=invalid
+    )
+
+
+def _api_calls(batch_results: List[Dict[str, Any]]) -> int:
+    return sum(1 for result in batch_results if not result.get("skipped"))
+
+
+def _applied(batch_results: List[Dict[str, Any]]) -> int:
+    """实际写入成功的条目数"""
+    return sum(len(result["entries"]) for result in batch_results if result["success"] and not result.get("skipped"))
+
+
+async def _apply(
+    plan: ReconcilePlan,
+    add: Callable[[List[str]], Awaitable[List[Dict[str, Any]]]],
+    remove: Callable[[List[str]], Awaitable[List[Dict[str, Any]]]]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    先新增再删除，返回 (新增结果, 删除结果)：同步过程中期望的条目一直生效，不会在删除和新增之间出现放行窗口；
+    新增因配额不足失败时，等删除多余条目释放配额后再重试这部分新增
+    """
+    add_results = await add(plan.to_add) if plan.to_add else []
+    remove_results = await remove(plan.to_remove) if plan.to_remove else []
+    quota_failed = [entry for result in add_results if result.get("quota_exceeded") for entry in result["entries"]]
+    if quota_failed and _applied(remove_results):
+        logger.info("新增因配额不足失败，删除多余条目后重试: {} 条", len(quota_failed))
+        add_results = [result for result in add_results if not result.get("quota_exceeded")] + await add(quota_failed)
+    return add_results, remove_results
+
+
+def _summary(
+    plan: ReconcilePlan,
+    dry_run: bool,
+    add_results: List[Dict[str, Any]],
+    remove_results: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    failures = collect_batch_failures(remove_results, plan.to_remove)
+    failures.update(collect_batch_failures(add_results, plan.to_add))
+    return {
+        "dry_run": dry_run,
+        "to_add": plan.to_add,
+        "to_remove": plan.to_remove,
+        "unchanged": plan.unchanged,
+        "invalid": plan.invalid,
+        "added": _applied(add_results),
+        "removed": _applied(remove_results),
+        "failures": failures,
+        "api_calls": _api_calls(add_results) + _api_calls(remove_results)
+    }
+
+
+async def reconcile_acl(
+    client: AliCloudClient,
+    acl_id: str,
+    desired: Iterable[str],
+    dry_run: bool = False,
+    description: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    把 ACL 同步为 desired：读取当前条目、计算差异，先新增缺少的条目再删除多余条目（配额不足时删除后重试新增），
+    两步都按原网段（不合并、不按缓存跳过）分批并发写入，保证重复同步收敛；dry_run=True 时只返回差异
+    """
+    plan = plan_reconcile(desired, await client.list_acl_cidrs_async(acl_id))
+    remove_results, add_results = [], []
+    if not dry_run:
+        add_results, remove_results = await _apply(
+            plan,
+            lambda cidrs: client.add_entries_to_acl_batch_async(acl_id, cidrs, description, exact=True),
+            lambda cidrs: client.remove_entries_from_acl_batch_async(acl_id, cidrs, exact=True)
+        )
+    logger.info(
+        "ACL 同步{}: {} 新增 {} 删除 {} 不变 {}",
+        "（预演）" if dry_run else "", acl_id, len(plan.to_add), len(plan.to_remove), plan.unchanged
+    )
+    return _summary(plan, dry_run, add_results, remove_results)
+
+
+async def reconcile_security_group(
+    client: AliCloudClient,
+    security_group_id: str,
+    desired: Iterable[str],
+    dry_run: bool = False,
+    description: Optional[str] = None,
+    policy: str = "Drop",
+    port_range: str = "-1/-1",
+    ip_protocol: str = "ALL"
+) -> Dict[str, Any]:
+    """
+    把安全组中策略、端口和协议均匹配的入方向规则同步为 desired，其余规则不受影响；
+    先添加缺少的规则再撤销多余规则（配额不足时撤销后重试添加），dry_run=True 时只返回差异
+    """
+    rule = {"policy": policy, "port_range": port_range, "ip_protocol": ip_protocol}
+    live = await client.list_security_group_cidrs_async(security_group_id, **rule)
+    plan = plan_reconcile(desired, live)
+    remove_results, add_results = [], []
+    if not dry_run:
+        add_results, remove_results = await _apply(
+            plan,
+            lambda cidrs: client.authorize_security_group_batch_async(
+                cidrs, security_group_id=security_group_id, description=description, exact=True, **rule
+            ),
+            lambda cidrs: client.revoke_security_group_batch_async(
+                cidrs, security_group_id=security_group_id, exact=True, **rule
+            )
+        )
+    logger.info(
+        "安全组同步{}: {} 新增 {} 删除 {} 不变 {}",
+        "（预演）" if dry_run else "", security_group_id, len(plan.to_add), len(plan.to_remove), plan.unchanged
+    )
+    return _summary(plan, dry_run, add_results, remove_results)
@@ -0,0 +1,304 @@
+"""
+共享状态存储
+多 worker 部署时，幂等键、限流令牌、状态缓存版本号、写回队列结果和后台任务租约需要在进程间共享：
+memory 为单进程默认实现；sqlite 使用本机 SQLite 文件（WAL），同一主机上的所有 worker 打开同一个文件即可共享，
+路径放在 /dev/shm 下时即为共享内存
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+from core.config import settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_kv_expires_at ON kv (expires_at) WHERE expires_at IS NOT NULL;
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+# SQLite 每写入多少次清理一次过期键
+_PURGE_EVERY = 256
+
+
+def _refill(tokens: float, updated_at: float, now: float, rate: float, burst: int) -> Tuple[float, float]:
+    """令牌桶取一个令牌，返回 (剩余令牌, 需要等待的秒数)，等待时不扣减"""
+    tokens = min(burst, tokens + max(0.0, now - updated_at) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class StateStore:
+    """共享状态存储接口，所有方法都是短小的阻塞调用；值为字符串，ttl 为秒"""
+
+    # 是否在进程间共享（为 False 时各调用方保留原有的进程内实现）
+    shared = False
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        """键不存在（或已过期）时写入并返回 True"""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def incr(self, key: str) -> int:
+        """计数器加一并返回新值"""
+        raise NotImplementedError
+
+    def take_token(self, key: str, rate: float, burst: int) -> float:
+        """从令牌桶取一个令牌，返回 0 表示已取得，否则为需要等待的秒数"""
+        raise NotImplementedError
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """获取或续期租约，租约被其他 owner 持有且未过期时返回 False"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryStateStore(StateStore):
+    """进程内实现：有界 LRU，超出容量时淘汰最久未使用的键"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Tuple[str, Optional[float]]]" = OrderedDict()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._leases: Dict[str, Tuple[str, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _live(self, key: str, now: float) -> Optional[Tuple[str, Optional[float]]]:
+        item = self._items.get(key)
+        if item is not None and item[1] is not None and item[1] <= now:
+            del self._items[key]
+            return None
+        return item
+
+    def _put(self, key: str, value: str, ttl: Optional[float], now: float):
+        self._items[key] = (value, now + ttl if ttl else None)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._live(key, time.time())
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        with self._lock:
+            self._put(key, value, ttl, time.time())
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        with self._lock:
+            now = time.time()
+            if self._live(key, now) is not None:
+                return False
+            self._put(key, value, ttl, now)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            now = time.time()
+            item = self._live(key, now)
+            value = int(item[0]) + 1 if item is not None else 1
+            self._put(key, str(value), None, now)
+            return value
+
+    def take_token(self, key: str, rate: float, burst: int) -> float:
+        with self._lock:
+            now = time.time()
+            tokens, updated_at = self._buckets.get(key, (float(burst), now))
+            tokens, wait = _refill(tokens, updated_at, now, rate, burst)
+            self._buckets[key] = (tokens, now)
+            return wait
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        with self._lock:
+            now = time.time()
+            holder = self._leases.get(name)
+            if holder is not None and holder[0] != owner and holder[1] > now:
+                return False
+            self._leases[name] = (owner, now + ttl)
+            return True
+
+
+class SQLiteStateStore(StateStore):
+    """
+    SQLite 实现：同一主机的多个 worker 打开同一个文件
+    读改写操作在 BEGIN IMMEDIATE 事务中完成，进程间由 SQLite 文件锁串行化
+    """
+
+    shared = True
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._writes = 0
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM kv WHERE expires_at IS NULL OR expires_at > ?", (time.time(),)
+            ).fetchone()[0]
+
+    def _transaction(self, func):
+        """在写事务中执行 func(conn, now)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self._conn, time.time())
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return result
+
+    def _after_write(self, conn: sqlite3.Connection, now: float):
+        self._writes += 1
+        if self._writes % _PURGE_EVERY == 0:
+            conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        def write(conn, now):
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, now + ttl if ttl else None)
+            )
+            self._after_write(conn, now)
+        self._transaction(write)
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        def write(conn, now):
+            conn.execute("DELETE FROM kv WHERE key = ? AND expires_at IS NOT NULL AND expires_at <= ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, now + ttl if ttl else None)
+            )
+            self._after_write(conn, now)
+            return cursor.rowcount == 1
+        return self._transaction(write)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def incr(self, key: str) -> int:
+        def write(conn, now):
+            row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+            value = int(row[0]) + 1 if row else 1
+            conn.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, NULL)", (key, str(value)))
+            return value
+        return self._transaction(write)
+
+    def take_token(self, key: str, rate: float, burst: int) -> float:
+        def write(conn, now):
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated_at = row if row else (float(burst), now)
+            tokens, wait = _refill(tokens, updated_at, now, rate, burst)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)", (key, tokens, now)
+            )
+            return wait
+        return self._transaction(write)
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        def write(conn, now):
+            row = conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row is not None and row[0] != owner and row[1] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)", (name, owner, now + ttl)
+            )
+            return True
+        return self._transaction(write)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ==== 进程内共享实例 ====
+
+_state_store: Optional[StateStore] = None
+_state_store_lock = threading.Lock()
+
+
+def state_store_backend() -> str:
+    """STATE_STORE 未配置时：单 worker 使用 memory，多 worker（WEB_CONCURRENCY > 1）使用 sqlite"""
+    return settings.state_store or ("sqlite" if settings.web_concurrency > 1 else "memory")
+
+
+def get_state_store() -> StateStore:
+    """获取共享状态存储，首次调用时按配置创建"""
+    global _state_store
+    if _state_store is None:
+        with _state_store_lock:
+            if _state_store is None:
+                backend = state_store_backend()
+                if backend == "sqlite":
+                    _state_store = SQLiteStateStore(settings.state_store_path)
+                elif backend == "memory":
+                    _state_store = MemoryStateStore(settings.idempotency_max_keys)
+                else:
+                    raise ValueError(f"未知的共享状态存储: {backend}")
+                logger.info("共享状态存储: {}", backend)
+    return _state_store
+
+
+def close_state_store():
+    """关闭共享状态存储，应用退出时调用"""
+    global _state_store
+    with _state_store_lock:
+        if _state_store is not None:
+            _state_store.close()
+            _state_store = None
@@ -0,0 +1,50 @@
+"""
+封禁目标
+一次封禁/解封需要写入的 (地域, ALB 访问控制, ECS 安全组) 列表，以及按并发上限向所有目标扇出的工具函数
+"""
+
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, List, Sequence, TypeVar
+from core.config import settings
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class BanTarget:
+    """一个封禁目标，acl_id 或 security_group_id 为空时跳过对应一路"""
+    region: str
+    acl_id: str = ""
+    security_group_id: str = ""
+
+
+def get_ban_targets() -> List[BanTarget]:
+    """读取 BAN_TARGETS，未配置时使用默认地域、ACL 和安全组"""
+    targets = [BanTarget(*target) for target in settings.BAN_TARGETS]
+    if not targets:
+        targets = [BanTarget(
+            settings.default_region,
+            settings.default_alb_acl_id,
+            settings.default_security_group_id
+        )]
+    return targets
+
+
+async def fan_out(
+    items: Sequence[T],
+    func: Callable[[T], Awaitable[Any]],
+    concurrency: int = 0,
+    return_exceptions: bool = False
+) -> List[Any]:
+    """
+    对每个条目并发执行 func，同时进行的数量不超过 concurrency（0 表示使用 BAN_FANOUT_CONCURRENCY）
+    总耗时接近最慢的一个目标，而不是各目标之和
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency or settings.ban_fanout_concurrency))
+
+    async def run(item: T):
+        async with semaphore:
+            return await func(item)
+
+    return list(await asyncio.gather(*(run(item) for item in items), return_exceptions=return_exceptions))
@@ -0,0 +1,46 @@
+"""
+测试公共配置
+默认使用内存模拟的云后端，不访问真实阿里云；设置 CLOUD_BACKEND=aliyun 可对真实环境运行
+"""
+
+import os
+import time
+
+import pytest
+
+os.environ.setdefault("CLOUD_BACKEND", "fake")
+os.environ.setdefault("FAKE_CLOUD_LATENCY", "0")
+
+
+class RecordingClient:
+    """记录每次调用所携带条目数的 ALB/ECS SDK 桩客户端"""
+
+    def __init__(self, fail_entries=(), latency=0.0):
+        self.calls = []
+        self.fail_entries = set(fail_entries)
+        self.latency = latency
+
+    def _record(self, operation, entries):
+        self.calls.append((operation, list(entries)))
+        time.sleep(self.latency)
+        if self.fail_entries & set(entries):
+            raise Exception(f"{operation} failed")
+        return {"operation": operation}
+
+    def add_entries_to_acl_with_options(self, request, runtime):
+        return self._record("AddEntriesToAcl", [e.entry for e in request.acl_entries])
+
+    def remove_entries_from_acl_with_options(self, request, runtime):
+        return self._record("RemoveEntriesFromAcl", request.entries)
+
+    def authorize_security_group_with_options(self, request, runtime):
+        return self._record("AuthorizeSecurityGroup", [p.source_cidr_ip or p.ipv_6source_cidr_ip for p in request.permissions])
+
+    def revoke_security_group_with_options(self, request, runtime):
+        return self._record("RevokeSecurityGroup", [p.source_cidr_ip or p.ipv_6source_cidr_ip for p in request.permissions])
+
+
+@pytest.fixture
+def recording_client():
+    """RecordingClient 桩客户端类，按需构造: recording_client(fail_entries=[...], latency=0.2)"""
+    return RecordingClient
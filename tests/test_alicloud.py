@@ -0,0 +1,400 @@
+"""
+阿里云客户端服务测试
+使用本地桩客户端替换 SDK，不访问真实阿里云接口
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from services.alicloud import AliCloudClient, collect_batch_failures
+
+from conftest import RecordingClient
+
+# 模拟的单次往返延迟（秒）
+LATENCY = 0.2
+
+
+class SlowAlbClient:
+    """模拟固定往返延迟的 ALB SDK 客户端"""
+
+    def add_entries_to_acl_with_options(self, request, runtime):
+        time.sleep(LATENCY)
+        return {"acl_id": request.acl_id}
+
+
+class ListingClient(RecordingClient):
+    """在 RecordingClient 基础上提供已有 ACL 条目/安全组规则的分页查询"""
+
+    def __init__(self, existing=(), page_size=2, **kwargs):
+        super().__init__(**kwargs)
+        self.existing = list(existing)
+        self.page_size = page_size
+
+    def _page(self, request):
+        start = int(request.next_token or 0)
+        end = start + self.page_size
+        self.calls.append(("List", self.existing[start:end]))
+        return self.existing[start:end], (str(end) if end < len(self.existing) else None)
+
+    def list_acl_entries_with_options(self, request, runtime):
+        page, next_token = self._page(request)
+        entries = [SimpleNamespace(entry=cidr, description=None, status="Available") for cidr in page]
+        return SimpleNamespace(body=SimpleNamespace(acl_entries=entries, next_token=next_token))
+
+    def describe_security_group_attribute_with_options(self, request, runtime):
+        page, next_token = self._page(request)
+        permissions = [
+            SimpleNamespace(
+                source_cidr_ip=cidr, ipv_6source_cidr_ip=None, policy="Drop", port_range="-1/-1",
+                ip_protocol="ALL", description=None, security_group_rule_id=f"sgr-{i}"
+            )
+            for i, cidr in enumerate(page)
+        ]
+        return SimpleNamespace(body=SimpleNamespace(
+            permissions=SimpleNamespace(permission=permissions), next_token=next_token
+        ))
+
+
+def make_cidrs(n):
+    return [f"10.{i // 65536}.{i // 256 % 256}.{i % 256}/32" for i in range(n)]
+
+
+@pytest.fixture
+def aliyun_client():
+    client = AliCloudClient()
+    client.alb_client = SlowAlbClient()
+    yield client
+    client.close()
+
+
+class TestAsyncExecution:
+    """异步执行路径测试"""
+
+    def test_concurrent_requests_take_one_round_trip(self, aliyun_client):
+        """N 个并发请求的总耗时应接近一次往返，而非 N 次"""
+        n = 8
+
+        async def run():
+            return await asyncio.gather(*(
+                aliyun_client.add_entries_to_acl_async("acl-test", f"10.0.0.{i}/32")
+                for i in range(n)
+            ))
+
+        start = time.perf_counter()
+        results = asyncio.run(run())
+        elapsed = time.perf_counter() - start
+
+        assert all(result["success"] for result in results)
+        assert elapsed < LATENCY * 2
+
+    def test_event_loop_not_blocked(self, aliyun_client):
+        """云 API 调用进行中时，事件循环仍能处理其他任务"""
+
+        async def run():
+            call = asyncio.create_task(aliyun_client.add_entries_to_acl_async("acl-test", "10.0.0.1/32"))
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            ticked = time.perf_counter() - start
+            await call
+            return ticked
+
+        assert asyncio.run(run()) < LATENCY / 2
+
+
+class TestBatching:
+    """批量接口分批测试"""
+
+    def test_acl_entries_packed_into_max_batches(self):
+        client = AliCloudClient()
+        client.alb_client = RecordingClient()
+
+        results = asyncio.run(client.add_entries_to_acl_batch_async("acl-test", make_cidrs(500)))
+        client.close()
+
+        assert len(results) == 25
+        assert all(len(entries) == 20 for _, entries in client.alb_client.calls)
+        assert all(result["success"] for result in results)
+
+    def test_security_group_permissions_packed_into_max_batches(self):
+        client = AliCloudClient()
+        client.ecs_client = RecordingClient()
+
+        results = client.revoke_security_group_batch(make_cidrs(250), security_group_id="sg-test")
+        client.close()
+
+        assert [len(entries) for _, entries in client.ecs_client.calls] == [100, 100, 50]
+        assert all(result["success"] for result in results)
+
+    def test_failed_batch_reports_its_entries(self):
+        cidrs = make_cidrs(30)
+        client = AliCloudClient()
+        client.ecs_client = RecordingClient(fail_entries=[cidrs[0]])
+
+        results = client.authorize_security_group_batch(cidrs, security_group_id="sg-test")
+        client.close()
+
+        assert results[0]["success"] is False
+        assert results[0]["entries"] == cidrs
+
+
+class TestSharedClient:
+    """进程内共享客户端测试"""
+
+    def test_single_instance_shared(self):
+        from services.alicloud import get_aliyun_client, close_aliyun_client
+
+        close_aliyun_client()
+        client = get_aliyun_client()
+        assert get_aliyun_client() is client
+
+        close_aliyun_client()
+        assert get_aliyun_client() is not client
+
+    def test_regional_clients_cached_and_share_executor(self):
+        client = AliCloudClient()
+        regional = client.for_region("cn-shanghai")
+
+        assert client.for_region("cn-shanghai") is regional
+        assert client.for_region(None) is client
+        assert regional.default_region == "cn-shanghai"
+        assert regional._executor is client._executor and regional.rate_limiter is client.rate_limiter
+
+        regional.close()
+        assert not client._executor._shutdown
+        client.close()
+
+
+class TestStateCache:
+    """ACL/安全组状态缓存测试"""
+
+    def _write_calls(self, fake):
+        return [call for call in fake.calls if call[0] != "List"]
+
+    def test_repeat_ban_answered_from_cache(self):
+        client = AliCloudClient()
+        client.alb_client = ListingClient(existing=["1.1.1.1/32", "2.2.2.2/32", "3.3.3.3/32"])
+
+        result = client.add_entries_to_acl("acl-test", "2.2.2.2/32")
+        assert result["success"] is True and result["skipped"] is True
+        assert self._write_calls(client.alb_client) == []
+
+        client.add_entries_to_acl("acl-test", "4.4.4.4/32")
+        again = client.add_entries_to_acl("acl-test", "4.4.4.4/32")
+        client.close()
+
+        assert again["skipped"] is True
+        assert self._write_calls(client.alb_client) == [("AddEntriesToAcl", ["4.4.4.4/32"])]
+        assert len([call for call in client.alb_client.calls if call[0] == "List"]) == 2
+
+    def test_batch_sends_only_changes(self):
+        client = AliCloudClient()
+        client.ecs_client = ListingClient(existing=["1.1.1.1/32", "2.2.2.2/32"])
+
+        results = asyncio.run(client.revoke_security_group_batch_async(
+            ["1.1.1.1/32", "2.2.2.2/32", "9.9.9.9/32"], security_group_id="sg-test"
+        ))
+        client.close()
+
+        assert results[0]["skipped"] is True and results[0]["entries"] == ["9.9.9.9/32"]
+        assert self._write_calls(client.ecs_client) == [("RevokeSecurityGroup", ["1.1.1.1/32", "2.2.2.2/32"])]
+
+    def test_failed_write_invalidates_cache(self):
+        client = AliCloudClient()
+        client.alb_client = ListingClient(existing=["1.1.1.1/32"], fail_entries=["5.5.5.5/32"])
+
+        assert client.add_entries_to_acl("acl-test", "5.5.5.5/32")["success"] is False
+        client.add_entries_to_acl("acl-test", "1.1.1.1/32")
+        client.close()
+
+        assert len([call for call in client.alb_client.calls if call[0] == "List"]) == 2
+
+
+class TestCIDRNormalization:
+    """写入前的 CIDR 规范化测试"""
+
+    def test_entry_covered_by_existing_supernet_skipped(self):
+        client = AliCloudClient()
+        client.alb_client = ListingClient(existing=["1.2.3.0/24"])
+
+        result = client.add_entries_to_acl("acl-test", "1.2.3.4")
+        client.close()
+
+        assert result["skipped"] is True and result["entries"] == ["1.2.3.4/32"]
+        assert [call for call in client.alb_client.calls if call[0] != "List"] == []
+
+    def test_batch_normalized_before_write(self):
+        client = AliCloudClient()
+        client.state_cache = None
+        client.ecs_client = RecordingClient()
+
+        results = client.authorize_security_group_batch(
+            ["10.0.0.0/24", "10.0.0.9", "10.0.0.9/32", "2001:DB8::1", "not-an-ip"], security_group_id="sg-test"
+        )
+        client.close()
+
+        assert results[0]["success"] is False and results[0]["entries"] == ["not-an-ip"]
+        assert client.ecs_client.calls == [("AuthorizeSecurityGroup", ["10.0.0.0/24", "2001:db8::1/128"])]
+
+    def test_merged_supernet_failure_maps_to_requested_entries(self, monkeypatch):
+        monkeypatch.setattr("services.alicloud.settings.cidr_merge_supernets", True)
+        client = AliCloudClient()
+        client.state_cache = None
+        client.alb_client = RecordingClient(fail_entries=["10.0.0.0/31"])
+
+        requested = ["10.0.0.0/32", "10.0.0.1/32", "10.0.0.5/32"]
+        results = client.add_entries_to_acl_batch("acl-test", requested)
+        client.close()
+
+        assert client.alb_client.calls == [("AddEntriesToAcl", ["10.0.0.0/31", "10.0.0.5/32"])]
+        failures = collect_batch_failures(results, requested)
+        assert set(requested) <= set(failures)
+
+
+class ThrottlingError(Exception):
+    """模拟 SDK 返回的带错误码异常"""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+def sdk_network_error(message: str = "Connection reset by peer") -> Exception:
+    """真实 SDK 网络错误（连接失败、超时）重试耗尽后的形态：UnretryableException 包装 RetryError，code 为空"""
+    from Tea.exceptions import RetryError, UnretryableException
+    from Tea.request import TeaRequest
+    return UnretryableException(TeaRequest(), RetryError(message))
+
+
+def sdk_error(code: str) -> Exception:
+    """真实 SDK 返回的带错误码异常"""
+    from Tea.exceptions import TeaException
+    return TeaException({"code": code, "message": code})
+
+
+class FlakyAlbClient:
+    """前若干次调用抛出指定错误的 ALB SDK 桩客户端"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.attempts = 0
+
+    def add_entries_to_acl_with_options(self, request, runtime):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"acl_id": request.acl_id}
+
+
+class TestRateLimitAndRetry:
+    """限流与重试测试"""
+
+    def _client(self, fake):
+        from services.ratelimit import RetryPolicy
+
+        client = AliCloudClient()
+        client.alb_client = fake
+        client.state_cache = None
+        client.retry_policy = RetryPolicy(max_retries=3, base_delay=0.001, max_delay=0.01)
+        return client
+
+    def test_throttling_retried_until_success(self):
+        fake = FlakyAlbClient([sdk_error("Throttling.User"), sdk_network_error()])
+        client = self._client(fake)
+
+        result = client.add_entries_to_acl("acl-test", "1.1.1.1/32")
+        bucket = client.rate_limiter.bucket("AddEntriesToAcl", client.default_region)
+        client.close()
+
+        assert result["success"] is True
+        assert fake.attempts == 3
+        assert bucket.rate < bucket.max_rate
+
+    def test_non_retryable_error_fails_immediately(self):
+        fake = FlakyAlbClient([ThrottlingError("InvalidParameter")])
+        client = self._client(fake)
+
+        result = client.add_entries_to_acl("acl-test", "1.1.1.1/32")
+        client.close()
+
+        assert result["success"] is False
+        assert fake.attempts == 1
+
+    def test_gives_up_after_max_retries(self):
+        fake = FlakyAlbClient([ThrottlingError("Throttling")] * 10)
+        client = self._client(fake)
+
+        result = client.add_entries_to_acl("acl-test", "1.1.1.1/32")
+        client.close()
+
+        assert result["success"] is False
+        assert fake.attempts == 4
+
+    def test_sdk_error_classification(self):
+        from Tea.exceptions import UnretryableException
+        from Tea.request import TeaRequest
+        from services.ratelimit import is_network_error, is_retryable_error, is_throttling_error
+
+        network = sdk_network_error("HTTPSConnectionPool: Read timed out.")
+        throttled = UnretryableException(TeaRequest(), sdk_error("Throttling.User"))
+
+        assert network.code is None
+        assert is_retryable_error(network) and is_network_error(network)
+        assert is_throttling_error(throttled) and is_retryable_error(throttled)
+        assert not is_network_error(throttled)
+        assert not is_retryable_error(sdk_error("InvalidParameter"))
+
+    def test_sdk_network_error_retried(self):
+        fake = FlakyAlbClient([sdk_network_error()] * 2)
+        client = self._client(fake)
+
+        result = client.add_entries_to_acl("acl-test", "1.1.1.1/32")
+        client.close()
+
+        assert result["success"] is True
+        assert fake.attempts == 3
+
+    def test_duplicate_after_ambiguous_attempt_is_success(self):
+        fake = FlakyAlbClient([sdk_network_error(), sdk_error("ResourceAlreadyExist.AclEntry")])
+        client = self._client(fake)
+
+        result = client.add_entries_to_acl("acl-test", "1.1.1.1/32")
+
+        assert result["success"] is True
+        assert fake.attempts == 2
+
+        # 没有不确定的尝试时，"已存在"仍是失败
+        fake.errors = [sdk_error("ResourceAlreadyExist.AclEntry")]
+        result = client.add_entries_to_acl("acl-test", "1.1.1.2/32")
+        client.close()
+
+        assert result["success"] is False
+
+    def test_ambiguous_write_confirmed_before_retry(self):
+        from services.fake_cloud import FakeAlbClient, FakeCloudBackend
+
+        class TimeoutAfterWrite(FakeAlbClient):
+            """写入已生效但响应超时"""
+
+            def add_entries_to_acl_with_options(self, request, runtime):
+                super().add_entries_to_acl_with_options(request, runtime)
+                raise sdk_network_error("Read timed out.")
+
+        backend = FakeCloudBackend()
+        client = self._client(TimeoutAfterWrite(backend))
+
+        result = client.add_entries_to_acl("acl-test", "1.1.1.1/32")
+        client.close()
+
+        assert result["success"] is True
+        assert backend.calls == {"AddEntriesToAcl": 1, "ListAclEntries": 1}
+
+    def test_token_bucket_limits_rate(self):
+        from services.ratelimit import TokenBucket
+
+        bucket = TokenBucket(rate=100, burst=1)
+        start = time.perf_counter()
+        for _ in range(11):
+            bucket.acquire()
+        assert time.perf_counter() - start >= 0.09
@@ -33,7 +33,7 @@ class TestALBAPI:
         data = response.json()
         assert data["success"] is True
         assert data["acl_entry_ip"] == test_ip
-        assert "添加成功" in data["message"]
+        assert data["message"] == "添加 ALB 访问控制条目成功"
 
     def test_remove_entries_from_acl(self):
         """测试删除 ALB 访问控制条目"""
@@ -49,7 +49,7 @@ class TestALBAPI:
         data = response.json()
         assert data["success"] is True
         assert data["acl_entry_ip"] == test_ip
-        assert "删除成功" in data["message"]
+        assert data["message"] == "删除 ALB 访问控制条目成功"
 
     def test_alb_documentation(self):
         """测试 ALB API 文档接口"""
@@ -91,7 +91,7 @@ class TestECSAPI:
         assert data["success"] is True
         assert data["source_cidr_ip"] == test_ip
         assert test_security_group_id in data["security_group_id"]
-        assert "添加成功" in data["message"]
+        assert data["message"] == "添加 ECS 安全组规则成功"
 
     def test_revoke_security_group(self):
         """测试删除 ECS 安全组规则"""
@@ -111,7 +111,7 @@ class TestECSAPI:
         assert data["success"] is True
         assert data["source_cidr_ip"] == test_ip
         assert test_security_group_id in data["security_group_id"]
-        assert "删除成功" in data["message"]
+        assert data["message"] == "删除 ECS 安全组规则成功"
 
     def test_ecs_documentation(self):
         """测试 ECS 安全组 API 文档接口"""
@@ -131,6 +131,76 @@ class TestECSAPI:
         assert revoke_doc["title"] == "删除ECS安全组入方向规则"
         assert "revokesecuritygroup" in revoke_doc["url"]
 
+class TestBanIPAPI:
+    """BanIP 聚合接口测试"""
+
+    def test_ban_runs_alb_and_ecs_concurrently(self, monkeypatch, recording_client):
+        """测试ALB与ECS两路并发执行，并返回各路耗时"""
+        from services.alicloud import get_aliyun_client
+
+        latency = 0.2
+        monkeypatch.setattr(get_aliyun_client(), "alb_client", recording_client(latency=latency))
+        monkeypatch.setattr(get_aliyun_client(), "ecs_client", recording_client(fail_entries=[f"{TEST_IP}/32"], latency=latency))
+
+        response = client.post("/api/v1/banip/ban", json={"ip": TEST_IP})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is True
+        assert data["alb_result"]["success"] is True
+        assert data["ecs_result"]["success"] is False
+        assert data["timings"]["alb"] >= latency * 1000
+        assert data["timings"]["ecs"] >= latency * 1000
+        assert data["timings"]["total"] < latency * 1000 * 1.75
+
+    def test_ban_fans_out_to_all_targets(self, monkeypatch, recording_client):
+        """测试多地域目标并发写入，总耗时接近最慢的一个地域"""
+        from services.alicloud import get_aliyun_client
+        from core.config import settings
+
+        latency = 0.2
+        regions = ["cn-hangzhou", "cn-shanghai", "cn-beijing"]
+        monkeypatch.setattr(settings, "ban_targets", "cn-hangzhou:acl-1:sg-1,cn-shanghai:acl-2:sg-2,cn-beijing::sg-3")
+        for region in regions:
+            regional = get_aliyun_client().for_region(region)
+            monkeypatch.setattr(regional, "alb_client", recording_client(latency=latency))
+            monkeypatch.setattr(regional, "ecs_client", recording_client(latency=latency))
+        monkeypatch.setattr(get_aliyun_client().for_region("cn-beijing"), "ecs_client", recording_client(fail_entries=["10.9.9.9/32"]))
+
+        response = client.post("/api/v1/banip/ban", json={"ip": "10.9.9.9"})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["message"] == "IP封禁完成（成功4/5）"
+        assert [t["region"] for t in data["targets"]] == regions
+        assert data["targets"][2]["alb_success"] is None
+        assert data["targets"][2]["ecs_success"] is False
+        assert data["timings"]["total"] < latency * 1000 * 1.75
+
+class TestBanIPBulkAPI:
+    """BanIP 批量接口测试"""
+
+    def test_ban_bulk_reports_per_ip_results(self, monkeypatch, recording_client):
+        """测试批量封禁按批调用并返回逐个IP结果"""
+        from services.alicloud import get_aliyun_client
+
+        monkeypatch.setattr(get_aliyun_client(), "alb_client", recording_client())
+        monkeypatch.setattr(get_aliyun_client(), "ecs_client", recording_client(fail_entries=["10.0.0.0/24"]))
+
+        ips = [f"10.1.{i // 256}.{i % 256}" for i in range(45)] + ["10.0.0.0/24", "10.1.0.0"]
+        response = client.post("/api/v1/banip/ban-bulk", json={"ips": ips})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is True
+        assert data["total"] == 46
+        assert data["alb_api_calls"] == 3
+        assert data["ecs_api_calls"] == 1
+        assert data["results"][0]["cidr_ip"] == "10.1.0.0/32"
+        failed = [r for r in data["results"] if not r["ecs_success"]]
+        assert len(failed) == 46
+        assert all(r["alb_success"] and r["success"] for r in failed)
+
 class TestHealthCheck:
     """健康检查接口测试"""
 
@@ -0,0 +1,112 @@
+"""
+封禁写回队列测试
+"""
+
+import asyncio
+import threading
+
+import pytest
+from services.alicloud import get_aliyun_client
+from services.ban_queue import BanQueue, BAN, UNBAN, STATUS_DONE, STATUS_CANCELLED
+from services.state_store import MemoryStateStore
+
+
+class ThreadRecordingStore(MemoryStateStore):
+    """记录每次存储调用所在线程的共享状态存储"""
+
+    shared = True
+
+    def __init__(self):
+        super().__init__()
+        self.threads = set()
+
+    def get(self, key):
+        self.threads.add(threading.get_ident())
+        return super().get(key)
+
+    def set(self, key, value, ttl=None):
+        self.threads.add(threading.get_ident())
+        return super().set(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        self.threads.add(threading.get_ident())
+        return super().add(key, value, ttl)
+
+    def delete(self, key):
+        self.threads.add(threading.get_ident())
+        return super().delete(key)
+
+
+@pytest.fixture
+def fake_clients(monkeypatch, recording_client):
+    alb, ecs = recording_client(), recording_client()
+    monkeypatch.setattr(get_aliyun_client(), "alb_client", alb)
+    monkeypatch.setattr(get_aliyun_client(), "ecs_client", ecs)
+    monkeypatch.setattr(get_aliyun_client(), "state_cache", None)
+    return alb, ecs
+
+
+class TestBanQueue:
+    """写回队列测试"""
+
+    def test_duplicates_coalesced_into_one_batch(self, fake_clients):
+        alb, ecs = fake_clients
+
+        async def run():
+            queue = BanQueue(max_batch=100, flush_interval=0.05)
+            submitted = [queue.submit(BAN, cidr) for cidr in ["1.1.1.1/32", "2.2.2.2/32", "1.1.1.1/32"]]
+            results = await asyncio.gather(*(future for _, future in submitted))
+            await queue.stop()
+            return queue, submitted, results, await queue.get_result(submitted[2][0])
+
+        queue, submitted, results, last = asyncio.run(run())
+
+        assert alb.calls == [("AddEntriesToAcl", ["1.1.1.1/32", "2.2.2.2/32"])]
+        assert ecs.calls == [("AuthorizeSecurityGroup", ["1.1.1.1/32", "2.2.2.2/32"])]
+        assert all(result["status"] == STATUS_DONE and result["alb_success"] for result in results)
+        assert last["status"] == STATUS_DONE
+
+    def test_ban_then_unban_cancel_out(self, fake_clients):
+        alb, ecs = fake_clients
+
+        async def run():
+            queue = BanQueue(max_batch=100, flush_interval=0.05)
+            _, ban = queue.submit(BAN, "3.3.3.3/32")
+            _, unban = queue.submit(UNBAN, "3.3.3.3/32")
+            results = await asyncio.gather(ban, unban)
+            await queue.stop()
+            return results
+
+        results = asyncio.run(run())
+
+        assert [result["status"] for result in results] == [STATUS_CANCELLED, STATUS_CANCELLED]
+        assert alb.calls == [] and ecs.calls == []
+
+    def test_shared_results_written_off_loop(self, fake_clients):
+        store = ThreadRecordingStore()
+
+        async def run():
+            queue = BanQueue(max_batch=100, flush_interval=0.05, store=store)
+            request_id, future = queue.submit(BAN, "5.5.5.5/32")
+            await future
+            await queue.stop()
+            # 其他 worker 上的队列从共享状态存储查询
+            return await BanQueue(store=store).get_result(request_id)
+
+        result = asyncio.run(run())
+
+        assert result["status"] == STATUS_DONE
+        assert store.threads and threading.get_ident() not in store.threads
+
+    def test_flush_triggered_by_batch_size(self, fake_clients):
+        alb, _ = fake_clients
+
+        async def run():
+            queue = BanQueue(max_batch=3, flush_interval=60)
+            futures = [queue.submit(BAN, f"4.4.4.{i}/32")[1] for i in range(3)]
+            await asyncio.wait_for(asyncio.gather(*futures), timeout=1)
+            await queue.stop()
+
+        asyncio.run(run())
+
+        assert len(alb.calls) == 1 and len(alb.calls[0][1]) == 3
@@ -0,0 +1,93 @@
+"""
+封禁列表导出/导入测试
+"""
+
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from core.config import settings
+from main import app
+from services.alicloud import CloudStateCache, get_aliyun_client
+from services.banlist import iter_uploaded_ips
+from tests.test_alicloud import ListingClient
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def listing_clients(monkeypatch):
+    alb = ListingClient(existing=["1.1.1.1/32", "2.2.2.2/32", "3.3.3.3/32"])
+    ecs = ListingClient(existing=["1.1.1.1/32", "4.4.4.4/32"])
+    monkeypatch.setattr(get_aliyun_client(), "alb_client", alb)
+    monkeypatch.setattr(get_aliyun_client(), "ecs_client", ecs)
+    monkeypatch.setattr(get_aliyun_client(), "state_cache", CloudStateCache(ttl=300))
+    return alb, ecs
+
+
+class TestUploadParsing:
+    """上传文件解析测试"""
+
+    def _parse(self, data: bytes, chunk_size: int):
+        chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+        async def read(_size):
+            return chunks.pop(0) if chunks else b""
+
+        async def collect():
+            return [ip async for ip in iter_uploaded_ips(read, chunk_size)]
+
+        return asyncio.run(collect())
+
+    def test_lines_split_across_chunks(self):
+        data = "# 威胁情报\n1.1.1.1\r\n\n2.2.2.0/24  # 扫描段\n3.3.3.3 scanner\n4.4.4.4".encode("utf-8")
+
+        assert self._parse(data, 3) == ["1.1.1.1", "2.2.2.0/24", "3.3.3.3", "4.4.4.4"]
+
+    def test_csv_header_selects_ip_column(self):
+        data = b"type,region,resource_id,cidr_ip,description\nalb,cn-hangzhou,acl-1,1.1.1.1/32,\"a, b\"\n"
+
+        assert self._parse(data, 1024) == ["1.1.1.1/32"]
+
+
+class TestBanListAPI:
+    """导出/导入接口测试"""
+
+    def test_list_streams_ndjson_and_csv(self, listing_clients):
+        response = client.get("/api/v1/banip/list")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [(row["type"], row["cidr_ip"]) for row in rows] == [
+            ("alb", "1.1.1.1/32"), ("alb", "2.2.2.2/32"), ("alb", "3.3.3.3/32"),
+            ("ecs", "1.1.1.1/32"), ("ecs", "4.4.4.4/32"),
+        ]
+
+        response = client.get("/api/v1/banip/list", params={"format": "csv"})
+
+        lines = response.text.splitlines()
+        assert lines[0] == "type,region,resource_id,cidr_ip,description"
+        assert len(lines) == 6
+
+    def test_import_writes_only_missing_entries_in_batches(self, listing_clients, monkeypatch):
+        alb, ecs = listing_clients
+        monkeypatch.setattr(settings, "ban_import_batch_size", 2)
+        feed = b"1.1.1.1\n2.2.2.2\n5.5.5.5\nnot-an-ip\n6.6.6.6\n"
+
+        response = client.post(
+            "/api/v1/banip/import",
+            files={"file": ("feed.txt", feed, "text/plain")}
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 5 and data["batches"] == 3
+        assert data["failed"] == 1 and data["failures"][0]["ip"] == "not-an-ip"
+        assert data["unchanged"] == 1
+        writes = [entries for operation, entries in alb.calls if operation == "AddEntriesToAcl"]
+        assert writes == [["5.5.5.5/32"], ["6.6.6.6/32"]]
+        writes = [entries for operation, entries in ecs.calls if operation == "AuthorizeSecurityGroup"]
+        assert writes == [["2.2.2.2/32"], ["5.5.5.5/32"], ["6.6.6.6/32"]]
@@ -0,0 +1,203 @@
+"""
+熔断测试
+"""
+
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from core.config import settings
+from main import app
+from services.alicloud import AliCloudClient
+from services.ban_queue import BanQueue, BAN, STATUS_DONE, STATUS_PENDING, get_ban_queue
+from services.breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitBreakers,
+    CircuitOpenError,
+    get_circuit_breakers
+)
+from services.fake_cloud import FakeAlbClient, FakeCloudBackend, FakeEcsClient
+from services.ratelimit import RetryPolicy
+from tests.test_alicloud import FlakyAlbClient, sdk_error, sdk_network_error
+from tests.test_ban_queue import fake_clients  # noqa: F401
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def breakers():
+    registry = get_circuit_breakers()
+    registry.reset()
+    yield registry
+    registry.reset()
+
+
+def _trip(registry, operation, region=None):
+    breaker = registry.get(operation, region or settings.default_region)
+    for _ in range(breaker.failure_threshold):
+        breaker.on_failure()
+    return breaker
+
+
+class TestCircuitBreaker:
+    """熔断状态转换测试"""
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker("AddEntriesToAcl", "cn-hangzhou", failure_threshold=3, reset_timeout=60)
+        breaker.on_failure()
+        breaker.on_failure()
+        breaker.on_success()
+        breaker.on_failure()
+        breaker.on_failure()
+        assert breaker.state == CLOSED
+
+        breaker.on_failure()
+
+        assert breaker.state == OPEN and not breaker.allows()
+        with pytest.raises(CircuitOpenError) as excinfo:
+            breaker.before_call()
+        assert 0 < excinfo.value.retry_after <= 60
+
+    def test_half_open_allows_single_probe(self):
+        breaker = CircuitBreaker("AddEntriesToAcl", "cn-hangzhou", failure_threshold=1, reset_timeout=0.01)
+        breaker.on_failure()
+        time.sleep(0.02)
+
+        breaker.before_call()
+        assert breaker.state == HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+        breaker.on_failure()
+        assert breaker.state == OPEN
+
+        time.sleep(0.02)
+        breaker.before_call()
+        breaker.on_success()
+        assert breaker.state == CLOSED and breaker.failures == 0
+
+
+class TestClientFastFail:
+    """客户端熔断测试"""
+
+    def test_open_breaker_skips_cloud_call(self, breakers, monkeypatch):
+        backend = FakeCloudBackend(error_rate=1.0, seed=1)
+        aliyun = AliCloudClient()
+        aliyun.alb_client = FakeAlbClient(backend)
+        aliyun.ecs_client = FakeEcsClient(backend)
+        aliyun.state_cache = None
+        monkeypatch.setattr(aliyun.retry_policy, "max_retries", 0)
+        try:
+            threshold = breakers.failure_threshold
+            results = [aliyun.add_entries_to_acl("acl-cb", f"10.0.0.{i}") for i in range(threshold + 2)]
+        finally:
+            aliyun.close()
+
+        assert backend.calls["AddEntriesToAcl"] == threshold
+        assert not any(result.get("circuit_open") for result in results[:threshold])
+        assert all(result["circuit_open"] and result["retry_after"] > 0 for result in results[threshold:])
+
+
+class TestBreakerCounting:
+    """熔断按逻辑调用计数测试"""
+
+    def _client(self, fake, threshold=2):
+        aliyun = AliCloudClient()
+        aliyun.alb_client = fake
+        aliyun.state_cache = None
+        aliyun.retry_policy = RetryPolicy(max_retries=5, base_delay=0.001, max_delay=0.01)
+        aliyun.circuit_breakers = CircuitBreakers(threshold, 60)
+        return aliyun
+
+    def _breaker(self, aliyun):
+        return aliyun.circuit_breakers.get("AddEntriesToAcl", aliyun.default_region)
+
+    def test_retry_then_success_keeps_breaker_closed(self):
+        fake = FlakyAlbClient([sdk_network_error(), sdk_network_error()])
+        aliyun = self._client(fake)
+        try:
+            result = aliyun.add_entries_to_acl("acl-cb", "10.0.1.1")
+        finally:
+            aliyun.close()
+
+        assert result["success"] and fake.attempts == 3
+        assert self._breaker(aliyun).state == CLOSED and self._breaker(aliyun).failures == 0
+
+    def test_exhausted_retries_count_once(self):
+        fake = FlakyAlbClient([sdk_network_error()] * 10)
+        aliyun = self._client(fake)
+        try:
+            result = aliyun.add_entries_to_acl("acl-cb", "10.0.1.2")
+        finally:
+            aliyun.close()
+
+        assert not result["success"] and fake.attempts == 6
+        assert self._breaker(aliyun).state == CLOSED and self._breaker(aliyun).failures == 1
+
+    def test_lock_conflicts_do_not_open_breaker(self):
+        fake = FlakyAlbClient([sdk_error("Conflict.Lock")] * 5)
+        aliyun = self._client(fake, threshold=1)
+        try:
+            retried = aliyun.add_entries_to_acl("acl-cb", "10.0.1.3")
+            fake.errors = [sdk_error("IncorrectStatus.Acl")] * 6
+            exhausted = aliyun.add_entries_to_acl("acl-cb", "10.0.1.4")
+            after = aliyun.add_entries_to_acl("acl-cb", "10.0.1.5")
+        finally:
+            aliyun.close()
+
+        assert retried["success"] and not exhausted["success"]
+        assert not exhausted.get("circuit_open") and after["success"]
+        assert self._breaker(aliyun).state == CLOSED
+
+
+class TestCircuitBreakerAPI:
+    """熔断时的接口行为测试"""
+
+    def test_fast_fail_503_and_health(self, breakers):
+        _trip(breakers, "AddEntriesToAcl")
+
+        response = client.post("/api/v1/alb/add-entries", json={"source_cidr_ip": "9.9.9.9/32", "acl_id": "acl-cb"})
+        health = client.get("/health").json()
+
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) >= 1
+        assert "熔断" in response.json()["detail"]
+        assert health["status"] == "degraded"
+        assert health["circuit_breakers"][f"AddEntriesToAcl:{settings.default_region}"]["state"] == OPEN
+
+    def test_ban_diverted_to_queue(self, breakers, monkeypatch):
+        monkeypatch.setattr(settings, "circuit_breaker_divert", True)
+        _trip(breakers, "AddEntriesToAcl")
+        _trip(breakers, "AuthorizeSecurityGroup")
+
+        response = client.post("/api/v1/banip/ban", json={"ip": "9.9.9.10"})
+
+        assert response.status_code == 202
+        request_id = response.json()["queued_request_id"]
+        assert asyncio.run(get_ban_queue().get_result(request_id))["status"] == STATUS_PENDING
+        get_ban_queue()._pending.pop("9.9.9.10/32", None)
+
+    def test_queue_holds_until_breaker_recovers(self, breakers, fake_clients):
+        alb, _ = fake_clients
+
+        async def run():
+            queue = BanQueue(max_batch=100, flush_interval=60)
+            _, future = queue.submit(BAN, "9.9.9.11/32")
+            _trip(breakers, "AddEntriesToAcl")
+            await queue.flush()
+            held = (queue.depth, list(alb.calls))
+            breakers.reset()
+            await queue.flush()
+            await queue.stop()
+            return held, await future
+
+        (depth, calls), result = asyncio.run(run())
+
+        assert depth == 1 and calls == []
+        assert result["status"] == STATUS_DONE
+        assert alb.calls == [("AddEntriesToAcl", ["9.9.9.11/32"])]
@@ -0,0 +1,50 @@
+"""
+CIDR 规范化测试
+"""
+
+import pytest
+
+from services.cidr import normalize_cidr, normalize_cidrs
+
+
+class TestNormalizeCIDR:
+    """单个 IP/CIDR 规范化测试"""
+
+    @pytest.mark.parametrize("value, expected", [
+        ("1.2.3.4", "1.2.3.4/32"),
+        (" 1.2.3.4/32 ", "1.2.3.4/32"),
+        ("1.2.3.4/24", "1.2.3.0/24"),
+        ("2001:DB8::1", "2001:db8::1/128"),
+        ("2001:db8::1/64", "2001:db8::/64"),
+        ("::ffff:1.2.3.4", "1.2.3.4/32"),
+    ])
+    def test_canonical_form(self, value, expected):
+        assert normalize_cidr(value) == expected
+
+    @pytest.mark.parametrize("value", ["", "1.2.3", "1.2.3.4/33", "example.com"])
+    def test_invalid_rejected(self, value):
+        with pytest.raises(ValueError):
+            normalize_cidr(value)
+
+
+class TestNormalizeCIDRs:
+    """批量规范化测试"""
+
+    def test_duplicates_and_covered_entries_dropped(self):
+        cidrs, invalid = normalize_cidrs(["1.2.3.4", "1.2.3.0/24", "1.2.3.4/32", "5.6.7.8", "bad"])
+
+        assert cidrs == ["1.2.3.0/24", "5.6.7.8/32"]
+        assert invalid == ["bad"]
+
+    def test_covered_entries_kept_when_disabled(self):
+        cidrs, _ = normalize_cidrs(["1.2.3.0/24", "1.2.3.4", "1.2.3.4/32"], drop_covered=False)
+
+        assert cidrs == ["1.2.3.0/24", "1.2.3.4/32"]
+
+    def test_adjacent_ranges_merged(self):
+        cidrs, _ = normalize_cidrs(
+            ["10.0.0.0/32", "10.0.0.1/32", "10.0.0.2/31", "10.0.1.0/24", "2001:db8::/128", "2001:db8::1/128"],
+            merge=True
+        )
+
+        assert cidrs == ["10.0.0.0/30", "10.0.1.0/24", "2001:db8::/127"]
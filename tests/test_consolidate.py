@@ -0,0 +1,149 @@
+"""
+安全组规则合并测试
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import services.ledger as ledger_module
+from core.config import settings
+from main import app
+from services.alicloud import CloudStateCache, get_aliyun_client
+from services.consolidate import plan_consolidation, split_covering
+from services.ledger import BanLedger
+from services.fake_cloud import FakeCloudBackend, FakeEcsClient
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def fake_ecs(monkeypatch, tmp_path):
+    backend = FakeCloudBackend()
+    monkeypatch.setattr(get_aliyun_client(), "ecs_client", FakeEcsClient(backend))
+    monkeypatch.setattr(get_aliyun_client(), "state_cache", CloudStateCache(ttl=300))
+    # 合并记录写入临时台账，避免落到进程内状态存储影响其他用例
+    ledger = BanLedger(str(tmp_path / "bans.db"))
+    monkeypatch.setattr(ledger_module, "_ban_ledger", ledger)
+    yield backend
+    ledger_module._ban_ledger.close()
+
+
+def _prefix_list(entries=(), max_entries=10):
+    return {"prefix_list_id": "pl-test", "address_family": "IPv4", "max_entries": max_entries, "entries": list(entries)}
+
+
+class TestPlanConsolidation:
+    """合并方案计算测试"""
+
+    def test_merges_only_fully_banned_neighbours(self):
+        plan = plan_consolidation([f"10.0.0.{i}/32" for i in range(4)] + ["10.0.1.0/32", "10.0.1.2/32"])
+
+        assert plan.to_add == ["10.0.0.0/30"]
+        assert plan.to_remove == [f"10.0.0.{i}/32" for i in range(4)]
+        assert plan.merges == {"10.0.0.0/30": [f"10.0.0.{i}/32" for i in range(4)]}
+        assert (plan.rules_before, plan.rules_after) == (6, 3)
+
+    def test_pinned_and_covered_rules(self):
+        plan = plan_consolidation(["10.0.0.0/24", "10.0.0.5/32", "1.1.1.0/32", "1.1.1.1/32"], pinned=["1.1.1.1"])
+
+        # 被已有 /24 包含的规则直接撤销；有到期时间的 1.1.1.1 不参与合并
+        assert plan.to_add == []
+        assert plan.replaced_by == {"10.0.0.5/32": "10.0.0.0/24"}
+        assert plan.pinned == ["1.1.1.1/32"]
+        assert plan.rules_after == 3
+
+    def test_overflow_moves_most_specific_networks_to_prefix_list(self):
+        live = ["10.0.0.0/24", "2.2.2.2/32", "3.3.3.3/32", "4.4.4.4/32", "2001:db8::1/128"]
+        plan = plan_consolidation(live, max_rules=3, prefix_list=_prefix_list(entries=["4.4.4.4/32"]))
+
+        # 超出 2 条 + 引用规则 1 条；已在前缀列表中的 4.4.4.4 优先，IPv6 不进入 IPv4 前缀列表
+        assert plan.moved == ["4.4.4.4/32", "2.2.2.2/32", "3.3.3.3/32"]
+        assert plan.to_prefix_list == ["2.2.2.2/32", "3.3.3.3/32"]
+        assert plan.add_reference
+        assert plan.rules_after == 3
+
+    def test_prefix_list_capacity_is_respected(self):
+        plan = plan_consolidation(
+            ["2.2.2.2/32", "3.3.3.3/32", "4.4.4.4/32"], max_rules=1,
+            prefix_list=_prefix_list(max_entries=1), prefix_list_referenced=True
+        )
+
+        assert plan.moved == ["2.2.2.2/32"]
+        assert not plan.add_reference
+        assert plan.rules_after == 2
+
+
+class TestSplitCovering:
+    """解封时拆分合并规则测试"""
+
+    def test_supernet_split_around_unbanned_networks(self):
+        splits = split_covering(["10.0.0.0/29", "1.1.1.1/32"], ["10.0.0.3/32", "10.0.0.6/32", "1.1.1.1/32"])
+
+        assert list(splits) == ["10.0.0.0/29"]
+        contained, remaining = splits["10.0.0.0/29"]
+        assert contained == ["10.0.0.3/32", "10.0.0.6/32"]
+        assert sorted(remaining) == ["10.0.0.0/31", "10.0.0.2/32", "10.0.0.4/31", "10.0.0.7/32"]
+
+    def test_equal_entry_only_when_requested(self):
+        assert split_covering(["1.1.1.1/32"], ["1.1.1.1/32"], include_equal=True) == {"1.1.1.1/32": (["1.1.1.1/32"], [])}
+
+
+class TestConsolidateAPI:
+    """合并接口测试（模拟云后端）"""
+
+    def _authorize(self, cidrs):
+        get_aliyun_client().authorize_security_group_batch(cidrs, security_group_id="sg-test")
+
+    def test_dry_run_writes_nothing(self, fake_ecs):
+        self._authorize([f"10.0.0.{i}" for i in range(8)])
+        calls = dict(fake_ecs.calls)
+
+        response = client.post("/api/v1/ecs/security-groups/sg-test/consolidate", json={"dry_run": True})
+
+        data = response.json()
+        assert data["success"] and data["dry_run"]
+        assert data["to_add"] == ["10.0.0.0/29"] and data["rules_saved"] == 7
+        assert fake_ecs.calls.get("AuthorizeSecurityGroup") == calls.get("AuthorizeSecurityGroup")
+        assert "RevokeSecurityGroup" not in fake_ecs.calls
+
+    def test_consolidates_with_batched_calls_and_prefix_list(self, fake_ecs):
+        fake_ecs.create_prefix_list("pl-test", max_entries=10)
+        self._authorize([f"10.0.0.{i}" for i in range(8)] + ["2.2.2.2", "3.3.3.3", "4.4.4.4"])
+        authorize_calls = fake_ecs.calls["AuthorizeSecurityGroup"]
+
+        response = client.post(
+            "/api/v1/ecs/security-groups/sg-test/consolidate",
+            json={"max_rules": 2, "prefix_list_id": "pl-test"}
+        )
+
+        data = response.json()
+        assert data["success"], data
+        assert (data["rules_before"], data["rules_after"], data["rules_saved"]) == (11, 2, 9)
+        assert get_aliyun_client().list_security_group_cidrs("sg-test") == ["10.0.0.0/29"]
+        assert sorted(get_aliyun_client().get_prefix_list("pl-test")["entries"]) == ["2.2.2.2/32", "3.3.3.3/32", "4.4.4.4/32"]
+        # 前缀列表 1 次、引用规则 1 次、超网 1 次、撤销 1 次
+        assert data["api_calls"] == 4
+        assert fake_ecs.calls["AuthorizeSecurityGroup"] - authorize_calls == 2
+        assert fake_ecs.calls["RevokeSecurityGroup"] == 1
+
+    def test_unban_after_consolidation_splits_covering_rules(self, fake_ecs, monkeypatch, tmp_path):
+        monkeypatch.setattr(settings, "ban_targets", f"{settings.default_region}::sg-test")
+        fake_ecs.create_prefix_list("pl-test", max_entries=10)
+        for ip in [f"10.0.0.{i}" for i in range(8)] + ["2.2.2.2", "3.3.3.3"]:
+            assert client.post("/api/v1/banip/ban", json={"ip": ip}).json()["success"]
+        consolidated = client.post(
+            "/api/v1/ecs/security-groups/sg-test/consolidate",
+            json={"max_rules": 2, "prefix_list_id": "pl-test"}
+        ).json()
+        assert consolidated["success"], consolidated
+        # 重启后合并记录仍在台账中
+        ledger_module._ban_ledger.close()
+        monkeypatch.setattr(ledger_module, "_ban_ledger", BanLedger(str(tmp_path / "bans.db")))
+
+        unbans = [client.post("/api/v1/banip/unban", json={"ip": ip}).json() for ip in ["10.0.0.3", "2.2.2.2"]]
+
+        assert all(unban["success"] for unban in unbans)
+        assert sorted(get_aliyun_client().list_security_group_cidrs("sg-test")) == [
+            "10.0.0.0/31", "10.0.0.2/32", "10.0.0.4/30"
+        ]
+        assert get_aliyun_client().get_prefix_list("pl-test")["entries"] == ["3.3.3.3/32"]
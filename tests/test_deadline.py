@@ -0,0 +1,313 @@
+"""
+SDK 运行时参数与请求截止时间测试
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from core.config import settings
+from core.deadline import (
+    DEADLINE_HEADER,
+    DeadlineExceededError,
+    DeadlineMiddleware,
+    cancellation_scope,
+    check_cancelled,
+    deadline_scope,
+    remaining
+)
+from core.metrics import metrics
+from fastapi import Response
+
+import services.ledger as ledger_module
+from api.models import BanIPRequest
+from api.v1.banip_router import _ban_ip
+from main import app
+from services.alicloud import AliCloudClient, build_runtime_options, get_aliyun_client
+from services.breaker import CircuitBreakers
+from services.fake_cloud import FakeAlbClient, FakeCloudBackend
+from services.ledger import BanLedger
+from tests.test_alicloud import sdk_network_error
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def aliyun():
+    aliyun = AliCloudClient()
+    aliyun.state_cache = None
+    aliyun.circuit_breakers = CircuitBreakers(1, 60)
+    yield aliyun
+    aliyun.close()
+
+
+class TimeoutAlbClient(FakeAlbClient):
+    """按运行时参数记录调用，每次都超时"""
+
+    def __init__(self, backend: FakeCloudBackend):
+        super().__init__(backend)
+        self.runtimes = []
+
+    def add_entries_to_acl_with_options(self, request, runtime):
+        self.runtimes.append(runtime)
+        raise sdk_network_error("HTTPSConnectionPool: Read timed out. (read timeout=1)")
+
+
+class TestRuntimeOptions:
+    """预先创建的运行时参数测试"""
+
+    def test_built_from_settings(self, monkeypatch):
+        monkeypatch.setattr(settings, "api_connect_timeout_ms", 2000)
+        monkeypatch.setattr(settings, "api_read_timeout_ms", 8000)
+        monkeypatch.setattr(settings, "api_read_timeouts", "DescribeSecurityGroupAttribute=30000")
+
+        default, overrides = build_runtime_options()
+
+        assert (default.connect_timeout, default.read_timeout) == (2000, 8000)
+        assert default.autoretry is False and default.keep_alive == settings.http_keep_alive
+        assert list(overrides) == ["DescribeSecurityGroupAttribute"]
+        assert overrides["DescribeSecurityGroupAttribute"].read_timeout == 30000
+
+    def test_shared_and_clamped_to_deadline(self, aliyun):
+        aliyun.runtime, aliyun.runtime_overrides = build_runtime_options()
+
+        assert aliyun._runtime_for("AddEntriesToAcl", None) is aliyun.runtime
+        assert aliyun.for_region("cn-shanghai").runtime is aliyun.runtime
+        clamped = aliyun._runtime_for("AddEntriesToAcl", 0.5)
+        assert clamped is not aliyun.runtime
+        assert clamped.read_timeout == 500 and clamped.connect_timeout == min(500, settings.api_connect_timeout_ms)
+        assert aliyun.runtime.read_timeout == settings.api_read_timeout_ms
+
+
+class TestDeadline:
+    """请求截止时间测试"""
+
+    def test_expired_deadline_skips_cloud_call(self, aliyun):
+        backend = FakeCloudBackend()
+        aliyun.alb_client = FakeAlbClient(backend)
+
+        with deadline_scope(-1):
+            result = aliyun.add_entries_to_acl("acl-deadline", "10.0.0.1")
+
+        assert result["deadline_exceeded"] and not result["success"]
+        assert "AddEntriesToAcl" not in backend.calls
+
+    def test_clamped_timeout_does_not_open_breaker(self, aliyun, monkeypatch):
+        aliyun.runtime, aliyun.runtime_overrides = build_runtime_options()
+        aliyun.alb_client = TimeoutAlbClient(FakeCloudBackend())
+        monkeypatch.setattr(aliyun.retry_policy, "max_retries", 0)
+
+        with deadline_scope(1):
+            result = aliyun.add_entries_to_acl("acl-deadline", "10.0.0.2")
+
+        assert result["deadline_exceeded"]
+        assert aliyun.alb_client.runtimes[0].read_timeout <= 1000
+        assert aliyun.circuit_breakers.get("AddEntriesToAcl", aliyun.default_region).failures == 0
+
+    def test_no_retry_past_deadline(self, aliyun, monkeypatch):
+        backend = FakeCloudBackend(error_rate=1.0, seed=1)
+        aliyun.alb_client = FakeAlbClient(backend)
+        monkeypatch.setattr(aliyun.retry_policy, "delay", lambda attempt: 5.0)
+
+        with deadline_scope(1):
+            result = aliyun.add_entries_to_acl("acl-deadline", "10.0.0.3")
+
+        assert not result["success"] and not result.get("deadline_exceeded")
+        assert backend.calls["AddEntriesToAcl"] == 1
+
+
+class TestDeadlineHeader:
+    """X-Request-Timeout 请求头测试"""
+
+    def test_invalid_header(self):
+        response = client.post(
+            "/api/v1/alb/add-entries", json={"source_cidr_ip": "9.9.9.20/32", "acl_id": "acl-deadline"},
+            headers={DEADLINE_HEADER: "soon"}
+        )
+
+        assert response.status_code == 400
+
+    def test_deadline_reaches_executor(self, monkeypatch):
+        seen = []
+        alb_client = get_aliyun_client().alb_client
+        original = alb_client.add_entries_to_acl_with_options
+
+        def record(request, runtime):
+            seen.append(remaining())
+            return original(request, runtime)
+
+        monkeypatch.setattr(alb_client, "add_entries_to_acl_with_options", record)
+
+        response = client.post(
+            "/api/v1/alb/add-entries", json={"source_cidr_ip": "9.9.9.21/32", "acl_id": "acl-deadline"},
+            headers={DEADLINE_HEADER: "30000"}
+        )
+
+        assert response.status_code == 200
+        assert len(seen) == 1 and 0 < seen[0] <= 30
+
+    def test_expired_deadline_returns_504(self, monkeypatch):
+        def expired(operation):
+            raise DeadlineExceededError(operation)
+
+        monkeypatch.setattr("services.alicloud.check_cancelled", expired)
+
+        response = client.post(
+            "/api/v1/alb/add-entries", json={"source_cidr_ip": "9.9.9.22/32", "acl_id": "acl-deadline"},
+            headers={DEADLINE_HEADER: "1"}
+        )
+
+        assert response.status_code == 504
+        assert "截止时间" in response.json()["detail"]
+
+
+class TestCancellation:
+    """客户端断开与截止时的取消测试"""
+
+    def test_queued_task_cancelled_and_late_result_dropped(self, aliyun):
+        aliyun._executor.shutdown()
+        aliyun._executor = ThreadPoolExecutor(max_workers=1)
+        release = threading.Event()
+        ran = []
+
+        def blocking():
+            release.wait(5)
+            return "late"
+
+        async def run():
+            running = asyncio.ensure_future(aliyun._run_in_executor(blocking))
+            queued = asyncio.ensure_future(aliyun._run_in_executor(ran.append, "queued"))
+            await asyncio.sleep(0.05)
+            running.cancel()
+            queued.cancel()
+            await asyncio.gather(running, queued, return_exceptions=True)
+            release.set()
+            # 单线程池：空闲后再提交的任务可以执行，说明被取消的任务没有占用线程
+            return await aliyun._run_in_executor(lambda: "next")
+
+        queued_before = metrics.value("cloud_tasks_abandoned_total", (("state", "queued"),))
+        running_before = metrics.value("cloud_tasks_abandoned_total", (("state", "running"),))
+
+        assert asyncio.run(run()) == "next"
+        assert ran == []
+        assert metrics.value("cloud_tasks_abandoned_total", (("state", "queued"),)) == queued_before + 1
+        assert metrics.value("cloud_tasks_abandoned_total", (("state", "running"),)) == running_before + 1
+
+    def test_cancel_interrupts_retry_backoff(self, aliyun, monkeypatch):
+        backend = FakeCloudBackend(error_rate=1.0, seed=1)
+        aliyun.alb_client = FakeAlbClient(backend)
+        monkeypatch.setattr(aliyun.retry_policy, "delay", lambda attempt: 5.0)
+
+        with cancellation_scope() as cancelled:
+            threading.Timer(0.05, cancelled.set).start()
+            start = time.monotonic()
+            result = aliyun.add_entries_to_acl("acl-deadline", "10.0.0.4")
+
+        assert time.monotonic() - start < 2
+        assert result["cancelled"] and not result.get("deadline_exceeded")
+        assert backend.calls["AddEntriesToAcl"] == 1
+
+
+class TestAbandonedWrites:
+    """请求被放弃后已发起的写入测试"""
+
+    def test_in_flight_ban_still_recorded(self, tmp_path, monkeypatch, recording_client):
+        ledger = BanLedger(str(tmp_path / "bans.db"))
+        monkeypatch.setattr(ledger_module, "_ban_ledger", ledger)
+        monkeypatch.setattr(settings, "ban_targets", f"{settings.default_region}:acl-late:sg-late")
+        regional = get_aliyun_client().for_region(settings.default_region)
+        alb, ecs = recording_client(latency=0.2), recording_client(latency=0.2)
+        monkeypatch.setattr(regional, "alb_client", alb)
+        monkeypatch.setattr(regional, "ecs_client", ecs)
+        monkeypatch.setattr(regional, "state_cache", None)
+
+        async def run():
+            with cancellation_scope() as cancelled:
+                handler = asyncio.ensure_future(
+                    _ban_ip(BanIPRequest(ip="10.6.6.6", ttl_seconds=60), Response(), get_aliyun_client())
+                )
+                # 两路写入都已发起后客户端断开
+                while not (alb.calls and ecs.calls):
+                    await asyncio.sleep(0.01)
+                cancelled.set()
+                handler.cancel()
+                await asyncio.gather(handler, return_exceptions=True)
+            await asyncio.sleep(0.4)
+            return handler
+
+        try:
+            handler = asyncio.run(run())
+            records = ledger.get("10.6.6.6/32")
+        finally:
+            ledger.close()
+
+        assert handler.cancelled()
+        assert len(records) == 1 and records[0].expires_at is not None
+        assert records[0].target.acl_id == "acl-late" and records[0].target.security_group_id == "sg-late"
+
+
+class TestDeadlineMiddleware:
+    """截止时间与断开检测中间件测试"""
+
+    @staticmethod
+    def _scope(headers=()):
+        return {"type": "http", "method": "POST", "path": "/api/v1/banip/ban", "headers": list(headers)}
+
+    def test_disconnect_cancels_handler(self):
+        observed = {}
+
+        async def app(scope, receive, send):
+            await receive()
+            try:
+                while True:
+                    check_cancelled("AddEntriesToAcl")
+                    await asyncio.sleep(0.01)
+            except asyncio.CancelledError:
+                observed["cancelled"] = True
+                raise
+
+        async def run():
+            messages = [{"type": "http.request", "body": b"{}", "more_body": False}, {"type": "http.disconnect"}]
+
+            async def receive():
+                if len(messages) == 1:
+                    await asyncio.sleep(0.05)
+                return messages.pop(0)
+
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+
+            await DeadlineMiddleware(app)(self._scope(), receive, send)
+            return sent
+
+        before = metrics.value("http_requests_abandoned_total", (("reason", "disconnect"),))
+
+        assert asyncio.run(run()) == []
+        assert observed["cancelled"]
+        assert metrics.value("http_requests_abandoned_total", (("reason", "disconnect"),)) == before + 1
+
+    def test_server_deadline_returns_504(self, monkeypatch):
+        monkeypatch.setattr(settings, "request_timeout_ms", 50)
+        alb_client = get_aliyun_client().alb_client
+        original = alb_client.add_entries_to_acl_with_options
+
+        def slow(request, runtime):
+            time.sleep(0.3)
+            return original(request, runtime)
+
+        monkeypatch.setattr(alb_client, "add_entries_to_acl_with_options", slow)
+
+        start = time.monotonic()
+        response = client.post(
+            "/api/v1/alb/add-entries", json={"source_cidr_ip": "9.9.9.23/32", "acl_id": "acl-deadline"},
+            headers={DEADLINE_HEADER: "60000"}
+        )
+
+        assert response.status_code == 504
+        assert time.monotonic() - start < 0.3
@@ -0,0 +1,63 @@
+"""
+模拟云后端测试
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from services.alicloud import AliCloudClient
+from services.fake_cloud import FakeAlbClient, FakeCloudBackend, FakeCloudError, FakeEcsClient
+from services.ratelimit import is_retryable_error, is_throttling_error
+
+
+@pytest.fixture
+def fake_client():
+    def build(**kwargs):
+        backend = FakeCloudBackend(seed=1, **kwargs)
+        client = AliCloudClient()
+        client.alb_client = FakeAlbClient(backend)
+        client.ecs_client = FakeEcsClient(backend)
+        client.state_cache = None
+        clients.append(client)
+        return client, backend
+
+    clients = []
+    yield build
+    for client in clients:
+        client.close()
+
+
+class TestFakeCloudBackend:
+    """模拟后端行为测试"""
+
+    def test_writes_visible_in_paged_listing(self, fake_client):
+        client, backend = fake_client()
+        cidrs = [f"10.0.{i // 256}.{i % 256}/32" for i in range(150)]
+
+        client.add_entries_to_acl_batch("acl-fake", cidrs)
+        client.remove_entries_from_acl_batch("acl-fake", cidrs[:10])
+        client.authorize_security_group_batch(["1.1.1.1", "2.2.2.2"], security_group_id="sg-fake")
+        client.revoke_security_group_batch(["1.1.1.1"], security_group_id="sg-fake")
+
+        assert client.list_acl_cidrs("acl-fake") == cidrs[10:]
+        assert backend.calls["ListAclEntries"] == 2
+        assert client.list_security_group_cidrs("sg-fake") == ["2.2.2.2/32"]
+
+    def test_throttling_raises_retryable_error(self, fake_client):
+        _, backend = fake_client(throttle_qps=1)
+        request = SimpleNamespace(acl_id="acl-fake", acl_entries=[])
+        backend.add_entries_to_acl(request)
+
+        with pytest.raises(FakeCloudError) as excinfo:
+            backend.add_entries_to_acl(request)
+
+        assert is_throttling_error(excinfo.value) and is_retryable_error(excinfo.value)
+
+    def test_errors_surface_as_failed_results(self, fake_client, monkeypatch):
+        client, _ = fake_client(error_rate=1.0)
+        monkeypatch.setattr(client.retry_policy, "max_retries", 0)
+
+        result = client.authorize_security_group("1.1.1.1", security_group_id="sg-fake")
+
+        assert not result["success"] and "ServiceUnavailable" in result["error"]
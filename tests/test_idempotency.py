@@ -0,0 +1,144 @@
+"""
+幂等键测试
+"""
+
+import asyncio
+import threading
+from uuid import uuid4
+
+from fastapi import Response
+from fastapi.testclient import TestClient
+
+from api.idempotency import run_idempotent
+from api.models import ApiResponse, BanIPRequest
+from core.config import settings
+from main import app
+from services.ban_queue import get_ban_queue
+from services.idempotency import IdempotencyStore
+from tests.test_ban_queue import ThreadRecordingStore, fake_clients  # noqa: F401
+from tests.test_breaker import _trip, breakers  # noqa: F401
+
+client = TestClient(app)
+
+
+class TestIdempotencyStore:
+    """幂等键存储测试"""
+
+    def test_concurrent_duplicates_share_one_execution(self):
+        store = IdempotencyStore(max_entries=10, ttl=60)
+        calls = []
+
+        async def handler():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return ApiResponse(success=True, message="ok")
+
+        async def run():
+            return await asyncio.gather(*(store.run("k", "f", handler) for _ in range(3)))
+
+        results = asyncio.run(run())
+
+        assert len(calls) == 1
+        assert [replayed for _, replayed in results] == [False, True, True]
+        assert len({id(result) for result, _ in results}) == 1
+
+    def test_failed_response_not_cached_and_capacity_bounded(self):
+        store = IdempotencyStore(max_entries=2, ttl=60)
+        outcomes = iter([False, True])
+
+        async def handler():
+            return ApiResponse(success=next(outcomes), message="")
+
+        async def run():
+            first, _ = await store.run("k", "f", handler)
+            second, replayed = await store.run("k", "f", handler)
+            for key in ("a", "b"):
+                await store.run(key, "f", lambda: asyncio.sleep(0, ApiResponse(success=True, message="ok")))
+            return first, second, replayed
+
+        first, second, replayed = asyncio.run(run())
+
+        assert not first.success and second.success and not replayed
+        assert len(store) == 2
+
+    def test_store_calls_run_off_event_loop(self):
+        backend = ThreadRecordingStore()
+        store = IdempotencyStore(ttl=60, store=backend)
+
+        async def handler():
+            return ApiResponse(success=True, message="ok")
+
+        async def run():
+            await store.run("k", "f", handler)
+            return await store.run("k", "f", handler)
+
+        _, replayed = asyncio.run(run())
+
+        assert replayed
+        assert backend.threads and threading.get_ident() not in backend.threads
+
+
+class TestIdempotencyAPI:
+    """Idempotency-Key 请求头测试"""
+
+    def test_retry_replays_response_without_cloud_call(self, fake_clients):
+        _, ecs = fake_clients
+        headers = {"Idempotency-Key": uuid4().hex}
+        body = {"source_cidr_ip": "10.7.7.7/32", "security_group_id": "sg-test"}
+
+        first = client.post("/api/v1/ecs/authorize", json=body, headers=headers)
+        second = client.post("/api/v1/ecs/authorize", json=body, headers=headers)
+
+        assert first.json()["success"] is True
+        assert second.json() == first.json()
+        assert second.headers["Idempotent-Replayed"] == "true"
+        assert len(ecs.calls) == 1
+
+    def test_key_reused_with_different_body_rejected(self, fake_clients):
+        alb, _ = fake_clients
+        headers = {"Idempotency-Key": uuid4().hex}
+
+        client.post("/api/v1/banip/ban", json={"ip": "10.8.8.8"}, headers=headers)
+        response = client.post("/api/v1/banip/ban", json={"ip": "10.8.8.9"}, headers=headers)
+
+        assert response.status_code == 422
+        assert len(alb.calls) == 1
+
+    def test_replay_keeps_status_code(self, breakers, monkeypatch):
+        monkeypatch.setattr(settings, "circuit_breaker_divert", True)
+        _trip(breakers, "AddEntriesToAcl")
+        _trip(breakers, "AuthorizeSecurityGroup")
+        headers = {"Idempotency-Key": uuid4().hex}
+
+        first = client.post("/api/v1/banip/ban", json={"ip": "10.8.8.10"}, headers=headers)
+        second = client.post("/api/v1/banip/ban", json={"ip": "10.8.8.10"}, headers=headers)
+        get_ban_queue()._pending.pop("10.8.8.10/32", None)
+
+        assert first.status_code == second.status_code == 202
+        assert second.headers["Idempotent-Replayed"] == "true"
+        assert second.json()["queued_request_id"] == first.json()["queued_request_id"]
+
+    def test_concurrent_duplicate_keeps_status_code(self):
+        key = uuid4().hex
+        request = BanIPRequest(ip="10.8.8.11")
+
+        async def handler(response):
+            await asyncio.sleep(0.05)
+            response.status_code = 202
+            response.headers["Retry-After"] = "5"
+            return ApiResponse(success=True, message="queued")
+
+        async def run():
+            responses = [Response(), Response()]
+            results = await asyncio.gather(*(
+                run_idempotent("test/status", key, request, response, lambda response=response: handler(response))
+                for response in responses
+            ))
+            return responses, results
+
+        responses, results = asyncio.run(run())
+
+        assert [response.status_code for response in responses] == [202, 202]
+        assert responses[1].headers["Retry-After"] == "5"
+        assert responses[1].headers["Idempotent-Replayed"] == "true"
+        assert results[0] is results[1]
@@ -0,0 +1,197 @@
+"""
+封禁台账测试
+"""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import services.ledger as ledger_module
+from core.config import settings
+from core.metrics import metrics
+from main import app
+from services.alicloud import CloudStateCache, get_aliyun_client
+from services.ledger import BanLedger, BanRecord, sweep_expired_bans
+from services.targets import BanTarget
+from tests.test_alicloud import ListingClient
+from tests.test_ban_queue import fake_clients  # noqa: F401
+
+client = TestClient(app)
+
+TARGET = BanTarget("cn-hangzhou", "acl-test", "sg-test")
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = BanLedger(str(tmp_path / "bans.db"))
+    yield ledger
+    ledger.close()
+
+
+class TestBanLedger:
+    """台账存取测试"""
+
+    def test_due_returns_expired_in_expiry_order(self, ledger):
+        ledger.record_bans([
+            BanRecord("1.1.1.1/32", TARGET, expires_at=300),
+            BanRecord("2.2.2.2/32", TARGET, expires_at=100),
+            BanRecord("3.3.3.3/32", TARGET, expires_at=None),
+            BanRecord("4.4.4.4/32", TARGET, expires_at=900),
+        ], now=0)
+
+        assert [record.cidr_ip for record in ledger.due(now=500)] == ["2.2.2.2/32", "1.1.1.1/32"]
+        assert [record.cidr_ip for record in ledger.due(now=500, limit=1)] == ["2.2.2.2/32"]
+
+    def test_reban_replaces_expiry_and_unban_forgets(self, ledger):
+        ledger.record_bans([BanRecord("1.1.1.1/32", TARGET, expires_at=100)], now=0)
+        ledger.record_bans([BanRecord("1.1.1.1/32", TARGET, expires_at=None)], now=50)
+
+        assert ledger.due(now=1000) == []
+        assert ledger.count() == 1
+
+        ledger.forget(["1.1.1.1/32"])
+        assert ledger.count() == 0
+
+    def test_release_removes_only_unbanned_legs(self, ledger):
+        shanghai = BanTarget("cn-shanghai", "acl-2", "sg-2")
+        ledger.record_bans([BanRecord("1.1.1.1/32", TARGET), BanRecord("1.1.1.1/32", shanghai)], now=0)
+
+        ledger.release([
+            BanRecord("1.1.1.1/32", TARGET),
+            BanRecord("1.1.1.1/32", BanTarget("cn-shanghai", "acl-2")),
+        ])
+
+        assert [record.target for record in ledger.get("1.1.1.1/32")] == [BanTarget("cn-shanghai", "", "sg-2")]
+        assert ledger.entries == 1
+
+    def test_entries_tracked_without_querying(self, ledger, monkeypatch):
+        ledger.record_bans([BanRecord("1.1.1.1/32", TARGET), BanRecord("2.2.2.2/32", TARGET)], now=0)
+        ledger.delete([BanRecord("1.1.1.1/32", TARGET)])
+        monkeypatch.setattr(ledger_module, "_ban_ledger", ledger)
+        monkeypatch.setattr(ledger, "_conn", None)
+
+        # 连接已不可用：指标仍能输出，说明没有查询数据库
+        assert ledger.entries == 1
+        assert "ban_ledger_entries 1" in metrics.render()
+
+    def test_due_query_uses_expiry_index(self, ledger):
+        plan = ledger._conn.execute(
+            "EXPLAIN QUERY PLAN SELECT cidr_ip FROM bans WHERE expires_at <= ? ORDER BY expires_at LIMIT ?",
+            (0, 10)
+        ).fetchall()
+
+        assert "idx_bans_expires_at" in str(plan)
+
+
+class TestSweepExpiredBans:
+    """到期清理测试"""
+
+    def test_expired_bans_removed_in_one_batch(self, ledger, fake_clients):
+        alb, ecs = fake_clients
+        ledger.record_bans([
+            BanRecord("1.1.1.1/32", TARGET, expires_at=10),
+            BanRecord("2.2.2.2/32", TARGET, expires_at=20),
+            BanRecord("3.3.3.3/32", TARGET, expires_at=1000),
+        ], now=0)
+
+        swept = asyncio.run(sweep_expired_bans(ledger, now=100))
+
+        assert swept == 2
+        assert alb.calls == [("RemoveEntriesFromAcl", ["1.1.1.1/32", "2.2.2.2/32"])]
+        assert ecs.calls == [("RevokeSecurityGroup", ["1.1.1.1/32", "2.2.2.2/32"])]
+        assert [record.cidr_ip for record in ledger.due(now=10_000)] == ["3.3.3.3/32"]
+
+    def test_failed_unban_rescheduled(self, ledger, fake_clients):
+        alb, _ = fake_clients
+        alb.fail_entries = {"1.1.1.1/32"}
+        ledger.record_bans([BanRecord("1.1.1.1/32", BanTarget("cn-hangzhou", "acl-test"), expires_at=10)], now=0)
+
+        asyncio.run(sweep_expired_bans(ledger, now=100))
+
+        assert ledger.due(now=100) == []
+        (record,) = ledger.get("1.1.1.1/32")
+        assert record.attempts == 1 and record.expires_at > 100
+
+
+class TestBanTTLAPI:
+    """封禁时长接口测试"""
+
+    def test_ban_with_ttl_recorded_and_unban_forgets(self, ledger, fake_clients, monkeypatch):
+        monkeypatch.setattr(ledger_module, "_ban_ledger", ledger)
+
+        response = client.post("/api/v1/banip/ban", json={"ip": "10.9.8.7", "ttl_seconds": 60})
+
+        assert response.status_code == 200
+        assert response.json()["expires_at"]
+        (record,) = ledger.get("10.9.8.7/32")
+        assert record.expires_at is not None and record.target.acl_id and record.target.security_group_id
+
+        client.post("/api/v1/banip/unban", json={"ip": "10.9.8.7"})
+        assert ledger.get("10.9.8.7/32") == []
+
+    def test_bulk_ledger_tracks_each_target(self, ledger, monkeypatch, recording_client):
+        monkeypatch.setattr(ledger_module, "_ban_ledger", ledger)
+        monkeypatch.setattr(settings, "ban_targets", "cn-hangzhou:acl-1:sg-1,cn-shanghai:acl-2:sg-2")
+        clients = {}
+        for region in ("cn-hangzhou", "cn-shanghai"):
+            regional = get_aliyun_client().for_region(region)
+            clients[region] = (recording_client(), recording_client())
+            monkeypatch.setattr(regional, "alb_client", clients[region][0])
+            monkeypatch.setattr(regional, "ecs_client", clients[region][1])
+            monkeypatch.setattr(regional, "state_cache", None)
+        clients["cn-shanghai"][0].fail_entries = {"10.9.8.1/32"}
+
+        response = client.post("/api/v1/banip/ban-bulk", json={"ips": ["10.9.8.1"], "ttl_seconds": 60})
+
+        assert response.json()["results"][0]["success"]
+        assert {record.target for record in ledger.get("10.9.8.1/32")} == {
+            BanTarget("cn-hangzhou", "acl-1", "sg-1"), BanTarget("cn-shanghai", "", "sg-2")
+        }
+
+        clients["cn-shanghai"][0].fail_entries = set()
+        clients["cn-shanghai"][1].fail_entries = {"10.9.8.1/32"}
+        client.post("/api/v1/banip/unban-bulk", json={"ips": ["10.9.8.1"]})
+
+        assert [record.target for record in ledger.get("10.9.8.1/32")] == [BanTarget("cn-shanghai", "", "sg-2")]
+
+    def test_ttl_bans_not_merged_into_supernets(self, ledger, fake_clients, monkeypatch):
+        alb, ecs = fake_clients
+        monkeypatch.setattr(ledger_module, "_ban_ledger", ledger)
+        monkeypatch.setattr(settings, "cidr_merge_supernets", True)
+
+        client.post("/api/v1/banip/ban-bulk", json={"ips": ["10.9.8.0", "10.9.8.1"], "ttl_seconds": 60})
+
+        # 按台账中的原网段写入，到期时才能删掉
+        assert alb.calls == [("AddEntriesToAcl", ["10.9.8.0/32", "10.9.8.1/32"])]
+        assert ecs.calls == [("AuthorizeSecurityGroup", ["10.9.8.0/32", "10.9.8.1/32"])]
+        alb.calls.clear()
+        asyncio.run(sweep_expired_bans(ledger, now=10 ** 12))
+        assert alb.calls == [("RemoveEntriesFromAcl", ["10.9.8.0/32", "10.9.8.1/32"])]
+
+        alb.calls.clear()
+        client.post("/api/v1/banip/ban-bulk", json={"ips": ["10.9.8.0", "10.9.8.1"], "ttl_seconds": 0})
+        assert alb.calls == [("AddEntriesToAcl", ["10.9.8.0/31"])]
+
+    def test_ttl_ban_covered_by_permanent_entry_not_recorded(self, ledger, monkeypatch):
+        monkeypatch.setattr(ledger_module, "_ban_ledger", ledger)
+        monkeypatch.setattr(settings, "ban_targets", f"{settings.default_region}:acl-test:sg-test")
+        alb, ecs = ListingClient(["10.9.8.0/24", "10.9.7.7/32"]), ListingClient(["10.9.8.0/24", "10.9.7.7/32"])
+        monkeypatch.setattr(get_aliyun_client(), "alb_client", alb)
+        monkeypatch.setattr(get_aliyun_client(), "ecs_client", ecs)
+        monkeypatch.setattr(get_aliyun_client(), "state_cache", CloudStateCache(ttl=300))
+        target = BanTarget(settings.default_region, "acl-test", "sg-test")
+        ledger.record_bans([BanRecord("10.9.7.7/32", target, expires_at=100)], now=0)
+
+        covered = client.post("/api/v1/banip/ban", json={"ip": "10.9.8.7", "ttl_seconds": 60}).json()
+        bulk = client.post("/api/v1/banip/ban-bulk", json={"ips": ["10.9.8.8", "10.9.7.7"], "ttl_seconds": 60}).json()
+
+        assert covered["success"] and covered["expires_at"] is None
+        assert "不会自动解封" in covered["message"]
+        assert ledger.get("10.9.8.7/32") == [] and ledger.get("10.9.8.8/32") == []
+        assert "不会自动解封" in bulk["results"][0]["message"]
+        # 已有的到期封禁照常延长
+        assert bulk["results"][1]["message"] == ""
+        (record,) = ledger.get("10.9.7.7/32")
+        assert record.expires_at > 100
+        assert not [call for call in alb.calls + ecs.calls if call[0] != "List"]
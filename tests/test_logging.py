@@ -0,0 +1,61 @@
+"""
+日志配置测试
+"""
+
+import io
+import json
+import logging
+
+import pytest
+from loguru import logger
+
+from core.logger import sampled_logger, setup_logging
+
+
+@pytest.fixture
+def sink():
+    stream = io.StringIO()
+    yield stream
+    setup_logging()
+
+
+def _lines(stream: io.StringIO):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+class TestSetupLogging:
+    """日志配置测试"""
+
+    def test_json_lines_with_lazy_arguments(self, sink):
+        setup_logging(level="INFO", json_output=True, enqueue=False, sample_per_second=0, log_file="", sink=sink)
+
+        logger.debug("不输出: {}", "x")
+        logger.info("封禁 {} 成功 {{原样}}", "1.2.3.4/32")
+
+        (line,) = _lines(sink)
+        assert line["level"] == "INFO"
+        assert line["message"] == "封禁 1.2.3.4/32 成功 {原样}"
+        assert "extra" not in line
+
+    def test_sampled_lines_rate_limited_per_call_site(self, sink):
+        setup_logging(level="INFO", json_output=True, enqueue=False, sample_per_second=3, log_file="", sink=sink)
+
+        for i in range(50):
+            sampled_logger.info("API 响应: 成功 {}", i)
+        for i in range(2):
+            logger.error("API 错误: {}", i)
+
+        lines = _lines(sink)
+        assert [line["message"] for line in lines if line["level"] == "INFO"] == [
+            "API 响应: 成功 0", "API 响应: 成功 1", "API 响应: 成功 2"
+        ]
+        assert len([line for line in lines if line["level"] == "ERROR"]) == 2
+
+    def test_background_sink_and_stdlib_intercept(self, sink):
+        setup_logging(level="INFO", json_output=True, enqueue=True, sample_per_second=0, log_file="", sink=sink)
+
+        logging.getLogger("uvicorn.error").info("Started server process")
+        logger.remove()  # 停止后台线程并写完队列
+
+        (line,) = _lines(sink)
+        assert line["message"] == "Started server process"
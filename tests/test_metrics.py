@@ -0,0 +1,77 @@
+"""
+Prometheus 指标测试
+"""
+
+import threading
+
+from fastapi.testclient import TestClient
+
+from core.metrics import MetricsRegistry
+from main import app
+
+client = TestClient(app)
+
+
+class TestMetricsRegistry:
+    """指标注册表测试"""
+
+    def test_concurrent_threads_counted_exactly(self):
+        registry = MetricsRegistry()
+        labels = (("operation", "AddEntriesToAcl"),)
+
+        def record():
+            for _ in range(10_000):
+                registry.inc("calls_total", labels)
+                registry.observe("duration_seconds", 0.2, labels)
+
+        threads = [threading.Thread(target=record) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert registry.value("calls_total", labels) == 80_000
+        assert registry.histogram_count("duration_seconds", labels) == 80_000
+
+    def test_render_histogram_buckets_cumulative(self):
+        registry = MetricsRegistry(buckets=(0.1, 1.0))
+        registry.describe("duration_seconds", "histogram", "耗时")
+        for value in (0.05, 0.5, 0.5, 3):
+            registry.observe("duration_seconds", value, (("route", "/a"),))
+        registry.register_callback("queue_depth", "队列长度", lambda: [((), 7)])
+
+        text = registry.render()
+
+        assert "# TYPE duration_seconds histogram" in text
+        assert 'duration_seconds_bucket{route="/a",le="0.1"} 1' in text
+        assert 'duration_seconds_bucket{route="/a",le="1"} 3' in text
+        assert 'duration_seconds_bucket{route="/a",le="+Inf"} 4' in text
+        assert 'duration_seconds_count{route="/a"} 4' in text
+        assert "queue_depth 7" in text
+
+
+class TestMetricsEndpoint:
+    """/metrics 接口测试"""
+
+    def test_route_and_cloud_operation_metrics(self, monkeypatch, recording_client):
+        from services.alicloud import get_aliyun_client
+
+        monkeypatch.setattr(get_aliyun_client(), "alb_client", recording_client())
+        monkeypatch.setattr(get_aliyun_client(), "ecs_client", recording_client())
+        client.post("/api/v1/banip/ban", json={"ip": "10.20.30.40"})
+        client.get("/api/v1/banip/queue/not-a-request")
+        client.get("/wp-login.php")
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        text = response.text
+        assert 'http_requests_total{method="POST",route="/api/v1/banip/ban",status="200"}' in text
+        assert 'http_request_duration_seconds_bucket{method="POST",route="/api/v1/banip/ban",le="+Inf"}' in text
+        assert 'cloud_api_calls_total{operation="AddEntriesToAcl",region="cn-hangzhou",result="success"}' in text
+        assert 'cloud_api_calls_total{operation="AuthorizeSecurityGroup",region="cn-hangzhou",result="success"}' in text
+        assert 'http_requests_total{method="GET",route="/api/v1/banip/queue/{request_id}",status="404"}' in text
+        assert 'http_requests_total{method="GET",route="unmatched",status="404"}' in text
+        assert "ban_queue_depth" in text
+        assert "http_requests_in_flight 1" in text
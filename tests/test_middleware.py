@@ -0,0 +1,136 @@
+"""
+IP 白名单中间件测试
+"""
+
+import asyncio
+import ipaddress
+import os
+
+from starlette.responses import JSONResponse
+
+from core.cidr_index import CIDRIndex
+from core.middleware import IPWhitelist, IPWhitelistMiddleware
+
+
+class TestCIDRIndex:
+    """CIDR 前缀索引测试"""
+
+    def test_ipv4_and_ipv6_lookup(self):
+        index = CIDRIndex.from_strings(["192.168.0.0/16", "10.1.2.3/32", "2001:db8::/32"])
+
+        assert "192.168.10.20" in index
+        assert "10.1.2.3" in index
+        assert "10.1.2.4" not in index
+        assert "2001:db8::1" in index
+        assert "2001:db9::1" not in index
+        assert "::ffff:192.168.1.1" in index
+        assert "not-an-ip" not in index
+
+    def test_overlapping_ranges_collapsed(self):
+        index = CIDRIndex.from_strings(["10.0.0.0/24", "10.0.0.128/25", "10.0.1.0/24", "10.0.0.5/32"])
+
+        assert index.networks == [ipaddress.ip_network("10.0.0.0/23")]
+        assert "10.0.1.255" in index
+        assert "10.0.2.0" not in index
+
+    def test_matches_linear_scan(self):
+        networks = [ipaddress.ip_network(f"172.{i}.{i * 7 % 256}.0/{20 + i % 12}", strict=False) for i in range(200)]
+        index = CIDRIndex(networks)
+
+        for i in range(0, 65536, 97):
+            ip = ipaddress.ip_address(f"172.{i // 256 % 200}.{i % 256}.{i % 251}")
+            assert (ip in index) == any(ip in network for network in networks)
+
+
+class TestIPWhitelistMiddleware:
+    """IP 白名单中间件测试"""
+
+    def test_is_ip_allowed(self):
+        middleware = IPWhitelistMiddleware(None, ["100.127.0.0/16", "120.26.104.119", "bad-entry"])
+
+        assert middleware._is_ip_allowed("100.127.3.4")
+        assert middleware._is_ip_allowed("120.26.104.119")
+        assert not middleware._is_ip_allowed("120.26.104.120")
+
+    def test_empty_whitelist_allows_all(self):
+        middleware = IPWhitelistMiddleware(None, [])
+
+        assert middleware.whitelist_index is None
+        assert middleware._is_ip_allowed("8.8.8.8")
+
+    def test_rejects_before_reaching_app(self):
+        calls = []
+
+        async def app(scope, receive, send):
+            calls.append(scope["path"])
+            await JSONResponse({"ok": True})(scope, receive, send)
+
+        middleware = IPWhitelistMiddleware(app, ["10.0.0.0/8"])
+
+        assert asyncio.run(self._request(middleware, "/api/v1/banip/ban", "10.1.2.3")) == 200
+        assert asyncio.run(self._request(middleware, "/api/v1/banip/ban", "8.8.8.8")) == 403
+        assert asyncio.run(self._request(middleware, "/health", "8.8.8.8")) == 200
+        assert calls == ["/api/v1/banip/ban", "/health"]
+
+    def test_reload_from_file_swaps_index(self, tmp_path):
+        whitelist_file = tmp_path / "whitelist.txt"
+        whitelist_file.write_text("# office\n10.0.0.0/8\n")
+        whitelist = IPWhitelist(["127.0.0.1"], str(whitelist_file))
+        middleware = IPWhitelistMiddleware(None, whitelist=whitelist)
+        old_index = middleware.whitelist_index
+
+        assert middleware._is_ip_allowed("10.1.2.3")
+        assert not middleware._is_ip_allowed("192.168.1.1")
+        assert not whitelist.reload_if_changed()
+
+        whitelist_file.write_text("192.168.0.0/16, 172.16.0.0/12\n")
+        os.utime(whitelist_file, (0, 0))
+        assert whitelist.reload_if_changed()
+
+        assert middleware.whitelist_index is not old_index
+        assert middleware._is_ip_allowed("192.168.1.1")
+        assert middleware._is_ip_allowed("127.0.0.1")
+        assert not middleware._is_ip_allowed("10.1.2.3")
+        # 旧索引保持完整，进行中的请求不受影响
+        assert "10.1.2.3" in old_index
+
+    def test_reload_keeps_index_when_file_missing(self, tmp_path):
+        whitelist_file = tmp_path / "whitelist.txt"
+        whitelist_file.write_text("10.0.0.0/8\n")
+        whitelist = IPWhitelist([], str(whitelist_file))
+
+        whitelist_file.unlink()
+
+        assert not whitelist.reload()
+        assert "10.1.2.3" in whitelist.index
+
+    def test_missing_file_on_first_load_fails_closed(self, tmp_path):
+        whitelist_file = tmp_path / "whitelist.txt"
+
+        whitelist = IPWhitelist(["10.0.0.0/8"], str(whitelist_file))
+        denied_all = IPWhitelist([], str(whitelist_file))
+
+        assert whitelist.enabled and denied_all.enabled
+        assert "10.1.2.3" in whitelist.index and "192.168.1.1" not in whitelist.index
+        assert "10.1.2.3" not in denied_all.index
+
+        whitelist_file.write_text("192.168.0.0/16\n")
+        assert whitelist.reload_if_changed()
+        assert "192.168.1.1" in whitelist.index
+
+    @staticmethod
+    async def _request(middleware, path, client_ip):
+        scope = {
+            "type": "http", "method": "POST", "path": path, "headers": [],
+            "query_string": b"", "client": (client_ip, 12345)
+        }
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        await middleware(scope, receive, send)
+        return messages[0]["status"]
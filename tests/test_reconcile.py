@@ -0,0 +1,116 @@
+"""
+期望状态同步测试
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from core.config import settings
+from main import app
+from services.alicloud import CloudStateCache, get_aliyun_client
+from services.fake_cloud import FakeAlbClient, FakeCloudBackend, FakeEcsClient
+from services.reconcile import plan_reconcile
+from tests.test_banlist import listing_clients  # noqa: F401
+
+client = TestClient(app)
+
+
+class TestPlanReconcile:
+    """差异计算测试"""
+
+    def test_diff_on_normalized_networks(self):
+        plan = plan_reconcile(
+            ["1.1.1.1", "10.0.0.5/24", "4.4.4.4/32", "bad", "1.1.1.1/32"],
+            ["1.1.1.1/32", "2.2.2.2/32", "10.0.0.0/24"]
+        )
+
+        assert plan.to_add == ["4.4.4.4/32"]
+        assert plan.to_remove == ["2.2.2.2/32"]
+        assert plan.unchanged == 2
+        assert plan.invalid == ["bad"]
+
+    def test_covered_networks_are_not_collapsed(self):
+        plan = plan_reconcile(["10.0.0.0/24", "10.0.0.1/32"], ["10.0.0.0/24"])
+
+        assert plan.to_add == ["10.0.0.1/32"]
+        assert plan.to_remove == []
+
+
+class TestReconcileAPI:
+    """同步接口测试"""
+
+    def test_acl_writes_only_diff(self, listing_clients):
+        alb, _ = listing_clients
+
+        response = client.put(
+            "/api/v1/alb/acls/acl-test/entries",
+            json={"cidrs": ["1.1.1.1", "4.4.4.4"]}
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] and data["added"] == 1 and data["removed"] == 2 and data["unchanged"] == 1
+        assert data["api_calls"] == 2
+        writes = [call for call in alb.calls if call[0] != "List"]
+        # 先新增再删除，期间期望的条目一直生效
+        assert writes == [
+            ("AddEntriesToAcl", ["4.4.4.4/32"]),
+            ("RemoveEntriesFromAcl", ["2.2.2.2/32", "3.3.3.3/32"]),
+        ]
+
+    def test_security_group_dry_run_writes_nothing(self, listing_clients):
+        _, ecs = listing_clients
+
+        response = client.put(
+            "/api/v1/ecs/security-groups/sg-test/rules",
+            json={"cidrs": ["4.4.4.4/32", "5.5.5.5"], "dry_run": True}
+        )
+
+        data = response.json()
+        assert data["dry_run"] and data["to_add"] == ["5.5.5.5/32"] and data["to_remove"] == ["1.1.1.1/32"]
+        assert data["added"] == 0 and data["api_calls"] == 0
+        assert [call for call in ecs.calls if call[0] != "List"] == []
+
+
+@pytest.fixture
+def fake_cloud(monkeypatch):
+    backend = FakeCloudBackend()
+    monkeypatch.setattr(get_aliyun_client(), "alb_client", FakeAlbClient(backend))
+    monkeypatch.setattr(get_aliyun_client(), "ecs_client", FakeEcsClient(backend))
+    monkeypatch.setattr(get_aliyun_client(), "state_cache", CloudStateCache(ttl=300))
+    return backend
+
+
+class TestReconcileConverges:
+    """重复同步收敛测试（模拟云后端，启用状态缓存）"""
+
+    def test_covered_entry_is_written(self, fake_cloud):
+        desired = {"cidrs": ["1.2.3.0/24", "1.2.3.4/32"]}
+
+        first = client.put("/api/v1/alb/acls/acl-converge/entries", json=desired).json()
+        second = client.put("/api/v1/alb/acls/acl-converge/entries", json=desired).json()
+
+        assert first["added"] == 2
+        assert second["added"] == 0 and second["removed"] == 0 and second["api_calls"] == 0
+        assert sorted(get_aliyun_client().list_acl_cidrs("acl-converge")) == ["1.2.3.0/24", "1.2.3.4/32"]
+
+    def test_adjacent_networks_not_merged(self, fake_cloud, monkeypatch):
+        monkeypatch.setattr(settings, "cidr_merge_supernets", True)
+        desired = {"cidrs": ["10.0.0.0/32", "10.0.0.1/32"]}
+
+        first = client.put("/api/v1/ecs/security-groups/sg-converge/rules", json=desired).json()
+        second = client.put("/api/v1/ecs/security-groups/sg-converge/rules", json=desired).json()
+
+        assert first["added"] == 2
+        assert second["to_add"] == [] and second["to_remove"] == [] and second["api_calls"] == 0
+        assert get_aliyun_client().list_security_group_cidrs("sg-converge") == ["10.0.0.0/32", "10.0.0.1/32"]
+
+    def test_full_acl_removes_first_after_quota_error(self, fake_cloud):
+        client.put("/api/v1/alb/acls/acl-full/entries", json={"cidrs": ["1.1.1.1", "2.2.2.2"]})
+        fake_cloud.set_acl_quota("acl-full", 2)
+
+        data = client.put("/api/v1/alb/acls/acl-full/entries", json={"cidrs": ["1.1.1.1", "3.3.3.3"]}).json()
+
+        assert data["success"] and data["added"] == 1 and data["removed"] == 1
+        assert data["failures"] == {}
+        assert sorted(get_aliyun_client().list_acl_cidrs("acl-full")) == ["1.1.1.1/32", "3.3.3.3/32"]
@@ -0,0 +1,38 @@
+"""
+启动耗时测试
+用 -X importtime 检查导入应用时不加载阿里云 SDK（SDK 在启动后于后台预热或首次使用时导入）
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 导入耗时较长、不应出现在启动路径上的模块前缀
+DEFERRED_MODULES = ("alibabacloud_", "Tea")
+
+
+def import_profile():
+    """在子进程中导入 main，返回 {模块名: 累计导入耗时（微秒）}"""
+    env = {**os.environ, "CLOUD_BACKEND": "aliyun", "LOG_LEVEL": "WARNING"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    profile = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|", 2)
+            if cumulative.strip().isdigit():
+                profile[name.strip()] = int(cumulative)
+    return profile
+
+
+def test_sdk_not_imported_at_startup():
+    profile = import_profile()
+
+    assert "main" in profile
+    assert [name for name in profile if name.startswith(DEFERRED_MODULES)] == []
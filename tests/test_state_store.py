@@ -0,0 +1,126 @@
+"""
+共享状态存储测试
+两个 SQLiteStateStore 实例打开同一个文件，模拟多 worker 部署
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from api.models import ApiResponse
+from services.alicloud import CloudStateCache
+from services.idempotency import IdempotencyStore
+from services.ratelimit import RateLimiter, SharedTokenBucket, TokenBucket
+from services.state_store import MemoryStateStore, SQLiteStateStore
+
+
+@pytest.fixture
+def worker_stores(tmp_path):
+    path = str(tmp_path / "state.db")
+    stores = [SQLiteStateStore(path), SQLiteStateStore(path)]
+    yield stores
+    for store in stores:
+        store.close()
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    store = MemoryStateStore(100) if request.param == "memory" else SQLiteStateStore(str(tmp_path / "state.db"))
+    yield store
+    store.close()
+
+
+class TestStateStore:
+    """memory 与 sqlite 实现行为一致"""
+
+    def test_get_set_add_delete_incr(self, store):
+        assert store.get("a") is None
+        store.set("a", "1")
+        assert store.get("a") == "1"
+        assert not store.add("a", "2")
+        assert store.add("b", "2", ttl=60)
+        store.delete("a")
+        assert store.get("a") is None
+        assert [store.incr("n"), store.incr("n")] == [1, 2]
+
+    def test_expired_key_can_be_added_again(self, store):
+        store.set("a", "1", ttl=0.01)
+        asyncio.run(asyncio.sleep(0.02))
+        assert store.get("a") is None
+        assert store.add("a", "2")
+
+    def test_token_bucket_and_lease(self, store):
+        assert [store.take_token("t", rate=1, burst=2) for _ in range(2)] == [0, 0]
+        assert store.take_token("t", rate=1, burst=2) > 0
+        assert store.acquire_lease("job", "w1", ttl=60)
+        assert not store.acquire_lease("job", "w2", ttl=60)
+        assert store.acquire_lease("job", "w1", ttl=60)
+
+
+class TestSharedAcrossWorkers:
+    """两个 worker 共享同一个 SQLite 文件"""
+
+    def test_tokens_and_leases_are_shared(self, worker_stores):
+        first, second = worker_stores
+        assert first.take_token("t", rate=1, burst=1) == 0
+        assert second.take_token("t", rate=1, burst=1) > 0
+        assert first.acquire_lease("ban_sweeper", "w1", ttl=60)
+        assert not second.acquire_lease("ban_sweeper", "w2", ttl=60)
+        assert first.incr("gen") == 1 and second.incr("gen") == 2
+
+    def test_rate_limiter_uses_shared_bucket_only_for_shared_store(self, worker_stores):
+        assert isinstance(RateLimiter(10, 5, store=worker_stores[0]).bucket("AddEntriesToAcl", "cn-hangzhou"), SharedTokenBucket)
+        assert isinstance(RateLimiter(10, 5, store=MemoryStateStore()).bucket("AddEntriesToAcl", "cn-hangzhou"), TokenBucket)
+
+    def test_idempotent_replay_from_other_worker(self, worker_stores):
+        calls = []
+
+        async def handler():
+            calls.append(1)
+            return ApiResponse(success=True, message="ok")
+
+        first = IdempotencyStore(ttl=60, store=worker_stores[0])
+        second = IdempotencyStore(ttl=60, store=worker_stores[1])
+        result, replayed = asyncio.run(first.run("k", "f", handler))
+        assert not replayed
+        stored, replayed = asyncio.run(second.run("k", "f", handler))
+
+        assert replayed
+        assert len(calls) == 1
+        assert json.loads(stored.body) == json.loads(result.model_dump_json())
+
+    def test_idempotent_duplicate_waits_for_other_worker(self, worker_stores):
+        calls = []
+
+        async def handler():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return ApiResponse(success=True, message="ok")
+
+        first = IdempotencyStore(ttl=60, store=worker_stores[0])
+        second = IdempotencyStore(ttl=60, store=worker_stores[1])
+
+        async def run():
+            return await asyncio.gather(first.run("k", "f", handler), second.run("k", "f", handler))
+
+        (_, first_replayed), (stored, second_replayed) = asyncio.run(run())
+
+        assert len(calls) == 1
+        assert (first_replayed, second_replayed) == (False, True)
+        assert json.loads(stored.body)["message"] == "ok"
+
+    def test_state_cache_write_invalidates_other_worker(self, worker_stores):
+        first = CloudStateCache(ttl=300, store=worker_stores[0])
+        second = CloudStateCache(ttl=300, store=worker_stores[1])
+        for cache in (first, second):
+            assert not cache.check("acl-1")
+            cache.load("acl-1", {"1.1.1.1/32"})
+            assert cache.check("acl-1")
+
+        first.add("acl-1", {"2.2.2.2/32"})
+
+        # 写入方的缓存保持有效并包含新条目，另一个 worker 需要重新加载
+        assert first.check("acl-1")
+        assert "2.2.2.2/32" in first.split("acl-1", ["2.2.2.2/32"], adding=True)[1]
+        assert not second.check("acl-1")
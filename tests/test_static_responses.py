@@ -0,0 +1,42 @@
+"""
+预序列化的文档/示例响应测试
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+
+client = TestClient(app)
+
+STATIC_PATHS = [
+    "/api/docs",
+    "/api/v1/alb/docs",
+    "/api/v1/alb/examples",
+    "/api/v1/ecs/docs",
+    "/api/v1/ecs/examples",
+    "/api/v1/banip/examples",
+]
+
+
+@pytest.mark.parametrize("path", STATIC_PATHS)
+def test_etag_and_not_modified(path):
+    response = client.get(path)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert "max-age" in response.headers["cache-control"]
+    etag = response.headers["etag"]
+
+    cached = client.get(path, headers={"If-None-Match": f'"other", W/{etag}'})
+
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+
+
+def test_payload_unchanged():
+    data = client.get("/api/v1/alb/docs").json()
+
+    assert data["add_entries_to_acl"]["title"] == "添加ALB访问控制条目"
+    assert client.get("/api/v1/ecs/examples").json()["authorize_security_group"][0]["request"]["port_range"] == "22/22"